@@ -0,0 +1,192 @@
+"""Partition log_lines by month.
+
+Revision ID: 9c2e5d41a7b3
+Revises: 3f12a7b9c4d1
+Create Date: 2026-10-19
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "9c2e5d41a7b3"
+down_revision = "3f12a7b9c4d1"
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = (
+    "id, version, creation_time, event_time, type, player1_name, player1_steamid, "
+    "player2_name, player2_steamid, raw, content, server, weapon, game"
+)
+# Partitions created past the current month, rcon.logs.partitions keeps creating them afterward
+MONTHS_AHEAD = 2
+
+
+def upgrade():
+    # The existing table is kept aside while the partitioned table is created, index
+    # names are unique per schema so the ones reused below must be renamed first
+    op.execute("ALTER TABLE log_lines RENAME TO log_lines_unpartitioned")
+    op.execute(
+        "ALTER INDEX IF EXISTS log_lines_pkey RENAME TO log_lines_unpartitioned_pkey"
+    )
+    op.execute(
+        "ALTER INDEX IF EXISTS unique_log_line RENAME TO log_lines_unpartitioned_unique_log_line"
+    )
+    op.execute(
+        "ALTER INDEX IF EXISTS ix_log_lines_player1_steamid RENAME TO ix_log_lines_unpartitioned_player1_steamid"
+    )
+    op.execute(
+        "ALTER INDEX IF EXISTS ix_log_lines_player2_steamid RENAME TO ix_log_lines_unpartitioned_player2_steamid"
+    )
+
+    # The partition key must be part of the primary key and of every unique constraint
+    op.execute(
+        """
+        CREATE TABLE log_lines (
+            id integer NOT NULL DEFAULT nextval('log_lines_id_seq'),
+            version integer,
+            creation_time timestamp without time zone,
+            event_time timestamp without time zone NOT NULL,
+            type varchar,
+            player1_name varchar,
+            player1_steamid integer REFERENCES steam_id_64 (id),
+            player2_name varchar,
+            player2_steamid integer REFERENCES steam_id_64 (id),
+            raw varchar NOT NULL,
+            content varchar,
+            server varchar,
+            weapon varchar,
+            game integer NOT NULL DEFAULT 1,
+            CONSTRAINT log_lines_pkey PRIMARY KEY (id, event_time),
+            CONSTRAINT unique_log_line UNIQUE (event_time, raw)
+        ) PARTITION BY RANGE (event_time)
+        """
+    )
+    op.execute("ALTER SEQUENCE log_lines_id_seq OWNED BY log_lines.id")
+
+    # The existing lines are not copied: the old table becomes the partition of
+    # the month of its most recent line, holding every line up to that month. The
+    # CHECK constraint proves its bound so that attaching it does not scan it again.
+    # Then one partition per month until a few months ahead, lines outside of them
+    # land in the default partition.
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            last_month timestamp := date_trunc(
+                'month',
+                COALESCE(
+                    (SELECT max(event_time) FROM log_lines_unpartitioned),
+                    now() AT TIME ZONE 'UTC'
+                )
+            );
+            month timestamp := last_month + interval '1 month';
+            until_month timestamp := date_trunc('month', now() AT TIME ZONE 'UTC')
+                + interval '{MONTHS_AHEAD} months';
+        BEGIN
+            EXECUTE format(
+                'ALTER TABLE log_lines_unpartitioned '
+                'ADD CONSTRAINT log_lines_unpartitioned_bound CHECK (event_time < %L)',
+                month
+            );
+            EXECUTE format(
+                'ALTER TABLE log_lines ATTACH PARTITION log_lines_unpartitioned '
+                'FOR VALUES FROM (MINVALUE) TO (%L)',
+                month
+            );
+            -- Superseded by the partition bound and by the (id, event_time) primary key
+            ALTER TABLE log_lines_unpartitioned DROP CONSTRAINT log_lines_unpartitioned_bound;
+            ALTER TABLE log_lines_unpartitioned DROP CONSTRAINT IF EXISTS log_lines_unpartitioned_pkey;
+            DROP INDEX IF EXISTS ix_log_lines_event_time;
+            EXECUTE format(
+                'ALTER TABLE log_lines_unpartitioned RENAME TO %I',
+                'log_lines_' || to_char(last_month, '"y"YYYY"m"MM')
+            );
+
+            WHILE month <= until_month LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF log_lines FOR VALUES FROM (%L) TO (%L)',
+                    'log_lines_' || to_char(month, '"y"YYYY"m"MM'),
+                    month,
+                    month + interval '1 month'
+                );
+                month := month + interval '1 month';
+            END LOOP;
+        END $$
+        """
+    )
+    op.execute("CREATE TABLE log_lines_default PARTITION OF log_lines DEFAULT")
+
+    # Created on the partitioned table so every partition, present or future, gets them.
+    # Lines are appended in event_time order which keeps the BRIN index tiny and selective.
+    op.execute(
+        "CREATE INDEX ix_log_lines_event_time_brin ON log_lines USING brin (event_time)"
+    )
+    op.execute(
+        "CREATE INDEX ix_log_lines_server_event_time ON log_lines (server, event_time)"
+    )
+    op.execute(
+        "CREATE INDEX ix_log_lines_player1_steamid ON log_lines (player1_steamid)"
+    )
+    op.execute(
+        "CREATE INDEX ix_log_lines_player2_steamid ON log_lines (player2_steamid)"
+    )
+
+
+def downgrade():
+    # The oldest partition, usually holding the lines recorded before the upgrade,
+    # becomes log_lines again and only the lines of the other partitions are copied.
+    # Partitions detached by the retention job are not part of log_lines anymore and
+    # are left as is.
+    op.execute("DROP INDEX IF EXISTS ix_log_lines_event_time_brin")
+    op.execute("DROP INDEX IF EXISTS ix_log_lines_server_event_time")
+    op.execute("DROP INDEX IF EXISTS ix_log_lines_player1_steamid")
+    op.execute("DROP INDEX IF EXISTS ix_log_lines_player2_steamid")
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            kept text := (
+                SELECT child.relname FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = 'log_lines'::regclass
+                    AND child.relname ~ '^log_lines_y[0-9]{{4}}m[0-9]{{2}}$'
+                ORDER BY child.relname
+                LIMIT 1
+            );
+        BEGIN
+            EXECUTE format('ALTER TABLE log_lines DETACH PARTITION %I', kept);
+            ALTER TABLE log_lines RENAME TO log_lines_partitioned;
+            EXECUTE format('ALTER TABLE %I RENAME TO log_lines', kept);
+            ALTER SEQUENCE log_lines_id_seq OWNED BY log_lines.id;
+
+            INSERT INTO log_lines ({COLUMNS}) SELECT {COLUMNS} FROM log_lines_partitioned;
+            DROP TABLE log_lines_partitioned;
+
+            -- The constraints inherited from the partitioned table have generated names
+            EXECUTE (
+                SELECT format('ALTER TABLE log_lines DROP CONSTRAINT %I', conname)
+                FROM pg_constraint
+                WHERE conrelid = 'log_lines'::regclass AND contype = 'p'
+            );
+            EXECUTE (
+                SELECT format(
+                    'ALTER TABLE log_lines RENAME CONSTRAINT %I TO unique_log_line',
+                    conname
+                )
+                FROM pg_constraint
+                WHERE conrelid = 'log_lines'::regclass AND contype = 'u'
+            );
+        END $$
+        """
+    )
+    op.execute("ALTER TABLE log_lines ADD CONSTRAINT log_lines_pkey PRIMARY KEY (id)")
+
+    op.execute("CREATE INDEX ix_log_lines_event_time ON log_lines (event_time)")
+    op.execute(
+        "CREATE INDEX ix_log_lines_player1_steamid ON log_lines (player1_steamid)"
+    )
+    op.execute(
+        "CREATE INDEX ix_log_lines_player2_steamid ON log_lines (player2_steamid)"
+    )
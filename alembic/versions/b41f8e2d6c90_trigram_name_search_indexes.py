@@ -0,0 +1,48 @@
+"""Trigram indexes for the player and log name searches.
+
+Revision ID: b41f8e2d6c90
+Revises: 9c2e5d41a7b3
+Create Date: 2026-10-19
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b41f8e2d6c90"
+down_revision = "9c2e5d41a7b3"
+branch_labels = None
+depends_on = None
+
+
+INDEXES = {
+    "ix_player_names_name_trgm": "player_names USING gin (name gin_trgm_ops)",
+    "ix_player_names_name_unaccent_trgm": (
+        "player_names USING gin (immutable_unaccent(name) gin_trgm_ops)"
+    ),
+    "ix_player_account_name_trgm": "player_account USING gin (name gin_trgm_ops)",
+    "ix_log_lines_player1_name_trgm": "log_lines USING gin (player1_name gin_trgm_ops)",
+    "ix_log_lines_player2_name_trgm": "log_lines USING gin (player2_name gin_trgm_ops)",
+}
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+    # unaccent() is only STABLE since its dictionary could change, which prevents
+    # using it in an index expression. Pinning the dictionary makes it safe to.
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION immutable_unaccent(text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ SELECT public.unaccent('public.unaccent'::regdictionary, $1) $$
+        """
+    )
+    for name, definition in INDEXES.items():
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+
+def downgrade():
+    for name in INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+    op.execute("DROP FUNCTION IF EXISTS immutable_unaccent(text)")
@@ -23,8 +23,14 @@ then
   ./manage.py migrate --noinput
   # Create this file after migrations which is how Docker determines the container is healthy
   touch maintenance-container-healthy
-  # Keep the container running until it's explicitly created again
-  sleep infinity
+  cd ..
+  # Keep the container running until it's explicitly created again, creating the
+  # upcoming log_lines partitions and detaching the expired ones once a day
+  while true
+  do
+    SERVER_NUMBER=1 LOGGING_PATH=/logs/ LOGGING_FILENAME=maintenance.log python -m rcon.cli maintain_log_partitions || true
+    sleep 86400
+  done
 fi
 
 # Check if we're in the webhook_service container
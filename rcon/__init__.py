@@ -10,8 +10,7 @@ __all__ = [
     "handle_on_tk",
     "hooks",
     "rcon",
-    "update_kills",
-    "update_tks",
+    "update_recent_actions",
     "watchdog",
 ]
 
@@ -24,5 +23,5 @@ if not os.getenv("HLL_MAINTENANCE_CONTAINER") and not os.getenv(
     from rcon.auto_kick import auto_kick
     from rcon.automods.tk_autoban import auto_ban_if_tks_right_after_connection
     from rcon.discord_chat import handle_on_chat, handle_on_kill, handle_on_tk
-    from rcon.recent_actions import update_kills, update_tks
+    from rcon.recent_actions import update_recent_actions
     from rcon.watchlist import watchdog
@@ -490,6 +490,7 @@ class RconAPI(Rcon):
         ignore_accent: bool = True,
         flags: str | list[str] | None = None,
         country: str | None = None,
+        fuzzy_name_match: bool = False,
     ):
         return get_players_by_appearance(
             page=page,
@@ -504,6 +505,7 @@ class RconAPI(Rcon):
             ignore_accent=ignore_accent,
             flags=flags,
             country=country,
+            fuzzy_name_match=fuzzy_name_match,
         )
 
     def flag_player(
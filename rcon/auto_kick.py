@@ -8,6 +8,7 @@ from rcon.discord import send_to_discord_audit
 from rcon.hooks import inject_player_ids
 from rcon.logs.loop import on_connected
 from rcon.player_history import get_player_profile, player_has_flag
+from rcon.policy_index import get_policy_index
 from rcon.user_config.name_kicks import NameKickUserConfig
 
 logger = logging.getLogger(__name__)
@@ -17,18 +18,26 @@ logger = logging.getLogger(__name__)
 @inject_player_ids
 def auto_kick(rcon: RconAPI, struct_log, name: str, player_id: str):
     config = NameKickUserConfig.load_from_db()
+    if not config.regular_expressions:
+        return
 
+    policy = get_policy_index().get(player_id)
     for r in config.regular_expressions:
         try:
-            profile = get_player_profile(player_id, 0)
-            for f in config.whitelist_flags:
-                if player_has_flag(profile, f):
-                    logger.debug(
-                        "Not checking nickname validity for whitelisted player %s (%s)",
-                        name,
-                        player_id,
-                    )
-                    return
+            if policy is not None:
+                whitelisted = any(f in policy.flags for f in config.whitelist_flags)
+            else:
+                profile = get_player_profile(player_id, 0)
+                whitelisted = any(
+                    player_has_flag(profile, f) for f in config.whitelist_flags
+                )
+            if whitelisted:
+                logger.debug(
+                    "Not checking nickname validity for whitelisted player %s (%s)",
+                    name,
+                    player_id,
+                )
+                return
         except:  # noqa
             logger.exception("Unable to check player profile")
 
@@ -1,87 +1,334 @@
 import logging
 import sys
 import time
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from typing import Callable
 
 import pytz
 
 from rcon.api_commands import get_rcon_api
-from rcon.conditions import Condition, create_condition
-from rcon.rcon import do_run_commands
+from rcon.auto_settings_events import AutoSettingsEvent, AutoSettingsEvents
+from rcon.conditions import (
+    Condition,
+    CurrentMapCondition,
+    Metrics,
+    OnlineModsCondition,
+    PlayerCountCondition,
+    TimeOfDayCondition,
+    create_condition,
+    evaluate_conditions,
+)
+from rcon.rcon import is_user_config_func, run_command
 from rcon.user_config.auto_settings import AutoSettingsConfig
 
 logger = logging.getLogger(__name__)
 
 
-def run():
-    rcon = get_rcon_api()
-    config = AutoSettingsConfig().get_settings()
+class TokenBucket:
+    """Allow bursts of `capacity` commands, refilled at `rate` commands per second"""
 
-    while True:
-        always_apply_defaults = config.get("always_apply_defaults", False)
-        can_invoke_multiple_rules = config.get("can_invoke_multiple_rules", False)
-        default_commands = config.get("defaults", {})
-        rule_matched = False
-        if always_apply_defaults:
-            # First run defaults so they can be overwritten. Save "set" commands so
-            # we prevent them from being sent more than once in the same iteration.
-            saved_commands = {
+    def __init__(
+        self,
+        rate: float = 1 / 5,
+        capacity: float = 5,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        self._refill()
+        if self.tokens < 1:
+            self.sleep((1 - self.tokens) / self.rate)
+            self._refill()
+        self.tokens -= 1
+
+
+@dataclass
+class CompiledRule:
+    conditions: list[Condition]
+    commands: dict[str, dict]
+    source: dict = field(repr=False, default_factory=dict)
+
+    def matches(self, rcon, metrics: Metrics | None = None) -> bool:
+        return evaluate_conditions(self.conditions, metrics, rcon=rcon)
+
+
+@dataclass
+class CompiledSettings:
+    always_apply_defaults: bool
+    can_invoke_multiple_rules: bool
+    defaults: dict[str, dict]
+    rules: list[CompiledRule]
+
+
+def compile_settings(config: dict) -> CompiledSettings:
+    """Build the conditions of every rule once, invalid conditions are ignored"""
+    rules = []
+    for rule in config["rules"]:
+        conditions: list[Condition] = []
+        for c_name, c_params in rule.get("conditions", {}).items():
+            try:
+                conditions.append(create_condition(c_name, **c_params))
+            except ValueError:
+                logger.exception(
+                    "Invalid condition %s %s, ignoring...", c_name, c_params
+                )
+            except pytz.UnknownTimeZoneError:
+                logger.exception(
+                    "Invalid timezone for condition %s %s, ignoring...",
+                    c_name,
+                    c_params,
+                )
+        rules.append(CompiledRule(conditions, rule.get("commands", {}), rule))
+
+    return CompiledSettings(
+        always_apply_defaults=config.get("always_apply_defaults", False),
+        can_invoke_multiple_rules=config.get("can_invoke_multiple_rules", False),
+        defaults=config.get("defaults", {}),
+        rules=rules,
+    )
+
+
+def desired_commands(
+    settings: CompiledSettings, rcon, metrics: Metrics | None = None
+) -> dict[str, dict]:
+    """The commands the matching rules and defaults end up applying
+
+    Commands are merged in the order they used to be sent one after the
+    other, so each one keeps the value it would have been left with.
+    """
+    metrics = metrics or Metrics(rcon=rcon)
+    desired: dict[str, dict] = {}
+    saved_commands = {}
+    if settings.always_apply_defaults:
+        # First run defaults so they can be overwritten. Save "set" commands so
+        # they are merged with the commands of the matching rules.
+        saved_commands = {
+            name: params
+            for (name, params) in settings.defaults.items()
+            if name.startswith("set_")
+        }
+        desired.update(
+            {
                 name: params
-                for (name, params) in default_commands.items()
-                if name.startswith("set_")
+                for (name, params) in settings.defaults.items()
+                if not name.startswith("set_")
             }
-            do_run_commands(
-                rcon,
-                {
-                    name: params
-                    for (name, params) in default_commands.items()
-                    if not name.startswith("set_")
-                },
+        )
+
+    rule_matched = False
+    can_invoke_multiple_rules = settings.can_invoke_multiple_rules
+    for rule in settings.rules:
+        if rule.matches(rcon, metrics):
+            # Overwrites the saved commands in case they're duplicate
+            desired.update({**saved_commands, **rule.commands})
+            rule_matched = True
+            if can_invoke_multiple_rules:
+                logger.info(
+                    f"Rule conditions met, can invoke multiple rules and moving to next one. ({can_invoke_multiple_rules=})"
+                )
+                continue
+            else:
+                logger.info(
+                    f"Rule conditions met, cannot invoke multiple rules, ignoring potential other rules. ({can_invoke_multiple_rules=})"
+                )
+                break
+
+        logger.info("Rule `%s` conditions not met, moving to next one.", rule.source)
+
+    if not rule_matched:
+        if settings.always_apply_defaults:
+            desired.update(saved_commands)
+        else:
+            desired.update(settings.defaults)
+    return desired
+
+
+class AutoSettingsApplier:
+    """Send the desired commands whose value differs from the server's
+
+    `set_*` commands describe a state. A user config command is skipped when
+    the stored config already holds its values, any other one when it was
+    applied with the same parameters less than `resync_seconds` ago, so
+    changes made by hand or a server restart get corrected eventually. Other
+    commands are sent on every evaluation. Sending is rate limited by a
+    token bucket instead of a fixed pause after each command.
+    """
+
+    def __init__(
+        self,
+        rcon,
+        bucket: TokenBucket | None = None,
+        resync_seconds: float = 15 * 60,
+    ):
+        self.rcon = rcon
+        self.bucket = bucket or TokenBucket()
+        self.resync_seconds = resync_seconds
+        self.applied: dict[str, tuple[dict, float]] = {}
+
+    def is_current(self, command: str, params: dict) -> bool:
+        if not command.startswith("set_"):
+            return False
+
+        if is_user_config_func(command):
+            try:
+                config = getattr(self.rcon, f"g{command[1:]}")()
+                observed = config.model_dump(mode="json")
+            except Exception:
+                logger.exception("Unable to get the current value of %s", command)
+                return False
+            return all(
+                observed.get(name) == value
+                for name, value in params.items()
+                if name != "by"
             )
 
-        for rule in config["rules"]:
-            conditions: list[Condition] = []
-            commands = rule.get("commands", {})
-            for c_name, c_params in rule.get("conditions", {}).items():
-                try:
-                    conditions.append(create_condition(c_name, **c_params))
-                except ValueError:
-                    logger.exception(
-                        "Invalid condition %s %s, ignoring...", c_name, c_params
-                    )
-                except pytz.UnknownTimeZoneError:
-                    logger.exception(
-                        "Invalid timezone for condition %s %s, ignoring...",
-                        c_name,
-                        c_params,
-                    )
-
-            if all(c.is_valid(rcon=rcon) for c in conditions):
-                if always_apply_defaults:
-                    # Overwrites the saved commands in case they're duplicate
-                    do_run_commands(rcon, {**saved_commands, **commands})
-                else:
-                    do_run_commands(rcon, commands)
-                rule_matched = True
-                if can_invoke_multiple_rules:
-                    logger.info(
-                        f"Rule conditions met, can invoke multiple rules and moving to next one. ({can_invoke_multiple_rules=})"
-                    )
-                    continue
-                else:
-                    logger.info(
-                        f"Rule conditions met, cannot invoke multiple rules, ignoring potential other rules. ({can_invoke_multiple_rules=})"
-                    )
-                    break
-
-            logger.info("Rule `%s` conditions not met, moving to next one.", rule)
-
-        if not rule_matched:
-            if always_apply_defaults:
-                # The saved commands were never ran yet, so we do that here
-                do_run_commands(rcon, saved_commands)
+        applied = self.applied.get(command)
+        return (
+            applied is not None
+            and applied[0] == params
+            and time.monotonic() - applied[1] < self.resync_seconds
+        )
+
+    def apply(self, desired: dict[str, dict]) -> list[str]:
+        """Send the commands that differ, return the ones that were applied"""
+        sent = []
+        for command, params in desired.items():
+            if self.is_current(command, params):
+                logger.debug("%s is already applied, skipping", command)
+                continue
+            self.bucket.acquire()
+            if run_command(self.rcon, command, params):
+                self.applied[command] = (params, time.monotonic())
+                sent.append(command)
             else:
-                do_run_commands(rcon, default_commands)
-        time.sleep(60)
+                self.applied.pop(command, None)
+        return sent
+
+
+class AutoSettingsTriggers:
+    """When the compiled rules are worth evaluating again
+
+    A map change only matters to current map conditions and a player count
+    change only when it crosses a threshold of the player count conditions.
+    Time of day conditions set a timer for their next boundary. Online and
+    in game mods have no event, rules using them are polled every
+    `poll_seconds`, everything is evaluated every `resync_seconds` anyway.
+    """
+
+    def __init__(
+        self,
+        settings: CompiledSettings,
+        poll_seconds: float = 60,
+        resync_seconds: float = 5 * 60,
+    ):
+        conditions = [c for rule in settings.rules for c in rule.conditions]
+        self.boundaries = sorted(
+            {
+                boundary
+                for c in conditions
+                if isinstance(c, PlayerCountCondition)
+                for boundary in c.boundaries
+            }
+        )
+        self.times_of_day = [c for c in conditions if isinstance(c, TimeOfDayCondition)]
+        self.on_map_change = any(isinstance(c, CurrentMapCondition) for c in conditions)
+        self.interval = (
+            poll_seconds
+            if any(isinstance(c, OnlineModsCondition) for c in conditions)
+            else resync_seconds
+        )
+        self.player_count_range: int | None = None
+
+    def observe_player_count(self, player_count: int) -> bool:
+        """Record the player count, True when it crossed a threshold"""
+        player_count_range = bisect_right(self.boundaries, player_count)
+        crossed = player_count_range != self.player_count_range
+        self.player_count_range = player_count_range
+        return crossed
+
+    def seconds_until_next(self, now: datetime | None = None) -> float:
+        now = now or datetime.now(tz=UTC)
+        delay = self.interval
+        for condition in self.times_of_day:
+            if (boundary := condition.next_boundary(now)) is not None:
+                delay = min(delay, (boundary - now).total_seconds())
+        return max(delay, 0)
+
+    def is_relevant(self, event: AutoSettingsEvent, rcon) -> bool:
+        match event:
+            case AutoSettingsEvent.CONFIG:
+                return True
+            case AutoSettingsEvent.MAP_CHANGE:
+                return self.on_map_change
+            case AutoSettingsEvent.PLAYER_COUNT:
+                if not self.boundaries:
+                    return False
+                return self.observe_player_count(
+                    Metrics(rcon=rcon).get("player_count", "rcon")
+                )
+        return False
+
+
+class AutoSettings:
+    """Compiled auto settings rules, recompiled when the config changes"""
+
+    def __init__(self, rcon, applier: AutoSettingsApplier | None = None):
+        self.rcon = rcon
+        self.applier = applier or AutoSettingsApplier(rcon)
+        self.config: dict | None = None
+        self.settings: CompiledSettings | None = None
+        self.triggers: AutoSettingsTriggers | None = None
+
+    def reload(self) -> CompiledSettings:
+        config = AutoSettingsConfig().get_settings()
+        if config != self.config:
+            if self.config is not None:
+                logger.info("Auto settings changed, compiling the new rules")
+            self.config = config
+            self.settings = compile_settings(config)
+            self.triggers = AutoSettingsTriggers(self.settings)
+        return self.settings
+
+    def run_once(self) -> list[str]:
+        settings = self.reload()
+        metrics = Metrics(rcon=self.rcon)
+        desired = desired_commands(settings, self.rcon, metrics)
+        if self.triggers.boundaries:
+            self.triggers.observe_player_count(metrics.get("player_count", "rcon"))
+        return self.applier.apply(desired)
+
+    def wait(self, events: AutoSettingsEvents) -> AutoSettingsEvent | None:
+        """Block until a relevant event arrives or the next timer is due"""
+        deadline = time.monotonic() + self.triggers.seconds_until_next()
+        while (remaining := deadline - time.monotonic()) > 0:
+            event = events.get(timeout=remaining)
+            if event is not None and self.triggers.is_relevant(event, self.rcon):
+                logger.info("Evaluating the auto settings rules on %s", event)
+                return event
+        return None
+
+
+def run():
+    auto_settings = AutoSettings(get_rcon_api())
+    events = AutoSettingsEvents()
+
+    while True:
+        auto_settings.run_once()
+        auto_settings.wait(events)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+import logging
+import time
+from enum import StrEnum
+
+import redis
+import redis.exceptions
+
+from rcon.cache_utils import get_redis_client
+from rcon.utils import get_server_number
+
+logger = logging.getLogger(__name__)
+
+
+class AutoSettingsEvent(StrEnum):
+    MAP_CHANGE = "map_change"
+    PLAYER_COUNT = "player_count"
+    CONFIG = "config"
+
+
+def auto_settings_channel(server_number: int | str | None = None) -> str:
+    return f"auto_settings:{server_number or get_server_number()}"
+
+
+def publish_auto_settings_event(
+    event: AutoSettingsEvent,
+    red: redis.Redis | None = None,
+    server_number: int | str | None = None,
+):
+    """Wake the auto settings service of a server up, this one by default
+
+    Never raises.
+    """
+    try:
+        (red or get_redis_client()).publish(
+            auto_settings_channel(server_number), event.value
+        )
+    except redis.exceptions.RedisError:
+        logger.exception("Unable to publish the auto settings event %s", event)
+
+
+class AutoSettingsEvents:
+    """The auto settings events published for this server"""
+
+    def __init__(self, red: redis.Redis | None = None):
+        self.pubsub = (red or get_redis_client()).pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(auto_settings_channel())
+
+    def get(self, timeout: float) -> AutoSettingsEvent | None:
+        """Wait up to `timeout` seconds for an event"""
+        try:
+            message = self.pubsub.get_message(timeout=timeout)
+        except redis.exceptions.RedisError:
+            logger.exception("Unable to receive the auto settings events")
+            time.sleep(timeout)
+            return None
+
+        if message is None:
+            return None
+        data = message["data"]
+        try:
+            return AutoSettingsEvent(data.decode() if isinstance(data, bytes) else data)
+        except ValueError:
+            logger.warning("Unknown auto settings event %s", data)
+            return None
@@ -10,7 +10,9 @@ from rcon.automods.level_thresholds import LevelThresholdsAutomod
 from rcon.automods.models import ActionMethod, PunishPlayer, PunitionsToApply
 from rcon.automods.no_leader import NoLeaderAutomod
 from rcon.automods.no_solotank import NoSoloTankAutomod
+from rcon.automods.scheduler import AutomodScheduler, iter_squads
 from rcon.automods.seeding_rules import SeedingRulesAutomod
+from rcon.automods.state_store import watch_states_tick
 from rcon.cache_utils import get_redis_client
 from rcon.commands import HLLCommandFailedError
 from rcon.discord import send_to_discord_audit
@@ -27,37 +29,32 @@ logger = logging.getLogger(__name__)
 first_run_done_key = "first_run_done"
 
 
-def get_punitions_to_apply(rcon, moderators) -> PunitionsToApply:
+def get_punitions_to_apply(
+    rcon, moderators, scheduler: AutomodScheduler | None = None
+) -> PunitionsToApply:
+    """
+    Evaluate the squads of both teams with every moderator,
+    or only the squads the scheduler planned for each of them
+    """
     logger.debug("Getting team info")
     team_view = rcon.get_team_view()
-    gamestate = rcon.get_gamestate()
     punitions_to_apply = PunitionsToApply()
 
-    for team in ["allies", "axis"]:
-        if not team_view.get(team):
-            continue
-
-        if team_view[team]["commander"] is not None:
-            for mod in moderators:
-                punitions_to_apply.merge(
-                    mod.punitions_to_apply(
-                        team_view,
-                        "Commander",
-                        team,
-                        {
-                            "players": [team_view[team]["commander"]],
-                        },
-                        gamestate,
-                    )
-                )
+    plan = scheduler.plan(team_view, moderators) if scheduler else None
+    if plan is not None and not any(plan.values()):
+        logger.debug("No squad changed and no escalation is due")
+        return punitions_to_apply
 
-        for squad_name, squad in team_view[team]["squads"].items():
-            for mod in moderators:
-                punitions_to_apply.merge(
-                    mod.punitions_to_apply(
-                        team_view, squad_name, team, squad, gamestate
-                    )
-                )
+    gamestate = rcon.get_gamestate()
+    for (team, squad_name), squad in iter_squads(team_view):
+        for mod in moderators:
+            if plan is not None:
+                if (team, squad_name) not in plan[scheduler.moderator_name(mod)]:
+                    continue
+                scheduler.mark_evaluated(mod, team, squad_name)
+            punitions_to_apply.merge(
+                mod.punitions_to_apply(team_view, squad_name, team, squad, gamestate)
+            )
 
     return punitions_to_apply
 
@@ -187,15 +184,19 @@ def set_first_run_done(r: Redis):
     r.setex(first_run_done_key, 4 * 60, "1")
 
 
-def punish_squads(rcon: Rcon, r: Redis):
+def punish_squads(rcon: Rcon, r: Redis, scheduler: AutomodScheduler | None = None):
     mods = enabled_moderators(rcon)
     if len(mods) == 0:
         logger.debug("No automod is enabled")
         return
 
-    punitions_to_apply = get_punitions_to_apply(rcon, mods)
+    # One load and one write of every squad watch state per tick
+    with watch_states_tick(mods):
+        punitions_to_apply = get_punitions_to_apply(rcon, mods, scheduler)
 
-    _do_punitions_for_moderators(rcon, punitions_to_apply, mods)
+        _do_punitions_for_moderators(rcon, punitions_to_apply, mods)
+        if scheduler:
+            scheduler.reschedule(mods)
     set_first_run_done(r)
 
 
@@ -294,10 +295,11 @@ def on_connected(rcon: Rcon, _, name: str, player_id: str):
 def run():
     rcon = get_rcon()
     red = get_redis_client()
+    scheduler = AutomodScheduler()
 
     while True:
         try:
-            punish_squads(rcon, red)
+            punish_squads(rcon, red, scheduler)
             time.sleep(5)
         except Exception:
             logger.exception("Squad automod: Something unexpected happened")
@@ -3,7 +3,6 @@ Enforces the min/max global and per-role levels requirements
 """
 
 import logging
-import pickle
 from contextlib import contextmanager
 from datetime import UTC, datetime, timedelta
 from typing import Literal
@@ -22,6 +21,7 @@ from rcon.automods.models import (
     WatchStatus,
 )
 from rcon.automods.num_or_inf import num_or_inf
+from rcon.automods.state_store import WatchStateStore, squad_field
 from rcon.types import GameStateType, GetDetailedPlayer
 from rcon.user_config.auto_mod_level import AutoModLevelUserConfig
 
@@ -34,6 +34,9 @@ class LevelThresholdsAutomod:
     Imported from rcon/automods/automod.py
     """
 
+    # Only evaluated when a squad changes or an escalation is due
+    change_driven = True
+
     logger: logging.Logger
     red: redis.StrictRedis
     config: AutoModLevelUserConfig
@@ -41,6 +44,9 @@ class LevelThresholdsAutomod:
     def __init__(self, config: AutoModLevelUserConfig, red: redis.StrictRedis or None):
         self.logger = logging.getLogger(__name__)
         self.red = red
+        self.state_store = WatchStateStore(
+            red, "level_thresholds_automod", LEVEL_THRESHOLDS_RESET_SECS
+        )
         self.config = config
 
     def enabled(self):
@@ -171,25 +177,15 @@ class LevelThresholdsAutomod:
         """
         Observe and actualize the current moderation step
         """
-        redis_key = f"level_thresholds_automod{team.lower()}{str(squad_name).lower()}"
-        watch_status = self.red.get(redis_key)
-        if watch_status:
-            watch_status = pickle.loads(watch_status)
-        # No punishments so far, starting a fresh one
-        else:
-            watch_status = WatchStatus()
-
-        try:
-            yield watch_status
-        except NoLevelViolation:
-            self.logger.debug(
-                "Squad %s - %s no level violation, clearing state", team, squad_name
-            )
-            self.red.delete(redis_key)
-        else:
-            self.red.setex(
-                redis_key, LEVEL_THRESHOLDS_RESET_SECS, pickle.dumps(watch_status)
-            )
+        field = squad_field(team, squad_name)
+        with self.state_store.watch(field) as watch_status:
+            try:
+                yield watch_status
+            except NoLevelViolation:
+                self.logger.debug(
+                    "Squad %s - %s no level violation, clearing state", team, squad_name
+                )
+                self.state_store.delete(field)
 
     def get_message(
         self,
@@ -3,7 +3,6 @@ Enforces the "Every squad must have an officer" rule
 """
 
 import logging
-import pickle
 from contextlib import contextmanager
 from datetime import UTC, datetime, timedelta
 from typing import Literal
@@ -23,6 +22,7 @@ from rcon.automods.models import (
     WatchStatus,
 )
 from rcon.automods.num_or_inf import num_or_inf
+from rcon.automods.state_store import WatchStateStore, squad_field
 from rcon.types import GameStateType
 from rcon.user_config.auto_mod_no_leader import AutoModNoLeaderUserConfig
 
@@ -35,6 +35,9 @@ class NoLeaderAutomod:
     Imported from rcon/automods/automod.py
     """
 
+    # Only evaluated when a squad changes or an escalation is due
+    change_driven = True
+
     logger: logging.Logger
     red: redis.StrictRedis
     config: AutoModNoLeaderUserConfig
@@ -44,6 +47,9 @@ class NoLeaderAutomod:
     ):
         self.logger = logging.getLogger(__name__)
         self.red = red
+        self.state_store = WatchStateStore(
+            red, "no_leader_watch", LEADER_WATCH_RESET_SECS
+        )
         self.config = config
 
     def enabled(self):
@@ -57,24 +63,15 @@ class NoLeaderAutomod:
         """
         Observe and actualize the current moderation step
         """
-        redis_key = f"no_leader_watch{team.lower()}{str(squad_name).lower()}"
-        watch_status = self.red.get(redis_key)
-        if watch_status:
-            watch_status = pickle.loads(watch_status)
-        else:  # No punishments so far, starting a fresh one
-            watch_status = WatchStatus()
-
-        try:
-            yield watch_status
-        except (SquadHasLeader, SquadCycleOver):
-            self.logger.debug(
-                "Squad %s - %s has a leader, clearing state", team, squad_name
-            )
-            self.red.delete(redis_key)
-        else:
-            self.red.setex(
-                redis_key, LEADER_WATCH_RESET_SECS, pickle.dumps(watch_status)
-            )
+        field = squad_field(team, squad_name)
+        with self.state_store.watch(field) as watch_status:
+            try:
+                yield watch_status
+            except (SquadHasLeader, SquadCycleOver):
+                self.logger.debug(
+                    "Squad %s - %s has a leader, clearing state", team, squad_name
+                )
+                self.state_store.delete(field)
 
     def get_message(
         self, watch_status: WatchStatus, aplayer: PunishPlayer, method: ActionMethod
@@ -3,7 +3,6 @@ Enforces the "An armor squad must have at least two members" rule
 """
 
 import logging
-import pickle
 from contextlib import contextmanager
 from datetime import UTC, datetime, timedelta
 from typing import Literal
@@ -22,6 +21,7 @@ from rcon.automods.models import (
     WatchStatus,
 )
 from rcon.automods.num_or_inf import num_or_inf
+from rcon.automods.state_store import WatchStateStore, squad_field
 from rcon.types import GameStateType
 from rcon.user_config.auto_mod_solo_tank import AutoModNoSoloTankUserConfig
 
@@ -34,6 +34,9 @@ class NoSoloTankAutomod:
     Imported from rcon/automods/automod.py
     """
 
+    # Only evaluated when a squad changes or an escalation is due
+    change_driven = True
+
     logger: logging.Logger
     red: redis.StrictRedis
     config: AutoModNoSoloTankUserConfig
@@ -43,6 +46,7 @@ class NoSoloTankAutomod:
     ):
         self.logger = logging.getLogger(__name__)
         self.red = red
+        self.state_store = WatchStateStore(red, "no_solo_tank", SOLO_TANK_RESET_SECS)
         self.config = config
 
     def enabled(self):
@@ -56,22 +60,17 @@ class NoSoloTankAutomod:
         """
         Observe and actualize the current moderation step
         """
-        redis_key = f"no_solo_tank{team.lower()}{str(squad_name).lower()}"
-        watch_status = self.red.get(redis_key)
-        if watch_status:
-            watch_status = pickle.loads(watch_status)
-        else:  # No punishments so far, starting a fresh one
-            watch_status = WatchStatus()
-
-        try:
-            yield watch_status
-        except NoSoloTanker:
-            self.logger.debug(
-                "Squad %s - %s no solotank violation, clearing state", team, squad_name
-            )
-            self.red.delete(redis_key)
-        else:
-            self.red.setex(redis_key, SOLO_TANK_RESET_SECS, pickle.dumps(watch_status))
+        field = squad_field(team, squad_name)
+        with self.state_store.watch(field) as watch_status:
+            try:
+                yield watch_status
+            except NoSoloTanker:
+                self.logger.debug(
+                    "Squad %s - %s no solotank violation, clearing state",
+                    team,
+                    squad_name,
+                )
+                self.state_store.delete(field)
 
     def get_message(
         self, watch_status: WatchStatus, aplayer: PunishPlayer, method: ActionMethod
@@ -0,0 +1,224 @@
+import logging
+import time
+from collections.abc import Hashable, Iterable
+
+from rcon.automods.get_team_count import get_team_count
+from rcon.automods.models import WatchStatus
+from rcon.automods.state_store import squad_field
+
+logger = logging.getLogger(__name__)
+
+SquadKey = tuple[str, str]
+
+
+class TimerWheel:
+    """A hashed timer wheel of `size` slots of `tick_seconds` each
+
+    Scheduling and cancelling are O(1), popping the due timers only visits
+    the slots elapsed since the previous call. A timer further away than one
+    turn of the wheel stays in its slot until its time comes.
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, size: int = 512):
+        self.tick_seconds = tick_seconds
+        self.size = size
+        self.slots: list[dict[Hashable, float]] = [{} for _ in range(size)]
+        self.timers: dict[Hashable, int] = {}
+        self.last_tick: int | None = None
+
+    def _tick(self, at: float) -> int:
+        return int(at // self.tick_seconds)
+
+    def schedule(self, key: Hashable, at: float):
+        self.cancel(key)
+        tick = self._tick(at)
+        if self.last_tick is not None:
+            # A timer already due goes in the next slot to be visited
+            tick = max(tick, self.last_tick)
+        slot = tick % self.size
+        self.timers[key] = slot
+        self.slots[slot][key] = at
+
+    def cancel(self, key: Hashable):
+        if (slot := self.timers.pop(key, None)) is not None:
+            self.slots[slot].pop(key, None)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.timers
+
+    def __len__(self) -> int:
+        return len(self.timers)
+
+    def pop_due(self, now: float) -> set[Hashable]:
+        current = self._tick(now)
+        first = current if self.last_tick is None else self.last_tick
+        ticks = range(first, current + 1)
+        if len(ticks) > self.size:
+            ticks = range(current - self.size + 1, current + 1)
+        self.last_tick = current
+
+        due = set()
+        for tick in ticks:
+            slot = self.slots[tick % self.size]
+            due.update(key for key, at in slot.items() if at <= now)
+        for key in due:
+            self.cancel(key)
+        return due
+
+
+def iter_squads(team_view) -> Iterable[tuple[SquadKey, dict]]:
+    """The squads of both teams as evaluated by the automods, commanders included"""
+    for team in ["allies", "axis"]:
+        if not team_view.get(team):
+            continue
+        if team_view[team]["commander"] is not None:
+            yield (team, "Commander"), {"players": [team_view[team]["commander"]]}
+        for squad_name, squad in team_view[team]["squads"].items():
+            yield (team, squad_name), squad
+
+
+def squad_fingerprint(squad: dict) -> Hashable:
+    """What the automods look at in a squad: its type, leader and members"""
+    players = []
+    for player in squad.get("players", []):
+        profile = player.get("profile") or {}
+        flags = tuple(
+            sorted(
+                f["flag"] if isinstance(f, dict) else f.flag
+                for f in profile.get("flags") or []
+            )
+        )
+        players.append(
+            (player.get("player_id"), player.get("role"), player.get("level"), flags)
+        )
+    return squad.get("type"), squad.get("has_leader"), tuple(sorted(players))
+
+
+def next_evaluation(
+    watch_status: WatchStatus, config, now: float, retry_seconds: float
+) -> float:
+    """When the next warn/punish/kick step of a watched squad becomes due
+
+    Each step is due its interval after the last time it was applied. When
+    none lies ahead (a step is blocked or a punish failed), the squad is
+    checked again after `retry_seconds`.
+    """
+    intervals = [
+        (watch_status.noted, getattr(config, "notes_interval_seconds", 0)),
+        (watch_status.warned, getattr(config, "warning_interval_seconds", 0)),
+        (watch_status.punished, getattr(config, "punish_interval_seconds", 0)),
+        (watch_status.punished, getattr(config, "kick_grace_period_seconds", 0)),
+    ]
+    upcoming = [
+        at
+        for steps, interval in intervals
+        for times in steps.values()
+        if times and (at := times[-1].timestamp() + interval) > now
+    ]
+    return min(upcoming, default=now + retry_seconds)
+
+
+class AutomodScheduler:
+    """Decide which squads the automods must evaluate on a tick
+
+    Consecutive team views are diffed: a squad is evaluated by every
+    moderator when its type, leader, members, their roles, levels or flags
+    changed. The watched squads of each moderator are put on a timer wheel
+    for the time their next escalation step is due. Everything is evaluated
+    when the team sizes or a moderator config change, which player count
+    thresholds depend on, and at least every `full_scan_seconds`.
+
+    Moderators without a `change_driven` attribute set, whose rules depend on
+    the game state (scores, offense points), evaluate every squad each tick.
+    """
+
+    def __init__(
+        self,
+        full_scan_seconds: float = 5 * 60,
+        retry_seconds: float = 15,
+        max_delay_seconds: float = 60,
+        wheel: TimerWheel | None = None,
+    ):
+        self.full_scan_seconds = full_scan_seconds
+        self.retry_seconds = retry_seconds
+        # Under the watch states TTL, so a watched squad is never forgotten
+        self.max_delay_seconds = max_delay_seconds
+        self.wheel = wheel or TimerWheel()
+        self.fingerprints: dict[SquadKey, Hashable] = {}
+        self.global_fingerprint: Hashable = None
+        self.last_full_scan = float("-inf")
+        self.evaluated: set[tuple[str, str, str]] = set()
+
+    @staticmethod
+    def moderator_name(mod) -> str:
+        return type(mod).__name__
+
+    def plan(
+        self, team_view, moderators, now: float | None = None
+    ) -> dict[str, set[SquadKey]]:
+        """The squads each moderator must evaluate, by moderator name"""
+        now = time.time() if now is None else now
+        squads = {
+            key: squad_fingerprint(squad) for key, squad in iter_squads(team_view)
+        }
+        global_fingerprint = (
+            get_team_count(team_view, "allies"),
+            get_team_count(team_view, "axis"),
+            tuple(mod.config.model_dump_json() for mod in moderators),
+        )
+
+        if (
+            global_fingerprint != self.global_fingerprint
+            or now - self.last_full_scan >= self.full_scan_seconds
+        ):
+            self.global_fingerprint = global_fingerprint
+            self.last_full_scan = now
+            changed = set(squads)
+        else:
+            changed = {
+                key for key, fp in squads.items() if self.fingerprints.get(key) != fp
+            }
+        self.fingerprints = squads
+
+        due: dict[str, set[SquadKey]] = {}
+        for name, team, squad_name in self.wheel.pop_due(now):
+            if (team, squad_name) in squads:
+                due.setdefault(name, set()).add((team, squad_name))
+
+        plan = {}
+        for mod in moderators:
+            name = self.moderator_name(mod)
+            if getattr(mod, "change_driven", False):
+                plan[name] = changed | due.get(name, set())
+            else:
+                plan[name] = set(squads)
+        logger.debug(
+            "Automod plan: %s changed, %s",
+            len(changed),
+            {name: len(keys) for name, keys in plan.items()},
+        )
+        return plan
+
+    def mark_evaluated(self, mod, team: str, squad_name: str):
+        if getattr(mod, "change_driven", False):
+            self.evaluated.add((self.moderator_name(mod), team, squad_name))
+
+    def reschedule(self, moderators, now: float | None = None):
+        """Put the squads evaluated this tick that are still watched on the wheel
+
+        Must run once the punitions are applied, a failed punish rewinds the
+        watch state.
+        """
+        now = time.time() if now is None else now
+        by_name = {self.moderator_name(mod): mod for mod in moderators}
+        for key in self.evaluated:
+            name, team, squad_name = key
+            mod = by_name.get(name)
+            store = getattr(mod, "state_store", None)
+            watch_status = store.peek(squad_field(team, squad_name)) if store else None
+            if watch_status is None:
+                self.wheel.cancel(key)
+                continue
+            at = next_evaluation(watch_status, mod.config, now, self.retry_seconds)
+            self.wheel.schedule(key, min(at, now + self.max_delay_seconds))
+        self.evaluated.clear()
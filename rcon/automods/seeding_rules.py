@@ -6,7 +6,6 @@ Enforces the various seeding rules :
 """
 
 import logging
-import pickle
 from contextlib import contextmanager
 from datetime import UTC, datetime, timedelta
 from typing import Literal
@@ -25,6 +24,7 @@ from rcon.automods.models import (
     WatchStatus,
 )
 from rcon.automods.num_or_inf import num_or_inf
+from rcon.automods.state_store import WatchStateStore, squad_field
 from rcon.cache_utils import get_redis_client
 from rcon.logs.loop import on_match_start
 from rcon.maps import GameMode
@@ -75,6 +75,9 @@ class SeedingRulesAutomod:
     ):
         self.logger = logging.getLogger(__name__)
         self.red = red
+        self.state_store = WatchStateStore(
+            red, "seeding_rules_automod", SEEDING_RULES_RESET_SECS
+        )
         self.config = config
 
     def enabled(self) -> bool:
@@ -193,24 +196,17 @@ class SeedingRulesAutomod:
         """
         Observe and actualize the current moderation step
         """
-        redis_key = f"seeding_rules_automod{team.lower()}{str(squad_name).lower()}"
-        watch_status = self.red.get(redis_key)
-        if watch_status:
-            watch_status = pickle.loads(watch_status)
-        else:  # No punishments so far, starting a fresh one
-            watch_status = WatchStatus()
-
-        try:
-            yield watch_status
-        except NoSeedingViolation:
-            self.logger.debug(
-                "Squad %s - %s no seeding violation, clearing state", team, squad_name
-            )
-            self.red.delete(redis_key)
-        else:
-            self.red.setex(
-                redis_key, SEEDING_RULES_RESET_SECS, pickle.dumps(watch_status)
-            )
+        field = squad_field(team, squad_name)
+        with self.state_store.watch(field) as watch_status:
+            try:
+                yield watch_status
+            except NoSeedingViolation:
+                self.logger.debug(
+                    "Squad %s - %s no seeding violation, clearing state",
+                    team,
+                    squad_name,
+                )
+                self.state_store.delete(field)
 
     def get_message(
         self,
@@ -0,0 +1,215 @@
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from datetime import UTC, datetime
+
+import orjson
+import redis
+
+from rcon.automods.models import WatchStatus
+
+logger = logging.getLogger(__name__)
+
+
+def _encode_times(times: list[datetime]) -> list[int]:
+    return [round(t.timestamp() * 1000) for t in times]
+
+
+def _decode_times(times: list[int]) -> list[datetime]:
+    return [datetime.fromtimestamp(t / 1000, tz=UTC) for t in times]
+
+
+def dump_watch_status(watch_status: WatchStatus) -> bytes:
+    """Serialize a watch status, timestamps are stored as epoch milliseconds"""
+    payload = {}
+    if watch_status.offensive_points:
+        payload["o"] = dict(watch_status.offensive_points)
+    for short, steps in (
+        ("n", watch_status.noted),
+        ("w", watch_status.warned),
+        ("p", watch_status.punished),
+    ):
+        if steps:
+            payload[short] = {name: _encode_times(t) for name, t in steps.items()}
+    return orjson.dumps(payload)
+
+
+def load_watch_status(raw: bytes | str) -> WatchStatus:
+    payload = orjson.loads(raw)
+    return WatchStatus(
+        offensive_points=payload.get("o", {}),
+        noted={n: _decode_times(t) for n, t in payload.get("n", {}).items()},
+        warned={n: _decode_times(t) for n, t in payload.get("w", {}).items()},
+        punished={n: _decode_times(t) for n, t in payload.get("p", {}).items()},
+    )
+
+
+EMPTY_WATCH_STATUS = dump_watch_status(WatchStatus())
+
+
+def squad_field(team: str, squad_name: str) -> str:
+    return f"{team.lower()}:{str(squad_name).lower()}"
+
+
+def _text(value: bytes | str) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class WatchStateStore:
+    """The per squad watch states of an automod, kept in a single Redis hash
+
+    Within a `tick()` every state is loaded in one round trip, automods
+    mutate them in memory and the states that changed are written back in
+    one pipeline when the tick ends. A second hash records when each squad
+    was last watched so a state that has not been looked at for
+    `ttl_seconds` starts over, as the former per squad keys expired. That
+    time is only rewritten once it is a quarter of the TTL old, an
+    unchanged state being watched every tick costs no write at all.
+
+    Outside of a tick, `watch()` opens one for the single state it is used on.
+    """
+
+    def __init__(self, red: redis.StrictRedis, key: str, ttl_seconds: int):
+        self.red = red
+        self.key = key
+        self.seen_key = f"{key}:seen"
+        self.ttl_seconds = ttl_seconds
+        self.in_tick = False
+        self._reset()
+
+    def _reset(self):
+        self.raw: dict[str, bytes] = {}
+        self.last_seen: dict[str, float] = {}
+        self.states: dict[str, WatchStatus] = {}
+        self.touched: set[str] = set()
+        self.deleted: set[str] = set()
+
+    def load(self):
+        with self.red.pipeline(transaction=False) as pipe:
+            pipe.hgetall(self.key)
+            pipe.hgetall(self.seen_key)
+            raw, seen = pipe.execute()
+
+        self._reset()
+        expired_before = time.time() - self.ttl_seconds
+        last_seen = {_text(k): float(v) for k, v in seen.items()}
+        for field, value in raw.items():
+            field = _text(field)
+            if last_seen.get(field, 0) < expired_before:
+                self.deleted.add(field)
+            else:
+                self.raw[field] = value
+                self.last_seen[field] = last_seen[field]
+        self.deleted.update(f for f in last_seen if f not in self.raw)
+
+    def get(self, field: str) -> WatchStatus:
+        if field not in self.states:
+            raw = self.raw.get(field)
+            try:
+                self.states[field] = (
+                    load_watch_status(raw) if raw is not None else WatchStatus()
+                )
+            except (orjson.JSONDecodeError, TypeError, ValueError):
+                logger.warning(
+                    "Discarding unreadable watch state %s %s", self.key, field
+                )
+                self.states[field] = WatchStatus()
+        return self.states[field]
+
+    def peek(self, field: str) -> WatchStatus | None:
+        """The state of `field` if the squad is being watched, without loading it"""
+        if field in self.deleted:
+            return None
+        if field in self.states:
+            watch_status = self.states[field]
+            return None if watch_status == WatchStatus() else watch_status
+        if field in self.raw:
+            return self.get(field)
+        return None
+
+    def delete(self, field: str):
+        self.states.pop(field, None)
+        self.touched.discard(field)
+        if field in self.raw:
+            self.deleted.add(field)
+
+    def flush(self):
+        """Write the changed states back, refresh when the others were last seen"""
+        now = time.time()
+        refresh_before = now - self.ttl_seconds / 4
+        changed = {}
+        seen = []
+        for field in self.touched:
+            payload = dump_watch_status(self.states[field])
+            if payload == EMPTY_WATCH_STATUS and field not in self.raw:
+                continue
+            if payload != self.raw.get(field):
+                changed[field] = payload
+            if field in changed or self.last_seen.get(field, 0) < refresh_before:
+                seen.append(field)
+        deleted = self.deleted - self.touched
+
+        if not (seen or deleted):
+            self.touched.clear()
+            self.deleted.clear()
+            return
+
+        with self.red.pipeline(transaction=False) as pipe:
+            if changed:
+                pipe.hset(self.key, mapping=changed)
+            if deleted:
+                pipe.hdel(self.key, *deleted)
+                pipe.hdel(self.seen_key, *deleted)
+            if seen:
+                pipe.hset(self.seen_key, mapping=dict.fromkeys(seen, now))
+            pipe.expire(self.key, self.ttl_seconds)
+            pipe.expire(self.seen_key, self.ttl_seconds)
+            pipe.execute()
+
+        self.raw.update(changed)
+        self.last_seen.update(dict.fromkeys(seen, now))
+        for field in deleted:
+            self.raw.pop(field, None)
+            self.last_seen.pop(field, None)
+        self.touched.clear()
+        self.deleted.clear()
+
+    @contextmanager
+    def tick(self):
+        if self.in_tick:
+            yield self
+            return
+
+        self.load()
+        self.in_tick = True
+        try:
+            yield self
+        finally:
+            self.in_tick = False
+            self.flush()
+
+    @contextmanager
+    def watch(self, field: str):
+        """Yield the state of `field`, changes are dropped if the block raises"""
+        with self.tick():
+            watch_status = self.get(field)
+            snapshot = dump_watch_status(watch_status)
+            try:
+                yield watch_status
+            except BaseException:
+                if self.states.get(field) is watch_status:
+                    self.states[field] = load_watch_status(snapshot)
+                raise
+            if self.states.get(field) is watch_status:
+                self.touched.add(field)
+                self.deleted.discard(field)
+
+
+@contextmanager
+def watch_states_tick(moderators):
+    """Share one load and one write of the watch states across a tick"""
+    with ExitStack() as stack:
+        for mod in moderators:
+            if (store := getattr(mod, "state_store", None)) is not None:
+                stack.enter_context(store.tick())
+        yield
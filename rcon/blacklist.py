@@ -1,7 +1,7 @@
 import logging
 import os
 import struct
-from collections.abc import Sequence
+from collections.abc import Mapping, Sequence
 from datetime import UTC, datetime, timedelta
 from enum import IntEnum, auto
 from typing import Literal, overload
@@ -21,6 +21,7 @@ from rcon.barricade import (
 from rcon.cache_utils import get_redis_client
 from rcon.commands import HLLCommandFailedError
 from rcon.discord import dict_to_discord, send_to_discord_audit
+from rcon.expiry import ExpiryKind, cancel_expirations, schedule_expirations
 from rcon.models import (
     Blacklist,
     BlacklistRecord,
@@ -31,10 +32,12 @@ from rcon.models import (
 )
 from rcon.player_history import (
     _get_set_player,
+    immutable_unaccent,
     remove_accent,
     safe_save_player_action,
     unaccent,
 )
+from rcon.policy_index import invalidate_player_policies, refresh_player_policies
 from rcon.rcon import Rcon, get_rcon
 from rcon.types import (
     BlacklistRecordType,
@@ -81,6 +84,11 @@ def get_server_number_mask():
     return 1 << (server_number - 1)
 
 
+def targets_this_server(servers: int | None) -> bool:
+    """Whether a blacklist with the given server mask applies to this server"""
+    return servers is None or bool(servers & get_server_number_mask())
+
+
 def get_blacklists(sess: Session):
     return sess.scalars(select(Blacklist).order_by(Blacklist.id)).all()
 
@@ -207,7 +215,7 @@ def search_blacklist_records(
             or_(
                 unaccent(BlacklistRecord.reason).ilike(f"%{clean_reason}%"),
                 PlayerID.names.any(
-                    unaccent(PlayerName.name).ilike(f"%{clean_reason}%")
+                    immutable_unaccent(PlayerName.name).ilike(f"%{clean_reason}%")
                 ),
             )
         )
@@ -529,6 +537,7 @@ def add_record_to_blacklist(
         )
         sess.add(record)
         sess.commit()
+        refresh_player_policies([player_id], sess)
 
         res = record.to_dict()
 
@@ -585,6 +594,7 @@ def edit_record_from_blacklist(
             return old_record
 
         sess.commit()
+        refresh_player_policies([record.player.player_id], sess)
         new_record = record.to_dict()
 
         # Check whether there were any changes made which would require resyncing a ban
@@ -649,6 +659,7 @@ def remove_record_from_blacklist(record_id: int):
 
         sess.delete(record)
         sess.commit()
+        refresh_player_policies([res["player_id"]], sess)
 
         if not record.is_expired():
             BlacklistCommandHandler.send(
@@ -704,6 +715,8 @@ def edit_blacklist(
             return old_blacklist
 
         sess.commit()
+        # Every player on the list may be affected
+        invalidate_player_policies()
         new_blacklist = blacklist.to_dict()
 
         # Merge old and new mask
@@ -746,6 +759,7 @@ def delete_blacklist(blacklist_id: int):
             # worry about ban syncing and can just delete straight away.
             sess.delete(blacklist)
             sess.commit()
+            invalidate_player_policies()
             return True
 
         # Iterate over all records and extract all necessary details
@@ -767,6 +781,7 @@ def delete_blacklist(blacklist_id: int):
 
         sess.delete(blacklist)
         sess.commit()
+        invalidate_player_policies()
 
         BlacklistCommandHandler.send(
             BlacklistCommand(
@@ -834,6 +849,7 @@ def expire_all_player_blacklists(player_id: str):
                     servers = 2**32 - 1
                 server_mask |= servers
             sess.commit()
+            refresh_player_policies([player_id], sess)
 
         BlacklistCommandHandler.send(
             BlacklistCommand(
@@ -845,6 +861,88 @@ def expire_all_player_blacklists(player_id: str):
         )
 
 
+def get_record_expirations(sess: Session) -> dict[int, datetime]:
+    """Expiration of every active temporary record applying to this server"""
+    stmt = (
+        select(BlacklistRecord.id, BlacklistRecord.expires_at)
+        .join(BlacklistRecord.blacklist)
+        .filter(
+            BlacklistRecord.expires_at > func.now(),
+            or_(
+                Blacklist.servers.is_(None),
+                Blacklist.servers.bitwise_and(get_server_number_mask()) != 0,
+            ),
+        )
+    )
+    return dict(sess.execute(stmt).tuples())
+
+
+def _synchronize_removed_record(
+    rcon: Rcon, sess: Session, old_record: BlacklistRecordWithBlacklistType
+):
+    """Synchronize a player's ban after one of their records stopped applying"""
+    new_record = is_player_blacklisted(sess, player_id=old_record["player_id"])
+
+    if (
+        # Check whether the removed record had a higher priority
+        # than the current top record
+        new_record is None
+        or _is_higher_priority_record(
+            old_record["created_at"],
+            old_record["expires_at"],
+            new_record.created_at,
+            new_record.expires_at,
+        )
+    ):
+        synchronize_ban(
+            rcon,
+            player_id=old_record["player_id"],
+            new_record=new_record,
+            old_state=get_ban_state_from_record(old_record),
+        )
+
+
+def synchronize_expired_records(rcon: Rcon, expirations: Mapping[int, datetime]):
+    """Lift the bans of records that reached their scheduled expiration
+
+    expirations maps record IDs to the time they were scheduled to expire at.
+    Records that were extended are scheduled again, records that were expired
+    early or edited otherwise were already synchronized by the edit.
+    """
+    now = datetime.now(tz=UTC)
+    extended: dict[int, datetime] = {}
+    with enter_session() as sess:
+        records = sess.scalars(
+            select(BlacklistRecord).filter(BlacklistRecord.id.in_(expirations))
+        ).all()
+        for record in records:
+            if record.expires_at is None or not targets_this_server(
+                record.blacklist.servers
+            ):
+                continue
+            if record.expires_at > now:
+                extended[record.id] = record.expires_at
+                continue
+            if abs(record.expires_at - expirations[record.id]) > timedelta(seconds=1):
+                continue
+            if get_ban_state_from_record(record) == BanState.NONE:
+                # Nothing to lift for a kick only record
+                continue
+
+            logger.info(
+                "Blacklist record %s of %s expired", record.id, record.player.player_id
+            )
+            try:
+                _synchronize_removed_record(rcon, sess, record.to_dict())
+            except Exception:
+                logger.exception(
+                    "Failed to synchronize ban of expired record %s", record.id
+                )
+
+    if extended:
+        schedule_expirations(ExpiryKind.BLACKLIST_RECORD, extended)
+
+
 class BlacklistCommandType(IntEnum):
     CREATE_RECORD = auto()
     EDIT_RECORD = auto()
@@ -1010,6 +1108,12 @@ class BlacklistCommandHandler:
     def handle_create_record(self, payload: BlacklistCreateRecordCommand):
         """Handle a new record being created."""
         with enter_session() as sess:
+            record = get_record(sess, payload.record_id)
+            if record and record.expires_at:
+                schedule_expirations(
+                    ExpiryKind.BLACKLIST_RECORD, {record.id: record.expires_at}
+                )
+
             top_record = is_player_blacklisted(sess, player_id=payload.player_id)
 
             if top_record is None or top_record.id != payload.record_id:
@@ -1043,6 +1147,18 @@ class BlacklistCommandHandler:
         - record.blacklist.sync"""
         old_record = payload.old_record
         with enter_session() as sess:
+            record = get_record(sess, old_record["id"])
+            schedule_expirations(
+                ExpiryKind.BLACKLIST_RECORD,
+                {
+                    old_record["id"]: (
+                        record.expires_at
+                        if record and targets_this_server(record.blacklist.servers)
+                        else None
+                    )
+                },
+            )
+
             new_record = is_player_blacklisted(sess, player_id=old_record["player_id"])
 
             if not new_record:
@@ -1080,26 +1196,9 @@ class BlacklistCommandHandler:
         server.
         """
         old_record = payload.old_record
+        cancel_expirations(ExpiryKind.BLACKLIST_RECORD, [old_record["id"]])
         with enter_session() as sess:
-            new_record = is_player_blacklisted(sess, player_id=old_record["player_id"])
-
-            if (
-                # Check whether the removed record had a higher priority
-                # than the current top record
-                new_record is None
-                or _is_higher_priority_record(
-                    old_record["created_at"],
-                    old_record["expires_at"],
-                    new_record.created_at,
-                    new_record.expires_at,
-                )
-            ):
-                synchronize_ban(
-                    self.rcon,
-                    player_id=old_record["player_id"],
-                    new_record=new_record,
-                    old_state=get_ban_state_from_record(old_record),
-                )
+            _synchronize_removed_record(self.rcon, sess, old_record)
 
     def handle_edit_list(self, payload: BlacklistEditListCommand):
         """Handle a blacklist being edited.
@@ -1185,6 +1284,17 @@ class BlacklistCommandHandler:
 
         Note that if a player was only temporarily blacklisted but also had
         a permanent ban, that permanent ban will also be removed."""
+        with enter_session() as sess:
+            cancel_expirations(
+                ExpiryKind.BLACKLIST_RECORD,
+                [
+                    record.id
+                    for record in get_player_blacklist_records(
+                        sess, player_id=payload.player_id
+                    )
+                ],
+            )
+
         # Check if the player is temp-banned
         if next(
             (
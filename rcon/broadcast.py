@@ -4,7 +4,13 @@ import re
 import time
 
 from rcon.commands import HLLCommandFailedError
-from rcon.message_variables import format_message_string, populate_message_variables
+from rcon.message_variables import (
+    VOLATILE_MESSAGE_VARIABLES,
+    MessageVariableResolver,
+    format_message_string,
+    parse_message_variables,
+    populate_message_variables,
+)
 from rcon.types import MessageVariable
 from rcon.user_config.auto_broadcast import AutoBroadcastUserConfig
 from rcon.user_config.chat_commands import MESSAGE_VAR_RE
@@ -12,6 +18,8 @@ from rcon.user_config.chat_commands import MESSAGE_VAR_RE
 logger = logging.getLogger(__name__)
 
 CHECK_INTERVAL = 20
+# How long the data behind the message variables is reused between broadcasts
+SOURCES_MAX_AGE = 20
 
 subs = {
     "nextmap": MessageVariable.next_map,
@@ -39,12 +47,18 @@ subs = {
 }
 
 
-def format_message(ctl, msg):
+def expand_subs(msg: str) -> str:
+    """Replace the legacy auto broadcast variables by their message variable"""
     for sub, value in subs.items():
         msg = msg.replace(f"{{{sub}}}", f"{{{value.value}}}")
+    return msg
+
+
+def format_message(ctl, msg, resolver: MessageVariableResolver | None = None):
+    msg = expand_subs(msg)
     message_vars: list[str] = re.findall(MESSAGE_VAR_RE, msg)
     populated_variables = populate_message_variables(
-        vars=message_vars, player_id=None, rcon=ctl
+        vars=message_vars, player_id=None, rcon=ctl, resolver=resolver
     )
 
     try:
@@ -60,11 +74,56 @@ def format_message(ctl, msg):
         return msg
 
 
+class BroadcastRotation:
+    """The messages of an auto broadcast rotation, rendered ahead of time
+
+    The variables of every message are resolved together so each piece of
+    data is fetched once for the whole rotation. A message is rendered again
+    only when the data it uses changed, which is checked when the data is
+    older than `SOURCES_MAX_AGE` by the time the message is broadcast.
+    """
+
+    def __init__(
+        self, ctl, messages: list[str], resolver: MessageVariableResolver | None = None
+    ):
+        self.ctl = ctl
+        self.messages = messages
+        self.resolver = resolver or MessageVariableResolver(
+            ctl, max_age_seconds=SOURCES_MAX_AGE
+        )
+        self.templates = [expand_subs(msg) for msg in messages]
+        self.variables = [
+            parse_message_variables(re.findall(MESSAGE_VAR_RE, template))
+            for template in self.templates
+        ]
+        self.rendered: list[tuple[tuple, str] | None] = [None] * len(messages)
+
+    def prefetch(self):
+        self.resolver.prefetch(var for vars in self.variables for var in vars)
+
+    def render(self, index: int) -> str:
+        variables = self.variables[index]
+        self.resolver.prefetch(variables)
+        versions = self.resolver.source_versions(variables)
+        cached = self.rendered[index]
+        if (
+            cached is not None
+            and cached[0] == versions
+            and VOLATILE_MESSAGE_VARIABLES.isdisjoint(variables)
+        ):
+            return cached[1]
+
+        formatted = format_message(self.ctl, self.templates[index], self.resolver)
+        self.rendered[index] = (versions, formatted)
+        return formatted
+
+
 def run():
     # avoid circular import
     from rcon.rcon import get_rcon
 
     ctl = get_rcon()
+    rotation: BroadcastRotation | None = None
 
     while True:
         config = AutoBroadcastUserConfig.load_from_db()
@@ -75,15 +134,22 @@ def run():
             time.sleep(CHECK_INTERVAL)
             continue
 
+        messages = [msg.message for msg in config.messages]
+        if rotation is None or rotation.messages != messages:
+            rotation = BroadcastRotation(ctl, messages)
+        try:
+            rotation.prefetch()
+        except Exception:
+            logger.exception("Unable to fetch the auto broadcast message variables")
+
+        order = list(range(len(config.messages)))
         if config.randomize:
             logger.debug("Auto broadcasts. Radomizing")
-            random.shuffle(config.messages)
-
-        for msg in config.messages:
-            if not config.enabled:
-                break
+            random.shuffle(order)
 
-            formatted = format_message(ctl, msg.message)
+        for index in order:
+            msg = config.messages[index]
+            formatted = rotation.render(index)
             logger.debug("Broadcasting for %s seconds: %s", msg.time_sec, formatted)
             try:
                 ctl.set_broadcast(formatted)
@@ -0,0 +1,108 @@
+"""Rewrite the logs_history entries stored as JSON objects in the compact format.
+
+LogsHistory reads both formats, this only reclaims the memory of the entries
+cached before the compact format without waiting for them to be trimmed.
+"""
+
+import logging
+import os
+
+import redis
+
+from rcon.cache_migrations.redis_databases import (
+    populated_database_numbers,
+    redis_client_for_database,
+)
+from rcon.utils import encode_log_history_entry, logs_deserializer
+
+logger = logging.getLogger(__name__)
+
+LOGS_HISTORY_KEY = "logs_history"
+LOGS_HISTORY_MIGRATION_LOCK_KEY = "logs_history:migration_lock"
+LOGS_HISTORY_CHUNK_SIZE = 5000
+
+
+def _is_legacy_entry(raw: bytes) -> bool:
+    return raw.lstrip()[:1] == b"{"
+
+
+def migrate_logs_history(
+    client: redis.Redis, key: str = LOGS_HISTORY_KEY, max_retries: int = 3
+) -> int:
+    """Re-encode the legacy entries of one logs_history list, in place"""
+    with client.lock(
+        LOGS_HISTORY_MIGRATION_LOCK_KEY, timeout=120, blocking_timeout=120
+    ):
+        for attempt in range(max_retries):
+            try:
+                with client.pipeline() as pipe:
+                    pipe.watch(key)
+                    raw_items = pipe.lrange(key, 0, -1)
+                    legacy_count = sum(_is_legacy_entry(raw) for raw in raw_items)
+                    if not legacy_count:
+                        pipe.unwatch()
+                        return 0
+
+                    migrated_items = [
+                        encode_log_history_entry(logs_deserializer(raw))
+                        if _is_legacy_entry(raw)
+                        else raw
+                        for raw in raw_items
+                    ]
+                    pipe.multi()
+                    pipe.delete(key)
+                    for i in range(0, len(migrated_items), LOGS_HISTORY_CHUNK_SIZE):
+                        pipe.rpush(
+                            key, *migrated_items[i : i + LOGS_HISTORY_CHUNK_SIZE]
+                        )
+                    pipe.execute()
+
+                logger.info(
+                    "Migrated %d logs_history entries to the compact format",
+                    legacy_count,
+                )
+                return legacy_count
+            except redis.WatchError:
+                if attempt + 1 == max_retries:
+                    raise
+                logger.warning("logs_history changed during migration; retrying")
+
+    return 0
+
+
+def migrate_all_logs_histories(redis_url: str) -> tuple[int, int]:
+    """Migrate logs_history in every populated logical Redis database."""
+    discovery_client = redis.Redis.from_url(redis_url)
+    database_count = 0
+    entry_count = 0
+    try:
+        for database in populated_database_numbers(discovery_client):
+            client = redis_client_for_database(discovery_client, database)
+            try:
+                if not client.exists(LOGS_HISTORY_KEY):
+                    continue
+                database_count += 1
+                entry_count += migrate_logs_history(client)
+            finally:
+                client.close()
+    finally:
+        discovery_client.close()
+
+    logger.info(
+        "logs_history migration checked %d Redis database(s) and migrated %d entries",
+        database_count,
+        entry_count,
+    )
+    return database_count, entry_count
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    redis_url = os.environ.get("HLL_REDIS_URL")
+    if not redis_url:
+        raise RuntimeError("HLL_REDIS_URL is required to migrate logs_history")
+    migrate_all_logs_histories(redis_url)
+
+
+if __name__ == "__main__":
+    main()
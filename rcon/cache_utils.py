@@ -1,17 +1,32 @@
 import functools
 import logging
+import marshal
 import os
 import pickle
 import time
 import uuid
+import zlib
 from collections.abc import Callable
 from contextlib import contextmanager
+from typing import Any
 
+import orjson
 import redis
+import redis.asyncio
 import redis.exceptions
 import simplejson
 from cachetools.func import ttl_cache as cachetools_ttl_cache
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
 logger = logging.getLogger(__name__)
 
 _REDIS_POOL = None
@@ -19,8 +34,128 @@ _REDIS_POOL = None
 _GLOBAL_REDIS_POOL = None
 
 
+# Protocol 2+ pickles start with the PROTO opcode, cache values written before
+# the codec have no header and are read as plain pickles
+PICKLE_PROTO = 0x80
+CACHE_CODEC_VERSION = 1
+
+CACHE_ENCODING_JSON = ord("j")
+CACHE_ENCODING_PICKLE = ord("p")
+
+CACHE_COMPRESSION_NONE = ord("-")
+CACHE_COMPRESSION_ZLIB = ord("z")
+CACHE_COMPRESSION_ZSTD = ord("s")
+CACHE_COMPRESSION_LZ4 = ord("l")
+
+_ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME
+    | orjson.OPT_PASSTHROUGH_SUBCLASS
+    | orjson.OPT_PASSTHROUGH_DATACLASS
+)
+
+
+def _not_json(value: Any):
+    raise TypeError(f"{type(value).__name__} is not stored as JSON")
+
+
+def _compressors() -> dict[int, tuple[Callable, Callable]]:
+    compressors = {
+        CACHE_COMPRESSION_ZLIB: (
+            functools.partial(zlib.compress, level=1),
+            zlib.decompress,
+        )
+    }
+    if lz4 is not None:
+        compressors[CACHE_COMPRESSION_LZ4] = (lz4.frame.compress, lz4.frame.decompress)
+    if zstandard is not None:
+        compressors[CACHE_COMPRESSION_ZSTD] = (
+            zstandard.ZstdCompressor(level=1).compress,
+            zstandard.ZstdDecompressor().decompress,
+        )
+    return compressors
+
+
+class CacheCodec:
+    """Serialize cached values behind a small versioned header
+
+    The header is the codec version, the encoding and the compression of the
+    payload. Values only made of builtin JSON types (dicts with str keys, lists
+    and tuples, str, numbers, bools and None) are stored as JSON, tuples being
+    read back as lists. Anything else, like enums, datetimes or models, is
+    still pickled. Payloads larger than
+    `compress_above` bytes are compressed with the fastest compressor
+    available, zstd then lz4 then zlib.
+    """
+
+    def __init__(self, compress_above: int = 4096, compression: int | None = None):
+        self.compress_above = compress_above
+        self.compressors = _compressors()
+        if compression is None:
+            compression = next(
+                c
+                for c in (
+                    CACHE_COMPRESSION_ZSTD,
+                    CACHE_COMPRESSION_LZ4,
+                    CACHE_COMPRESSION_ZLIB,
+                )
+                if c in self.compressors
+            )
+        self.compression = compression
+
+    @staticmethod
+    def _encode(value: Any) -> tuple[int, bytes]:
+        try:
+            payload = orjson.dumps(value, default=_not_json, option=_ORJSON_OPTIONS)
+            # orjson encodes enums and UUIDs as their plain values, marshal only
+            # accepts the exact builtin types
+            marshal.dumps(value)
+            return CACHE_ENCODING_JSON, payload
+        except (TypeError, ValueError):
+            pass
+        return CACHE_ENCODING_PICKLE, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def dumps(self, value: Any) -> bytes:
+        encoding, payload = self._encode(value)
+        compression = CACHE_COMPRESSION_NONE
+        if len(payload) > self.compress_above:
+            compression = self.compression
+            payload = self.compressors[compression][0](payload)
+        return bytes((CACHE_CODEC_VERSION, encoding, compression)) + payload
+
+    def loads(self, data: bytes) -> Any:
+        if data[0] == PICKLE_PROTO:
+            return pickle.loads(data)
+        if data[0] != CACHE_CODEC_VERSION:
+            raise ValueError(f"Unknown cache codec version {data[0]}")
+
+        encoding, compression = data[1], data[2]
+        payload = memoryview(data)[3:]
+        if compression != CACHE_COMPRESSION_NONE:
+            try:
+                payload = self.compressors[compression][1](payload)
+            except KeyError:
+                raise ValueError(
+                    f"Compression {chr(compression)!r} is not available"
+                ) from None
+        if encoding == CACHE_ENCODING_JSON:
+            return orjson.loads(payload)
+        return pickle.loads(payload)
+
+
+DEFAULT_CACHE_CODEC = CacheCodec()
+
+
 class RedisCached:
+    """Cache the results of a function in Redis
+
+    Every cached value is stamped with the generation of its function, reading
+    it is a single MGET of the value and of the current generation. Invalidating
+    every cached value of a function is then a single INCR of its generation,
+    the stale values are ignored until they expire or are overwritten.
+    """
+
     PREFIX = "cached_"
+    GENERATION_PREFIX = "cache_generation_"
 
     def __init__(
         self,
@@ -33,6 +168,7 @@ class RedisCached:
         cache_falsy=True,
         serializer=simplejson.dumps,
         deserializer=simplejson.loads,
+        key_serializer=None,
     ):
         # TODO: isinstance check ttl_seconds it must be an int
         # not a float or anything else
@@ -47,6 +183,7 @@ class RedisCached:
         self.function_cache_unavailable = function_cache_unavailable
         self.serializer = serializer
         self.deserializer = deserializer
+        self.key_serializer = key_serializer or serializer
         self.ttl_seconds = ttl_seconds
         self.is_method = is_method
         self.cache_falsy = cache_falsy
@@ -64,10 +201,38 @@ class RedisCached:
     def key_prefix(self):
         return f"{self.PREFIX}{self.function.__qualname__}"
 
+    @property
+    def generation_key(self):
+        return f"{self.GENERATION_PREFIX}{self.function.__qualname__}"
+
+    @staticmethod
+    def _stamp(generation: int, value: bytes | str) -> bytes | str:
+        if isinstance(value, bytes):
+            return b"%d|" % generation + value
+        return f"{generation}|{value}"
+
+    @staticmethod
+    def _unstamp(stamped: bytes | str | None, generation: int) -> bytes | str | None:
+        """Return the cached value if it belongs to the current generation"""
+        if stamped is None:
+            return None
+        separator = b"|" if isinstance(stamped, bytes) else "|"
+        stamp, _, value = stamped.partition(separator)
+        # Values cached before generations were introduced have no valid stamp
+        if not stamp.isdigit() or int(stamp) != generation:
+            return None
+        return value
+
+    def _get(self, key) -> tuple[bytes | str | None, int]:
+        """Return the cached value (if current) and the current generation"""
+        stamped, generation = self.red.mget(key, self.generation_key)
+        generation = int(generation or 0)
+        return self._unstamp(stamped, generation), generation
+
     def key(self, *args, **kwargs):
         if self.is_method:
             args = args[1:]
-        params = self.serializer({"args": args, "kwargs": kwargs})
+        params = self.key_serializer({"args": args, "kwargs": kwargs})
         if isinstance(params, bytes):
             return self.key_prefix.encode() + b"__" + params
         return f"{self.key_prefix}__{params}"
@@ -107,9 +272,10 @@ class RedisCached:
         lock_acquired = False
         cache_available = True
         refresh_without_lock = False
+        generation = 0
         func = self.function
         try:
-            val = self.red.get(key)
+            val, generation = self._get(key)
         except redis.exceptions.RedisError:
             cache_available = False
             logger.exception("Unable to use cache")
@@ -143,7 +309,7 @@ class RedisCached:
             while time.monotonic() < deadline:
                 time.sleep(0.05)
                 try:
-                    val = self.red.get(key)
+                    val, _ = self._get(key)
                 except redis.exceptions.RedisError:
                     logger.exception("Unable to use cache while waiting for refresh")
                     break
@@ -157,8 +323,12 @@ class RedisCached:
                 logger.debug("Caching falsy result is disabled for %s", self.__name__)
                 return val
 
+            # Stamped with the generation read before calling the function, the value
+            # is already stale if the cache was invalidated in the meantime
             try:
-                self.red.setex(key, self.ttl_seconds, self.serializer(val))
+                self.red.setex(
+                    key, self.ttl_seconds, self._stamp(generation, self.serializer(val))
+                )
                 # logger.debug("Cache SET for %s", self.key(*args, **kwargs))
             except redis.exceptions.RedisError:
                 logger.exception("Unable to set cache")
@@ -173,7 +343,8 @@ class RedisCached:
             key = self.key(None, *args, **kwargs)
         else:
             key = self.key(*args, **kwargs)
-        return self.red.get(key)
+        val, _ = self._get(key)
+        return val
 
     def clear_for(self, *args, **kwargs):
         if self.is_method:
@@ -186,13 +357,9 @@ class RedisCached:
 
     def clear_all(self):
         try:
-            keys = list(self.red.scan_iter(match=f"{self.key_prefix}*"))
-            if keys:
-                self.red.delete(*keys)
+            self.red.incr(self.generation_key)
         except redis.exceptions.RedisError:
             logger.exception("Unable to clear cache")
-        # else:
-        #   logger.debug("Cache CLEARED for %s", keys)
 
 
 def construct_redis_url(db_number: int = 0) -> str:
@@ -258,12 +425,20 @@ def get_redis_client(
     return redis.Redis(connection_pool=pool)
 
 
+def get_async_redis_client(redis_url: str | None = None) -> redis.asyncio.Redis:
+    """A client for async code, its pool belongs to the running event loop"""
+    if redis_url is None:
+        redis_url = os.getenv("HLL_REDIS_URL")
+    return redis.asyncio.Redis.from_url(redis_url, socket_connect_timeout=5)
+
+
 def ttl_cache(
     ttl,
     *args,
     is_method=True,
     cache_falsy=True,
     function_cache_unavailable=None,
+    codec: CacheCodec = DEFAULT_CACHE_CODEC,
     **kwargs,
 ):
     pool = get_redis_pool(decode_responses=False)
@@ -289,8 +464,10 @@ def ttl_cache(
             function_cache_unavailable=function_cache_unavailable,
             is_method=is_method,
             cache_falsy=cache_falsy,
-            serializer=pickle.dumps,
-            deserializer=pickle.loads,
+            serializer=codec.dumps,
+            deserializer=codec.loads,
+            # Keys stay pickled so values cached before the codec are still found
+            key_serializer=pickle.dumps,
         )
 
         def wrapper(*args, **kwargs):
@@ -307,10 +484,29 @@ def ttl_cache(
     return decorator
 
 
+def clear_caches(*cached_funcs):
+    """Invalidate the caches of several functions, with one round trip per Redis pool"""
+    by_pool: dict[redis.ConnectionPool, list[RedisCached]] = {}
+    for f in cached_funcs:
+        cached = getattr(f, "cache", None)
+        if isinstance(cached, RedisCached):
+            by_pool.setdefault(cached.red.connection_pool, []).append(cached)
+        else:
+            # In memory cache (see ttl_cache)
+            f.cache_clear()
+
+    for caches in by_pool.values():
+        try:
+            with caches[0].red.pipeline(transaction=False) as pipe:
+                for cached in caches:
+                    pipe.incr(cached.generation_key)
+                pipe.execute()
+        except redis.exceptions.RedisError:
+            logger.exception("Unable to clear caches")
+
+
 @contextmanager
 def invalidates(*cached_funcs):
-    for f in cached_funcs:
-        f.cache_clear()
+    clear_caches(*cached_funcs)
     yield None
-    for f in cached_funcs:
-        f.cache_clear()
+    clear_caches(*cached_funcs)
@@ -10,7 +10,7 @@ import pydantic
 from sqlalchemy import func as pg_func
 from sqlalchemy import select, text
 
-import rcon.expiring_vips.service
+import rcon.expiry_service
 import rcon.seed_vip.service
 import rcon.user_config
 import rcon.user_config.utils
@@ -20,10 +20,12 @@ from rcon.automods import automod
 from rcon.blacklist import BlacklistCommandHandler
 from rcon.cache_utils import RedisCached, get_redis_pool, invalidates
 from rcon.discord_chat import get_handler
+from rcon.logs import partitions
 from rcon.logs.loop import LogLoop, load_generic_hooks
 from rcon.logs.recorder import LogRecorder
 from rcon.logs.stream import LogStream
 from rcon.models import PlayerID, enter_session, install_unaccent
+from rcon.player_identity import get_player_identity
 from rcon.player_stats import live_stats_loop
 from rcon.rcon import get_rcon
 from rcon.steam_utils import enrich_db_users
@@ -113,9 +115,15 @@ def run_routines():
     routines.run()
 
 
+@cli.command(name="expiry_scheduler")
+def run_expiry_scheduler():
+    rcon.expiry_service.run()
+
+
 @cli.command(name="expiring_vips")
 def run_expiring_vips():
-    rcon.expiring_vips.service.run()
+    """Deprecated name of expiry_scheduler"""
+    rcon.expiry_service.run()
 
 
 @cli.command(name="seed_vip")
@@ -232,12 +240,20 @@ def do_print(func):
     default=False,
     help="Set this flag if you want the existing stats to be overriden. Otherwise they will just log an error and we move on to the next",
 )
-def process_games(start_day_offset, end_day_offset=0, force=False):
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=4,
+    show_default=True,
+    help="The number of games processed in parallel. Each worker holds its own database connection",
+)
+def process_games(start_day_offset, end_day_offset=0, force=False, workers=4):
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
     from sqlalchemy import and_
-    from sqlalchemy.exc import IntegrityError
 
-    from rcon.models import Maps, enter_session
-    from rcon.workers import record_stats_from_map
+    from rcon.models import Maps, enter_session, get_engine
+    from rcon.workers import reprocess_map_stats
 
     start_date = datetime.now(tz=UTC) - timedelta(days=start_day_offset)
     start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -246,27 +262,34 @@ def process_games(start_day_offset, end_day_offset=0, force=False):
 
     print("Reprocessing date range: ", start_date, end_date)
     with enter_session() as sess:
-        all_maps = (
-            sess.query(Maps)
+        map_ids = [
+            map_id
+            for (map_id,) in sess.query(Maps.id)
             .filter(and_(Maps.start > start_date, Maps.start < end_date))
-            .all()
-        )
-        print(f"Found {len(all_maps)} games to reprocess")
-        for map_ in all_maps:
-            print("Reprocessing map: ", map_.to_dict())
+            .order_by(Maps.start)
+        ]
+    print(f"Found {len(map_ids)} games to reprocess")
+
+    # Connections must not be shared with the forked worker processes
+    get_engine().dispose()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(reprocess_map_stats, map_id, force): map_id
+            for map_id in map_ids
+        }
+        for future in as_completed(futures):
+            map_id = futures[future]
             try:
-                # TODO we could attempt to find the temporary cached stats in redis for the match
-                record_stats_from_map(sess, map_, None, force=force)
-                sess.commit()
-                print("Done")
-            except IntegrityError as e:
-                sess.rollback()
-                # logger.exception("Failed")
+                error = future.result()
+            except Exception as e:
+                error = repr(e)
+            if error:
                 print(
-                    "Can't re-process stats. Probably already exist. Set force flag to override. Error msg: ",
-                    repr(e),
+                    f"Can't re-process stats for map {map_id}. Set force flag to override. Error msg: ",
+                    error,
                 )
                 continue
+            print(f"Done reprocessing map {map_id}")
 
 
 def _models_to_exclude():
@@ -607,6 +630,9 @@ def _merge_duplicate_player_ids(existing_ids: set[str] | None = None):
             session.execute(
                 text("DELETE FROM steam_id_64 WHERE id = ANY(:ids)"), {"ids": ids}
             )
+    if duplicate_players:
+        # The merged rows may still be cached by the running services
+        get_player_identity().forget_all()
     logger.info("Duplicate player ID merge complete")
 
 
@@ -639,6 +665,9 @@ def convert_win_player_ids():
 
         logger.info(f"Converted {updated} player IDs")
 
+    if updated:
+        get_player_identity().forget_all()
+
     if player_ids_to_merge:
         logger.info(
             f"{len(player_ids_to_merge)} old style player IDs already existed, merging them"
@@ -684,6 +713,24 @@ def clear_maps_cache():
     ctl.get_map_sequence.cache_clear()
 
 
+@cli.command(name="maintain_log_partitions")
+@click.option(
+    "--retention-months",
+    type=click.IntRange(min=0),
+    default=None,
+    help="Full months of log lines to keep, 0 keeps everything (defaults to HLL_LOG_LINES_RETENTION_MONTHS)",
+)
+@click.option(
+    "--drop/--archive",
+    default=None,
+    help="Drop expired partitions instead of keeping them as archive tables (defaults to HLL_LOG_LINES_DROP_EXPIRED)",
+)
+def maintain_log_partitions(retention_months: int | None, drop: bool | None):
+    created, detached = partitions.maintain_partitions(retention_months, drop)
+    print(f"Created partitions: {created}")
+    print(f"Detached partitions: {detached}")
+
+
 PREFIXES_TO_EXPOSE = ["get_", "set_", "do_"]
 EXCLUDED: set[str] = {"set_map_rotation", "connection_pool"}
 
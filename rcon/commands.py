@@ -350,6 +350,21 @@ class ServerCtl:
             "GetServerInformation", 2, {"Name": "players", "Value": ""}
         ).content_dict["players"]
 
+    def get_players_and_vips(self) -> tuple[list[PlayerInfoType], list[VipId]]:
+        """The info of every connected player and the VIP list
+
+        Both commands are sent before the responses are read.
+        """
+        players = self.send("GetServerInformation", 2, {"Name": "players", "Value": ""})
+        vips = self.send("GetServerInformation", 2, {"Name": "vipplayers", "Value": ""})
+        return (
+            self.receive(players).content_dict["players"],
+            [
+                VipId(player_id=vip["iD"], name=vip["comment"])
+                for vip in self.receive(vips).content_dict["vipPlayers"]
+            ],
+        )
+
     # TODO: HLLV: Update response type and everything that depends on it
     def get_player_info(self, player_id: str) -> PlayerInfoType | None:
         return self.exchange(
@@ -662,6 +677,39 @@ class ServerCtl:
     def remove_vip(self, player_id) -> bool:
         return self.exchange_success("RemoveVip", 2, {"PlayerId": player_id})
 
+    def bulk_add_vips(self, vips: Sequence[tuple[str, str]]) -> dict[str, bool]:
+        """Add (player_id, description) VIPs, returns whether each one succeeded
+
+        Every command is sent before the responses are read.
+        """
+        handles = [
+            (
+                player_id,
+                self.send(
+                    "AddVip",
+                    2,
+                    {"PlayerId": player_id, "Comment": escape_string(description)},
+                ),
+            )
+            for player_id, description in vips
+        ]
+        return {
+            player_id: self.receive_success(handle) for player_id, handle in handles
+        }
+
+    def bulk_remove_vips(self, player_ids: Sequence[str]) -> dict[str, bool]:
+        """Remove VIPs, returns whether each one succeeded
+
+        Every command is sent before the responses are read.
+        """
+        handles = [
+            (player_id, self.send("RemoveVip", 2, {"PlayerId": player_id}))
+            for player_id in player_ids
+        ]
+        return {
+            player_id: self.receive_success(handle) for player_id, handle in handles
+        }
+
     @_escape_params
     def message_player(self, player_id: str, message: str) -> bool:
         return self.exchange_success(
@@ -1,5 +1,5 @@
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
 import pytz
 
@@ -37,6 +37,30 @@ METRICS = {
 }
 
 
+class Metrics:
+    """The metrics of a single evaluation, each one is fetched at most once"""
+
+    def __init__(self, **metric_sources):
+        self.sources = metric_sources
+        self.values = {}
+
+    def get(self, metric_name: str, metric_source: str | None):
+        key = (metric_name, metric_source)
+        if key not in self.values:
+            args = [] if metric_source is None else [self.sources[metric_source]]
+            self.values[key] = METRICS[metric_name](*args)
+        return self.values[key]
+
+
+def evaluate_conditions(
+    conditions: list["Condition"], metrics: Metrics | None = None, **metric_sources
+) -> bool:
+    """Whether all the conditions are met, sharing their metrics"""
+    metrics = metrics or Metrics(**metric_sources)
+    metric_sources = metrics.sources | metric_sources
+    return all(c.is_valid(metrics=metrics, **metric_sources) for c in conditions)
+
+
 def create_condition(name, **kwargs):
     kwargs["inverse"] = kwargs.get("not", False)  # Using "not" would cause issues later
     if name == "player_count":
@@ -73,11 +97,14 @@ class Condition:
         except:  # noqa
             return None
 
+    def get_metric(self, metric_sources: dict):
+        metrics: Metrics | None = metric_sources.get("metrics")
+        if metrics is None:
+            metrics = Metrics(**metric_sources)
+        return metrics.get(self.metric_name, self.metric_source)
+
     def is_valid(self, **metric_sources):
-        metric_source = []
-        if self.metric_source is not None:
-            metric_source.append(metric_sources[self.metric_source])
-        comparand = self.metric_getter(*metric_source)
+        comparand = self.get_metric(metric_sources)
         res = self.min <= comparand <= self.max
         logger.info(
             "Applying condition %s: %s <= %s <= %s = %s. Inverse: %s",
@@ -99,6 +126,11 @@ class PlayerCountCondition(Condition):
         super().__init__(*args, **kwargs)
         self.metric_name = "player_count"
 
+    @property
+    def boundaries(self) -> tuple[int, int]:
+        """The player counts at which the condition changes"""
+        return self.min, self.max + 1
+
 
 class OnlineModsCondition(Condition):
     def __init__(self, *args, **kwargs):
@@ -120,8 +152,7 @@ class ListCondition(Condition):
         self.values = []
 
     def is_valid(self, **metric_sources):
-        metric_source = metric_sources[self.metric_source]
-        comparand = self.metric_getter(metric_source)
+        comparand = self.get_metric(metric_sources)
         res = comparand in self.values
         logger.info(
             "Applying condition %s: %s in %s = %s. Inverse: %s",
@@ -156,7 +187,7 @@ class PlayerFlagCondition(Condition):
         metric_source = metric_sources[self.metric_source]
         if metric_source is None:
             return False
-        comparand = self.metric_getter(metric_source)
+        comparand = self.get_metric(metric_sources)
         res = False
         for c in comparand:
             if res := c in self.flags:
@@ -221,3 +252,26 @@ class TimeOfDayCondition(Condition):
             return not res
         else:
             return res
+
+    def next_boundary(self, now: datetime | None = None) -> datetime | None:
+        """The next time the condition can change, None if it is invalid"""
+        try:
+            min_h, min_m = [int(i) for i in self.min.split(":")[:2]]
+            max_h, max_m = [int(i) for i in self.max.split(":")[:2]]
+        except Exception:
+            return None
+
+        now = (now or datetime.now(tz=self.tz)).astimezone(self.tz)
+        boundaries = []
+        # The condition compares hours and minutes, it stops holding a minute after max
+        for hour, minute, shift in ((min_h, min_m, 0), (max_h, max_m, 1)):
+            try:
+                at = now.replace(
+                    hour=hour, minute=minute, second=0, microsecond=0
+                ) + timedelta(minutes=shift)
+            except ValueError:
+                return None
+            while at <= now:
+                at += timedelta(days=1)
+            boundaries.append(at)
+        return min(boundaries)
@@ -1,35 +1,45 @@
 import logging
-import time
+from collections.abc import Iterable
 from datetime import UTC, datetime, timedelta
 
 from pydantic import HttpUrl
+from sqlalchemy.orm import Session
 
 from rcon.discord import send_to_discord_audit
 from rcon.models import PlayerID, PlayerVIP, enter_session
-from rcon.rcon import Rcon, get_rcon
-from rcon.user_config.expired_vips import ExpiredVipsUserConfig
+from rcon.rcon import Rcon
 from rcon.utils import INDEFINITE_VIP_DATE, get_server_number
+from rcon.vip_reconciliation import reconcile_vips
 
 SERVICE_NAME = "ExpiringVIPs"
 logger = logging.getLogger(__name__)
 
 
-def remove_expired_vips(rcon_hook: Rcon, webhook_url: HttpUrl | None = None):
+def remove_expired_vips(
+    rcon_hook: Rcon,
+    webhook_url: HttpUrl | None = None,
+    player_ids: Iterable[str] | None = None,
+):
+    """Remove the expired VIPs, only among player_ids if given
+
+    Without player_ids every VIP is checked and the VIPs without an
+    expiration record get an indefinite one.
+    """
     logger.info("Checking for expired VIPs")
 
     count = 0
     server_number = get_server_number()
     with enter_session() as session:
-        expired_vips: list[PlayerVIP] = (
-            session.query(PlayerVIP)
-            .filter(
-                PlayerVIP.server_number == server_number,
-                PlayerVIP.expiration < datetime.now(tz=UTC),
-            )
-            .all()
+        query = session.query(PlayerVIP).filter(
+            PlayerVIP.server_number == server_number,
+            PlayerVIP.expiration < datetime.now(tz=UTC),
         )
+        if player_ids is not None:
+            query = query.join(PlayerVIP.player).filter(
+                PlayerID.player_id.in_(list(player_ids))
+            )
+        expired_vips: list[PlayerVIP] = query.all()
 
-        count = len(expired_vips)
         for vip in expired_vips:
             name: str
             try:
@@ -50,67 +60,17 @@ def remove_expired_vips(rcon_hook: Rcon, webhook_url: HttpUrl | None = None):
                 by=SERVICE_NAME,
                 webhookurls=webhookurls,
             )
-            rcon_hook.remove_vip(vip.player.player_id)
-
-        # Look for anyone with VIP but without a record and create one for them
-        vip_ids = rcon_hook.get_vip_ids()
-        missing_expiration_records = []
-        for player in vip_ids:
-            player_expiration: datetime | None = player["vip_expiration"]
-            if player_expiration is None:
-                missing_expiration_records.append(player)
-            # Find any old style records that had a floating creation date + 200 year expiration
-            # so they get changed to the new fixed UTC 3000-01-01 datetime
-            elif (
-                player_expiration
-                and player_expiration >= datetime.now(UTC) + timedelta(days=365 * 100)
-                and player_expiration.year < 3000
-            ):
-                missing_expiration_records.append(player)
-                logger.info(
-                    "Correcting old style expiration date for %s", player["player_id"]
-                )
 
-        for raw_player in missing_expiration_records:
-            player: PlayerID = (
-                session.query(PlayerID)
-                .filter(PlayerID.player_id == raw_player["player_id"])
-                .one_or_none()
+        if expired_vips:
+            result = reconcile_vips(
+                rcon_hook, [], remove=[vip.player.player_id for vip in expired_vips]
             )
+            count = len(result["removed"])
+            for error in result["errors"]:
+                logger.error(error)
 
-            if player:
-                expiration_date = INDEFINITE_VIP_DATE
-                vip_record = (
-                    session.query(PlayerVIP)
-                    .filter(
-                        PlayerVIP.player_id_id == player.id,
-                        PlayerVIP.server_number == get_server_number(),
-                    )
-                    .one_or_none()
-                )
-
-                if vip_record:
-                    vip_record.expiration = expiration_date
-                else:
-                    vip_record = PlayerVIP(
-                        expiration=expiration_date,
-                        player_id_id=player.id,
-                        server_number=server_number,
-                    )
-                    session.add(vip_record)
-
-                try:
-                    name = player.names[0].name
-                except IndexError:
-                    name = "No name found"
-
-                logger.info(
-                    f"Creating missing VIP expiration (indefinite) record for {name} / {player.player_id}"
-                )
-            else:
-                logger.info(
-                    f"{raw_player['player_id']} has VIP on the server but does not have a PlayerSteamID record."
-                )
+        if player_ids is None:
+            _create_missing_vip_records(rcon_hook, session, server_number)
 
     if count > 0:
         logger.info(f"Removed VIP from {count} player(s)")
@@ -118,17 +78,63 @@ def remove_expired_vips(rcon_hook: Rcon, webhook_url: HttpUrl | None = None):
         logger.info("No expired VIPs found")
 
 
-def run():
-    rcon_hook = get_rcon()
+def _create_missing_vip_records(rcon_hook: Rcon, session: Session, server_number: int):
+    # Look for anyone with VIP but without a record and create one for them
+    vip_ids = rcon_hook.get_vip_ids()
+    missing_expiration_records = []
+    for player in vip_ids:
+        player_expiration: datetime | None = player["vip_expiration"]
+        if player_expiration is None:
+            missing_expiration_records.append(player)
+        # Find any old style records that had a floating creation date + 200 year expiration
+        # so they get changed to the new fixed UTC 3000-01-01 datetime
+        elif (
+            player_expiration
+            and player_expiration >= datetime.now(UTC) + timedelta(days=365 * 100)
+            and player_expiration.year < 3000
+        ):
+            missing_expiration_records.append(player)
+            logger.info(
+                "Correcting old style expiration date for %s", player["player_id"]
+            )
 
-    while True:
-        config = ExpiredVipsUserConfig.load_from_db()
+    for raw_player in missing_expiration_records:
+        player: PlayerID = (
+            session.query(PlayerID)
+            .filter(PlayerID.player_id == raw_player["player_id"])
+            .one_or_none()
+        )
 
-        if config.enabled:
-            remove_expired_vips(rcon_hook, config.discord_webhook_url)
+        if player:
+            expiration_date = INDEFINITE_VIP_DATE
+            vip_record = (
+                session.query(PlayerVIP)
+                .filter(
+                    PlayerVIP.player_id_id == player.id,
+                    PlayerVIP.server_number == get_server_number(),
+                )
+                .one_or_none()
+            )
 
-        time.sleep(config.interval_minutes * 60)
+            if vip_record:
+                vip_record.expiration = expiration_date
+            else:
+                vip_record = PlayerVIP(
+                    expiration=expiration_date,
+                    player_id_id=player.id,
+                    server_number=server_number,
+                )
+                session.add(vip_record)
 
+            try:
+                name = player.names[0].name
+            except IndexError:
+                name = "No name found"
 
-if __name__ == "__main__":
-    run()
+            logger.info(
+                f"Creating missing VIP expiration (indefinite) record for {name} / {player.player_id}"
+            )
+        else:
+            logger.info(
+                f"{raw_player['player_id']} has VIP on the server but does not have a PlayerSteamID record."
+            )
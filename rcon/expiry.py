@@ -0,0 +1,219 @@
+"""Shared schedule of everything that expires at a known time.
+
+VIPs, temporary blacklist records and watch_killrate report cooldowns are kept
+in a Redis sorted set per server, scored by the timestamp they expire at. Every
+write path schedules (or cancels) the expiration of what it writes, so the
+expiry service (rcon.expiry_service) can sleep exactly until the next entry is
+due instead of scanning the database on an interval.
+"""
+
+import logging
+from collections.abc import Iterable, Mapping
+from datetime import UTC, datetime
+from enum import StrEnum
+from typing import NamedTuple, Optional
+
+import redis
+import redis.exceptions
+
+from rcon.cache_utils import get_redis_client
+from rcon.utils import INDEFINITE_VIP_DATE, get_server_number
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER: Optional["ExpiryScheduler"] = None
+
+
+class ExpiryKind(StrEnum):
+    VIP = "vip"
+    BLACKLIST_RECORD = "blacklist_record"
+    KILLRATE_COOLDOWN = "killrate_cooldown"
+
+
+class DueEntry(NamedTuple):
+    kind: ExpiryKind
+    entity_id: str
+    expires_at: datetime
+
+
+def _timestamp(value: datetime) -> float:
+    # Naive datetimes are UTC everywhere in the database
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.timestamp()
+
+
+def _member(kind: ExpiryKind, entity_id: str | int) -> str:
+    return f"{kind}:{entity_id}"
+
+
+class ExpiryScheduler:
+    KEY = "expiry_schedule"
+    WAKEUP_KEY = "expiry_schedule_wakeup"
+
+    def __init__(
+        self, red: redis.Redis | None = None, server_number: int | None = None
+    ):
+        self.red = red or get_redis_client()
+        server_number = server_number or get_server_number()
+        self.key = f"{self.KEY}:{server_number}"
+        self.wakeup_key = f"{self.WAKEUP_KEY}:{server_number}"
+
+    def schedule(
+        self, kind: ExpiryKind, entity_id: str | int, expires_at: datetime | None
+    ):
+        """Schedule an expiration, None cancels it"""
+        self.schedule_many(kind, {entity_id: expires_at})
+
+    def schedule_many(
+        self, kind: ExpiryKind, expirations: Mapping[str | int, datetime | None]
+    ):
+        scheduled = {
+            _member(kind, entity_id): _timestamp(expires_at)
+            for entity_id, expires_at in expirations.items()
+            if expires_at is not None
+        }
+        cancelled = [
+            _member(kind, entity_id)
+            for entity_id, expires_at in expirations.items()
+            if expires_at is None
+        ]
+        if not scheduled and not cancelled:
+            return
+
+        try:
+            with self.red.pipeline(transaction=False) as pipe:
+                if scheduled:
+                    pipe.zadd(self.key, scheduled)
+                    # The service may be sleeping past the new entry
+                    pipe.lpush(self.wakeup_key, 1)
+                    pipe.ltrim(self.wakeup_key, 0, 0)
+                if cancelled:
+                    pipe.zrem(self.key, *cancelled)
+                pipe.execute()
+        except redis.exceptions.RedisError:
+            # The periodic sweeps of the expiry service still catch them
+            logger.exception("Unable to schedule %s expirations", kind)
+
+    def cancel(self, kind: ExpiryKind, *entity_ids: str | int):
+        self.schedule_many(kind, dict.fromkeys(entity_ids))
+
+    def cancel_kind(self, kind: ExpiryKind):
+        members = [
+            member for member, _ in self.red.zscan_iter(self.key, match=f"{kind}:*")
+        ]
+        if members:
+            self.red.zrem(self.key, *members)
+
+    def get_expiration(self, kind: ExpiryKind, entity_id: str | int) -> datetime | None:
+        score = self.red.zscore(self.key, _member(kind, entity_id))
+        if score is None:
+            return None
+        return datetime.fromtimestamp(score, tz=UTC)
+
+    def is_pending(
+        self, kind: ExpiryKind, entity_id: str | int, now: datetime | None = None
+    ) -> bool:
+        """Whether the entity has an expiration that is not due yet
+
+        False when the schedule can't be read, e.g. a cooldown is skipped
+        rather than failing the caller.
+        """
+        try:
+            expires_at = self.get_expiration(kind, entity_id)
+        except redis.exceptions.RedisError:
+            logger.exception("Unable to read the %s expiration of %s", kind, entity_id)
+            return False
+        return expires_at is not None and expires_at > (now or datetime.now(tz=UTC))
+
+    def next_due(self) -> datetime | None:
+        entries = self.red.zrange(self.key, 0, 0, withscores=True)
+        if not entries:
+            return None
+        return datetime.fromtimestamp(entries[0][1], tz=UTC)
+
+    def claim_due(
+        self, now: datetime | None = None, batch_size: int = 100
+    ) -> list[DueEntry]:
+        """Remove and return up to batch_size entries that are due
+
+        An entry is only returned to the caller that removed it, so several
+        processes can share the schedule without handling an entry twice.
+        """
+        now = now or datetime.now(tz=UTC)
+        entries = self.red.zrangebyscore(
+            self.key, "-inf", now.timestamp(), start=0, num=batch_size, withscores=True
+        )
+        if not entries:
+            return []
+
+        with self.red.pipeline(transaction=False) as pipe:
+            for member, _ in entries:
+                pipe.zrem(self.key, member)
+            claimed = pipe.execute()
+
+        due: list[DueEntry] = []
+        for (member, score), removed in zip(entries, claimed):
+            if not removed:
+                continue
+            if isinstance(member, bytes):
+                member = member.decode()
+            kind, _, entity_id = member.partition(":")
+            try:
+                due.append(
+                    DueEntry(
+                        ExpiryKind(kind),
+                        entity_id,
+                        datetime.fromtimestamp(score, tz=UTC),
+                    )
+                )
+            except ValueError:
+                logger.warning("Dropping unknown expiration %s", member)
+        return due
+
+    def wait(self, timeout: float):
+        """Block until timeout seconds elapsed or something new was scheduled
+
+        The client must not have a socket timeout shorter than timeout.
+        """
+        if timeout <= 0:
+            return
+        # BLPOP takes a timeout with a millisecond precision, 0 would block forever
+        self.red.blpop([self.wakeup_key], timeout=max(timeout, 0.001))
+
+
+def get_expiry_scheduler() -> ExpiryScheduler:
+    global SCHEDULER
+    if SCHEDULER is None:
+        SCHEDULER = ExpiryScheduler()
+    return SCHEDULER
+
+
+def schedule_expirations(
+    kind: ExpiryKind, expirations: Mapping[str | int, datetime | None]
+):
+    """Keep the schedule up to date from a write path, never raises"""
+    try:
+        get_expiry_scheduler().schedule_many(kind, expirations)
+    except Exception:
+        logger.exception("Unable to schedule %s expirations", kind)
+
+
+def cancel_expirations(kind: ExpiryKind, entity_ids: Iterable[str | int]):
+    schedule_expirations(kind, dict.fromkeys(entity_ids))
+
+
+def schedule_vip_expirations(expirations: Mapping[str, datetime | None]):
+    """Schedule VIP expirations, indefinite VIPs are never scheduled"""
+    schedule_expirations(
+        ExpiryKind.VIP,
+        {
+            player_id: (
+                None
+                if expires_at is None
+                or _timestamp(expires_at) >= INDEFINITE_VIP_DATE.timestamp()
+                else expires_at
+            )
+            for player_id, expires_at in expirations.items()
+        },
+    )
@@ -0,0 +1,145 @@
+"""Process the expiry schedule (rcon.expiry) of the server as entries become due.
+
+The service sleeps until the next entry is due, or until a write path
+schedules something new, and handles the due entries in batches. The schedule
+is rebuilt from the database on startup and on every sweep, which also catches
+whatever was written without going through a write path that schedules it.
+"""
+
+import logging
+import os
+import time
+from collections import defaultdict
+from collections.abc import Callable, Mapping
+from datetime import UTC, datetime
+
+import redis
+
+from rcon.blacklist import get_record_expirations, synchronize_expired_records
+from rcon.expiring_vips.service import remove_expired_vips
+from rcon.expiry import (
+    ExpiryKind,
+    ExpiryScheduler,
+    schedule_expirations,
+    schedule_vip_expirations,
+)
+from rcon.models import PlayerID, PlayerVIP, enter_session
+from rcon.rcon import Rcon, get_rcon
+from rcon.user_config.expired_vips import ExpiredVipsUserConfig
+from rcon.utils import INDEFINITE_VIP_DATE, get_server_number
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+# Upper bound of a sleep so configuration changes are picked up
+MAX_SLEEP_SECONDS = 60
+
+
+def _handle_vips(
+    rcon: Rcon, config: ExpiredVipsUserConfig, expirations: Mapping[str, datetime]
+):
+    if not config.enabled:
+        # Scheduled again by the next sweep
+        return
+    remove_expired_vips(rcon, config.discord_webhook_url, player_ids=expirations)
+
+
+def _handle_blacklist_records(
+    rcon: Rcon, config: ExpiredVipsUserConfig, expirations: Mapping[str, datetime]
+):
+    synchronize_expired_records(
+        rcon,
+        {int(record_id): expires_at for record_id, expires_at in expirations.items()},
+    )
+
+
+def _handle_killrate_cooldowns(
+    rcon: Rcon, config: ExpiredVipsUserConfig, expirations: Mapping[str, datetime]
+):
+    # A cooldown lasts as long as its entry, removing it is all there is to do
+    logger.debug("Report cooldowns of %s ended", list(expirations))
+
+
+HANDLERS: dict[
+    ExpiryKind,
+    Callable[[Rcon, ExpiredVipsUserConfig, Mapping[str, datetime]], None],
+] = {
+    ExpiryKind.VIP: _handle_vips,
+    ExpiryKind.BLACKLIST_RECORD: _handle_blacklist_records,
+    ExpiryKind.KILLRATE_COOLDOWN: _handle_killrate_cooldowns,
+}
+
+
+def rebuild_schedule():
+    """Schedule the expiration of every temporary VIP and blacklist record"""
+    server_number = get_server_number()
+    with enter_session() as sess:
+        vips = dict(
+            sess.query(PlayerID.player_id, PlayerVIP.expiration)
+            .join(PlayerVIP, PlayerVIP.player_id_id == PlayerID.id)
+            .filter(
+                PlayerVIP.server_number == server_number,
+                PlayerVIP.expiration < INDEFINITE_VIP_DATE,
+            )
+            .tuples()
+        )
+        records = get_record_expirations(sess)
+
+    schedule_vip_expirations(vips)
+    schedule_expirations(ExpiryKind.BLACKLIST_RECORD, records)
+    logger.info(
+        "Scheduled %s VIP and %s blacklist record expirations", len(vips), len(records)
+    )
+
+
+def process_due(
+    scheduler: ExpiryScheduler,
+    rcon: Rcon,
+    config: ExpiredVipsUserConfig,
+    now: datetime | None = None,
+) -> int:
+    """Handle every due entry in batches, returns the number of entries handled"""
+    processed = 0
+    while batch := scheduler.claim_due(now, BATCH_SIZE):
+        by_kind: defaultdict[ExpiryKind, dict[str, datetime]] = defaultdict(dict)
+        for entry in batch:
+            by_kind[entry.kind][entry.entity_id] = entry.expires_at
+
+        for kind, expirations in by_kind.items():
+            logger.info("Handling %s expired %s", len(expirations), kind)
+            try:
+                HANDLERS[kind](rcon, config, expirations)
+            except Exception:
+                logger.exception("Failed to handle expired %s %s", kind, expirations)
+        processed += len(batch)
+    return processed
+
+
+def run():
+    rcon = get_rcon()
+    # A client of its own: waiting on the schedule outlasts the socket
+    # timeout of the shared connection pool
+    scheduler = ExpiryScheduler(
+        redis.Redis.from_url(os.getenv("HLL_REDIS_URL"), decode_responses=True)
+    )
+
+    next_sweep = 0.0
+    while True:
+        config = ExpiredVipsUserConfig.load_from_db()
+
+        if time.monotonic() >= next_sweep:
+            rebuild_schedule()
+            if config.enabled:
+                remove_expired_vips(rcon, config.discord_webhook_url)
+            next_sweep = time.monotonic() + config.interval_minutes * 60
+
+        process_due(scheduler, rcon, config)
+
+        timeout = min(MAX_SLEEP_SECONDS, next_sweep - time.monotonic())
+        if next_due := scheduler.next_due():
+            timeout = min(timeout, (next_due - datetime.now(tz=UTC)).total_seconds())
+        scheduler.wait(timeout)
+
+
+if __name__ == "__main__":
+    run()
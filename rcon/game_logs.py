@@ -1,6 +1,7 @@
 import datetime
 import logging
 import unicodedata
+from collections.abc import Mapping
 
 from dateutil import parser
 from sqlalchemy import and_, or_
@@ -14,11 +15,17 @@ from rcon.types import (
     StructuredLogLineWithMetaData,
 )
 from rcon.utils import (
+    LogHistoryEntry,
     strtobool,
 )
 
 logger = logging.getLogger(__name__)
 
+# Newest first searches are run over time windows growing backward, so that they
+# only touch the most recent partitions of log_lines when those have enough lines.
+# Past the last window the rest of the table is searched at once.
+HISTORY_WINDOWS = [datetime.timedelta(days=2**i) for i in range(9)]
+
 
 def is_player(search_str, player, exact_match=False):
     if exact_match:
@@ -59,6 +66,12 @@ def is_action(action_filter, action, exact_match=False):
     return False
 
 
+def _to_log(
+    line: LogHistoryEntry | StructuredLogLineWithMetaData,
+) -> StructuredLogLineWithMetaData:
+    return line.to_dict() if isinstance(line, LogHistoryEntry) else line
+
+
 def get_recent_logs(
     start: int = 0,
     end: int = 100000,
@@ -79,7 +92,6 @@ def get_recent_logs(
     # inclusive_filter=False will do the opposite, show all lines except what is passed in
     # `actions_filter`
     log_list = LogLoop.get_log_history_list()
-    all_logs = log_list
 
     if not isinstance(start, int):
         start = 0
@@ -94,19 +106,16 @@ def get_recent_logs(
     exact_action = strtobool(exact_action)
     inclusive_filter = strtobool(inclusive_filter)
 
-    if start != 0:
-        all_logs = log_list[start : min(end, len(log_list))]
+    # Fields are decoded as the filters read them, only kept lines are fully decoded
+    all_logs = log_list.entries(start, end)
     logs: list[StructuredLogLineWithMetaData] = []
     all_players = set()
     actions = set(LOG_ACTIONS)
     if player_search and not isinstance(player_search, list):
         player_search = [player_search]
     # flatten that shit
-    line: StructuredLogLineWithMetaData
     for idx, line in enumerate(all_logs):
-        if idx >= end - start:
-            break
-        if not isinstance(line, dict):
+        if not isinstance(line, Mapping):
             continue
         if min_timestamp and line["timestamp_ms"] / 1000 < min_timestamp:
             logger.debug("Stopping log read due to old timestamp at index %s", idx)
@@ -134,7 +143,7 @@ def get_recent_logs(
                     )
                     or not action_filter
                 ):
-                    logs.append(line)
+                    logs.append(_to_log(line))
                     break
         elif action_filter:
             # Filter out anything that isn't in action_filter
@@ -144,9 +153,9 @@ def get_recent_logs(
                 or not inclusive_filter
                 and not is_action(action_filter, line["action"], exact_action)
             ):
-                logs.append(line)
+                logs.append(_to_log(line))
         elif not player_search and not action_filter:
-            logs.append(line)
+            logs.append(_to_log(line))
 
         if p1 := line["player_name_1"]:
             all_players.add(p1)
@@ -161,6 +170,21 @@ def get_recent_logs(
     }
 
 
+def player_name_filter(player_name: str, exact_player_match: bool = False):
+    """Match the log lines of a player name, either side of the line
+
+    Substring searches are served by the trigram indexes on both name columns.
+    """
+    if exact_player_match:
+        return or_(
+            LogLine.player1_name == player_name, LogLine.player2_name == player_name
+        )
+    return or_(
+        LogLine.player1_name.ilike(f"%{player_name}%"),
+        LogLine.player2_name.ilike(f"%{player_name}%"),
+    )
+
+
 def get_historical_logs_records(
     sess: Session,
     player_name: str | None = None,
@@ -184,7 +208,11 @@ def get_historical_logs_records(
     if isinstance(till, str):
         till = parser.parse(till)
 
-    name_filters = []
+    # Naive times are stored and compared as UTC
+    if from_ and from_.tzinfo is None:
+        from_ = from_.replace(tzinfo=datetime.UTC)
+    if till and till.tzinfo is None:
+        till = till.replace(tzinfo=datetime.UTC)
 
     q = sess.query(LogLine)
     if action and not exact_action:
@@ -211,37 +239,54 @@ def get_historical_logs_records(
             or_(LogLine.player1_player_id == id_, LogLine.player2_player_id == id_)
         )
 
-    if player_name and not exact_player_match:
-        name_filters.extend(
-            [
-                LogLine.player1_name.ilike(f"%{player_name}%"),
-                LogLine.player2_name.ilike(f"%{player_name}%"),
-            ]
-        )
-    elif player_name and exact_player_match:
-        name_filters.extend(
-            [
-                LogLine.player1_name == player_name,
-                LogLine.player2_name == player_name,
-            ]
-        )
-
-    if name_filters:
-        q = q.filter(or_(*name_filters))
+    if player_name:
+        q = q.filter(player_name_filter(player_name, exact_player_match))
 
     if server_filter:
         q = q.filter(LogLine.server == server_filter)
 
+    if time_sort == "desc":
+        return _search_newest_first(q, limit, from_, till)
+
     if time_sort:
-        q = q.order_by(
-            LogLine.event_time.desc()
-            if time_sort == "desc"
-            else LogLine.event_time.asc()
-        ).limit(limit)
+        q = q.order_by(LogLine.event_time.asc()).limit(limit)
 
     return q.all()
 
 
+def _search_newest_first(
+    q, limit: int, from_: datetime.datetime | None, till: datetime.datetime | None
+) -> list[LogLine]:
+    """Return the `limit` newest lines matched by the query
+
+    Every window is bounded on event_time, which lets Postgres prune the
+    partitions (and the BRIN ranges) outside of it.
+    """
+    end = till or datetime.datetime.now(tz=datetime.UTC)
+    upper: datetime.datetime | None = None
+    rows: list[LogLine] = []
+
+    for window in HISTORY_WINDOWS:
+        lower = end - window
+        if from_ and lower <= from_:
+            break
+        window_q = q.filter(LogLine.event_time >= lower)
+        # The first window is bounded by `till` (if any) through the query filters
+        if upper:
+            window_q = window_q.filter(LogLine.event_time < upper)
+        rows.extend(
+            window_q.order_by(LogLine.event_time.desc()).limit(limit - len(rows))
+        )
+        if len(rows) >= limit:
+            return rows
+        upper = lower
+
+    if upper:
+        q = q.filter(LogLine.event_time < upper)
+    rows.extend(q.order_by(LogLine.event_time.desc()).limit(limit - len(rows)))
+    return rows
+
+
 def get_historical_logs(
     player_name: str | None = None,
     action: str | None = None,
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+from collections.abc import Callable
+from typing import Any
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+GAME_STATE_TOO_SLOW = (
+    "Too many updates waiting to be sent, reconnect for a new snapshot"
+)
+
+JsonPatch = list[dict[str, Any]]
+
+
+def _escape(key: str) -> str:
+    return key.replace("~", "~0").replace("/", "~1")
+
+
+def json_patch(old: Any, new: Any, path: str = "") -> JsonPatch:
+    """The RFC 6902 operations that turn `old` into `new`, two JSON values
+
+    Objects are compared key by key and arrays of the same length item by
+    item, any other value that changed is replaced as a whole.
+    """
+    ops: JsonPatch = []
+    _diff(old, new, path, ops)
+    return ops
+
+
+def _diff(old: Any, new: Any, path: str, ops: JsonPatch):
+    if type(old) is dict and type(new) is dict:
+        for key in old.keys() - new.keys():
+            ops.append({"op": "remove", "path": f"{path}/{_escape(key)}"})
+        for key, value in new.items():
+            child = f"{path}/{_escape(key)}"
+            if key in old:
+                _diff(old[key], value, child, ops)
+            else:
+                ops.append({"op": "add", "path": child, "value": value})
+    elif type(old) is list and type(new) is list and len(old) == len(new):
+        for i, (old_item, new_item) in enumerate(zip(old, new)):
+            _diff(old_item, new_item, f"{path}/{i}", ops)
+    elif type(old) is not type(new) or old != new:
+        ops.append({"op": "replace", "path": path, "value": new})
+
+
+class GameStateSubscription:
+    """The serialized updates waiting to be sent to one client
+
+    A client more than `maxsize` updates behind is dropped instead of
+    buffering for it, it can reconnect to start over from a new snapshot.
+    """
+
+    def __init__(self, maxsize: int = 100):
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize)
+        self.error: str | None = None
+        self.closed = asyncio.Event()
+
+    def deliver(self, message: str) -> bool:
+        if self.closed.is_set():
+            return False
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.close(GAME_STATE_TOO_SLOW)
+            return False
+        return True
+
+    def close(self, error: str | None = None):
+        if not self.closed.is_set():
+            self.error = error
+            self.closed.set()
+
+    async def get(self) -> str | None:
+        """Wait for the next update, None once closed"""
+        if not self.queue.empty():
+            return self.queue.get_nowait()
+        getter = asyncio.ensure_future(self.queue.get())
+        closed = asyncio.ensure_future(self.closed.wait())
+        try:
+            await asyncio.wait([getter, closed], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+        if not getter.done():
+            getter.cancel()
+            return None
+        return getter.result()
+
+
+class GameStateHub:
+    """Poll the game state once per process and push its changes to websockets
+
+    While there are subscribers a single task refreshes every section each
+    `interval_seconds`. A new subscriber gets the current snapshot, then
+    everyone gets the JSON patch of what changed at each refresh. Snapshots
+    and patches are serialized once whatever the number of clients, and
+    nothing is sent while the game state does not change.
+    """
+
+    def __init__(
+        self,
+        sections: dict[str, Callable[[], Any]],
+        interval_seconds: float = 5,
+        default: Callable[[Any], Any] | None = None,
+    ):
+        self.sections = sections
+        self.interval_seconds = interval_seconds
+        self.default = default
+        self.snapshot: dict[str, Any] = {}
+        self.version = 0
+        self.subscriptions: set[GameStateSubscription] = set()
+        self.task: asyncio.Task | None = None
+        self.ready = asyncio.Event()
+        self._snapshot_message: tuple[int, str] | None = None
+
+    def dumps(self, value: Any) -> bytes:
+        return orjson.dumps(value, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+
+    async def _fetch(self, name: str, section: Callable[[], Any]) -> Any:
+        try:
+            # Compared as JSON, the way clients see it
+            return orjson.loads(self.dumps(await asyncio.to_thread(section)))
+        except Exception:
+            logger.exception("Unable to refresh the %s game state", name)
+            return self.snapshot.get(name)
+
+    async def refresh(self):
+        values = await asyncio.gather(
+            *(self._fetch(name, section) for name, section in self.sections.items())
+        )
+        snapshot = dict(zip(self.sections, values))
+        ops = json_patch(self.snapshot, snapshot)
+        self.snapshot = snapshot
+        if not ops:
+            return
+
+        self.version += 1
+        message = self.dumps(
+            {"type": "patch", "version": self.version, "ops": ops}
+        ).decode()
+        for subscription in list(self.subscriptions):
+            if not subscription.deliver(message):
+                logger.warning("Dropping a game state client: %s", subscription.error)
+                self.subscriptions.discard(subscription)
+
+    def snapshot_message(self) -> str:
+        if self._snapshot_message is None or self._snapshot_message[0] != self.version:
+            message = self.dumps(
+                {"type": "snapshot", "version": self.version, "state": self.snapshot}
+            ).decode()
+            self._snapshot_message = (self.version, message)
+        return self._snapshot_message[1]
+
+    async def subscribe(self, maxsize: int = 100) -> GameStateSubscription:
+        if self.task is None or self.task.done():
+            self.ready = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+        await self.ready.wait()
+
+        # Added with the snapshot, it only receives the patches that follow it
+        subscription = GameStateSubscription(maxsize)
+        subscription.deliver(self.snapshot_message())
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: GameStateSubscription):
+        subscription.close()
+        self.subscriptions.discard(subscription)
+
+    async def run(self):
+        try:
+            await self.refresh()
+        finally:
+            self.ready.set()
+
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            if not self.subscriptions:
+                break
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Unable to refresh the game state")
@@ -2,15 +2,19 @@ import json
 import logging
 import re
 import shlex
+from collections.abc import Callable, Iterable, Mapping
 from datetime import UTC, datetime, timedelta
 from functools import wraps
-from typing import Final
+from typing import Any, Final
 
 from discord.utils import escape_markdown
 from discord_webhook import DiscordEmbed
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 
 from rcon import steam_utils
 from rcon.arguments import max_arg_index, replace_params
+from rcon.auto_settings_events import AutoSettingsEvent, publish_auto_settings_event
 from rcon.blacklist import (
     apply_blacklist_punishment,
     blacklist_or_ban,
@@ -18,12 +22,14 @@ from rcon.blacklist import (
 )
 from rcon.cache_utils import get_redis_client, invalidates
 from rcon.commands import HLLCommandFailedError
+from rcon.connection import HLLCommandError
 from rcon.discord import get_prepared_discord_hooks, send_to_discord_audit
 from rcon.logs.loop import (
+    on_batch,
     on_camera,
     on_chat,
     on_connected,
-    on_disconnected,
+    on_connected_batch,
     on_match_end,
     on_match_start,
 )
@@ -33,17 +39,14 @@ from rcon.maps import (
 )
 from rcon.message_variables import format_message_string, populate_message_variables
 from rcon.models import GameLayout, PlayerID, PlayerSoldier, enter_session
-from rcon.player_history import (
-    get_player,
-    save_end_player_session,
-    save_player,
-    save_start_player_session,
-)
+from rcon.player_history import save_player_sessions, save_players
+from rcon.policy_index import get_policy_index
 from rcon.rcon import Rcon, StructuredLogLineWithMetaData, do_run_commands
 from rcon.recent_actions import get_recent_actions
 from rcon.types import (
+    AllLogTypes,
+    GetDetailedPlayer,
     MessageVariableContext,
-    MostRecentEvents,
     PlayerFlagType,
     SteamBansType,
     WindowsStoreIdActionType,
@@ -67,7 +70,13 @@ from rcon.user_config.rcon_server_settings import RconServerSettingsUserConfig
 from rcon.user_config.real_vip import RealVipUserConfig
 from rcon.user_config.vac_game_bans import VacGameBansUserConfig
 from rcon.user_config.webhooks import CameraWebhooksUserConfig
-from rcon.utils import DefaultStringFormat, MapsHistory, guess_map_from_log
+from rcon.utils import (
+    DefaultStringFormat,
+    MapsHistory,
+    batched,
+    guess_map_from_log,
+    parse_raw_player_info,
+)
 from rcon.vote_map import VoteMap
 from rcon.workers import (
     get_queue,
@@ -75,7 +84,7 @@ from rcon.workers import (
     save_missing_match_logs_worker,
     temporary_broadcast,
     temporary_welcome,
-    update_player_steaminfo_on_connect_worker,
+    update_players_steaminfo_on_connect_worker,
 )
 
 logger = logging.getLogger(__name__)
@@ -104,12 +113,11 @@ def chat_commands(rcon: Rcon, struct_log: StructuredLogLineWithMetaData):
     if chat_message is None:
         return
 
-    event_cache = get_recent_actions()
     player_id: str = struct_log["player_id_1"]
     if player_id is None:
         return
 
-    player_cache = event_cache.get(player_id, MostRecentEvents())
+    player_cache = get_recent_actions(player_id)
     chat_words = set(chat_message.split())
     ctx = {
         MessageVariableContext.player_name.value: struct_log["player_name_1"],
@@ -273,6 +281,11 @@ def reset_watch_killrate_cooldown(
     reset_cache()
 
 
+@on_match_start
+def notify_auto_settings_map_change(rcon: Rcon, struct_log):
+    publish_auto_settings_event(AutoSettingsEvent.MAP_CHANGE)
+
+
 @on_match_start
 def handle_new_match_start(rcon: Rcon, struct_log):
     log_map = guess_map_from_log(struct_log, rcon.game_profile)
@@ -433,14 +446,31 @@ def record_map_end(rcon: Rcon, struct_log: StructuredLogLineWithMetaData):
 
 
 def ban_if_blacklisted(rcon: Rcon, player_id: str, name: str):
+    return player_id in ban_blacklisted_players(rcon, {player_id: name})
+
+
+def ban_blacklisted_players(rcon: Rcon, players: Mapping[str, str]) -> set[str]:
+    """Punish every blacklisted player (player_id -> name), returns who was punished
+
+    The whole batch is checked against the policy index in one lookup, only
+    the blacklisted players are looked up in the database.
+    """
+    policies = get_policy_index().get_many(players)
+    punished: set[str] = set()
     with enter_session() as sess:
-        blacklist = is_player_blacklisted(sess, player_id)
-        if not blacklist:
-            return False
+        for player_id, name in players.items():
+            if policies is not None and not policies[player_id].blacklisted:
+                continue
 
-        return apply_blacklist_punishment(
-            rcon, blacklist, player_id=player_id, player_name=name
-        )
+            try:
+                blacklist = is_player_blacklisted(sess, player_id)
+                if blacklist and apply_blacklist_punishment(
+                    rcon, blacklist, player_id=player_id, player_name=name
+                ):
+                    punished.add(player_id)
+            except Exception:
+                logger.exception("Unable to check the blacklist of %s", player_id)
+    return punished
 
 
 def should_ban(
@@ -476,6 +506,14 @@ def should_ban(
 
 
 def ban_if_has_vac_bans(rcon: Rcon, player_id: str, name: str):
+    ban_players_with_vac_bans(rcon, {player_id: name})
+
+
+def ban_players_with_vac_bans(rcon: Rcon, players: Mapping[str, str]):
+    """Ban or blacklist every player (player_id -> name) with a recent VAC/game ban
+
+    The steam info of the whole batch is loaded with a single query.
+    """
     config = VacGameBansUserConfig.load_from_db()
 
     max_days_since_ban = config.vac_history_days
@@ -484,53 +522,68 @@ def ban_if_has_vac_bans(rcon: Rcon, player_id: str, name: str):
     )
     whitelist_flags = config.whitelist_flags
 
-    if max_days_since_ban <= 0:
+    if max_days_since_ban <= 0 or not players:
         return  # Feature is disabled
 
     with enter_session() as sess:
-        player = get_player(sess, player_id)
-
-        if not player:
-            logger.error("Can't check VAC history, player not found %s", player_id)
-            return
-
-        bans = player.steaminfo.bans if player.steaminfo else None
-        if not bans or not isinstance(bans, dict):
-            logger.warning(
-                "Can't fetch Bans for player %s, received %s", player_id, bans
+        found = {
+            player.player_id: player
+            for player in sess.scalars(
+                select(PlayerID)
+                .options(selectinload(PlayerID.steaminfo), selectinload(PlayerID.flags))
+                .where(PlayerID.player_id.in_(players))
             )
-            return
+        }
 
-        if should_ban(
-            bans,
-            max_game_bans,
-            max_days_since_ban,
-            player_flags=player.flags,
-            whitelist_flags=whitelist_flags,
-        ):
-            days_since_last_ban = bans["DaysSinceLastBan"]
-            reason = config.ban_on_vac_history_reason.format(
-                DAYS_SINCE_LAST_BAN=days_since_last_ban,
-                MAX_DAYS_SINCE_BAN=str(max_days_since_ban),
-            )
-            if config.auto_expire:
-                days_until_expire = max_days_since_ban - days_since_last_ban
-                expires_at = datetime.now(tz=UTC) + timedelta(days=days_until_expire)
-            else:
-                expires_at = None
-            blacklist_or_ban(
-                rcon=rcon,
-                blacklist_id=config.blacklist_id,
-                player_id=player_id,
-                reason=reason,
-                expires_at=expires_at,
-                admin_name="VAC BOT",
-            )
-            logger.info(
-                "Player %s was banned due VAC history, last ban: %s days ago",
-                str(player),
-                bans.get("DaysSinceLastBan"),
-            )
+        for player_id in players:
+            player = found.get(player_id)
+            if not player:
+                logger.error("Can't check VAC history, player not found %s", player_id)
+                continue
+
+            bans = player.steaminfo.bans if player.steaminfo else None
+            if not bans or not isinstance(bans, dict):
+                logger.warning(
+                    "Can't fetch Bans for player %s, received %s", player_id, bans
+                )
+                continue
+
+            if should_ban(
+                bans,
+                max_game_bans,
+                max_days_since_ban,
+                player_flags=player.flags,
+                whitelist_flags=whitelist_flags,
+            ):
+                days_since_last_ban = bans["DaysSinceLastBan"]
+                reason = config.ban_on_vac_history_reason.format(
+                    DAYS_SINCE_LAST_BAN=days_since_last_ban,
+                    MAX_DAYS_SINCE_BAN=str(max_days_since_ban),
+                )
+                if config.auto_expire:
+                    days_until_expire = max_days_since_ban - days_since_last_ban
+                    expires_at = datetime.now(tz=UTC) + timedelta(
+                        days=days_until_expire
+                    )
+                else:
+                    expires_at = None
+                try:
+                    blacklist_or_ban(
+                        rcon=rcon,
+                        blacklist_id=config.blacklist_id,
+                        player_id=player_id,
+                        reason=reason,
+                        expires_at=expires_at,
+                        admin_name="VAC BOT",
+                    )
+                except Exception:
+                    logger.exception("Unable to ban %s for VAC history", player_id)
+                    continue
+                logger.info(
+                    "Player %s was banned due VAC history, last ban: %s days ago",
+                    str(player),
+                    bans.get("DaysSinceLastBan"),
+                )
 
 
 def inject_player_ids(func):
@@ -543,82 +596,151 @@ def inject_player_ids(func):
     return wrapper
 
 
-@on_connected()
-@inject_player_ids
-def handle_on_connect(
-    rcon: Rcon, struct_log: StructuredLogLineWithMetaData, name: str, player_id: str
+# Steam enrichment is queued so a slow external API cannot block log processing.
+@on_connected_batch
+def update_player_steaminfo_on_connect(
+    rcon, struct_logs: list[StructuredLogLineWithMetaData]
 ):
-    try:
-        rcon.get_players.cache_clear()
-        rcon.get_player_info.clear_for(player_id=struct_log["player_id_1"])
-        rcon.get_detailed_player_info.clear_for(player_id=struct_log["player_id_1"])
-    except Exception:
-        logger.exception("Unable to clear cache for %s", player_id)
-
-    timestamp = int(struct_log["timestamp_ms"]) / 1000
-    if not player_id:
-        logger.error(
-            "Unable to get player ID for %s, can't process connection",
-            struct_log,
+    players: dict[str, str] = {}
+    for struct_log in struct_logs:
+        if not struct_log["player_id_1"]:
+            logger.error(
+                "Can't update steam info, no steam id available for %s",
+                struct_log.get("player_name_1"),
+            )
+            continue
+        players[struct_log["player_id_1"]] = struct_log["player_name_1"]
+
+    # One job per Steam API request
+    for chunk in batched(players.items(), steam_utils.STEAM_API_MAX_STEAM_IDS):
+        logger.info("Queueing Steam enrichment for %s players", len(chunk))
+        get_queue().enqueue(
+            update_players_steaminfo_on_connect_worker,
+            dict(chunk),
+            job_timeout=60,
         )
-        return
 
+
+def _get_connected_players_info(
+    rcon: Rcon, player_ids: Iterable[str]
+) -> dict[str, GetDetailedPlayer]:
+    """The info of the connected players that are still online, in one RCON call"""
+    player_ids = set(player_ids)
     try:
-        player_info = rcon.get_detailed_player_info(player_id)
-    except HLLCommandFailedError as e:
-        logger.warning("Unable to update soldier info for %s\n%s", player_id, str(e))
-        player_info = None
+        all_player_info = rcon.get_all_player_info()
+    except (HLLCommandFailedError, HLLCommandError) as e:
+        logger.warning("Unable to update soldier info for %s\n%s", player_ids, str(e))
+        return {}
+
+    return {
+        raw["iD"]: parse_raw_player_info(raw, rcon.game_profile.game)
+        for raw in all_player_info
+        if raw["iD"] in player_ids
+    }
 
-    save_player(
-        struct_log["player_name_1"],
-        player_id,
-        timestamp=int(struct_log["timestamp_ms"]) / 1000,
-        steam_id=player_info["steam_id"] if player_info else None,
-    )
 
-    if player_info:
-        PlayerSoldier.update(player_info)
+def _in_batch_or_one_by_one(func: Callable[[list], Any], items: list, action: str):
+    """Call func with every item, or with one item at a time if that fails
 
-    blacklisted = ban_if_blacklisted(rcon, player_id, struct_log["player_name_1"])
-    if blacklisted:
-        # We don't need the player potentially blacklisted a second
-        # time because of VAC bans. So we return here.
+    A bad log line then only loses its own changes, as when every line was
+    handled by its own hook.
+    """
+    try:
+        func(items)
         return
+    except Exception:
+        logger.exception("Unable to %s in a batch, retrying one by one", action)
 
-    save_start_player_session(player_id, timestamp=timestamp)
-    ban_if_has_vac_bans(rcon, player_id, struct_log["player_name_1"])
+    for item in items:
+        try:
+            func([item])
+        except Exception:
+            logger.exception("Unable to %s for %s", action, item)
 
 
-@on_disconnected
-@inject_player_ids
-def handle_on_disconnect(rcon, struct_log, _, player_id: str):
-    save_end_player_session(player_id, struct_log["timestamp_ms"] / 1000)
+@on_batch(AllLogTypes.connected, AllLogTypes.disconnected)
+def handle_connections(rcon: Rcon, struct_logs: list[StructuredLogLineWithMetaData]):
+    """Save the players and sessions of every connection of a log fetch at once"""
+    connected: dict[str, StructuredLogLineWithMetaData] = {}
+    for struct_log in struct_logs:
+        if not struct_log["player_id_1"]:
+            logger.error(
+                "Unable to get player ID for %s, can't process connection",
+                struct_log,
+            )
+        elif struct_log["action"] == AllLogTypes.connected.value:
+            connected[struct_log["player_id_1"]] = struct_log
 
+    names = {
+        player_id: struct_log["player_name_1"]
+        for player_id, struct_log in connected.items()
+    }
+    blacklisted: set[str] = set()
+    if connected:
+        try:
+            rcon.get_players.cache_clear()
+            for player_id in connected:
+                rcon.get_player_info.clear_for(player_id=player_id)
+                rcon.get_detailed_player_info.clear_for(player_id=player_id)
+        except Exception:
+            logger.exception("Unable to clear cache for %s", list(connected))
+
+        players_info = _get_connected_players_info(rcon, connected)
+
+        def save(player_ids: list[str]):
+            save_players(
+                {player_id: names[player_id] for player_id in player_ids},
+                timestamp={
+                    player_id: int(connected[player_id]["timestamp_ms"]) / 1000
+                    for player_id in player_ids
+                },
+                steam_ids={
+                    player_id: players_info[player_id]["steam_id"]
+                    for player_id in player_ids
+                    if player_id in players_info and players_info[player_id]["steam_id"]
+                },
+            )
+            PlayerSoldier.update_many(
+                [players_info[p] for p in player_ids if p in players_info]
+            )
 
-# Steam enrichment is queued so a slow external API cannot block log processing.
-@on_connected(0)
-@inject_player_ids
-def update_player_steaminfo_on_connect(
-    rcon, struct_log: StructuredLogLineWithMetaData, _, player_id: str
-):
-    if not player_id:
-        logger.error(
-            "Can't update steam info, no steam id available for %s",
-            struct_log.get("player_name_1"),
-        )
-        return
+        _in_batch_or_one_by_one(save, list(connected), "save connected players")
 
-    logger.info(
-        "Queueing Steam enrichment for player %s %s",
-        struct_log["player_name_1"],
-        player_id,
-    )
-    get_queue().enqueue(
-        update_player_steaminfo_on_connect_worker,
-        struct_log["player_name_1"],
-        player_id,
-        job_timeout=60,
+        # We don't need the player potentially blacklisted a second
+        # time because of VAC bans, nor to record their session.
+        try:
+            blacklisted = ban_blacklisted_players(rcon, names)
+        except Exception:
+            logger.exception("Unable to check the blacklists of %s", list(names))
+
+    _in_batch_or_one_by_one(
+        save_player_sessions,
+        [
+            (
+                struct_log["player_id_1"],
+                struct_log["action"] == AllLogTypes.connected.value,
+                int(struct_log["timestamp_ms"]) / 1000,
+            )
+            for struct_log in struct_logs
+            if struct_log["player_id_1"]
+            and not (
+                struct_log["action"] == AllLogTypes.connected.value
+                and struct_log["player_id_1"] in blacklisted
+            )
+        ],
+        "save player sessions",
     )
+    try:
+        ban_players_with_vac_bans(
+            rcon,
+            {
+                player_id: name
+                for player_id, name in names.items()
+                if player_id not in blacklisted
+            },
+        )
+    except Exception:
+        logger.exception("Unable to check the VAC history of %s", list(names))
 
 
 @on_connected()
@@ -697,14 +819,15 @@ def _set_real_vips(rcon: Rcon, struct_log):
     logger.info("Real VIP set slots to %s", remaining_vip_slots)
 
 
-@on_connected()
-def do_real_vips(rcon: Rcon, struct_log):
-    _set_real_vips(rcon, struct_log)
+# Only the player count after the last connection of a log fetch matters
+@on_batch(AllLogTypes.connected, AllLogTypes.disconnected)
+def do_real_vips(rcon: Rcon, struct_logs):
+    _set_real_vips(rcon, struct_logs[-1])
 
 
-@on_disconnected
-def undo_real_vips(rcon: Rcon, struct_log):
-    _set_real_vips(rcon, struct_log)
+@on_batch(AllLogTypes.connected, AllLogTypes.disconnected)
+def notify_auto_settings_player_count(rcon: Rcon, struct_logs):
+    publish_auto_settings_event(AutoSettingsEvent.PLAYER_COUNT)
 
 
 @on_camera
@@ -0,0 +1,232 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Callable
+
+from rcon.types import StructuredLogLineWithMetaData
+
+logger = logging.getLogger(__name__)
+
+
+def hook_name(hook: Callable) -> str:
+    return f"{hook.__module__}.{hook.__name__}"
+
+
+@dataclass
+class HookStats:
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def record(self, duration: float):
+        self.calls += 1
+        self.total_seconds += duration
+        self.max_seconds = max(self.max_seconds, duration)
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.calls if self.calls else 0.0
+
+
+class _Lane:
+    """A worker running the hooks of its queue one at a time, in order
+
+    Hooks run on a separate runner thread so the lane can report one that
+    exceeds its timeout. The lane keeps waiting for it rather than starting
+    another runner: an abandoned runner would keep its thread and its RCON
+    connection, and the hooks sharing its key must still run in order.
+    """
+
+    def __init__(self, executor: "HookExecutor", index: int):
+        self.executor = executor
+        self.index = index
+        self.queue: queue.Queue = queue.Queue(maxsize=executor.queue_size)
+        self.runner = self._make_runner()
+        self.thread = threading.Thread(
+            target=self.run, name=f"log-hooks-{index}", daemon=True
+        )
+        self.thread.start()
+
+    def _make_runner(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"log-hook-runner-{self.index}"
+        )
+
+    def run(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    self.runner.shutdown(wait=True)
+                    return
+                self.execute(*task)
+            finally:
+                self.queue.task_done()
+
+    def execute(self, hook: Callable, rcon, log, description: str):
+        """Run the hook on a log line, or on the list of lines of a batch hook"""
+        name = hook_name(hook)
+        timeout = getattr(hook, "hook_timeout_seconds", self.executor.timeout_seconds)
+        started = time.monotonic()
+        future = self.runner.submit(hook, rcon, log)
+        try:
+            future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.executor.record(name, time.monotonic() - started, timed_out=True)
+            logger.error(
+                "Hook '%s' for '%s' timed out after %ss, waiting for it to complete",
+                name,
+                description,
+                timeout,
+            )
+            try:
+                future.result()
+            except Exception:
+                logger.exception(f"Hook '{name}' for '{description}' returned an error")
+            logger.warning(
+                "Hook '%s' for '%s' completed after %.3fs",
+                name,
+                description,
+                time.monotonic() - started,
+            )
+            return
+        except Exception as e:
+            self.executor.record(name, time.monotonic() - started, failed=True)
+            logger.exception(
+                f"Hook '{name}' for '{description}' returned an error: {e}"
+            )
+            return
+
+        duration = time.monotonic() - started
+        self.executor.record(name, duration)
+        if duration >= self.executor.slow_hook_seconds:
+            logger.warning("Slow hook %.3fs %s on %s", duration, name, description)
+        logger.debug("Ran in %.4f seconds %s on %s", duration, name, description)
+
+
+class HookExecutor:
+    """Run the log line hooks on a bounded pool of workers
+
+    Hooks are dispatched to `max_workers` lanes by ordering key: the player
+    of the log line, or a single key shared by the lines without a player
+    (match start and end, ...) and the batch hooks, so they keep running one
+    after the other, in log order. Hooks sharing a key run in the order they
+    were submitted, everything else runs in parallel. Each lane queues at
+    most `queue_size` hooks, submitting to a full lane blocks so a backlog
+    slows the log loop down instead of growing without bounds.
+
+    A hook exceeding `timeout_seconds` is reported and waited for, a hook can
+    override it with a `hook_timeout_seconds` attribute.
+    """
+
+    # The ordering key of the log lines without a player
+    MATCH_KEY = ""
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        queue_size: int = 200,
+        timeout_seconds: float = 30,
+        slow_hook_seconds: float = 5,
+        report_interval_seconds: float = 10 * 60,
+    ):
+        self.queue_size = queue_size
+        self.timeout_seconds = timeout_seconds
+        self.slow_hook_seconds = slow_hook_seconds
+        self.report_interval_seconds = report_interval_seconds
+        self.stats: dict[str, HookStats] = {}
+        self.stats_lock = threading.Lock()
+        self.last_report = time.monotonic()
+        self.lanes = [_Lane(self, index) for index in range(max_workers)]
+
+    @staticmethod
+    def ordering_key(hook: Callable, log: StructuredLogLineWithMetaData) -> str:
+        return log.get("player_id_1") or HookExecutor.MATCH_KEY
+
+    def lane_of(self, key: str) -> _Lane:
+        return self.lanes[hash(key) % len(self.lanes)]
+
+    def submit(self, hook: Callable, rcon, log: StructuredLogLineWithMetaData):
+        lane = self.lane_of(self.ordering_key(hook, log))
+        self._put(lane, hook, (hook, rcon, log, log["raw"]))
+
+    def submit_batch(
+        self, hook: Callable, rcon, logs: list[StructuredLogLineWithMetaData]
+    ):
+        """Queue a batch hook with every line of a fetch it applies to
+
+        Batch hooks share the lane of the lines without a player, so they run
+        one after the other, fetch after fetch, without holding the log loop.
+        """
+        lane = self.lane_of(self.MATCH_KEY)
+        self._put(lane, hook, (hook, rcon, logs, f"{len(logs)} logs"))
+
+    def _put(self, lane: _Lane, hook: Callable, task: tuple):
+        try:
+            lane.queue.put_nowait(task)
+        except queue.Full:
+            logger.warning(
+                "Hook queue %s is full (%s hooks), waiting before queueing %s",
+                lane.index,
+                lane.queue.qsize(),
+                hook_name(hook),
+            )
+            started = time.monotonic()
+            lane.queue.put(task)
+            logger.warning(
+                "Waited %.3fs for hook queue %s",
+                time.monotonic() - started,
+                lane.index,
+            )
+
+    def pending(self) -> int:
+        return sum(lane.queue.qsize() for lane in self.lanes)
+
+    def join(self):
+        """Wait for every submitted hook to complete"""
+        for lane in self.lanes:
+            lane.queue.join()
+
+    def shutdown(self):
+        for lane in self.lanes:
+            lane.queue.put(None)
+        for lane in self.lanes:
+            lane.thread.join()
+
+    def record(
+        self, name: str, duration: float, failed: bool = False, timed_out: bool = False
+    ):
+        with self.stats_lock:
+            stats = self.stats.setdefault(name, HookStats())
+            stats.record(duration)
+            stats.errors += failed
+            stats.timeouts += timed_out
+
+    def report(self, force: bool = False) -> dict[str, HookStats]:
+        """Log the hook metrics once per report interval and start a new window"""
+        now = time.monotonic()
+        if not force and now - self.last_report < self.report_interval_seconds:
+            return {}
+
+        with self.stats_lock:
+            stats, self.stats = self.stats, {}
+        self.last_report = now
+
+        for name, s in sorted(stats.items(), key=lambda item: -item[1].total_seconds):
+            logger.info(
+                "Hook %s: %s calls, %s errors, %s timeouts, mean %.3fs, max %.3fs",
+                name,
+                s.calls,
+                s.errors,
+                s.timeouts,
+                s.mean_seconds,
+                s.max_seconds,
+            )
+        logger.info("Hook queues: %s pending", self.pending())
+        return stats
@@ -1,7 +1,7 @@
 import datetime
 import logging
 import re
-import sys
+import threading
 import time
 from collections import defaultdict
 from functools import partial
@@ -11,17 +11,25 @@ import discord_webhook
 from discord.utils import escape_markdown
 from rcon.cache_utils import get_redis_client, ttl_cache
 from rcon.connection import HLLServerError
-from rcon.discord import make_hook
+from rcon.logs.hook_executor import HookExecutor
 from rcon.maps import GameMode, Team as MapTeam, get_theoretical_match_time
 from rcon.rcon import get_rcon
 from rcon.types import AllLogTypes, GameStateType, GetDetailedPlayers, MapInfo, MapScore, UnitHistoryEntry, StructuredLogLineWithMetaData, PlayerStat, WorldPositionType
 from rcon.user_config.log_line_webhooks import LogLineWebhookUserConfig
 from rcon.user_config.rcon_server_settings import RconServerSettingsUserConfig
 from rcon.user_config.webhooks import DiscordMentionWebhook
-from rcon.utils import LogsHistory, MapsHistory
+from rcon.utils import LogsHistory, LogsRecorderStream, MapsHistory, get_server_number
+from rcon.webhook_service import (
+    WebhookMessage,
+    WebhookMessageType,
+    WebhookType,
+    enqueue_message,
+)
 
 logger = logging.getLogger(__name__)
 
+DISCORD_EMBED_DESCRIPTION_LENGTH = 4096
+
 HOOKS: Dict[str, list[Callable]] = {
     AllLogTypes.admin.value: [],
     AllLogTypes.admin_anti_cheat.value: [],
@@ -57,6 +65,12 @@ HOOKS: Dict[str, list[Callable]] = {
     AllLogTypes.vote_started.value: [],
 }
 
+# Hooks receiving every matching log line of a single fetch at once
+BATCH_HOOKS: Dict[str, list[Callable]] = {
+    AllLogTypes.connected.value: [],
+    AllLogTypes.disconnected.value: [],
+}
+
 
 def on_kill(func):
     HOOKS[AllLogTypes.kill.value].append(func)
@@ -117,6 +131,29 @@ def on_disconnected(func):
     return func
 
 
+def on_batch(*actions: AllLogTypes):
+    """Register a hook called once per log fetch with every line of the given actions
+
+    The hook receives (rcon, logs) with the lines in the order they happened.
+    It runs on the hook executor, on the lane of the lines without a player:
+    after the batch hooks of the previous fetches and before the single-event
+    hooks of the lines without a player, while the hooks of each player run
+    in parallel with it. A hook registered for several actions gets all of
+    their lines in one call.
+    """
+
+    def wrapper(func):
+        for action in actions:
+            BATCH_HOOKS.setdefault(action.value, []).append(func)
+        return func
+
+    return wrapper
+
+
+def on_connected_batch(func):
+    return on_batch(AllLogTypes.connected)(func)
+
+
 def on_match_start(func):
     HOOKS[AllLogTypes.match_start.value].append(func)
     return func
@@ -162,44 +199,122 @@ def make_allowed_mentions(mentions: Iterable[str]) -> defaultdict[str, list[str]
     return allowed_mentions
 
 
-def send_log_line_webhook_message(
+def make_log_line_webhook_messages(
         webhook: DiscordMentionWebhook,
-        _,
-        log_line: Dict[str, str | int | float | None],
-) -> None:
-    """Send a time stammped embed of the log_line and mentions to the provided Discord Webhook"""
+        log_lines: list[Dict[str, str | int | float | None]],
+        short_name: str,
+) -> list[WebhookMessage]:
+    """Build the webhook messages of the log lines with the webhook mentions
+
+    A single line is sent as a time stamped embed. Coalesced lines are packed
+    into as few embeds as Discord allows, each line prefixed with its time.
+    """
+    # Invalid URLs are reported by the webhook service
+    wh = discord_webhook.DiscordWebhook(url=str(webhook.url))
+    mentions = webhook.user_mentions + webhook.role_mentions
+    allowed_mentions = make_allowed_mentions(mentions)
+    if len(log_lines) == 1:
+        log_line = log_lines[0]
+        descriptions = [(escape_markdown(log_line["line_without_time"]), log_line)]
+    else:
+        descriptions = []
+        for log_line in log_lines:
+            line = f"<t:{int(log_line['timestamp_ms']) // 1000}:T> {escape_markdown(log_line['line_without_time'])}"
+            if (
+                descriptions
+                and len(descriptions[-1][0]) + 1 + len(line)
+                <= DISCORD_EMBED_DESCRIPTION_LENGTH
+            ):
+                descriptions[-1] = (f"{descriptions[-1][0]}\n{line}", descriptions[-1][1])
+            else:
+                descriptions.append((line[:DISCORD_EMBED_DESCRIPTION_LENGTH], log_line))
+
+    messages = []
+    for description, first_line in descriptions:
+        embed = discord_webhook.DiscordEmbed(
+            description=description,
+            timestamp=datetime.datetime.utcfromtimestamp(first_line["timestamp_ms"] / 1000),
+        )
+        embed.set_footer(text=short_name)
+
+        wh.remove_embeds()
+        wh.content = " ".join(mentions)
+        wh.add_embed(embed)
+        wh.allowed_mentions = allowed_mentions
+        messages.append(
+            WebhookMessage(
+                payload=wh.json,
+                webhook_type=WebhookType.DISCORD,
+                message_type=WebhookMessageType.LOG_LINE,
+                server_number=int(get_server_number()),
+            )
+        )
+    return messages
+
 
+def enqueue_log_line_webhook_messages(
+        webhook: DiscordMentionWebhook,
+        log_lines: list[Dict[str, str | int | float | None]],
+) -> None:
     config = RconServerSettingsUserConfig.load_from_db()
+    for message in make_log_line_webhook_messages(webhook, log_lines, config.short_name):
+        enqueue_message(message=message)
 
-    mentions = webhook.user_mentions + webhook.role_mentions
 
-    wh = make_hook(webhook.url)
-    if not wh:
-        logger.error("Error creating discord webhook for: %s", webhook.url)
-        return
+class LogLineWebhookCoalescer:
+    """Buffer the log lines of each webhook to send them as one message per window
 
-    allowed_mentions = make_allowed_mentions(mentions)
+    The first line buffered for a webhook starts its window, every line
+    received until the window closes is sent along with it.
+    """
 
-    content = " ".join(mentions)
-    description: str = escape_markdown(log_line["line_without_time"])
-    embed = discord_webhook.DiscordEmbed(
-        description=description,
-        timestamp=datetime.datetime.utcfromtimestamp(log_line["timestamp_ms"] / 1000),
-    )
-
-    embed.set_footer(text=config.short_name)
-
-    wh.content = content
-    wh.add_embed(embed)
-    wh.allowed_mentions = allowed_mentions
-    started = time.perf_counter()
-    try:
-        wh.execute()
-    finally:
-        logger.debug(
-            "Discord log webhook completed in %.3fs",
-            time.perf_counter() - started,
-        )
+    def __init__(self, window_seconds: float = 1.0):
+        self.window_seconds = window_seconds
+        self.lock = threading.Lock()
+        self.pending: dict[str, tuple[DiscordMentionWebhook, list]] = {}
+
+    def add(self, webhook: DiscordMentionWebhook, log_line: Dict[str, str | int | float | None]):
+        key = str(webhook.url)
+        with self.lock:
+            if key in self.pending:
+                self.pending[key][1].append(log_line)
+                return
+            self.pending[key] = (webhook, [log_line])
+
+        timer = threading.Timer(self.window_seconds, self.flush, args=(key,))
+        timer.daemon = True
+        timer.start()
+
+    def flush(self, key: str):
+        with self.lock:
+            webhook, log_lines = self.pending.pop(key, (None, []))
+        if not log_lines:
+            return
+        try:
+            enqueue_log_line_webhook_messages(webhook, log_lines)
+        except Exception:
+            logger.exception("Unable to enqueue %s log lines for %s", len(log_lines), key)
+
+
+LOG_LINE_COALESCER = LogLineWebhookCoalescer()
+
+
+def send_log_line_webhook_message(
+        webhook: DiscordMentionWebhook,
+        _,
+        log_line: Dict[str, str | int | float | None],
+        coalesce: bool = False,
+) -> None:
+    """Queue a time stamped embed of the log_line and mentions for the provided Discord Webhook
+
+    The webhook service sends it, within the rate limits of the webhook. With
+    coalesce the lines received within LOG_LINE_COALESCER's window are sent
+    together in a single message.
+    """
+    if coalesce:
+        LOG_LINE_COALESCER.add(webhook, log_line)
+    else:
+        enqueue_log_line_webhook_messages(webhook, [log_line])
 
 
 # I don't think there is a good way to cache invalidate this without
@@ -212,7 +327,9 @@ def load_generic_hooks():
     config = LogLineWebhookUserConfig.load_from_db()
     for hook in config.webhooks:
         # mentions = [h.user_mentions + h.role_mentions for h in conf.webhooks]
-        func = partial(send_log_line_webhook_message, hook.webhook)
+        func = partial(
+            send_log_line_webhook_message, hook.webhook, coalesce=hook.coalesce
+        )
 
         # Have to set these attributes as the're used in LogLoop.process_hooks()
         func.__name__ = send_log_line_webhook_message.__name__
@@ -229,6 +346,8 @@ class LogLoop:
         self.red = get_redis_client()
         self.duplicate_guard_key = "unique_logs"
         self.log_history = self.get_log_history_list()
+        self.recorder_stream = LogsRecorderStream()
+        self.hook_executor = HookExecutor()
         self.ACTIVE_MAP_INDEX = 0
         self.RECORD_STATS = 30 # 0.5 minute
         self.RECORD_PLAYER_STATS_DELAY = 120 # 2 minutes
@@ -237,6 +356,7 @@ class LogLoop:
         self.CURR_MAP_END = 0
         self.now = 0
         logger.info("Registered hooks: %s", HOOKS)
+        logger.info("Registered batch hooks: %s", BATCH_HOOKS)
 
     @staticmethod
     def get_log_history_list():
@@ -259,6 +379,7 @@ class LogLoop:
                 # Let's log it and prevent restarting the service
                 logger.warning("Connection error: %s", str(e))
             last_cleanup_time = self.cleanup(last_cleanup_time, cleanup_frequency_minutes)
+            self.hook_executor.report()
             time.sleep(loop_frequency_secs)
 
     # GENERAL
@@ -353,10 +474,15 @@ class LogLoop:
         self.GET_LOGS_SINCE_MIN = 5
         current_map = MapsHistory().get_current_map()
         name_to_id = self._get_name_to_id(current_map) if current_map else {} 
+        lines = []
         for log in reversed(logs["logs"]):
             line = self.record_line(log, name_to_id)
             if line:
-                self.process_hooks(line)
+                lines.append(line)
+
+        self.process_batch_hooks(lines)
+        for line in lines:
+            self.process_hooks(line)
 
     def get_detailed_players(self) -> GetDetailedPlayers:
         started = time.perf_counter()
@@ -636,6 +762,7 @@ class LogLoop:
                     log[f"player_id_{slot}"] = player_id
                     
         self.log_history.add(log)
+        self.recorder_stream.add(log)
         return log
 
     def cleanup(self, last_cleanup_time: datetime.datetime, cleanup_frequency_minutes: int) -> datetime.datetime:
@@ -658,45 +785,31 @@ class LogLoop:
         return now
 
     def process_hooks(self, log: StructuredLogLineWithMetaData):
+        """Hand the hooks of the log line over to the hook executor"""
         logger.debug("Processing %s", f"{log['action']} | {log['message']}")
         hooks = []
-        started_total = time.time()
         for action_hook, funcs in HOOKS.items():
             if log["action"] == action_hook:
                 hooks += funcs
 
         for hook in hooks:
-            try:
-                logger.info(
-                    "Triggered %s.%s on %s", hook.__module__, hook.__name__, log["raw"]
-                )
-                started = time.time()
-                hook(self.rcon, log)
-                duration = time.time() - started
-                if duration >= 5:
-                    logger.warning(
-                        "Slow hook %.3fs %s.%s on %s",
-                        duration,
-                        hook.__module__,
-                        hook.__name__,
-                        log["raw"],
-                    )
-                logger.debug(
-                    "Ran in %.4f seconds %s.%s on %s",
-                    duration,
-                    hook.__module__,
-                    hook.__name__,
-                    log["raw"],
-                    )
-            except KeyboardInterrupt:
-                sys.exit(0)
-            except Exception as e:
-                logger.exception(
-                    f"Hook '{hook.__module__}.{hook.__name__}' for '{log}' returned an error: {e}"
-                )
-        logger.debug(
-            "Processed %s hooks in %.4f for: %s",
-            len(hooks),
-            time.time() - started_total,
-            f"{log['action']}{log['message']}",
+            logger.info(
+                "Triggered %s.%s on %s", hook.__module__, hook.__name__, log["raw"]
+            )
+            self.hook_executor.submit(hook, self.rcon, log)
+
+    def process_batch_hooks(self, logs: list[StructuredLogLineWithMetaData]):
+        """Hand the batch hooks of a fetch over to the hook executor"""
+        hooks: dict[Callable, list[StructuredLogLineWithMetaData]] = {}
+        for log in logs:
+            for hook in BATCH_HOOKS.get(log["action"], []):
+                hooks.setdefault(hook, []).append(log)
+
+        for hook, hook_logs in hooks.items():
+            logger.info(
+                "Triggered batch %s.%s on %d logs",
+                hook.__module__,
+                hook.__name__,
+                len(hook_logs),
             )
+            self.hook_executor.submit_batch(hook, self.rcon, hook_logs)
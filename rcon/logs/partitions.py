@@ -0,0 +1,204 @@
+"""Maintenance of the monthly partitions of the log_lines table.
+
+log_lines is range partitioned on event_time with one partition per month
+named log_lines_yYYYYmMM, plus a default partition catching the lines that
+fall outside of every monthly partition. The oldest partition also holds every
+line recorded before log_lines was partitioned, so those are only expired along
+with its month. Partitions are created a few months ahead, and the partitions older than the configured retention are detached and
+either kept as archive tables or dropped.
+"""
+
+import datetime
+import logging
+import os
+import re
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from rcon.models import enter_session
+from rcon.utils import strtobool
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "log_lines"
+DEFAULT_PARTITION = "log_lines_default"
+PARTITION_PREFIX = "log_lines_"
+ARCHIVE_PREFIX = "log_lines_archive_"
+PARTITION_NAME = re.compile(r"^log_lines_y(\d{4})m(\d{2})$")
+MONTHS_AHEAD = 2
+# Serializes the maintenance run by every server sharing the database
+ADVISORY_LOCK_ID = 0x4C4F475F50415254
+
+
+def get_retention_months() -> int:
+    """Number of full months of log lines to keep, 0 keeps them forever"""
+    return int(os.getenv("HLL_LOG_LINES_RETENTION_MONTHS") or 0)
+
+
+def get_drop_expired() -> bool:
+    """Whether expired partitions are dropped instead of kept as archive tables"""
+    return strtobool(os.getenv("HLL_LOG_LINES_DROP_EXPIRED", "false"))
+
+
+def month_start(value: datetime.date) -> datetime.date:
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date, prefix: str = PARTITION_PREFIX) -> str:
+    return f"{prefix}y{month.year:04d}m{month.month:02d}"
+
+
+def is_partitioned(sess: Session) -> bool:
+    return sess.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+            "WHERE partrelid = to_regclass(:table))"
+        ),
+        {"table": PARENT_TABLE},
+    ).scalar()
+
+
+def list_partitions(sess: Session) -> dict[str, datetime.date]:
+    """Map the name of every monthly partition to the month it holds"""
+    names = sess.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:table)"
+        ),
+        {"table": PARENT_TABLE},
+    ).scalars()
+
+    partitions: dict[str, datetime.date] = {}
+    for name in names:
+        if match := PARTITION_NAME.match(name):
+            partitions[name] = datetime.date(int(match[1]), int(match[2]), 1)
+    return partitions
+
+
+def create_partition(sess: Session, month: datetime.date) -> str:
+    name = partition_name(month)
+    bounds = {"lower": month, "upper": add_months(month, 1)}
+    range_ = f"FROM ('{bounds['lower']}') TO ('{bounds['upper']}')"
+
+    in_default = sess.execute(
+        text(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} "
+            "WHERE event_time >= :lower AND event_time < :upper)"
+        ),
+        bounds,
+    ).scalar()
+    if not in_default:
+        sess.execute(
+            text(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES {range_}")
+        )
+        return name
+
+    # A partition can't be added while the default partition holds lines of its
+    # range (e.g. the maintenance did not run for a while), move them first
+    logger.info("Moving lines of %s out of the default partition", name)
+    sess.execute(
+        text(
+            f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+    )
+    sess.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            "WHERE event_time >= :lower AND event_time < :upper RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        bounds,
+    )
+    sess.execute(
+        text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES {range_}")
+    )
+    return name
+
+
+def ensure_partitions(
+    sess: Session,
+    now: datetime.datetime | None = None,
+    months_ahead: int = MONTHS_AHEAD,
+) -> list[str]:
+    """Create the partitions of the current month and of the next months_ahead months"""
+    now = now or datetime.datetime.now(tz=datetime.UTC)
+    existing = set(list_partitions(sess).values())
+    current = month_start(now)
+
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if month not in existing:
+            created.append(create_partition(sess, month))
+    return created
+
+
+def detach_expired_partitions(
+    sess: Session,
+    retention_months: int,
+    now: datetime.datetime | None = None,
+    drop: bool = False,
+) -> list[str]:
+    """Detach the partitions older than the retention
+
+    The current month and the retention_months full months before it are kept.
+    Detached partitions are renamed log_lines_archive_yYYYYmMM unless dropped.
+    """
+    now = now or datetime.datetime.now(tz=datetime.UTC)
+    cutoff = add_months(month_start(now), -retention_months)
+
+    detached = []
+    for name, month in sorted(list_partitions(sess).items(), key=lambda p: p[1]):
+        if month >= cutoff:
+            continue
+        logger.info("Detaching expired log lines partition %s", name)
+        sess.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        if drop:
+            sess.execute(text(f"DROP TABLE {name}"))
+        else:
+            sess.execute(
+                text(
+                    f"ALTER TABLE {name} RENAME TO {partition_name(month, ARCHIVE_PREFIX)}"
+                )
+            )
+        detached.append(name)
+    return detached
+
+
+def maintain_partitions(
+    retention_months: int | None = None,
+    drop: bool | None = None,
+    now: datetime.datetime | None = None,
+) -> tuple[list[str], list[str]]:
+    """Create the upcoming partitions and detach the expired ones
+
+    Returns the names of the created and of the detached partitions.
+    """
+    if retention_months is None:
+        retention_months = get_retention_months()
+    if drop is None:
+        drop = get_drop_expired()
+
+    with enter_session() as sess:
+        if sess.get_bind().dialect.name != "postgresql" or not is_partitioned(sess):
+            logger.warning("%s is not partitioned, nothing to maintain", PARENT_TABLE)
+            return [], []
+
+        sess.execute(
+            text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID}
+        )
+        created = ensure_partitions(sess, now)
+        detached = []
+        if retention_months > 0:
+            detached = detach_expired_partitions(sess, retention_months, now, drop)
+
+    if created:
+        logger.info("Created log lines partitions %s", created)
+    return created, detached
@@ -1,105 +1,204 @@
+import csv
 import datetime
+import io
 import logging
-import os
 import time
-from typing import Callable, Iterable
 
-from django.template.context_processors import tz
-from sqlalchemy import desc
+import psycopg2
+import psycopg2.errors
+from sqlalchemy import func
 from sqlalchemy.dialects.postgresql import insert as postgresql_insert
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.orm import Session
 
 from rcon.game.registry import GAME_ID
-from rcon.logs.loop import LogLoop
-from rcon.models import LogLine, PlayerID, enter_session
-from rcon.player_history import _get_set_player
+from rcon.models import LogLine, enter_session
+from rcon.player_identity import get_player_identity
 from rcon.types import StructuredLogLineWithMetaData
-from rcon.utils import get_server_number
+from rcon.utils import LogsHistory, LogsRecorderStream, StreamID, get_server_number
 
 logger = logging.getLogger(__name__)
 
+# The LogLine attributes written for each recorded log, in COPY column order
+COPY_ATTRIBUTES = (
+    "version",
+    "creation_time",
+    "event_time",
+    "type",
+    "player1_name",
+    "player2_name",
+    "player1_player_id",
+    "player2_player_id",
+    "raw",
+    "content",
+    "server",
+    "weapon",
+    "game",
+)
+
+
+def _to_copy_value(value):
+    # log_lines stores naive UTC timestamps (see UTCDateTime)
+    if isinstance(value, datetime.datetime) and value.tzinfo is not None:
+        return value.astimezone(datetime.UTC).replace(tzinfo=None).isoformat()
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
 class LogRecorder:
-    def __init__(self, dump_frequency_seconds=10, log_history_fn: Callable[[], Iterable[StructuredLogLineWithMetaData]] = LogLoop.get_log_history_list):
+    """Persist the log lines cached by the log loop to the database
+
+    Lines are consumed in order from the LogsRecorderStream through a Redis
+    consumer group and only acknowledged once they are committed, so a line
+    is never lost if the recorder stops or the database is unavailable.
+    """
+
+    GROUP = "log_recorder"
+    CONSUMER = "log_recorder"
+    STAGING_TABLE = "log_lines_staging"
+
+    def __init__(
+        self,
+        dump_frequency_seconds=10,
+        stream: LogsRecorderStream | None = None,
+        batch_size: int = 10_000,
+    ):
         self.dump_frequency_seconds = dump_frequency_seconds
         self.server_id = get_server_number()
-        self.log_history_fn = log_history_fn
         if not self.server_id:
             raise ValueError("SERVER_NUMBER is not set, can't record logs")
+        self.stream = stream or LogsRecorderStream()
+        self.batch_size = batch_size
 
-    def _get_new_logs(self, sess: Session):
-        to_store: list[StructuredLogLineWithMetaData] = []
-        last_log = (
-            sess.query(LogLine)
-            .filter(LogLine.server == self.server_id)
-            .order_by(desc(LogLine.event_time))
-            .limit(1)
-            .one_or_none()
-        )
-        logger.info("Getting new logs from %s", last_log.event_time if last_log else 0)
-        log: StructuredLogLineWithMetaData
-        for log in self.log_history_fn():
-            if not isinstance(log, dict):
-                logger.warning("Log is invalid, not a dict: %s", log)
-                continue
-            if last_log and log["event_time"] == last_log.event_time and '] ' + log["line_without_time"] in last_log.raw:
-                logger.debug("This log is the same as the last saved log, skipping saving the rest of the logs\n%s", log)
-                break
-            to_store.append(log)
-        return to_store
+    def _backfill_from_history(self):
+        """Record the cached logs newer than the last recorded log
 
-    def _collect_player_ids(self, sess: Session, logs: list[StructuredLogLineWithMetaData]) -> dict[str, PlayerID | None]:
-        players: dict[str, PlayerID | None] = {}
+        Only needed when the consumer group is created, for the logs that were
+        cached before the log loop started feeding the recorder stream.
+        """
+        # Oldest first, in a single LRANGE
+        cached = [log for log in reversed(LogsHistory()[:]) if isinstance(log, dict)]
+        if not cached:
+            return
+
+        with enter_session() as sess:
+            # Bounded by the oldest cached log so only the recent partitions are searched
+            last_event_time = (
+                sess.query(func.max(LogLine.event_time))
+                .filter(
+                    LogLine.server == self.server_id,
+                    LogLine.event_time >= cached[0]["event_time"],
+                )
+                .scalar()
+            )
+            logger.info("Backfilling cached logs from %s", last_event_time)
+            to_store = [
+                log
+                for log in cached
+                if last_event_time is None or log["event_time"] >= last_event_time
+            ]
+            if self._save_logs(sess, to_store):
+                sess.commit()
+
+    def _collect_player_ids(
+        self, sess: Session, logs: list[StructuredLogLineWithMetaData]
+    ) -> dict[str, int]:
+        """Resolve every player ID found in the logs to its PlayerID primary key"""
         names: dict[str, str | None] = {}
         for log in logs:
             for i in [1, 2]:
                 if log[f"player_id_{i}"] is not None:
-                    players.setdefault(log[f"player_id_{i}"], None)
                     names.setdefault(log[f"player_id_{i}"], log[f"player_name_{i}"])
-        if not players:
-            return players
-
-        # NOTE potential race condition if this player id collection runs before
-        # the player id is stored in the db
-        # or the logs did not arrive in chronological order e.g. KILL log before CONNECTED log
-        # where PlayerID is only created on CONNECTED log trigger
-        unique_player_ids = set(players.keys( ))
-        pid_query = sess.query(PlayerID).filter(PlayerID.player_id.in_(list(players.keys())))
-        for pid in pid_query:
-            players[pid.player_id] = pid
-            unique_player_ids.remove(pid.player_id)
-        if len(unique_player_ids) != 0:
-            logger.info("[MISSING PlayerID Records] - Creating PlayerID records\nMissing: %s", unique_player_ids)
-            for player_id in unique_player_ids:
-                pid = _get_set_player(sess, player_id, names[player_id])
-                players[pid.player_id] = pid
-        return players
-
-    def _save_logs(self, sess, to_store: list[StructuredLogLineWithMetaData]):
+        if not names:
+            return {}
+
+        # Players that are not yet known (e.g. a KILL log processed before the CONNECTED
+        # log of that player was) are created in bulk along with their name
+        return get_player_identity().get_or_create_pks(sess, names)
+
+    def _copy_rows(self, sess: Session, rows: list[dict]):
+        """COPY the rows into a staging table and merge them into log_lines
+
+        Lines that were already recorded are skipped thanks to the unique
+        (event_time, raw) constraint.
+        """
+        columns = ", ".join(
+            LogLine.__mapper__.columns[attribute].name for attribute in COPY_ATTRIBUTES
+        )
+        buffer = io.StringIO()
+        # Only None is left unquoted, which COPY reads as NULL
+        writer = csv.writer(buffer, quoting=csv.QUOTE_NOTNULL)
+        writer.writerows(
+            [_to_copy_value(row[attribute]) for attribute in COPY_ATTRIBUTES]
+            for row in rows
+        )
+        buffer.seek(0)
+
+        cursor = sess.connection().connection.cursor()
+        try:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE IF NOT EXISTS {self.STAGING_TABLE} "
+                f"ON COMMIT DELETE ROWS AS SELECT {columns} FROM log_lines WITH NO DATA"
+            )
+            cursor.copy_expert(
+                f"COPY {self.STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+            cursor.execute(
+                f"INSERT INTO log_lines ({columns}) SELECT {columns} FROM {self.STAGING_TABLE} "
+                "ON CONFLICT ON CONSTRAINT unique_log_line DO NOTHING"
+            )
+            cursor.execute(f"TRUNCATE {self.STAGING_TABLE}")
+        finally:
+            cursor.close()
+
+    def _insert_rows(self, sess: Session, rows: list[dict]):
+        """Insert the rows one at a time, skipping the ones the database rejects
+
+        Used when a batch can't be copied, so that one bad line doesn't keep
+        the whole batch pending forever.
+        """
+        for row in rows:
+            statement = postgresql_insert(LogLine).values(**row)
+            statement = statement.on_conflict_do_nothing(constraint="unique_log_line")
+            try:
+                with sess.begin_nested():
+                    sess.execute(statement)
+            # psycopg2 refuses strings with NUL characters before sending them
+            except (DataError, IntegrityError, ValueError):
+                logger.exception(
+                    "Unable to record log line, skipping it: %s", row["raw"]
+                )
+
+    def _save_logs(self, sess, to_store: list[StructuredLogLineWithMetaData]) -> bool:
+        """Add the logs to the session's transaction, return False if they could not be"""
         if not to_store:
-            return
+            return True
 
         players = self._collect_player_ids(sess, to_store)
         rows = []
+        creation_time = datetime.datetime.now(tz=datetime.UTC)
 
         for log in to_store:
-            player_1: PlayerID | None = None
-            player_2: PlayerID | None = None
+            player_1: int | None = None
+            player_2: int | None = None
             if log["player_id_1"]:
-                player_1 = players[log["player_id_1"]]
+                player_1 = players.get(log["player_id_1"])
             if log["player_id_2"]:
-                player_2 = players[log["player_id_2"]]
+                player_2 = players.get(log["player_id_2"])
 
             logger.debug("Saving log: [%d] -> %s", log["timestamp_ms"], log["raw"])
             rows.append(
                 {
                     "version": log["version"],
+                    "creation_time": creation_time,
                     "event_time": log["event_time"],
                     "type": log["action"],
                     "player1_name": log["player_name_1"],
                     "player2_name": log["player_name_2"],
-                    "player1_player_id": player_1.id if player_1 else None,
-                    "player2_player_id": player_2.id if player_2 else None,
+                    "player1_player_id": player_1,
+                    "player2_player_id": player_2,
                     "raw": log["raw"],
                     "content": log["message"],
                     "server": self.server_id,
@@ -108,38 +207,106 @@ class LogRecorder:
                 }
             )
 
-
         try:
             if sess.get_bind().dialect.name == "postgresql":
-                statement = postgresql_insert(LogLine).values(rows)
-                statement = statement.on_conflict_do_nothing(
-                    constraint="unique_log_line",
-                )
-                sess.execute(statement)
+                try:
+                    with sess.begin_nested():
+                        self._copy_rows(sess, rows)
+                # A cached PK whose PlayerID row is gone, drop them and retry later
+                except psycopg2.errors.ForeignKeyViolation:
+                    sess.rollback()
+                    get_player_identity().forget(*players)
+                    logger.exception("Unable to record log batch, stale player PKs")
+                    return False
+                # COPY goes through the raw cursor, its errors are not wrapped
+                except (psycopg2.DataError, psycopg2.IntegrityError):
+                    logger.exception(
+                        "Unable to copy log batch, inserting it line by line"
+                    )
+                    self._insert_rows(sess, rows)
             else:
                 sess.add_all(LogLine(**row) for row in rows)
                 sess.flush()
         except IntegrityError:
             sess.rollback()
             logger.exception("Unable to record log batch")
+            return False
+        return True
+
+    def _record_entries(
+        self, entries: list[tuple[StreamID, StructuredLogLineWithMetaData | None]]
+    ) -> bool:
+        """Save the stream entries and acknowledge them once committed"""
+        to_store = []
+        for _, log in entries:
+            # Trimmed from the stream before they could be recorded
+            if log is None:
+                continue
+            if not isinstance(log, dict):
+                logger.warning("Log is invalid, not a dict: %s", log)
+                continue
+            to_store.append(log)
+
+        committed = False
+        started = time.perf_counter()
+        with enter_session() as sess:
+            if self._save_logs(sess, to_store):
+                sess.commit()
+                committed = True
+
+        if not committed:
+            logger.error(
+                "Unable to record %d log lines, they will be retried", len(to_store)
+            )
+            return False
+
+        self.stream.ack(self.GROUP, *(id_ for id_, _ in entries))
+        logger.info(
+            "Recorded %d log lines in %.3fs",
+            len(to_store),
+            time.perf_counter() - started,
+        )
+        return True
 
     def run(self, run_immediately=False, one_off=False):
-        last_run = datetime.datetime.now(tz=datetime.UTC)
-        if run_immediately or one_off:
-            last_run = last_run - datetime.timedelta(seconds=self.dump_frequency_seconds + 1)
+        """Record new logs every dump_frequency_seconds
+
+        one_off records everything available and returns, run_immediately
+        skips waiting for the first batch to accumulate.
+        """
+        if self.stream.create_group(self.GROUP):
+            self._backfill_from_history()
+
+        # Start with the entries delivered to us but never acknowledged (e.g. the
+        # recorder was restarted mid batch), they must be recorded first to keep ordering
+        pending = True
+        if not (run_immediately or one_off):
+            time.sleep(self.dump_frequency_seconds)
 
         while True:
-            now = datetime.datetime.now(tz=datetime.UTC)
-            if not (now - last_run).total_seconds() > self.dump_frequency_seconds:
-                logger.debug("Not due for recording yet")
-                time.sleep(5)
+            entries = self.stream.read_group(
+                self.GROUP,
+                self.CONSUMER,
+                pending=pending,
+                count=self.batch_size,
+                block_ms=None if one_off else self.dump_frequency_seconds * 1000,
+            )
+            if not entries:
+                if pending:
+                    pending = False
+                    continue
+                if one_off:
+                    break
                 continue
-            with enter_session() as sess:
-                to_store = self._get_new_logs(sess)
-                logger.info("%s log lines to record", len(to_store))
 
-                self._save_logs(sess, to_store)
+            if not self._record_entries(entries):
+                # Unacknowledged entries stay pending, retry them after a while
+                pending = True
+                if one_off:
+                    break
+                time.sleep(self.dump_frequency_seconds)
+                continue
 
-                last_run = datetime.datetime.now(tz=datetime.UTC)
-            if one_off:
-                break
+            # Let the next batch accumulate instead of writing a few lines at a time
+            if len(entries) < self.batch_size and not one_off:
+                time.sleep(self.dump_frequency_seconds)
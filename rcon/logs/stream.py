@@ -2,17 +2,80 @@ import datetime
 import logging
 import time
 from collections import defaultdict
+from collections.abc import Iterable
 
+import orjson
 import redis
 
 from rcon.cache_utils import get_redis_client
 from rcon.rcon import Rcon, get_rcon
 from rcon.types import StructuredLogLineWithMetaData
 from rcon.user_config.log_stream import LogStreamUserConfig
-from rcon.utils import Stream, StreamOlderElement, StreamID, StreamNoElements
+from rcon.utils import Stream, StreamID, StreamNoElements
 
 logger = logging.getLogger(__name__)
 
+# A log is stored in a single field as a JSON array of its values in this order
+LOG_STREAM_FIELDS = tuple(StructuredLogLineWithMetaData.__annotations__)
+LOG_STREAM_FIELD = b"l"
+
+
+def encode_log_stream_entry(log: StructuredLogLineWithMetaData) -> dict[bytes, bytes]:
+    return {LOG_STREAM_FIELD: orjson.dumps([log.get(f) for f in LOG_STREAM_FIELDS])}
+
+
+def decode_log_stream_entry(fields: dict) -> StructuredLogLineWithMetaData:
+    """Decode an entry of the log stream, for the producer and every consumer"""
+    packed = fields.get(LOG_STREAM_FIELD, fields.get(LOG_STREAM_FIELD.decode()))
+    if packed is None:
+        # Written before the compact format, one JSON encoded field per key
+        return {orjson.loads(k): orjson.loads(v) for k, v in fields.items()}
+    return dict(zip(LOG_STREAM_FIELDS, orjson.loads(packed)))  # type: ignore
+
+
+def stream_id_key(stream_id: str) -> tuple[int, int]:
+    ms, _, seq = stream_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class CompactLogStream(Stream[StructuredLogLineWithMetaData]):
+    def _to_compatible_object(self, obj: StructuredLogLineWithMetaData):
+        return encode_log_stream_entry(obj)
+
+    def _from_compatible_object(self, raw_obj: dict[bytes, bytes]):
+        return decode_log_stream_entry(raw_obj)
+
+    def add_many(
+        self, entries: Iterable[tuple[str, StructuredLogLineWithMetaData]]
+    ) -> int:
+        """XADD every (ID, log) then trim the stream, in a single round trip
+
+        Returns how many were added, the entries the stream rejects (e.g. an ID
+        not greater than its last one) are logged and skipped.
+        """
+        pipe = self.red.pipeline(transaction=False)
+        stream_ids = []
+        for stream_id, log in entries:
+            pipe.xadd(self.key, fields=self._to_compatible_object(log), id=stream_id)
+            stream_ids.append(stream_id)
+        if not stream_ids:
+            return 0
+        pipe.xtrim(self.key, maxlen=self.maxlen, approximate=True)
+        *results, trimmed = pipe.execute(raise_on_error=False)
+
+        added = 0
+        for stream_id, result in zip(stream_ids, results):
+            if isinstance(result, redis.ResponseError):
+                logger.warning(
+                    "Unable to add log %s to the stream: %s", stream_id, result
+                )
+            else:
+                added += 1
+        if isinstance(trimmed, redis.ResponseError):
+            logger.warning("Unable to trim the log stream: %s", trimmed)
+        return added
+
+
 class LogStream:
     # Each CRCON uses its own redis database, no need for keys to be unique across servers
     def __init__(
@@ -26,7 +89,7 @@ class LogStream:
         self.rcon = rcon or get_rcon()
         self.red = red or get_redis_client()
         self.log_history_key = key
-        self.log_stream = Stream(key=key, maxlen=maxlen or config.stream_size)
+        self.log_stream = CompactLogStream(key=key, maxlen=maxlen or config.stream_size)
 
     def clear(self):
         logger.info("Clearing stream")
@@ -73,28 +136,46 @@ class LogStream:
         logs = self.rcon.get_structured_logs(since_min_ago=since_min)["logs"]
         since_min = active_since_min or config.refresh_since_mins
 
-        last_seen_id = None
+        tail = self.log_stream.tail()
+        last_seen_id = tail[0] if tail else None
         while True:
             config = LogStreamUserConfig.load_from_db()
             if not config.enabled:
                 break
-            ordered_logs = self.bucket_by_timestamp(logs)
-            new_logs = 0
-            for timestamp, log_bucket in ordered_logs:
-                for idx, log in enumerate(log_bucket):
-                    timestamp_ms = log["timestamp_ms"] // 1000
-                    stream_id = f"{timestamp_ms}-{idx}"
-                    try:
-                        last_seen_id = self.log_stream.add(custom_id=stream_id, obj=log)
-                        new_logs += 1
-                    except StreamOlderElement:
-                        continue
-
+            new_logs = self.new_entries(self.bucket_by_timestamp(logs), last_seen_id)
             if new_logs:
-                logger.info(f"Added {new_logs} new logs {last_seen_id=}")
+                added = self.log_stream.add_many(new_logs)
+                if added == len(new_logs):
+                    last_seen_id = new_logs[-1][0]
+                else:
+                    # Some were rejected, start over from what the stream holds
+                    tail = self.log_stream.tail()
+                    last_seen_id = tail[0] if tail else None
+                logger.info(f"Added {added} new logs {last_seen_id=}")
             time.sleep(loop_frequency_secs or config.refresh_frequency_sec)
             logs = self.rcon.get_structured_logs(since_min_ago=since_min)["logs"]
 
+    @staticmethod
+    def new_entries(
+        ordered_logs: list[
+            tuple[datetime.datetime, list[StructuredLogLineWithMetaData]]
+        ],
+        last_seen_id: StreamID = None,
+    ) -> list[tuple[str, StructuredLogLineWithMetaData]]:
+        """The (stream ID, log) of the logs more recent than the stream's last entry
+
+        Filtering them upfront lets every XADD of a fetch go in one pipeline,
+        the stream rejects IDs that are not greater than its last one.
+        """
+        last_seen = stream_id_key(last_seen_id) if last_seen_id else (0, 0)
+        entries = []
+        for timestamp, log_bucket in ordered_logs:
+            for idx, log in enumerate(log_bucket):
+                timestamp_ms = log["timestamp_ms"] // 1000
+                if (timestamp_ms, idx) > last_seen:
+                    entries.append((f"{timestamp_ms}-{idx}", log))
+        return entries
+
     def logs_since(
             self, last_seen: StreamID | None = None, block_ms=500
     ) -> list[tuple[StreamID, StructuredLogLineWithMetaData]]:
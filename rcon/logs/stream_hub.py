@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Iterable
+
+import redis.asyncio
+import redis.exceptions
+
+from rcon.cache_utils import get_async_redis_client
+from rcon.game_logs import is_action
+from rcon.logs.stream import decode_log_stream_entry, stream_id_key
+from rcon.types import AllLogTypes, StructuredLogLineWithMetaData
+from rcon.user_config.log_stream import LogStreamUserConfig
+from rcon.utils import REDIS_STREAM_INVALID_ID, StreamID
+
+logger = logging.getLogger(__name__)
+
+LOG_STREAM_KEY = "log_stream"
+LOG_STREAM_DISABLED = "Log stream is not enabled in your config"
+LOG_STREAM_TOO_SLOW = "Too many logs waiting to be sent, reconnect with last_seen_id"
+
+LogStreamEntry = tuple[str, StructuredLogLineWithMetaData]
+
+
+def decode_stream_entry(id_: bytes | str, fields: dict) -> LogStreamEntry:
+    """Deserialize a log stream entry, see `rcon.logs.stream.CompactLogStream`"""
+    if isinstance(id_, bytes):
+        id_ = id_.decode()
+    return id_, decode_log_stream_entry(fields)
+
+
+class LogStreamSubscription:
+    """The logs waiting to be sent to one client
+
+    Entries are filtered on the client's actions and queued up to `maxsize`,
+    a client that falls that far behind is dropped instead of slowing down
+    the others, it can reconnect from its last seen ID. Until the entries
+    missed since `last_seen_id` are loaded, the live ones are held back.
+    """
+
+    def __init__(
+        self,
+        last_seen_id: StreamID = None,
+        actions: list[AllLogTypes] | None = None,
+        maxsize: int = 1000,
+    ):
+        self.last_seen_id = last_seen_id
+        self.actions = actions or []
+        self.queue: asyncio.Queue[LogStreamEntry] = asyncio.Queue(maxsize)
+        self.error: str | None = None
+        self.closed = asyncio.Event()
+        self.held_back: list[LogStreamEntry] | None = []
+
+    def wants(self, entry: LogStreamEntry) -> bool:
+        if not self.actions:
+            return True
+        return bool(is_action(self.actions, entry[1]["action"], exact_match=False))
+
+    def deliver(self, entries: Iterable[LogStreamEntry]) -> bool:
+        """Queue the entries newer than the last seen one, False once dropped"""
+        if self.closed.is_set():
+            return False
+        if self.held_back is not None:
+            self.held_back.extend(entries)
+            return True
+
+        last_seen = stream_id_key(self.last_seen_id) if self.last_seen_id else None
+        for entry in entries:
+            if last_seen is not None and stream_id_key(entry[0]) <= last_seen:
+                continue
+            self.last_seen_id = entry[0]
+            if not self.wants(entry):
+                continue
+            try:
+                self.queue.put_nowait(entry)
+            except asyncio.QueueFull:
+                self.close(LOG_STREAM_TOO_SLOW)
+                return False
+        return True
+
+    def release(self, missed: Iterable[LogStreamEntry]) -> bool:
+        """Queue the missed entries, then the live ones held back meanwhile"""
+        held_back, self.held_back = self.held_back or [], None
+        return self.deliver(missed) and self.deliver(held_back)
+
+    def close(self, error: str | None = None):
+        if not self.closed.is_set():
+            self.error = error
+            self.closed.set()
+
+    async def get_batch(self, size: int = 25) -> list[LogStreamEntry]:
+        """Wait for entries and return up to `size` of them, [] once closed"""
+        if self.queue.empty():
+            getter = asyncio.ensure_future(self.queue.get())
+            closed = asyncio.ensure_future(self.closed.wait())
+            try:
+                await asyncio.wait(
+                    [getter, closed], return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                closed.cancel()
+            if not getter.done():
+                getter.cancel()
+                return []
+            batch = [getter.result()]
+        else:
+            batch = [self.queue.get_nowait()]
+
+        while len(batch) < size and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+
+class LogStreamHub:
+    """Read the log stream once per process and fan it out to the websockets
+
+    A single task blocks on XREAD with an async client while there are
+    subscribers, each entry is read and deserialized once whatever the
+    number of clients. The log stream config is checked every
+    `config_ttl_seconds`, subscribers are closed when it gets disabled.
+    """
+
+    def __init__(
+        self,
+        red: redis.asyncio.Redis | None = None,
+        key: str = LOG_STREAM_KEY,
+        block_ms: int = 5000,
+        count: int = 500,
+        config_ttl_seconds: float = 5,
+        load_config: Callable[[], Awaitable[LogStreamUserConfig]] | None = None,
+    ):
+        self._red = red
+        self.key = key
+        self.block_ms = block_ms
+        self.count = count
+        self.config_ttl_seconds = config_ttl_seconds
+        self.load_config = load_config or self._load_config
+        self.subscriptions: set[LogStreamSubscription] = set()
+        self.last_id: str | None = None
+        self.task: asyncio.Task | None = None
+        self.started = asyncio.Event()
+        self._enabled: tuple[float, bool] | None = None
+
+    @property
+    def red(self) -> redis.asyncio.Redis:
+        if self._red is None:
+            self._red = get_async_redis_client()
+        return self._red
+
+    @staticmethod
+    async def _load_config() -> LogStreamUserConfig:
+        return await asyncio.to_thread(LogStreamUserConfig.load_from_db)
+
+    async def is_enabled(self) -> bool:
+        now = time.monotonic()
+        if self._enabled is None or now - self._enabled[0] >= self.config_ttl_seconds:
+            self._enabled = (now, (await self.load_config()).enabled)
+        return self._enabled[1]
+
+    async def _tail_id(self) -> str:
+        tail = await self.red.xrevrange(self.key, count=1)
+        return decode_stream_entry(*tail[0])[0] if tail else "0-0"
+
+    async def _missed(
+        self, subscription: LogStreamSubscription
+    ) -> list[LogStreamEntry]:
+        """The entries since the last seen ID, at most half a queue of the newest"""
+        if subscription.last_seen_id is None:
+            # Like a fresh LogStream.logs_since, start with the most recent log
+            count, min_id = 1, "-"
+        else:
+            count = max(subscription.queue.maxsize // 2, 1)
+            min_id = f"({subscription.last_seen_id}"
+
+        try:
+            entries = await self.red.xrevrange(
+                self.key, max="+", min=min_id, count=count
+            )
+        except redis.exceptions.ResponseError:
+            subscription.close(REDIS_STREAM_INVALID_ID)
+            return []
+        return [decode_stream_entry(*entry) for entry in reversed(entries)]
+
+    async def subscribe(
+        self,
+        last_seen_id: StreamID = None,
+        actions: list[AllLogTypes] | None = None,
+        maxsize: int = 1000,
+    ) -> LogStreamSubscription:
+        subscription = LogStreamSubscription(last_seen_id, actions, maxsize)
+        if not await self.is_enabled():
+            subscription.close(LOG_STREAM_DISABLED)
+            return subscription
+
+        self.subscriptions.add(subscription)
+        if self.task is None or self.task.done():
+            self.started = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+        # The reader must know where the stream ends before the missed entries
+        # are read, or the ones added in between would be lost
+        await self.started.wait()
+
+        try:
+            missed = await self._missed(subscription)
+        except Exception:
+            self.unsubscribe(subscription)
+            raise
+        subscription.release(missed)
+        return subscription
+
+    def unsubscribe(self, subscription: LogStreamSubscription):
+        subscription.close()
+        self.subscriptions.discard(subscription)
+
+    def broadcast(self, entries: list[LogStreamEntry]):
+        for subscription in list(self.subscriptions):
+            if not subscription.deliver(entries):
+                logger.warning("Dropping a log stream client: %s", subscription.error)
+                self.subscriptions.discard(subscription)
+
+    def close_all(self, error: str | None = None):
+        for subscription in self.subscriptions:
+            subscription.close(error)
+        self.subscriptions.clear()
+
+    async def read(self) -> list[LogStreamEntry]:
+        response = await self.red.xread(
+            {self.key: self.last_id}, count=self.count, block=self.block_ms
+        )
+        if not response:
+            return []
+        entries = [decode_stream_entry(*entry) for entry in response[0][1]]
+        self.last_id = entries[-1][0]
+        return entries
+
+    async def run(self):
+        try:
+            self.last_id = await self._tail_id()
+        except Exception:
+            logger.exception("Unable to read the end of the log stream")
+        finally:
+            self.started.set()
+
+        while self.subscriptions:
+            try:
+                if self.last_id is None:
+                    self.last_id = await self._tail_id()
+                if not await self.is_enabled():
+                    self.close_all(LOG_STREAM_DISABLED)
+                    break
+                if entries := await self.read():
+                    self.broadcast(entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Unable to read the log stream")
+                await asyncio.sleep(1)
+
+
+_HUB: LogStreamHub | None = None
+
+
+def get_log_stream_hub() -> LogStreamHub:
+    global _HUB
+    if _HUB is None:
+        _HUB = LogStreamHub()
+    return _HUB
@@ -1,6 +1,7 @@
 import math
 import random
-from collections.abc import Iterable, Sequence
+import time
+from collections.abc import Callable, Iterable, Sequence
 from datetime import datetime
 from functools import partial
 from itertools import takewhile
@@ -22,120 +23,318 @@ from rcon.vote_map import VoteMap
 logger = getLogger(__name__)
 
 
-def populate_message_variables(
-    vars: Iterable[str],
-    player_id: str | None = None,
-    rcon: Rcon | None = None,
-) -> dict[MessageVariable, str | None]:
-    """Return globally available info for message formatting"""
-    populated_variables: dict[MessageVariable, str | None] = {}
-    if rcon is None:
-        rcon = get_rcon()
-
-    vote_results: list[tuple[Layer, int]] | None = None
-
-    def fetch_vote_results():
-        nonlocal vote_results
-        if vote_results is None:
-            vote_results = vote_status()
-        return vote_results
-
-    message_variable_to_lookup = {
-        MessageVariable.vip_status: lambda: _is_vip(player_id=player_id, rcon=rcon),
-        MessageVariable.vip_expiration: lambda: _vip_expiration(
-            player_id=player_id, rcon=rcon
+# Shared data the message variables are computed from, fetched at most once
+# per resolver so a variable used in several messages costs a single lookup.
+# Names are looked up when called so they can be monkeypatched.
+MESSAGE_VARIABLE_SOURCES: dict[str, Callable[[Rcon], Any]] = {
+    "server_name": lambda rcon: rcon.get_name(),
+    "server_settings": lambda rcon: RconServerSettingsUserConfig.load_from_db(),
+    "admin_ping": lambda rcon: AdminPingWebhooksUserConfig.load_from_db(),
+    "online_mods": lambda rcon: online_mods(),
+    "ingame_mods": lambda rcon: ingame_mods(),
+    "next_map": lambda rcon: rcon.get_next_map(),
+    "map_rotation": lambda rcon: rcon.get_map_rotation(),
+    "live_game_stats": lambda rcon: get_cached_live_game_stats(),
+    "vote_results": lambda rcon: vote_status(),
+    "vote_selection": lambda rcon: VoteMap().get_selection(),
+    "vote_map_config": lambda rcon: VoteMapUserConfig.load_from_db(),
+    "admin_ids": lambda rcon: rcon.get_admin_ids(),
+    "vip_ids": lambda rcon: rcon.get_vip_ids(),
+}
+
+
+def _admin_names(admin_ids, role: str | None = None) -> list[str]:
+    return [d["name"] for d in admin_ids if role is None or d["role"] == role]
+
+
+def _total_votes(vote_results):
+    return sum(v for m, v in vote_results) if vote_results else math.nan
+
+
+# variable: (sources it depends on, compute(get_source, player_id))
+MESSAGE_VARIABLE_LOOKUPS: dict[
+    MessageVariable,
+    tuple[tuple[str, ...], Callable[[Callable[[str], Any], str | None], Any]],
+] = {
+    MessageVariable.vip_status: (
+        ("vip_ids",),
+        lambda get, player_id: _is_vip(player_id=player_id, vip_ids=get("vip_ids")),
+    ),
+    MessageVariable.vip_expiration: (
+        ("vip_ids",),
+        lambda get, player_id: _vip_expiration(
+            player_id=player_id, vip_ids=get("vip_ids")
         ),
-        MessageVariable.server_name: rcon.get_name,
-        MessageVariable.server_short_name: _server_short_name,
-        MessageVariable.discord_invite_url: _discord_invite_url,
-        MessageVariable.admin_ping_trigger_words: _admin_ping_trigger_words,
-        MessageVariable.num_online_mods: lambda: str(len(online_mods())),
-        MessageVariable.num_ingame_mods: lambda: str(len(ingame_mods())),
-        MessageVariable.next_map: _next_map,
-        MessageVariable.next_map_id: _next_map_id,
-        MessageVariable.map_rotation: _map_rotation,
-        MessageVariable.top_kills_player_name: lambda: _generic_score_ties(
-            stat_key=PlayerStatsEnum.KILLS, tie_key="kills", result_key="player"
+    ),
+    MessageVariable.server_name: (("server_name",), lambda get, _: get("server_name")),
+    MessageVariable.server_short_name: (
+        ("server_settings",),
+        lambda get, _: _server_short_name(get("server_settings")),
+    ),
+    MessageVariable.discord_invite_url: (
+        ("server_settings",),
+        lambda get, _: _discord_invite_url(get("server_settings")),
+    ),
+    MessageVariable.admin_ping_trigger_words: (
+        ("admin_ping",),
+        lambda get, _: _admin_ping_trigger_words(get("admin_ping")),
+    ),
+    MessageVariable.num_online_mods: (
+        ("online_mods",),
+        lambda get, _: str(len(get("online_mods"))),
+    ),
+    MessageVariable.num_ingame_mods: (
+        ("ingame_mods",),
+        lambda get, _: str(len(get("ingame_mods"))),
+    ),
+    MessageVariable.next_map: (
+        ("next_map",),
+        lambda get, _: get("next_map").pretty_name,
+    ),
+    MessageVariable.next_map_id: (("next_map",), lambda get, _: get("next_map").id),
+    MessageVariable.map_rotation: (
+        ("map_rotation",),
+        lambda get, _: ", ".join(map_.pretty_name for map_ in get("map_rotation")),
+    ),
+    MessageVariable.top_kills_player_name: (
+        ("live_game_stats",),
+        lambda get, _: _generic_score_ties(
+            stat_key=PlayerStatsEnum.KILLS,
+            tie_key="kills",
+            result_key="player",
+            stats=get("live_game_stats"),
         ),
-        MessageVariable.top_kills_player_score: lambda: _generic_score_top_only(
-            stat_key=PlayerStatsEnum.KILLS, result_key="kills"
+    ),
+    MessageVariable.top_kills_player_score: (
+        ("live_game_stats",),
+        lambda get, _: _generic_score_top_only(
+            stat_key=PlayerStatsEnum.KILLS,
+            result_key="kills",
+            stats=get("live_game_stats"),
         ),
-        MessageVariable.top_kill_streak_player_name: lambda: _generic_score_ties(
+    ),
+    MessageVariable.top_kill_streak_player_name: (
+        ("live_game_stats",),
+        lambda get, _: _generic_score_ties(
             stat_key=PlayerStatsEnum.KILLS_STREAK,
             tie_key="kills_streak",
             result_key="player",
+            stats=get("live_game_stats"),
         ),
-        MessageVariable.top_kill_streak_player_score: lambda: _generic_score_top_only(
-            stat_key=PlayerStatsEnum.KILLS_STREAK, result_key="kills_streak"
-        ),
-        MessageVariable.votenextmap_line: partial(format_map_vote, format_type="line"),
-        MessageVariable.votenextmap_noscroll: partial(
-            format_map_vote, format_type="max_length"
-        ),
-        MessageVariable.votenextmap_vertical: partial(
-            format_map_vote, format_type="vertical"
-        ),
-        MessageVariable.votenextmap_by_mod_line: partial(
-            format_map_vote, format_type="by_mod_line"
-        ),
-        MessageVariable.votenextmap_by_mod_vertical: partial(
-            format_map_vote, format_type="by_mod_vertical"
-        ),
-        MessageVariable.votenextmap_by_mod_vertical_all: partial(
-            format_map_vote, format_type="by_mod_vertical_all"
-        ),
-        MessageVariable.votenextmap_by_mod_split: partial(
-            format_map_vote, format_type="by_mod_split"
-        ),
-        MessageVariable.total_votes: lambda: (
-            sum(v for m, v in fetch_vote_results())
-            if fetch_vote_results()
-            else math.nan
-        ),
-        MessageVariable.winning_maps_short: lambda: format_winning_map(
-            rcon, fetch_vote_results(), 2
+    ),
+    MessageVariable.top_kill_streak_player_score: (
+        ("live_game_stats",),
+        lambda get, _: _generic_score_top_only(
+            stat_key=PlayerStatsEnum.KILLS_STREAK,
+            result_key="kills_streak",
+            stats=get("live_game_stats"),
         ),
-        MessageVariable.winning_maps_all: lambda: format_winning_map(
-            rcon, fetch_vote_results(), 0
+    ),
+    **{
+        var: (
+            ("vote_selection",),
+            partial(
+                lambda format_type, get, _: format_map_vote(
+                    format_type, selection=get("vote_selection")
+                ),
+                format_type,
+            ),
+        )
+        for var, format_type in [
+            (MessageVariable.votenextmap_line, "line"),
+            (MessageVariable.votenextmap_noscroll, "max_length"),
+            (MessageVariable.votenextmap_vertical, "vertical"),
+            (MessageVariable.votenextmap_by_mod_line, "by_mod_line"),
+            (MessageVariable.votenextmap_by_mod_vertical, "by_mod_vertical"),
+            (MessageVariable.votenextmap_by_mod_vertical_all, "by_mod_vertical_all"),
+            (MessageVariable.votenextmap_by_mod_split, "by_mod_split"),
+        ]
+    },
+    MessageVariable.total_votes: (
+        ("vote_results",),
+        lambda get, _: _total_votes(get("vote_results")),
+    ),
+    MessageVariable.winning_maps_short: (
+        ("vote_results", "next_map"),
+        lambda get, _: format_winning_map(
+            None, get("vote_results"), 2, next_map=get("next_map")
         ),
-        MessageVariable.scrolling_votemap: lambda: scrolling_votemap(
-            rcon, fetch_vote_results()
+    ),
+    MessageVariable.winning_maps_all: (
+        ("vote_results", "next_map"),
+        lambda get, _: format_winning_map(
+            None, get("vote_results"), 0, next_map=get("next_map")
         ),
-        # Deprecated: Taken over from previous auto-broadcast
-        MessageVariable.admin_names: lambda: [d["name"] for d in rcon.get_admin_ids()],
-        MessageVariable.owner_names: lambda: [
-            d["name"] for d in rcon.get_admin_ids() if d["role"] == "owner"
-        ],
-        MessageVariable.senior_names: lambda: [
-            d["name"] for d in rcon.get_admin_ids() if d["role"] == "senior"
-        ],
-        MessageVariable.junior_names: lambda: [
-            d["name"] for d in rcon.get_admin_ids() if d["role"] == "junior"
-        ],
-        MessageVariable.vip_names: lambda: [d["name"] for d in rcon.get_vip_ids()],
-        MessageVariable.random_vip_name: lambda: random.choice(
-            [d["name"] for d in rcon.get_vip_ids()]
+    ),
+    MessageVariable.scrolling_votemap: (
+        ("vote_results", "next_map", "vote_selection", "vote_map_config"),
+        lambda get, _: scrolling_votemap(
+            None,
+            get("vote_results"),
+            config=get("vote_map_config"),
+            selection=get("vote_selection"),
+            next_map=get("next_map"),
         ),
-        MessageVariable.online_mods: lambda: [mod["username"] for mod in online_mods()],
-        MessageVariable.ingame_mods: lambda: [mod["username"] for mod in ingame_mods()],
-    }
-
+    ),
+    # Deprecated: Taken over from previous auto-broadcast
+    MessageVariable.admin_names: (
+        ("admin_ids",),
+        lambda get, _: _admin_names(get("admin_ids")),
+    ),
+    MessageVariable.owner_names: (
+        ("admin_ids",),
+        lambda get, _: _admin_names(get("admin_ids"), "owner"),
+    ),
+    MessageVariable.senior_names: (
+        ("admin_ids",),
+        lambda get, _: _admin_names(get("admin_ids"), "senior"),
+    ),
+    MessageVariable.junior_names: (
+        ("admin_ids",),
+        lambda get, _: _admin_names(get("admin_ids"), "junior"),
+    ),
+    MessageVariable.vip_names: (
+        ("vip_ids",),
+        lambda get, _: [d["name"] for d in get("vip_ids")],
+    ),
+    MessageVariable.random_vip_name: (
+        ("vip_ids",),
+        lambda get, _: random.choice([d["name"] for d in get("vip_ids")]),
+    ),
+    MessageVariable.online_mods: (
+        ("online_mods",),
+        lambda get, _: [mod["username"] for mod in get("online_mods")],
+    ),
+    MessageVariable.ingame_mods: (
+        ("ingame_mods",),
+        lambda get, _: [mod["username"] for mod in get("ingame_mods")],
+    ),
+}
+
+# Their value changes every time they are computed
+VOLATILE_MESSAGE_VARIABLES = {MessageVariable.random_vip_name}
+
+
+def parse_message_variables(vars: Iterable[str]) -> list[MessageVariable]:
+    """The known message variables of `vars`, others are context variables"""
+    parsed = []
     for raw_var in vars:
         try:
-            var = MessageVariable[raw_var]
+            parsed.append(MessageVariable[raw_var])
         except KeyError:
             # Not logging this because otherwise any context passed variables would
             # clutter the logs every single message
             continue
+    return parsed
 
-        populated_variables[var] = message_variable_to_lookup[var]()
 
-    return populated_variables
+class MessageVariableResolver:
+    """Compute message variables from sources fetched once per resolver
 
+    Every variable is derived from a handful of sources (server name, VIP
+    list, vote results...), the distinct sources needed by a batch of
+    variables are fetched once and kept. With `max_age_seconds` set a
+    source is fetched again once it gets older than that, `versions` tells
+    whether its value changed since, so already formatted messages only need
+    to be rendered again when one of their sources did.
+    """
 
-def scrolling_votemap(rcon, winning_maps, repeat=10):
-    config = VoteMapUserConfig.load_from_db()
-    vote_options = format_map_vote("line")
+    def __init__(
+        self,
+        rcon: Rcon | None = None,
+        max_age_seconds: float | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._rcon = rcon
+        self.max_age_seconds = max_age_seconds
+        self.clock = clock
+        self.values: dict[str, Any] = {}
+        self.fetched_at: dict[str, float] = {}
+        self.versions: dict[str, int] = {}
+
+    @property
+    def rcon(self) -> Rcon:
+        if self._rcon is None:
+            self._rcon = get_rcon()
+        return self._rcon
+
+    @staticmethod
+    def sources_of(variables: Iterable[MessageVariable]) -> set[str]:
+        return {
+            source for var in variables for source in MESSAGE_VARIABLE_LOOKUPS[var][0]
+        }
+
+    def is_stale(self, source: str) -> bool:
+        if source not in self.fetched_at:
+            return True
+        return (
+            self.max_age_seconds is not None
+            and self.clock() - self.fetched_at[source] >= self.max_age_seconds
+        )
+
+    def _store(self, source: str, value: Any):
+        if source not in self.values or self.values[source] != value:
+            self.versions[source] = self.versions.get(source, 0) + 1
+        self.values[source] = value
+        self.fetched_at[source] = self.clock()
+
+    def prefetch(self, variables: Iterable[MessageVariable]):
+        """Fetch the missing or outdated sources of `variables`
+
+        Sources are fetched one after the other on the calling thread: most of
+        them are cached, and ServerCtl keeps an RCON connection open for every
+        thread that uses it, so a thread per fetch would leak connections.
+        """
+        for source in sorted(self.sources_of(variables)):
+            if self.is_stale(source):
+                self._store(source, MESSAGE_VARIABLE_SOURCES[source](self.rcon))
+
+    def get(self, source: str) -> Any:
+        if self.is_stale(source):
+            self._store(source, MESSAGE_VARIABLE_SOURCES[source](self.rcon))
+        return self.values[source]
+
+    def source_versions(self, variables: Iterable[MessageVariable]) -> tuple:
+        """Identify the values of the sources of `variables`, must be prefetched"""
+        return tuple(
+            (source, self.versions.get(source))
+            for source in sorted(self.sources_of(variables))
+        )
+
+    def resolve(
+        self, vars: Iterable[str], player_id: str | None = None
+    ) -> dict[MessageVariable, str | None]:
+        variables = parse_message_variables(vars)
+        self.prefetch(variables)
+        return {
+            var: MESSAGE_VARIABLE_LOOKUPS[var][1](self.get, player_id)
+            for var in variables
+        }
+
+
+def populate_message_variables(
+    vars: Iterable[str],
+    player_id: str | None = None,
+    rcon: Rcon | None = None,
+    resolver: MessageVariableResolver | None = None,
+) -> dict[MessageVariable, str | None]:
+    """Return globally available info for message formatting"""
+    if resolver is None:
+        resolver = MessageVariableResolver(rcon)
+    return resolver.resolve(vars, player_id=player_id)
+
+
+def scrolling_votemap(
+    rcon,
+    winning_maps,
+    repeat=10,
+    config: VoteMapUserConfig | None = None,
+    selection: list[Layer] | None = None,
+    next_map: Layer | None = None,
+):
+    if config is None:
+        config = VoteMapUserConfig.load_from_db()
+    vote_options = format_map_vote("line", selection=selection)
     if not vote_options:
         return ""
     separator = "  ***  "
@@ -147,7 +346,11 @@ def scrolling_votemap(rcon, winning_maps, repeat=10):
     instructions = separator.join([instructions] * repeat_instructions)
 
     winning_maps = format_winning_map(
-        rcon, winning_maps, display_count=0, default=config.no_vote_text
+        rcon,
+        winning_maps,
+        display_count=0,
+        default=config.no_vote_text,
+        next_map=next_map,
     )
     repeat_winning_maps = max(
         int(len(options) / (len(winning_maps) + len(separator))), 1
@@ -162,12 +365,14 @@ def format_winning_map(
     winning_maps: Sequence[tuple[maps.Layer, int]],
     display_count=2,
     default=None,
+    next_map: Layer | None = None,
 ):
-    nextmap = ctl.get_next_map()
     if not winning_maps:
         if default:
             return str(default)
-        return f"{nextmap}"
+        if next_map is None:
+            next_map = ctl.get_next_map()
+        return f"{next_map}"
     wins = winning_maps[:display_count]
     if display_count == 0:
         wins = winning_maps
@@ -209,8 +414,9 @@ def join_vote_options(
     return join_char.join(f"[{maps_to_numbers[m]}] {m.pretty_name}" for m in selection)
 
 
-def format_map_vote(format_type="line"):
-    selection = VoteMap().get_selection()
+def format_map_vote(format_type="line", selection: list[Layer] | None = None):
+    if selection is None:
+        selection = VoteMap().get_selection()
     if not selection:
         return ""
 
@@ -286,28 +492,38 @@ def format_message_string(
 
 
 def _vip_status(
-    player_id: str | None = None, rcon: Rcon | None = None
+    player_id: str | None = None,
+    rcon: Rcon | None = None,
+    vip_ids: list[VipIdType] | None = None,
 ) -> VipIdType | None:
-    if rcon is None:
-        rcon = get_rcon()
+    if vip_ids is None:
+        if rcon is None:
+            rcon = get_rcon()
+        vip_ids = rcon.get_vip_ids()
 
-    vip = [v for v in rcon.get_vip_ids() if v["player_id"] == player_id]
+    vip = [v for v in vip_ids if v["player_id"] == player_id]
     logger.info(f"{vip=}")
 
     if vip:
         return vip[0]
 
 
-def _is_vip(player_id: str | None = None, rcon: Rcon | None = None) -> bool:
-    vip = _vip_status(player_id=player_id, rcon=rcon)
+def _is_vip(
+    player_id: str | None = None,
+    rcon: Rcon | None = None,
+    vip_ids: list[VipIdType] | None = None,
+) -> bool:
+    vip = _vip_status(player_id=player_id, rcon=rcon, vip_ids=vip_ids)
 
     return vip is not None
 
 
 def _vip_expiration(
-    player_id: str | None = None, rcon: Rcon | None = None
+    player_id: str | None = None,
+    rcon: Rcon | None = None,
+    vip_ids: list[VipIdType] | None = None,
 ) -> datetime | None:
-    vip = _vip_status(player_id=player_id, rcon=rcon)
+    vip = _vip_status(player_id=player_id, rcon=rcon, vip_ids=vip_ids)
 
     return vip["vip_expiration"] if vip else None
 
@@ -377,6 +593,7 @@ def _generic_score_top_only(
     result_key: str,
     stats: CachedLiveGameStats | None = None,
 ):
-    stats = get_cached_live_game_stats()
+    if stats is None:
+        stats = get_cached_live_game_stats()
     metric_stats = get_stat(stats["stats"], key=stat_key, limit=1)
     return str(metric_stats[0][result_key])
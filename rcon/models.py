@@ -15,6 +15,7 @@ from sqlalchemy import (
     Engine,
     Enum,
     ForeignKey,
+    Index,
     NullPool,
     Pool,
     String,
@@ -312,41 +313,42 @@ class PlayerSoldier(Base):
     )
 
     @classmethod
-    def update(cls, player: GetDetailedPlayer):
-        logger.debug(f"Updating soldier {player['name']}")
-        with enter_session() as sess:
-            # Retrieve the PlayerID instance to get its ID for foreign key reference
-            player_id_stmt = select(PlayerID).where(
-                PlayerID.player_id == player["player_id"]
-            )
-            player_id_record = sess.execute(player_id_stmt).scalars().one_or_none()
+    def update_many(cls, players: Sequence[GetDetailedPlayer]):
+        """Update the soldier of every player, loaded together in a single query"""
+        if not players:
+            return
 
-            if not player_id_record:
-                # Handle case where PlayerID does not exist
-                logger.exception(
-                    f"PlayerID not found for player_id: {player['player_id']}"
-                )
-                return
-
-            player_id_fk = player_id_record.id
+        with enter_session() as sess:
+            rows = sess.execute(
+                select(PlayerID.player_id, PlayerID.id, cls)
+                .outerjoin(cls, cls.player_id_id == PlayerID.id)
+                .where(PlayerID.player_id.in_([p["player_id"] for p in players]))
+            ).tuples()
+            soldiers = {player_id: (pk, profile) for player_id, pk, profile in rows}
+
+            for player in players:
+                logger.debug(f"Updating soldier {player['name']}")
+                if player["player_id"] not in soldiers:
+                    # Handle case where PlayerID does not exist
+                    logger.error(
+                        f"PlayerID not found for player_id: {player['player_id']}"
+                    )
+                    continue
 
-            # Query for existing PlayerSoldier
-            profile_stmt = select(cls).where(
-                cls.player_id_id == player_id_fk
-            )  # Direct filter on FK; join optional here
-            profile = sess.execute(profile_stmt).scalars().one_or_none()
-            if not profile:
-                # Create new instance
-                profile = cls(player_id_id=player_id_fk)
-                sess.add(profile)
+                player_id_fk, profile = soldiers[player["player_id"]]
+                if not profile:
+                    # Create new instance
+                    profile = cls(player_id_id=player_id_fk)
+                    sess.add(profile)
+                    soldiers[player["player_id"]] = (player_id_fk, profile)
 
-            # Proceed with updates
-            profile.eos_id = player["eos_id"]
-            profile.name = player["name"]
-            profile.platform = player["platform"]
-            profile.clan_tag = player["clan_tag"]
+                # Proceed with updates
+                profile.eos_id = player["eos_id"]
+                profile.name = player["name"]
+                profile.platform = player["platform"]
+                profile.clan_tag = player["clan_tag"]
 
-            profile.level = max(profile.level, player["level"])
+                profile.level = max(profile.level or 0, player["level"])
 
             sess.commit()
 
@@ -421,6 +423,14 @@ class PlayerSoldier(Base):
 
 class PlayerAccount(Base):
     __tablename__ = "player_account"
+    __table_args__ = (
+        Index(
+            "ix_player_account_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     player_id_id: Mapped[int] = mapped_column(
@@ -661,6 +671,18 @@ class PlayerName(Base):
     __tablename__ = "player_names"
     __table_args__ = (
         UniqueConstraint("playersteamid_id", "name", name="unique_name_steamid"),
+        # Name searches use ILIKE, served by pg_trgm indexes (see rcon.player_history)
+        Index(
+            "ix_player_names_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_player_names_name_unaccent_trgm",
+            text("immutable_unaccent(name) gin_trgm_ops"),
+            postgresql_using="gin",
+        ),
     )
 
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -733,13 +755,32 @@ class PlayersAction(Base):
 
 class LogLine(Base):
     __tablename__ = "log_lines"
-    __table_args__ = (UniqueConstraint("event_time", "raw", name="unique_log_line"),)
+    # Monthly partitions are managed by rcon.logs.partitions, the partition key
+    # has to be part of the primary key and of every unique constraint
+    __table_args__ = (
+        UniqueConstraint("event_time", "raw", name="unique_log_line"),
+        Index("ix_log_lines_event_time_brin", "event_time", postgresql_using="brin"),
+        Index("ix_log_lines_server_event_time", "server", "event_time"),
+        Index(
+            "ix_log_lines_player1_name_trgm",
+            "player1_name",
+            postgresql_using="gin",
+            postgresql_ops={"player1_name": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_log_lines_player2_name_trgm",
+            "player2_name",
+            postgresql_using="gin",
+            postgresql_ops={"player2_name": "gin_trgm_ops"},
+        ),
+        {"postgresql_partition_by": "RANGE (event_time)"},
+    )
 
-    id: Mapped[int] = mapped_column(primary_key=True)
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     version: Mapped[int] = mapped_column(default=1)
     creation_time: Mapped[datetime] = mapped_column(TIMESTAMP, default=datetime.utcnow)
     event_time: Mapped[datetime] = mapped_column(
-        UTCDateTime, nullable=False, index=True
+        UTCDateTime, primary_key=True, nullable=False
     )
     type: Mapped[str] = mapped_column(nullable=True)
     player1_name: Mapped[str] = mapped_column(nullable=True)
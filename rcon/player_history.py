@@ -2,11 +2,12 @@ import datetime
 import logging
 import math
 import unicodedata
+from collections.abc import Mapping, Sequence
 from datetime import UTC
 from functools import cmp_to_key
 
 from dateutil import parser
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, select, union, update
 from sqlalchemy.orm import Session, contains_eager, selectinload
 from sqlalchemy.sql.functions import ReturnTypeFromArgs
 
@@ -25,6 +26,8 @@ from rcon.models import (
     WatchList,
     enter_session,
 )
+from rcon.player_identity import get_player_identity
+from rcon.policy_index import refresh_player_policies
 from rcon.types import (
     PlayerActionState,
     PlayerActionType,
@@ -40,6 +43,12 @@ class unaccent(ReturnTypeFromArgs):
     pass
 
 
+class immutable_unaccent(ReturnTypeFromArgs):
+    """unaccent() wrapper usable in index expressions, see the trigram indexes"""
+
+    pass
+
+
 logger = logging.getLogger(__name__)
 
 
@@ -100,8 +109,27 @@ def _get_profiles(sess, player_ids, nb_sessions=0):
 
 
 def get_profiles(player_ids, nb_sessions=1):
+    """The profiles of many players, every relationship they serialize is
+    loaded with one query for all of them instead of one per player"""
     with enter_session() as sess:
-        players = _get_profiles(sess, player_ids, nb_sessions)
+        players = (
+            sess.query(PlayerID)
+            .filter(PlayerID.player_id.in_(player_ids))
+            .options(
+                selectinload(PlayerID.names),
+                selectinload(PlayerID.sessions),
+                selectinload(PlayerID.received_actions),
+                selectinload(PlayerID.blacklists).selectinload(
+                    BlacklistRecord.blacklist
+                ),
+                selectinload(PlayerID.flags),
+                selectinload(PlayerID.watchlist),
+                selectinload(PlayerID.steaminfo),
+                selectinload(PlayerID.soldier),
+                selectinload(PlayerID.account),
+            )
+            .all()
+        )
 
         return [p.to_dict(limit_sessions=nb_sessions) for p in players]
 
@@ -135,6 +163,55 @@ def remove_accent(s):
     return unicodedata.normalize("NFD", s).encode("ascii", "ignore").decode("utf-8")
 
 
+def _players_matching_name(
+    player_name: str,
+    exact_name_match: bool = False,
+    ignore_accent: bool = True,
+    fuzzy_name_match: bool = False,
+):
+    """Select the PKs of the players with a soldier or account name matching player_name
+
+    Names and accounts are searched separately so each side of the union can
+    use its trigram index, player_name must already be unaccented if ignore_accent is set.
+    """
+    soldier_name = (
+        immutable_unaccent(PlayerName.name) if ignore_accent else PlayerName.name
+    )
+    account_name = PlayerAccount.name
+    if exact_name_match:
+        soldier_match = soldier_name == player_name
+        account_match = account_name == player_name
+    elif fuzzy_name_match:
+        # pg_trgm similarity operator, true above pg_trgm.similarity_threshold
+        soldier_match = soldier_name.op("%")(player_name)
+        account_match = account_name.op("%")(player_name)
+    else:
+        soldier_match = soldier_name.ilike(f"%{player_name}%")
+        account_match = account_name.ilike(f"%{player_name}%")
+
+    return union(
+        select(PlayerName.player_id_id).where(soldier_match),
+        select(PlayerAccount.player_id_id).where(account_match),
+    )
+
+
+def _name_similarity(player_name: str, ignore_accent: bool = True):
+    """Best trigram similarity between player_name and any name of the player"""
+    soldier_name = (
+        immutable_unaccent(PlayerName.name) if ignore_accent else PlayerName.name
+    )
+    return func.greatest(
+        select(func.max(func.similarity(soldier_name, player_name)))
+        .where(PlayerName.player_id_id == PlayerID.id)
+        .correlate(PlayerID)
+        .scalar_subquery(),
+        select(func.similarity(PlayerAccount.name, player_name))
+        .where(PlayerAccount.player_id_id == PlayerID.id)
+        .correlate(PlayerID)
+        .scalar_subquery(),
+    )
+
+
 def get_players_by_appearance(
     page: int = 1,
     page_size: int = 500,
@@ -148,7 +225,14 @@ def get_players_by_appearance(
     ignore_accent: bool = True,
     flags: str | list[str] | None = None,
     country: str | None = None,
+    fuzzy_name_match: bool = False,
 ):
+    """Search the players, most recently seen first
+
+    fuzzy_name_match matches the names similar to player_name (typos, missing
+    characters...) instead of the ones containing it, and ranks the players by
+    how similar their closest name is.
+    """
     page = int(page)
     page_size = int(page_size)
 
@@ -162,6 +246,7 @@ def get_players_by_appearance(
     is_watched = strtobool(is_watched)
     exact_name_match = strtobool(exact_name_match)
     ignore_accent = strtobool(ignore_accent)
+    fuzzy_name_match = strtobool(fuzzy_name_match) and not exact_name_match
 
     if page <= 0:
         raise ValueError("page needs to be >= 1")
@@ -189,35 +274,19 @@ def get_players_by_appearance(
         if player_id:
             query = query.filter(PlayerID.player_id.ilike(f"%{player_id}%"))
 
+        order_by = [func.coalesce(sub.c.last, PlayerID.created).desc()]
         if player_name:
-            soldier_name = PlayerName.name
-            account_name = PlayerAccount.name
             if ignore_accent:
-                soldier_name = unaccent(PlayerName.name)
                 player_name = remove_accent(player_name)
-            if not exact_name_match:
-                query = (
-                    query.join(PlayerID.names)
-                    .join(PlayerID.account)
-                    .filter(
-                        or_(
-                            soldier_name.ilike(f"%{player_name}%"),
-                            account_name.isnot(None)
-                            & account_name.ilike(f"%{player_name}%"),
-                        )
-                    )
-                )
-            else:
-                query = (
-                    query.join(PlayerID.names)
-                    .join(PlayerID.account)
-                    .filter(
-                        or_(
-                            soldier_name == player_name,
-                            account_name.isnot(None) & (account_name == player_name),
-                        )
+            query = query.filter(
+                PlayerID.id.in_(
+                    _players_matching_name(
+                        player_name, exact_name_match, ignore_accent, fuzzy_name_match
                     )
                 )
+            )
+            if fuzzy_name_match:
+                order_by.insert(0, _name_similarity(player_name, ignore_accent).desc())
 
         if blacklisted is True:
             query = query.filter(
@@ -261,7 +330,7 @@ def get_players_by_appearance(
         total = query.count()
         page = min(max(math.ceil(total / page_size), 1), page)
         players = (
-            query.order_by(func.coalesce(sub.c.last, PlayerID.created).desc())
+            query.order_by(*order_by)
             .limit(page_size)
             .offset((page - 1) * page_size)
             # All relations used in PlayerID.to_dict should be loaded here to avoid lazyloading in the for loop below
@@ -353,6 +422,12 @@ def _save_player_alias(sess, player: PlayerID, player_name: str, timestamp=None)
     return name
 
 
+def _set_steam_id(sess: Session, player_pk: int, steam_id: str):
+    sess.query(PlayerID).filter(PlayerID.id == player_pk).update(
+        {PlayerID.steam_id: steam_id}
+    )
+
+
 def save_player(
     player_name: str,
     player_id: str,
@@ -361,17 +436,42 @@ def save_player(
     steam_id: str | None = None,
 ) -> None:
     """Create a PlayerID record if non existent and save the player name alias"""
+    save_players(
+        {player_id: player_name},
+        timestamp,
+        steam_ids={player_id: steam_id} if steam_id else None,
+    )
+
+
+def save_players(
+    players: Mapping[str, str],
+    timestamp: float | Mapping[str, float] | None = None,
+    *,
+    steam_ids: Mapping[str, str] | None = None,
+) -> dict[str, int]:
+    """Bulk version of save_player for a mapping of player IDs to names
+
+    timestamp is when the names were seen, either one for every player or
+    one per player ID. Returns the PK of every player.
+    """
     with enter_session() as sess:
-        player = _save_player_id(sess, player_id)
-        _save_player_alias(
+        pks = get_player_identity().get_or_create_pks(
             sess,
-            player,
-            player_name,
+            players,
             timestamp or datetime.datetime.now(tz=UTC).timestamp(),
+            save_names=True,
         )
-        if steam_id:
-            player.steam_id = steam_id
-            sess.commit()
+        if steam_ids:
+            sess.execute(
+                update(PlayerID),
+                [
+                    {"id": pks[player_id], "steam_id": steam_id}
+                    for player_id, steam_id in steam_ids.items()
+                    if player_id in pks
+                ],
+            )
+        sess.commit()
+    return pks
 
 
 def save_player_action(
@@ -385,17 +485,15 @@ def save_player_action(
     steam_id: str | None = None,
 ):
     with enter_session() as sess:
-        player = _get_set_player(
-            sess,
-            player_name=player_name,
-            player_id=player_id,
-            timestamp=timestamp,
-            steam_id=steam_id,
-        )
+        player_pk = get_player_identity().get_or_create_pks(
+            sess, {player_id: player_name}, timestamp, save_names=True
+        )[player_id]
+        if steam_id:
+            _set_steam_id(sess, player_pk, steam_id)
         sess.add(
             PlayersAction(
                 action_type=action_type.name.upper(),
-                player=player,
+                player_id_id=player_pk,
                 reason=reason,
                 by=by,
             )
@@ -433,84 +531,113 @@ def save_start_player_session(
     server_name: str | None = None,
     server_number: int | None = None,
 ):
-    config = RconServerSettingsUserConfig.load_from_db()
+    save_player_sessions([(player_id, True, timestamp)], server_name, server_number)
+
+
+def save_end_player_session(player_id: str, timestamp):
+    save_player_sessions([(player_id, False, timestamp)])
 
-    server_name = server_name or config.short_name
 
+def save_player_sessions(
+    events: Sequence[tuple[str, bool, float]],
+    server_name: str | None = None,
+    server_number: int | None = None,
+):
+    """Record the start or the end of the sessions of many players at once
+
+    events are (player_id, connected, timestamp) tuples in the order they
+    happened. The sessions of every player are loaded with a single query
+    and the changes are written in a single flush.
+    """
+    if not events:
+        return
+
+    config = RconServerSettingsUserConfig.load_from_db()
+    server_name = server_name or config.short_name
     if server_number is None:
         server_number = int(get_server_number())
 
     with enter_session() as sess:
-        player = get_player(sess, player_id)
-        if not player:
-            logger.error(
-                "Can't record player session for %s, player not found", player_id
-            )
-            return
-
-        start_time = datetime.datetime.fromtimestamp(timestamp, tz=UTC)
-        already_saved = (
-            sess.query(PlayerSession)
-            .filter(PlayerSession.player == player)
-            .filter(PlayerSession.start == start_time)
-            .first()
+        pks = get_player_identity().get_pks(
+            sess, {player_id for player_id, _, _ in events}
         )
-
-        if already_saved is not None:
-            logger.info(
-                f"Player session starting at {start_time} for player {player_id} already recorded, skipping..."
-            )
-            return
-
-        sess.add(
-            PlayerSession(
-                player=player,
-                start=start_time,
-                server_name=server_name,
-                server_number=server_number,
+        starts = [
+            datetime.datetime.fromtimestamp(timestamp, tz=UTC)
+            for _, connected, timestamp in events
+            if connected
+        ]
+        recorded_starts: set[tuple[int, datetime.datetime]] = set()
+        if starts:
+            recorded_starts = set(
+                sess.execute(
+                    select(PlayerSession.player_id_id, PlayerSession.start).where(
+                        PlayerSession.player_id_id.in_(pks.values()),
+                        PlayerSession.start.in_(starts),
+                    )
+                ).tuples()
             )
+        last_session_ids = (
+            select(func.max(PlayerSession.id))
+            .where(PlayerSession.player_id_id.in_(pks.values()))
+            .group_by(PlayerSession.player_id_id)
         )
-        logger.info(
-            "Recorded player %s session start at %s",
-            player_id,
-            datetime.datetime.fromtimestamp(timestamp, tz=UTC),
-        )
-        sess.commit()
-
-
-def save_end_player_session(player_id: str, timestamp):
-    with enter_session() as sess:
-        player = get_player(sess, player_id)
-        if not player:
-            logger.error(
-                "Can't record player session for %s, player not found", player_id
+        last_sessions: dict[int, PlayerSession] = {
+            session.player_id_id: session
+            for session in sess.scalars(
+                select(PlayerSession).where(PlayerSession.id.in_(last_session_ids))
             )
-            return
+        }
 
-        last_session = (
-            sess.query(PlayerSession)
-            .filter(PlayerSession.player == player)
-            .order_by(PlayerSession.created.desc())
-            .first()
-        )
+        for player_id, connected, timestamp in events:
+            player_pk = pks.get(player_id)
+            if player_pk is None:
+                logger.error(
+                    "Can't record player session for %s, player not found", player_id
+                )
+                continue
+
+            event_time = datetime.datetime.fromtimestamp(timestamp, tz=UTC)
+            if connected:
+                if (player_pk, event_time) in recorded_starts:
+                    logger.info(
+                        "Player session starting at %s for player %s already recorded, skipping...",
+                        event_time,
+                        player_id,
+                    )
+                    continue
 
-        if last_session is None:
-            logger.warning(
-                "Can't record player session for %s, last session not found",
-                player_id,
-            )
-            return
+                session = PlayerSession(
+                    player_id_id=player_pk,
+                    start=event_time,
+                    server_name=server_name,
+                    server_number=server_number,
+                )
+                sess.add(session)
+                recorded_starts.add((player_pk, event_time))
+                last_sessions[player_pk] = session
+                logger.info(
+                    "Recorded player %s session start at %s", player_id, event_time
+                )
+                continue
 
-        if last_session.end:
-            logger.warning(
-                "Last session was already ended for %s. Creating a new one instead",
-                player_id,
-            )
-            last_session = PlayerSession(
-                player=player,
-            )
-        last_session.end = datetime.datetime.fromtimestamp(timestamp, tz=UTC)
-        logger.info("Recorded player %s session end at %s", player_id, last_session.end)
+            session = last_sessions.get(player_pk)
+            if session is None:
+                logger.warning(
+                    "Can't record player session for %s, last session not found",
+                    player_id,
+                )
+                continue
+
+            if session.end:
+                logger.warning(
+                    "Last session was already ended for %s. Creating a new one instead",
+                    player_id,
+                )
+                session = PlayerSession(player_id_id=player_pk)
+                sess.add(session)
+                last_sessions[player_pk] = session
+            session.end = event_time
+            logger.info("Recorded player %s session end at %s", player_id, event_time)
         sess.commit()
 
 
@@ -540,6 +667,7 @@ def add_flag_to_player(
         new = PlayerFlag(flag=flag, comment=comment, player=player)
         sess.add(new)
         sess.commit()
+        refresh_player_policies([player_id], sess)
         res = player.to_dict()
         return res, new.to_dict()
 
@@ -571,6 +699,7 @@ def remove_flag(
         old_flag = exists.to_dict()
         sess.delete(exists)
         sess.commit()
+        refresh_player_policies([player["player_id"]], sess)
 
     return player, old_flag
 
@@ -0,0 +1,305 @@
+"""Shared resolution of game player IDs to PlayerID primary keys.
+
+The player_id -> PK mapping only changes when PlayerID rows are merged or
+re-keyed by the maintenance commands, so it is cached aggressively: an
+in-process LRU in front of a Redis hash shared by every process of the server.
+Those commands call forget_all(), which drops the hash and has every process
+drop its LRU within GENERATION_CHECK_SECONDS. Missing players are created in
+bulk so resolving a whole batch of log lines or connecting players costs a
+constant number of queries.
+"""
+
+import datetime
+import logging
+import threading
+import time
+from collections.abc import Iterable, Mapping
+from datetime import UTC
+from typing import Optional
+
+import redis
+import redis.exceptions
+from cachetools import LRUCache
+from sqlalchemy import event
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.orm import Session
+
+from rcon.cache_utils import get_redis_client
+from rcon.models import PlayerAccount, PlayerID, PlayerName, PlayerSoldier
+
+logger = logging.getLogger(__name__)
+
+IDENTITY: Optional["PlayerIdentityCache"] = None
+
+# Session.info key of the players created in its transaction, they are only
+# cached once it is committed
+_CREATED_PLAYERS_KEY = "player_identity_created"
+
+
+class PlayerIdentityCache:
+    REDIS_KEY = "player_identity_pks"
+    # Set when the hash is created and never extended, so whatever the maintenance
+    # commands could not invalidate (e.g. a database restored from a backup) is
+    # dropped at least once a day
+    REDIS_TTL_SECONDS = 60 * 60 * 24
+    # Bumped by forget_all() so every process drops its local cache
+    GENERATION_KEY = "player_identity_generation"
+    GENERATION_CHECK_SECONDS = 10
+
+    def __init__(self, red: redis.Redis | None = None, maxsize: int = 50_000):
+        self.red = red or get_redis_client()
+        self._local: LRUCache[str, int] = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._generation: bytes | str | None = None
+        self._generation_checked_at: float | None = None
+
+    def _remember(self, pks: Mapping[str, int]):
+        if not pks:
+            return
+        with self._lock:
+            self._local.update(pks)
+        try:
+            with self.red.pipeline(transaction=False) as pipe:
+                pipe.hset(self.REDIS_KEY, mapping=dict(pks))
+                pipe.expire(self.REDIS_KEY, self.REDIS_TTL_SECONDS, nx=True)
+                pipe.execute()
+        except redis.exceptions.RedisError:
+            logger.exception("Unable to cache player PKs")
+
+    def _remember_after_commit(self, sess: Session, pks: Mapping[str, int]):
+        if pks:
+            sess.info.setdefault(_CREATED_PLAYERS_KEY, []).append((self, dict(pks)))
+
+    def _check_generation(self):
+        """Drop the local cache if forget_all() was called by another process"""
+        now = time.monotonic()
+        if (
+            self._generation_checked_at is not None
+            and now - self._generation_checked_at < self.GENERATION_CHECK_SECONDS
+        ):
+            return
+        try:
+            generation = self.red.get(self.GENERATION_KEY)
+        except redis.exceptions.RedisError:
+            logger.exception("Unable to check the player PKs generation")
+            return
+        with self._lock:
+            if generation != self._generation:
+                self._local.clear()
+                self._generation = generation
+            self._generation_checked_at = now
+
+    def forget_all(self):
+        """For the commands deleting or re-keying PlayerID rows"""
+        with self._lock:
+            self._local.clear()
+        try:
+            with self.red.pipeline(transaction=True) as pipe:
+                pipe.delete(self.REDIS_KEY)
+                pipe.incr(self.GENERATION_KEY)
+                pipe.execute()
+        except redis.exceptions.RedisError:
+            logger.exception("Unable to forget the cached player PKs")
+
+    def forget(self, *player_ids: str):
+        if not player_ids:
+            return
+        with self._lock:
+            for player_id in player_ids:
+                self._local.pop(player_id, None)
+        try:
+            self.red.hdel(self.REDIS_KEY, *player_ids)
+        except redis.exceptions.RedisError:
+            logger.exception("Unable to forget player PKs")
+
+    def get_pks(self, sess: Session, player_ids: Iterable[str]) -> dict[str, int]:
+        """Map each known player ID to its PK, unknown player IDs are omitted
+
+        Looks up the process local LRU, then the shared Redis hash and finally
+        the database with a single IN query for whatever is left.
+        """
+        self._check_generation()
+        pks: dict[str, int] = {}
+        missing: list[str] = []
+        with self._lock:
+            for player_id in set(player_ids):
+                pk = self._local.get(player_id)
+                if pk is None:
+                    missing.append(player_id)
+                else:
+                    pks[player_id] = pk
+
+        if not missing:
+            return pks
+
+        try:
+            cached = self.red.hmget(self.REDIS_KEY, missing)
+        except redis.exceptions.RedisError:
+            logger.exception("Unable to read cached player PKs")
+            cached = [None] * len(missing)
+
+        from_redis: dict[str, int] = {}
+        still_missing: list[str] = []
+        for player_id, pk in zip(missing, cached):
+            if pk is None:
+                still_missing.append(player_id)
+            else:
+                from_redis[player_id] = int(pk)
+        with self._lock:
+            self._local.update(from_redis)
+        pks.update(from_redis)
+
+        if still_missing:
+            from_db: dict[str, int] = dict(
+                sess.query(PlayerID.player_id, PlayerID.id).filter(
+                    PlayerID.player_id.in_(still_missing)
+                )
+            )
+            self._remember(from_db)
+            pks.update(from_db)
+
+        return pks
+
+    def get_pk(self, sess: Session, player_id: str) -> int | None:
+        return self.get_pks(sess, [player_id]).get(player_id)
+
+    def get_or_create_pks(
+        self,
+        sess: Session,
+        players: Mapping[str, str | None],
+        timestamp: float | Mapping[str, float] | None = None,
+        *,
+        save_names: bool = False,
+    ) -> dict[str, int]:
+        """Resolve every player ID to its PK, creating the missing players
+
+        players maps a player ID to its name (if known). Names are saved as
+        aliases for newly created players, or for every player if save_names
+        is set, as last seen at timestamp, which can be given per player ID.
+        The created players are flushed, the caller commits them and their PKs
+        are only cached once it does.
+        """
+        pks = self.get_pks(sess, players.keys())
+        missing = [player_id for player_id in players if player_id not in pks]
+        created: dict[str, int] = {}
+        if missing:
+            logger.info("Adding first time seen players %s", missing)
+            created = _bulk_create_players(sess, missing)
+            pks.update(created)
+
+        names = {
+            pks[player_id]: name
+            for player_id, name in players.items()
+            if name and player_id in pks and (save_names or player_id in created)
+        }
+        if names:
+            if isinstance(timestamp, Mapping):
+                timestamp = {
+                    pks[player_id]: player_timestamp
+                    for player_id, player_timestamp in timestamp.items()
+                    if player_id in pks
+                }
+            _bulk_upsert_player_names(sess, names, timestamp)
+
+        if created:
+            sess.flush()
+            self._remember_after_commit(sess, created)
+        return pks
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_created_players(sess: Session):
+    for identity, pks in sess.info.pop(_CREATED_PLAYERS_KEY, []):
+        identity._remember(pks)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_uncommitted_players(sess: Session, transaction):
+    # Rolled back or closed without a commit, the players were never created
+    if transaction.parent is None:
+        sess.info.pop(_CREATED_PLAYERS_KEY, None)
+
+
+def _bulk_create_players(sess: Session, player_ids: list[str]) -> dict[str, int]:
+    if sess.get_bind().dialect.name != "postgresql":
+        from rcon.player_history import _save_player_id
+
+        return {
+            player_id: _save_player_id(sess, player_id).id for player_id in player_ids
+        }
+
+    statement = (
+        postgresql_insert(PlayerID)
+        .values([{"player_id": player_id} for player_id in player_ids])
+        .on_conflict_do_nothing(index_elements=[PlayerID.player_id])
+        .returning(PlayerID.player_id, PlayerID.id)
+    )
+    created: dict[str, int] = dict(sess.execute(statement).tuples().all())
+    if created:
+        accounts = [{"player_id_id": pk} for pk in created.values()]
+        for model in (PlayerAccount, PlayerSoldier):
+            sess.execute(
+                postgresql_insert(model)
+                .values(accounts)
+                .on_conflict_do_nothing(index_elements=[model.player_id_id])
+            )
+
+    # Another process may have created some of them in the meantime
+    raced = [player_id for player_id in player_ids if player_id not in created]
+    if raced:
+        created.update(
+            sess.query(PlayerID.player_id, PlayerID.id).filter(
+                PlayerID.player_id.in_(raced)
+            )
+        )
+    return created
+
+
+def _bulk_upsert_player_names(
+    sess: Session,
+    names: Mapping[int, str],
+    timestamp: float | Mapping[int, float] | None = None,
+):
+    """Save the names as seen at timestamp, a single one or one per PK"""
+    if isinstance(timestamp, Mapping):
+        timestamps = timestamp
+    else:
+        timestamps = dict.fromkeys(names, timestamp)
+
+    if sess.get_bind().dialect.name != "postgresql":
+        from rcon.player_history import _save_player_alias
+
+        for pk, name in names.items():
+            _save_player_alias(sess, sess.get(PlayerID, pk), name, timestamps.get(pk))
+        return
+
+    now = datetime.datetime.now(tz=UTC)
+    statement = postgresql_insert(PlayerName).values(
+        [
+            {
+                "player_id_id": pk,
+                "name": name,
+                "last_seen": (
+                    datetime.datetime.fromtimestamp(timestamps[pk], tz=UTC)
+                    if timestamps.get(pk)
+                    else now
+                ),
+            }
+            for pk, name in names.items()
+        ]
+    )
+    sess.execute(
+        statement.on_conflict_do_update(
+            constraint="unique_name_steamid",
+            set_={"last_seen": statement.excluded.last_seen},
+        )
+    )
+
+
+def get_player_identity() -> PlayerIdentityCache:
+    """Return the process wide player identity cache"""
+    global IDENTITY
+
+    if IDENTITY is None:
+        IDENTITY = PlayerIdentityCache()
+    return IDENTITY
@@ -0,0 +1,320 @@
+"""Connect-time policy of every player that needs one, in a single Redis hash.
+
+Whether a player is blacklisted, watched, flagged or VIP is precomputed for the
+players it applies to, so a connecting player costs a single HGET and the
+database is only queried for the players that actually need an action.
+Players without any policy are absent from the hash.
+
+Blacklist records and VIPs are kept for every server with their expiration so
+the index lives in the global Redis database, shared by all the servers, and
+never goes stale when a record expires. The write paths refresh the players they
+change, whichever server they run on; the index is rebuilt from the database
+when it is missing and at least every REBUILD_INTERVAL_SECONDS to catch whatever
+changed without going through them.
+"""
+
+import logging
+from collections import defaultdict
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from typing import Optional
+
+import orjson
+import redis
+import redis.exceptions
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from rcon.cache_utils import get_redis_client
+from rcon.models import (
+    Blacklist,
+    BlacklistRecord,
+    PlayerFlag,
+    PlayerID,
+    PlayerVIP,
+    WatchList,
+    enter_session,
+)
+from rcon.utils import get_server_number
+
+logger = logging.getLogger(__name__)
+
+INDEX: Optional["PolicyIndex"] = None
+
+
+@dataclass(frozen=True)
+class PlayerPolicy:
+    blacklisted: bool = False
+    watched: bool = False
+    flags: tuple[str, ...] = ()
+    vip_expiration: datetime | None = None
+
+    @property
+    def is_vip(self) -> bool:
+        return self.vip_expiration is not None
+
+    @property
+    def needs_action(self) -> bool:
+        return self.blacklisted or self.watched
+
+
+NO_POLICY = PlayerPolicy()
+
+
+@dataclass
+class _Entry:
+    # (server mask, expiration timestamp) of every active blacklist record
+    blacklists: list[tuple[int | None, float | None]] = field(default_factory=list)
+    watched: bool = False
+    flags: list[str] = field(default_factory=list)
+    # server number -> expiration timestamp
+    vips: dict[int, float] = field(default_factory=dict)
+
+    def encode(self) -> bytes:
+        return orjson.dumps(
+            {"b": self.blacklists, "w": self.watched, "f": self.flags, "v": self.vips},
+            option=orjson.OPT_NON_STR_KEYS,
+        )
+
+
+def decode_policy(
+    raw: bytes | str | None, server_number: int, now: datetime | None = None
+) -> PlayerPolicy:
+    """The policy of a player on the given server from its index entry"""
+    if raw is None:
+        return NO_POLICY
+    entry = orjson.loads(raw)
+    now_ts = (now or datetime.now(tz=UTC)).timestamp()
+    server_mask = 1 << (server_number - 1)
+
+    blacklisted = any(
+        (servers is None or servers & server_mask)
+        and (expires_at is None or expires_at > now_ts)
+        for servers, expires_at in entry["b"]
+    )
+    vip_expiration = entry["v"].get(str(server_number))
+    if vip_expiration is not None and vip_expiration <= now_ts:
+        vip_expiration = None
+
+    return PlayerPolicy(
+        blacklisted=blacklisted,
+        watched=entry["w"],
+        flags=tuple(entry["f"]),
+        vip_expiration=(
+            datetime.fromtimestamp(vip_expiration, tz=UTC)
+            if vip_expiration is not None
+            else None
+        ),
+    )
+
+
+def _timestamp(value: datetime) -> float:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.timestamp()
+
+
+def load_entries(
+    sess: Session, player_ids: Iterable[str] | None = None
+) -> dict[str, _Entry]:
+    """Compute the index entries of the given players, or of every player"""
+    if player_ids is not None:
+        player_ids = list(player_ids)
+
+    def restrict(stmt):
+        if player_ids is None:
+            return stmt
+        return stmt.filter(PlayerID.player_id.in_(player_ids))
+
+    entries: defaultdict[str, _Entry] = defaultdict(_Entry)
+
+    blacklists = (
+        select(PlayerID.player_id, Blacklist.servers, BlacklistRecord.expires_at)
+        .join(BlacklistRecord.player)
+        .join(BlacklistRecord.blacklist)
+        .filter(
+            or_(
+                BlacklistRecord.expires_at.is_(None),
+                BlacklistRecord.expires_at > func.now(),
+            )
+        )
+    )
+    for player_id, servers, expires_at in sess.execute(restrict(blacklists)):
+        entries[player_id].blacklists.append(
+            (servers, _timestamp(expires_at) if expires_at else None)
+        )
+
+    watched = (
+        select(PlayerID.player_id)
+        .join(WatchList, WatchList.player_id_id == PlayerID.id)
+        .filter(WatchList.is_watched.is_(True))
+    )
+    for player_id in sess.scalars(restrict(watched)):
+        entries[player_id].watched = True
+
+    flags = select(PlayerID.player_id, PlayerFlag.flag).join(
+        PlayerFlag, PlayerFlag.player_id_id == PlayerID.id
+    )
+    for player_id, flag in sess.execute(restrict(flags)):
+        entries[player_id].flags.append(flag)
+
+    vips = (
+        select(PlayerID.player_id, PlayerVIP.server_number, PlayerVIP.expiration)
+        .join(PlayerVIP, PlayerVIP.player_id_id == PlayerID.id)
+        .filter(PlayerVIP.expiration > func.now())
+    )
+    for player_id, server_number, expiration in sess.execute(restrict(vips)):
+        entries[player_id].vips[server_number] = _timestamp(expiration)
+
+    return dict(entries)
+
+
+class PolicyIndex:
+    KEY = "connect_policy"
+    BUILT_KEY = "connect_policy_built"
+    BUILD_LOCK_KEY = "connect_policy_building"
+    # A rebuild is written aside then renamed over the index
+    REBUILD_KEY = "connect_policy_rebuild"
+    # The players refreshed recently, a rebuild refreshes them again once renamed
+    REFRESHED_KEY = "connect_policy_refreshed"
+    REBUILD_INTERVAL_SECONDS = 60 * 60
+    BUILD_LOCK_SECONDS = 60
+    WRITE_BATCH_SIZE = 1_000
+
+    def __init__(
+        self, red: redis.Redis | None = None, server_number: int | None = None
+    ):
+        self.red = red or get_redis_client(decode_responses=False, global_pool=True)
+        self.server_number = int(server_number or get_server_number())
+
+    def is_built(self) -> bool:
+        return bool(self.red.exists(self.BUILT_KEY))
+
+    def rebuild(self) -> int:
+        """Replace the whole index with the database state, returns its size"""
+        with enter_session() as sess:
+            entries = load_entries(sess)
+
+        items = [(player_id, entry.encode()) for player_id, entry in entries.items()]
+        self.red.delete(self.REBUILD_KEY)
+        for start in range(0, len(items), self.WRITE_BATCH_SIZE):
+            self.red.hset(
+                self.REBUILD_KEY,
+                mapping=dict(items[start : start + self.WRITE_BATCH_SIZE]),
+            )
+
+        with self.red.pipeline(transaction=True) as pipe:
+            if items:
+                pipe.rename(self.REBUILD_KEY, self.KEY)
+            else:
+                pipe.delete(self.KEY)
+            pipe.set(self.BUILT_KEY, 1, ex=self.REBUILD_INTERVAL_SECONDS)
+            pipe.smembers(self.REFRESHED_KEY)
+            pipe.delete(self.REFRESHED_KEY)
+            refreshed = pipe.execute()[-2]
+        logger.info("Built the connect policy index of %s players", len(entries))
+
+        # Refreshed while the database was being read, the rebuild may have missed them
+        if refreshed:
+            self.refresh(player_id.decode() for player_id in refreshed)
+        return len(entries)
+
+    def ensure_built(self) -> bool:
+        """Build the index if it is missing, returns whether it can be used"""
+        if self.is_built():
+            return True
+        # Only one process builds it, the others fall back to the database meanwhile
+        if not self.red.set(
+            self.BUILD_LOCK_KEY, 1, nx=True, ex=self.BUILD_LOCK_SECONDS
+        ):
+            return False
+        try:
+            self.rebuild()
+        finally:
+            self.red.delete(self.BUILD_LOCK_KEY)
+        return True
+
+    def get_many(
+        self, player_ids: Iterable[str], now: datetime | None = None
+    ) -> dict[str, PlayerPolicy] | None:
+        """The policy of each player on this server, None if the index is unavailable"""
+        player_ids = list(player_ids)
+        if not player_ids:
+            return {}
+        try:
+            if not self.ensure_built():
+                return None
+            raw_entries = self.red.hmget(self.KEY, player_ids)
+        except Exception:
+            logger.exception("Unable to read the connect policy index")
+            return None
+        return {
+            player_id: decode_policy(raw, self.server_number, now)
+            for player_id, raw in zip(player_ids, raw_entries)
+        }
+
+    def get(self, player_id: str, now: datetime | None = None) -> PlayerPolicy | None:
+        policies = self.get_many([player_id], now)
+        return None if policies is None else policies[player_id]
+
+    def refresh(self, player_ids: Iterable[str], sess: Session | None = None):
+        """Recompute the entries of the given players from the database"""
+        player_ids = set(player_ids)
+        if not player_ids:
+            return
+        if sess is None:
+            with enter_session() as sess:
+                entries = load_entries(sess, player_ids)
+        else:
+            entries = load_entries(sess, player_ids)
+
+        removed = player_ids - entries.keys()
+        with self.red.pipeline(transaction=True) as pipe:
+            if entries:
+                pipe.hset(
+                    self.KEY,
+                    mapping={
+                        player_id: entry.encode()
+                        for player_id, entry in entries.items()
+                    },
+                )
+            if removed:
+                pipe.hdel(self.KEY, *removed)
+            pipe.sadd(self.REFRESHED_KEY, *player_ids)
+            pipe.expire(self.REFRESHED_KEY, self.BUILD_LOCK_SECONDS)
+            pipe.execute()
+
+    def invalidate(self):
+        """Have the index rebuilt on its next use"""
+        self.red.delete(self.BUILT_KEY)
+
+
+def get_policy_index() -> PolicyIndex:
+    global INDEX
+    if INDEX is None:
+        INDEX = PolicyIndex()
+    return INDEX
+
+
+def refresh_player_policies(player_ids: Iterable[str], sess: Session | None = None):
+    """Keep the index up to date from a write path, never raises
+
+    When sess is given it must already hold the changes.
+    """
+    try:
+        get_policy_index().refresh(player_ids, sess)
+    except Exception:
+        logger.exception("Unable to refresh the connect policy of %s", player_ids)
+        try:
+            get_policy_index().invalidate()
+        except redis.exceptions.RedisError:
+            pass
+
+
+def invalidate_player_policies():
+    """For write paths changing too many players to refresh them one by one"""
+    try:
+        get_policy_index().invalidate()
+    except redis.exceptions.RedisError:
+        logger.exception("Unable to invalidate the connect policy index")
@@ -23,6 +23,7 @@ from rcon.commands import (
     VipId,
 )
 from rcon.connection import HLLCommandError
+from rcon.expiry import ExpiryKind, cancel_expirations, schedule_vip_expirations
 from rcon.maps import UNKNOWN_MAP_NAME, Layer, is_server_loading_map
 from rcon.models import GameLayout, PlayerID, PlayerVIP, enter_session
 from rcon.perf_statistics import PerformanceStatistics
@@ -32,6 +33,8 @@ from rcon.player_history import (
     safe_save_player_action,
     save_player,
 )
+from rcon.policy_index import refresh_player_policies
+from rcon.team_view import build_team_view, guess_squad_type, has_leader
 from rcon.types import (
     AdminType,
     GameEnum,
@@ -57,8 +60,6 @@ from rcon.user_config.rcon_connection_settings import RconConnectionSettingsUser
 from rcon.user_config.rcon_server_settings import RconServerSettingsUserConfig
 from rcon.user_config.utils import BaseUserConfig
 from rcon.utils import (
-    ALL_ROLES,
-    ALL_ROLES_KEY_INDEX_MAP,
     INDEFINITE_VIP_DATE,
     MapsHistory,
     default_player_info_dict,
@@ -69,7 +70,6 @@ from rcon.utils import (
 PLAYER_ID = "player_id"
 NAME = "name"
 ROLE = "role"
-UNASSIGNED = "unassigned"
 
 TEMP_BAN = "temp"
 PERMA_BAN = "perma"
@@ -140,34 +140,39 @@ def get_rcon(credentials: ServerInfo | None = None):
     return CTL
 
 
+def run_command(rcon, command: str, params: dict) -> bool:
+    """Apply a single auto settings command, True if it was sent successfully"""
+    try:
+        logger.info("Applying %s %s", command, params)
+
+        # Allow people to apply partial changes to a user config to make
+        # auto settings less gigantic
+        if is_user_config_func(command):
+            # super dirty we should probably make an actual look up table
+            # but all the names are consistent
+            get_config_command = f"g{command[1:]}"
+            config: BaseUserConfig = rcon.__getattribute__(get_config_command)()
+            # get the existing config, override anything set in params
+            merged_params = config.model_dump() | params
+
+            if "by" not in merged_params:
+                merged_params["by"] = "AutoSettings"
+
+            rcon.__getattribute__(command)(**merged_params)
+        else:
+            # Non user config settings
+            rcon.__getattribute__(command)(**params)
+        return True
+    except AttributeError:
+        logger.exception("%s is not a valid command, double check the name!", command)
+    except Exception:
+        logger.exception("Unable to apply %s: %s", command, params)
+    return False
+
+
 def do_run_commands(rcon, commands):
     for command, params in commands.items():
-        try:
-            logger.info("Applying %s %s", command, params)
-
-            # Allow people to apply partial changes to a user config to make
-            # auto settings less gigantic
-            if is_user_config_func(command):
-                # super dirty we should probably make an actual look up table
-                # but all the names are consistent
-                get_config_command = f"g{command[1:]}"
-                config: BaseUserConfig = rcon.__getattribute__(get_config_command)()
-                # get the existing config, override anything set in params
-                merged_params = config.model_dump() | params
-
-                if "by" not in merged_params:
-                    merged_params["by"] = "AutoSettings"
-
-                rcon.__getattribute__(command)(**merged_params)
-            else:
-                # Non user config settings
-                rcon.__getattribute__(command)(**params)
-        except AttributeError:
-            logger.exception(
-                "%s is not a valid command, double check the name!", command
-            )
-        except Exception:
-            logger.exception("Unable to apply %s: %s", command, params)
+        run_command(rcon, command, params)
         time.sleep(5)  # go easy on the server
 
 
@@ -285,38 +290,36 @@ class Rcon(ServerCtl):
     def run_in_pool(self, function_name: str, *args, **kwargs):
         return self.thread_pool.submit(getattr(self, function_name), *args, **kwargs)
 
-    # TODO
-    # When returns value from the cache it is always {}
-    @ttl_cache(ttl=5)
-    def get_players(self) -> list[GetPlayersType]:
-        player_ids = {
-            player_id: {NAME: name, PLAYER_ID: player_id}
-            for name, player_id in self.get_player_ids()
-        }
-        # can't pickle dict keys object
-        steam_profiles = rcon.steam_utils.get_steam_profiles_mult_players(
-            steam_id_64s=[k for k in player_ids]
-        )
-
-        vip_player_ids = {v[PLAYER_ID] for v in super().get_vip_ids()}
+    def _build_players(
+        self, all_player_info: list[PlayerInfoType], vip_ids: list[VipId]
+    ) -> dict[str, GetPlayersType]:
+        """Players by ID, the profiles and their steam info are loaded at once"""
+        vip_player_ids = {v[PLAYER_ID] for v in vip_ids}
         profiles = {
-            p[PLAYER_ID]: p
-            for p in get_profiles([player_id for player_id in player_ids])
+            p[PLAYER_ID]: p for p in get_profiles([p["iD"] for p in all_player_info])
         }
 
         players: dict[str, GetPlayersType] = {}
-        for player_id in player_ids:
-            profile = steam_profiles.get(player_id)
+        for player_info in all_player_info:
+            player_id = player_info["iD"]
+            profile = profiles.get(player_id)
+            steaminfo = profile.get("steaminfo") if profile else None
             players[player_id] = {
-                NAME: player_ids[player_id]["name"],
+                NAME: player_info["name"],
                 PLAYER_ID: player_id,
-                "country": profile.get("country") if profile else None,
-                "steam_bans": profile.get("bans") if profile else None,
-                "profile": profiles.get(player_id),
+                "country": steaminfo.get("country") if steaminfo else None,
+                "steam_bans": steaminfo.get("bans") if steaminfo else None,
+                "profile": profile,
                 "is_vip": player_id in vip_player_ids,
             }
+        return players
 
-        return [p for p in players.values()]
+    # TODO
+    # When returns value from the cache it is always {}
+    @ttl_cache(ttl=5)
+    def get_players(self) -> list[GetPlayersType]:
+        all_player_info, vip_ids = super().get_players_and_vips()
+        return list(self._build_players(all_player_info, vip_ids).values())
 
     def get_detailed_players(self) -> GetDetailedPlayers:
         try:
@@ -329,18 +332,14 @@ class Rcon(ServerCtl):
 
         map_time_seconds = int(datetime.now(UTC).timestamp() - current_map_start)
 
-        players = self.get_players()
+        all_player_info, vip_ids = super().get_players_and_vips()
+        players = self._build_players(all_player_info, vip_ids)
         fail_count = 0
         players_by_id: dict[str, GetDetailedPlayer] = {}
 
-        all_player_info = {p["iD"]: p for p in super().get_all_player_info()}
-
-        for player in players:
-            player_id = player[PLAYER_ID]
-            player_info = all_player_info.get(player_id)
-            if player_info is None:
-                continue
-
+        for player_info in all_player_info:
+            player_id = player_info["iD"]
+            player = players[player_id]
             try:
                 player_data = self._get_detailed_player_info(player_info, player)
             except Exception:  # noqa
@@ -366,68 +365,7 @@ class Rcon(ServerCtl):
 
     @ttl_cache(ttl=2, cache_falsy=False)
     def get_team_view(self):
-        teams = {}
-        detailed_players = self.get_detailed_players()
-        players_by_id = detailed_players["players"]
-        fail_count = detailed_players["fail_count"]
-
-        for player in players_by_id.values():
-            team_name = (
-                player.get("team") if player.get("team") is not None else UNASSIGNED
-            )
-            team = teams.setdefault(team_name, {})
-            squad = team.setdefault(player.get("unit_name"), {})
-            squad_players = squad.setdefault("players", [])
-            squad_players.append(player)
-
-        for team, squads in teams.items():
-            for squad in squads.values():
-                squad["players"] = sorted(
-                    squad["players"],
-                    key=lambda player: (
-                        ALL_ROLES_KEY_INDEX_MAP.get(player.get("role"), len(ALL_ROLES)),
-                        player.get(PLAYER_ID),
-                    ),
-                )
-                squad["type"] = self._guess_squad_type(squad)
-                squad["has_leader"] = self._has_leader(squad)
-
-                squad["combat"] = sum(p["combat"] for p in squad["players"])
-                squad["offense"] = sum(p["offense"] for p in squad["players"])
-                squad["defense"] = sum(p["defense"] for p in squad["players"])
-                squad["support"] = sum(p["support"] for p in squad["players"])
-                squad["kills"] = sum(p["kills"] for p in squad["players"])
-                squad["deaths"] = sum(p["deaths"] for p in squad["players"])
-
-        game = {}
-        for team, squads in teams.items():
-            commander = [
-                squad for _, squad in squads.items() if squad["type"] == "commander"
-            ]
-            if not commander:
-                commander = None
-            else:
-                commander = (
-                    commander[0]["players"][0] if commander[0].get("players") else None
-                )
-
-            game[team] = {
-                "squads": {
-                    squad_name: squad
-                    for squad_name, squad in squads.items()
-                    if squad["type"] != "commander"
-                },
-                "commander": commander,
-                "combat": sum(s["combat"] for s in squads.values()),
-                "offense": sum(s["offense"] for s in squads.values()),
-                "defense": sum(s["defense"] for s in squads.values()),
-                "support": sum(s["support"] for s in squads.values()),
-                "kills": sum(s["kills"] for s in squads.values()),
-                "deaths": sum(s["deaths"] for s in squads.values()),
-                "count": sum(len(s["players"]) for s in squads.values()),
-            }
-
-        return dict(fail_count=fail_count, **game)
+        return build_team_view(self.get_detailed_players())
 
     @ttl_cache(ttl=1)
     def get_structured_logs(
@@ -481,31 +419,10 @@ class Rcon(ServerCtl):
     def _guess_squad_type(
         self, squad
     ) -> Literal["armor", "recon", "commander", "infantry", "artillery"]:
-        for player in squad.get("players", []):
-            if player.get("role") in ["tankcommander", "crewman"]:
-                return "armor"
-            if player.get("role") in ["spotter", "sniper"]:
-                return "recon"
-            if player.get("role") in ["armycommander"]:
-                return "commander"
-            if player.get("role") in ["artilleryobserver", "operator", "gunner"]:
-                return "artillery"
-
-        return "infantry"
+        return guess_squad_type(squad.get("players", []))
 
     def _has_leader(self, squad) -> bool:
-        for player in squad.get("players", []):
-            if player.get("role") in [
-                "tankcommander",
-                "officer",
-                "squadleader",
-                "spotter",
-                "artilleryobserver",
-                "mortarobserver",
-                "helicopterlogisticsofficer",
-            ]:
-                return True
-        return False
+        return has_leader(squad.get("players", []))
 
     @ttl_cache(ttl=60 * 60 * 24, cache_falsy=False)
     def get_player_info(self, player_id: str, can_fail=False):
@@ -689,6 +606,8 @@ class Rcon(ServerCtl):
                 # or that your instance of CRCON hasn't seen before, but you might want to prune these
                 logger.warning(f"{player_id} has no PlayerSteamID record")
 
+        cancel_expirations(ExpiryKind.VIP, [player_id])
+        refresh_player_policies([player_id])
         return result
 
     def add_vip(
@@ -764,6 +683,8 @@ class Rcon(ServerCtl):
                     f"Modified PlayerVIP record {player.player_id=} {vip_record.expiration} {previous_expiration=}"
                 )
 
+        schedule_vip_expirations({player_id: expiration_date})
+        refresh_player_policies([player_id])
         return result
 
     def remove_all_vips(self) -> bool:
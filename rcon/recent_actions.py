@@ -1,103 +1,140 @@
-from collections import defaultdict
+from dataclasses import fields
 from logging import getLogger
+from typing import Optional
 
-from rcon.cache_utils import invalidates, ttl_cache
-from rcon.logs.loop import on_kill, on_match_start, on_tk
+import redis
+import redis.exceptions
+
+from rcon.cache_utils import get_redis_client
+from rcon.logs.loop import on_batch, on_match_start
 from rcon.rcon import Rcon
-from rcon.types import MostRecentEvents, StructuredLogLineWithMetaData
+from rcon.types import AllLogTypes, MostRecentEvents, StructuredLogLineWithMetaData
+from rcon.utils import get_server_number
 
 logger = getLogger(__name__)
 
-RECENT_ACTIONS: defaultdict[str, MostRecentEvents] | None = None
+STORE: Optional["RecentActionsStore"] = None
 
+EVENT_FIELDS = frozenset(f.name for f in fields(MostRecentEvents))
 
-# 2.5 hours is the max length of a HLL match (full 5 objective offensive round)
-@ttl_cache(9000, is_method=False)
-def get_recent_actions() -> defaultdict[str, MostRecentEvents]:
-    global RECENT_ACTIONS
-    if RECENT_ACTIONS is None:
-        RECENT_ACTIONS = defaultdict(MostRecentEvents)
 
-    return RECENT_ACTIONS
+class RecentActionsStore:
+    """The most recent kill/team kill events of each player, one Redis hash per player
 
+    Readers only fetch the player they need and writers only touch the fields
+    that changed. The players are tracked in a set so they can all be cleared
+    between rounds.
+    """
 
-def set_recent_actions(recent_actions: defaultdict[str, MostRecentEvents]):
-    global RECENT_ACTIONS
-    with invalidates(get_recent_actions):
-        RECENT_ACTIONS = recent_actions
+    # 2.5 hours is the max length of a HLL match (full 5 objective offensive round)
+    TTL_SECONDS = 9000
 
+    def __init__(
+        self, red: redis.Redis | None = None, server_number: int | None = None
+    ):
+        self.red = red or get_redis_client(decode_responses=True)
+        self.prefix = f"recent_actions:{server_number or get_server_number()}"
+        self.players_key = f"{self.prefix}:players"
 
-@on_match_start
-def reset_recent_actions(rcon: Rcon, struct_log):
-    """Clear the event cache between rounds to prevent unbounded growing"""
-    set_recent_actions(defaultdict(MostRecentEvents))
-
-
-@on_kill
-def update_kills(rcon: Rcon, log: StructuredLogLineWithMetaData):
-    killer_name = log["player_name_1"]
-    killer_player_id = log["player_id_1"]
-    victim_name = log["player_name_2"]
-    victim_player_id = log["player_id_2"]
-    weapon = log["weapon"]
-
-    if not killer_player_id or not victim_player_id:
-        logger.error(
-            "update_kills called with killer_player_id=%s victim_player_id=%s",
-            killer_player_id,
-            victim_player_id,
+    def key(self, player_id: str) -> str:
+        return f"{self.prefix}:{player_id}"
+
+    def get(self, player_id: str) -> MostRecentEvents:
+        values = self.red.hgetall(self.key(player_id))
+        return MostRecentEvents(
+            **{name: value for name, value in values.items() if name in EVENT_FIELDS}
         )
-        return
-
-    cached_actions = get_recent_actions()
-    killer = cached_actions[killer_player_id]
-    victim = cached_actions[victim_player_id]
-
-    killer.player_name = killer_name
-    killer.last_victim_player_id = victim_player_id
-    killer.last_victim_name = victim_name
-    killer.last_victim_weapon = weapon
-
-    victim.player_name = victim_name
-    victim.last_nemesis_player_id = killer_player_id
-    victim.last_nemesis_name = killer_name
-    victim.last_nemesis_weapon = weapon
-
-    set_recent_actions(cached_actions)
-    # Refresh the redis cache so it's available for interprocess communication
-    get_recent_actions()
-
-
-@on_tk
-def update_tks(rcon: Rcon, log: StructuredLogLineWithMetaData):
-    killer_name = log["player_name_1"]
-    killer_player_id = log["player_id_1"]
-    victim_name = log["player_name_2"]
-    victim_player_id = log["player_id_2"]
-    weapon = log["weapon"]
-
-    if not killer_player_id or not victim_player_id:
-        logger.error(
-            "update_kills called with killer_player_id=%s victim_player_id=%s",
-            killer_player_id,
-            victim_player_id,
+
+    def update(self, updates: dict[str, dict[str, str | None]]):
+        """Set the given fields of each player (player_id -> field -> value)"""
+        if not updates:
+            return
+
+        with self.red.pipeline(transaction=False) as pipe:
+            for player_id, values in updates.items():
+                key = self.key(player_id)
+                mapping = {k: v for k, v in values.items() if v is not None}
+                if mapping:
+                    pipe.hset(key, mapping=mapping)
+                if removed := [k for k, v in values.items() if v is None]:
+                    pipe.hdel(key, *removed)
+                pipe.expire(key, self.TTL_SECONDS)
+            pipe.sadd(self.players_key, *updates)
+            pipe.expire(self.players_key, self.TTL_SECONDS)
+            pipe.execute()
+
+    def clear(self):
+        player_ids = self.red.smembers(self.players_key)
+        with self.red.pipeline(transaction=False) as pipe:
+            for player_id in player_ids:
+                pipe.delete(self.key(player_id))
+            pipe.delete(self.players_key)
+            pipe.execute()
+
+
+def get_recent_actions_store() -> RecentActionsStore:
+    global STORE
+    if STORE is None:
+        STORE = RecentActionsStore()
+    return STORE
+
+
+def get_recent_actions(player_id: str) -> MostRecentEvents:
+    """The most recent events of the player, empty if unavailable"""
+    try:
+        return get_recent_actions_store().get(player_id)
+    except redis.exceptions.RedisError:
+        logger.exception("Unable to get the recent actions of %s", player_id)
+        return MostRecentEvents()
+
+
+def collect_recent_actions(
+    logs: list[StructuredLogLineWithMetaData],
+) -> dict[str, dict[str, str | None]]:
+    """The fields to update for the kills and team kills, later events win"""
+    updates: dict[str, dict[str, str | None]] = {}
+    for log in logs:
+        killer_name = log["player_name_1"]
+        killer_player_id = log["player_id_1"]
+        victim_name = log["player_name_2"]
+        victim_player_id = log["player_id_2"]
+        weapon = log["weapon"]
+
+        if not killer_player_id or not victim_player_id:
+            logger.error(
+                "update_recent_actions called with killer_player_id=%s victim_player_id=%s",
+                killer_player_id,
+                victim_player_id,
+            )
+            continue
+
+        prefix = "last_tk_" if log["action"] == AllLogTypes.team_kill.value else "last_"
+        updates.setdefault(killer_player_id, {}).update(
+            {
+                "player_name": killer_name,
+                f"{prefix}victim_player_id": victim_player_id,
+                f"{prefix}victim_name": victim_name,
+                f"{prefix}victim_weapon": weapon,
+            }
+        )
+        updates.setdefault(victim_player_id, {}).update(
+            {
+                "player_name": victim_name,
+                f"{prefix}nemesis_player_id": killer_player_id,
+                f"{prefix}nemesis_name": killer_name,
+                f"{prefix}nemesis_weapon": weapon,
+            }
         )
-        return
+    return updates
 
-    cached_actions = get_recent_actions()
-    killer = cached_actions[killer_player_id]
-    victim = cached_actions[victim_player_id]
 
-    killer.player_name = killer_name
-    killer.last_tk_victim_player_id = victim_player_id
-    killer.last_tk_victim_name = victim_name
-    killer.last_tk_victim_weapon = weapon
+@on_match_start
+def reset_recent_actions(rcon: Rcon, struct_log):
+    """Clear the event cache between rounds to prevent unbounded growing"""
+    get_recent_actions_store().clear()
 
-    victim.player_name = victim_name
-    victim.last_tk_nemesis_player_id = killer_player_id
-    victim.last_tk_nemesis_name = killer_name
-    victim.last_tk_nemesis_weapon = weapon
 
-    set_recent_actions(cached_actions)
-    # Refresh the redis cache so it's available for interprocess communication
-    get_recent_actions()
+@on_batch(AllLogTypes.kill, AllLogTypes.team_kill)
+def update_recent_actions(rcon: Rcon, logs: list[StructuredLogLineWithMetaData]):
+    """Record the kills and team kills of a log fetch in a single round trip"""
+    get_recent_actions_store().update(collect_recent_actions(logs))
@@ -14,9 +14,10 @@ from rcon.seed_vip.models import (
     ServerPopulation,
     VipPlayer,
 )
-from rcon.types import GameStateType, GetPlayersType, VipIdType
+from rcon.types import DesiredVipType, GameStateType, GetPlayersType, VipIdType
 from rcon.user_config.seed_vip import SeedVIPUserConfig
 from rcon.utils import INDEFINITE_VIP_DATE
+from rcon.vip_reconciliation import reconcile_vips
 
 logger = getLogger(__name__)
 
@@ -208,6 +209,7 @@ def reward_players(
     logger.info(f"Rewarding players with VIP {config.dry_run=}")
     logger.info(f"Total={len(to_add_vip_steam_ids)} {to_add_vip_steam_ids=}")
     logger.info(f"Total={len(current_vips)=} {current_vips=}")
+    desired: list[DesiredVipType] = []
     for player_id in to_add_vip_steam_ids:
         player = current_vips.get(player_id)
         expiration_date = expiration_timestamps[player_id]
@@ -226,21 +228,19 @@ def reward_players(
                 format_str=config.reward.player_name_format_not_current_vip,
             )
         )
+        logger.info(
+            f"{config.dry_run=} adding VIP to {player_id=} {player=} {vip_name=} {expiration_date=}",
+        )
+        desired.append(
+            {
+                "player_id": player_id,
+                "description": vip_name,
+                "expiration": expiration_date,
+            }
+        )
 
-        if not config.dry_run:
-            logger.info(
-                f"{config.dry_run=} adding VIP to {player_id=} {player=} {vip_name=} {expiration_date=}",
-            )
-            rcon.add_vip(
-                player_id=player_id,
-                description=vip_name,
-                expiration=expiration_date.isoformat(),
-            )
-
-        else:
-            logger.info(
-                f"{config.dry_run=} adding VIP to {player_id=} {player=} {vip_name=} {expiration_date=}",
-            )
+    result = reconcile_vips(rcon, desired, dry_run=config.dry_run)
+    logger.info(f"{config.dry_run=} VIP rewards {result=}")
 
 
 def get_next_player_bucket(
@@ -386,6 +386,32 @@ def update_missing_old_steam_info_single_player(
             player.steaminfo.bans = bans
 
 
+def update_missing_old_steam_info_mult_players(
+    sess: Session,
+    players: Sequence[PlayerID],
+    age_limit: datetime.timedelta = datetime.timedelta(hours=12),
+) -> int:
+    """Fetch steam API info if missing or older than age_limit for many players
+
+    Same selection as `update_missing_old_steam_info_single_player` but the
+    players needing a refresh are updated together, with a single API request
+    per 100 steam IDs. Returns the number of players refreshed.
+    """
+    now = datetime.datetime.now(tz=datetime.UTC)
+    outdated = [
+        player
+        for player in players
+        if player.steaminfo is None
+        or (player.steaminfo.updated and now - player.steaminfo.updated >= age_limit)
+        or player.steaminfo.bans is None
+        or player.steaminfo.profile is None
+        or player.steaminfo.country is None
+    ]
+    if outdated:
+        update_db_player_info(sess, outdated)
+    return len(outdated)
+
+
 def enrich_db_users(chunk_size=100, update_from_days_old=30):
     """Use the Steam API to update steam profiles/bans for missing or old records"""
     max_age = datetime.datetime.now(tz=datetime.UTC) - datetime.timedelta(
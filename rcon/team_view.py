@@ -0,0 +1,169 @@
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from operator import itemgetter
+from typing import Literal
+
+from rcon.types import GetDetailedPlayer, GetDetailedPlayers
+from rcon.utils import ALL_ROLES, ALL_ROLES_KEY_INDEX_MAP
+
+UNASSIGNED = "unassigned"
+
+SquadType = Literal["armor", "recon", "commander", "infantry", "artillery"]
+
+LEADER_ROLES = frozenset(
+    [
+        "tankcommander",
+        "officer",
+        "squadleader",
+        "spotter",
+        "artilleryobserver",
+        "mortarobserver",
+        "helicopterlogisticsofficer",
+    ]
+)
+
+
+# The first player holding one of these roles decides the type of the squad
+ROLE_SQUAD_TYPES: dict[str, SquadType] = {
+    "tankcommander": "armor",
+    "crewman": "armor",
+    "spotter": "recon",
+    "sniper": "recon",
+    "armycommander": "commander",
+    "artilleryobserver": "artillery",
+    "operator": "artillery",
+    "gunner": "artillery",
+}
+
+
+def _squad_type_of_roles(roles: Iterable[str | None]) -> SquadType:
+    for role in roles:
+        if (squad_type := ROLE_SQUAD_TYPES.get(role)) is not None:
+            return squad_type
+    return "infantry"
+
+
+def guess_squad_type(players: list[GetDetailedPlayer]) -> SquadType:
+    return _squad_type_of_roles(player.get("role") for player in players)
+
+
+def has_leader(players: list[GetDetailedPlayer]) -> bool:
+    return any(player.get("role") in LEADER_ROLES for player in players)
+
+
+STAT_FIELDS = ("combat", "offense", "defense", "support", "kills", "deaths")
+
+
+@dataclass(slots=True)
+class TeamViewColumns:
+    """The players of a team view with their stats stored column by column
+
+    Every player gets a squad ID and every squad a team ID, each stat is a
+    flat list indexed by player so the squad totals are summed in one pass
+    over the column, then the team totals over the squad totals.
+    """
+
+    players: list[GetDetailedPlayer] = field(default_factory=list)
+    team_names: list[str] = field(default_factory=list)
+    squad_names: list[str | None] = field(default_factory=list)
+    squad_team: list[int] = field(default_factory=list)
+    player_squad: list[int] = field(default_factory=list)
+    roles: list[str | None] = field(default_factory=list)
+    columns: dict[str, list[int]] = field(
+        default_factory=lambda: {name: [] for name in STAT_FIELDS}
+    )
+
+    @classmethod
+    def from_players(cls, players: Iterable[GetDetailedPlayer]) -> "TeamViewColumns":
+        view = cls(players=list(players))
+        team_ids: dict[str, int] = {}
+        squad_ids: dict[tuple[str, str | None], int] = {}
+        player_squad = view.player_squad
+        for player in view.players:
+            team_name = player.get("team")
+            if team_name is None:
+                team_name = UNASSIGNED
+            squad_key = (team_name, player.get("unit_name"))
+            squad_id = squad_ids.get(squad_key)
+            if squad_id is None:
+                team_id = team_ids.get(team_name)
+                if team_id is None:
+                    team_id = team_ids[team_name] = len(view.team_names)
+                    view.team_names.append(team_name)
+                squad_id = squad_ids[squad_key] = len(view.squad_names)
+                view.squad_names.append(squad_key[1])
+                view.squad_team.append(team_id)
+            player_squad.append(squad_id)
+
+        view.roles = [player.get("role") for player in view.players]
+        rows = map(itemgetter(*STAT_FIELDS), view.players)
+        for name, column in zip(STAT_FIELDS, zip(*rows)):
+            view.columns[name] = list(column)
+        return view
+
+    def squad_totals(self) -> dict[str, list[int]]:
+        totals = {}
+        for name, column in self.columns.items():
+            sums = [0] * len(self.squad_names)
+            for squad_id, value in zip(self.player_squad, column):
+                sums[squad_id] += value
+            totals[name] = sums
+        return totals
+
+    def to_dict(self, fail_count: int) -> dict:
+        squad_totals = self.squad_totals()
+        team_totals = {name: [0] * len(self.team_names) for name in STAT_FIELDS}
+        for name, sums in squad_totals.items():
+            totals = team_totals[name]
+            for squad_id, value in enumerate(sums):
+                totals[self.squad_team[squad_id]] += value
+
+        # Players sorted by role then ID, grouped by squad
+        no_role = len(ALL_ROLES)
+        order = sorted(
+            range(len(self.players)),
+            key=lambda i: (
+                ALL_ROLES_KEY_INDEX_MAP.get(self.roles[i], no_role),
+                self.players[i].get("player_id"),
+            ),
+        )
+        squad_members: list[list[int]] = [[] for _ in self.squad_names]
+        for i in order:
+            squad_members[self.player_squad[i]].append(i)
+
+        teams = [{"squads": {}, "commander": None, "count": 0} for _ in self.team_names]
+        for squad_id, members in enumerate(squad_members):
+            team = teams[self.squad_team[squad_id]]
+            players = [self.players[i] for i in members]
+            roles = [self.roles[i] for i in members]
+            squad_type = _squad_type_of_roles(roles)
+            team["count"] += len(players)
+            if squad_type == "commander":
+                if team["commander"] is None and players:
+                    team["commander"] = players[0]
+                continue
+            team["squads"][self.squad_names[squad_id]] = {
+                "players": players,
+                "type": squad_type,
+                "has_leader": not LEADER_ROLES.isdisjoint(roles),
+                **{name: squad_totals[name][squad_id] for name in STAT_FIELDS},
+            }
+
+        return dict(
+            fail_count=fail_count,
+            **{
+                team_name: {
+                    "squads": teams[team_id]["squads"],
+                    "commander": teams[team_id]["commander"],
+                    **{name: team_totals[name][team_id] for name in STAT_FIELDS},
+                    "count": teams[team_id]["count"],
+                }
+                for team_id, team_name in enumerate(self.team_names)
+            },
+        )
+
+
+def build_team_view(detailed_players: GetDetailedPlayers) -> dict:
+    """Group the players by team and squad with their summed stats"""
+    columns = TeamViewColumns.from_players(detailed_players["players"].values())
+    return columns.to_dict(detailed_players["fail_count"])
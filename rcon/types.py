@@ -317,6 +317,21 @@ class VipIdType(TypedDict):
     vip_expiration: datetime.datetime | None
 
 
+class DesiredVipType(TypedDict):
+    player_id: str
+    description: str
+    expiration: datetime.datetime
+
+
+class VipReconciliationResultType(TypedDict):
+    added: list[str]
+    # Description or expiration changed
+    updated: list[str]
+    removed: list[str]
+    unchanged: int
+    errors: list[str]
+
+
 class GameServerBanType(TypedDict):
     type: str
     name: str | None
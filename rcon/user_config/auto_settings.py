@@ -1,5 +1,6 @@
 import logging
 
+from rcon.auto_settings_events import AutoSettingsEvent, publish_auto_settings_event
 from rcon.game import get_game_profile
 from rcon.types import GameEnum
 from rcon.user_config.utils import (
@@ -61,12 +62,16 @@ class AutoSettingsConfig:
 
     def set_settings(self, dict_):
         self.validate_settings(dict_)
-        return set_user_config(
+        result = set_user_config(
             self.SETTINGS,
             dict(dict_),
             game=self.game,
             server_number=self.server_number,
         )
+        publish_auto_settings_event(
+            AutoSettingsEvent.CONFIG, server_number=self.server_number
+        )
+        return result
 
     def validate_settings(self, settings) -> None:
         """Validate game-specific references embedded in auto-setting rules."""
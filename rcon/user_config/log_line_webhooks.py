@@ -1,4 +1,4 @@
-from typing import TypedDict
+from typing import NotRequired, TypedDict
 
 from pydantic import BaseModel, Field
 
@@ -10,6 +10,7 @@ from rcon.user_config.webhooks import DiscordMentionWebhook, WebhookMentionType
 class LogLineWebhookType(TypedDict):
     log_types: list[AllLogTypes]
     webhook: WebhookMentionType
+    coalesce: NotRequired[bool]
 
 
 class LogLineType(TypedDict):
@@ -19,6 +20,10 @@ class LogLineType(TypedDict):
 class LogLineWebhook(BaseModel):
     log_types: list[AllLogTypes] = Field(default_factory=list)
     webhook: DiscordMentionWebhook
+    coalesce: bool = Field(
+        default=False,
+        description="Send the lines received within a second in a single message",
+    )
 
 
 class LogLineWebhookUserConfig(BaseUserConfig):
@@ -64,6 +69,7 @@ class LogLineWebhookUserConfig(BaseUserConfig):
             log_line = LogLineWebhook(
                 log_types=raw_log_types,
                 webhook=hook,
+                coalesce=obj.get("coalesce", False),
             )
             validated_log_lines.append(log_line)
 
@@ -5,7 +5,7 @@ from functools import cached_property
 import pytz
 from pydantic import Field, field_validator
 
-from rcon.conditions import Condition, create_condition
+from rcon.conditions import Condition, create_condition, evaluate_conditions
 from rcon.models import PlayerID
 from rcon.rcon import Rcon, get_rcon
 from rcon.user_config.chat_commands import (
@@ -78,8 +78,8 @@ class RConChatCommand(BaseChatCommand):
                     condition,
                     params,
                 )
-        return all(
-            c.is_valid(rcon=rcon, player_id=p, message_context=ctx) for c in conditions
+        return evaluate_conditions(
+            conditions, rcon=rcon, player_id=p, message_context=ctx
         )
 
 
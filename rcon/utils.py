@@ -2,7 +2,7 @@ import inspect
 import logging
 import os
 import secrets
-from collections.abc import Callable, Iterable, Iterator
+from collections.abc import Callable, Iterable, Iterator, Mapping
 from datetime import UTC, datetime, timedelta
 from itertools import islice
 from typing import (
@@ -252,6 +252,60 @@ class Stream[T]:
         except IndexError:
             return None
 
+    def create_group(self, group: str, start_id: str = "0") -> bool:
+        """Create the consumer group (and the stream) unless it already exists"""
+        try:
+            self.red.xgroup_create(self.key, group, id=start_id, mkstream=True)
+            return True
+        except redis.exceptions.ResponseError as e:
+            if str(e).startswith("BUSYGROUP"):
+                return False
+            raise
+
+    def read_group(
+        self,
+        group: str,
+        consumer: str,
+        pending: bool = False,
+        count: int | None = None,
+        block_ms: int | None = None,
+    ) -> list[tuple[StreamID, T | None]]:
+        """Read the entries delivered to consumer, oldest first
+
+        With pending set, re-read the entries already delivered to this consumer
+        but never acknowledged instead of new ones. Pending entries that were
+        trimmed from the stream since are returned with a None body.
+        """
+        try:
+            response = self.red.xreadgroup(
+                groupname=group,
+                consumername=consumer,
+                streams={self.key: "0" if pending else ">"},
+                count=count,
+                block=None if pending else block_ms,
+            )
+        except redis.exceptions.ResponseError:
+            raise StreamInvalidID(REDIS_STREAM_INVALID_ID)
+
+        if not response:
+            return []
+        # RESP2 returns a list of [key, entries], RESP3 a dict of key: entries
+        entries = (
+            next(iter(response.values()))
+            if isinstance(response, dict)
+            else response[0][1]
+        )
+        return [
+            (id_.decode(), self._from_compatible_object(obj) if obj else None)
+            for id_, obj in entries
+        ]
+
+    def ack(self, group: str, *ids: StreamID) -> int:
+        """Acknowledge processed entries returning the number acknowledged"""
+        if not ids:
+            return 0
+        return self.red.xack(self.key, group, *ids)
+
 
 class FixedLenList[T]:
     def __init__(
@@ -339,8 +393,13 @@ def logs_deserializer(data: bytes | str) -> StructuredLogLineWithMetaData:
     A custom deserializer that ensures conversion of datetime strings
     to datetime.datetime objects
     """
-    obj = orjson.loads(data)
+    entry = decode_log_history_entry(data)
+    if isinstance(entry, LogHistoryEntry):
+        return entry.to_dict()
+    return entry
+
 
+def _parse_event_time(obj: dict[str, Any]) -> StructuredLogLineWithMetaData:
     if "event_time" in obj:
         if isinstance(obj["event_time"], (int, float)):
             obj["event_time"] = datetime.fromtimestamp(obj["event_time"], tz=UTC)
@@ -355,9 +414,277 @@ def logs_deserializer(data: bytes | str) -> StructuredLogLineWithMetaData:
     return obj
 
 
+# A LogsHistory entry is a JSON array of these fields with the trailing nulls
+# dropped, entries written before are JSON objects and are still read.
+LOG_HISTORY_FIELDS = (
+    "version",
+    "timestamp_ms",
+    "event_time",
+    "relative_time_ms",
+    "raw",
+    "line_without_time",
+    "action",
+    "player_name_1",
+    "player_id_1",
+    "player_name_2",
+    "player_id_2",
+    "weapon",
+    "message",
+    "sub_content",
+)
+_LOG_HISTORY_FIELD_INDEX = {field: i for i, field in enumerate(LOG_HISTORY_FIELDS)}
+_TIMESTAMP_MS = _LOG_HISTORY_FIELD_INDEX["timestamp_ms"]
+_EVENT_TIME = _LOG_HISTORY_FIELD_INDEX["event_time"]
+_RAW = _LOG_HISTORY_FIELD_INDEX["raw"]
+_LINE_WITHOUT_TIME = _LOG_HISTORY_FIELD_INDEX["line_without_time"]
+_ACTION = _LOG_HISTORY_FIELD_INDEX["action"]
+_PLAYER_ID_1 = _LOG_HISTORY_FIELD_INDEX["player_id_1"]
+_PLAYER_ID_2 = _LOG_HISTORY_FIELD_INDEX["player_id_2"]
+_MESSAGE = _LOG_HISTORY_FIELD_INDEX["message"]
+
+# Stored by their index, only ever append to this list
+LOG_HISTORY_ACTIONS = (
+    "KILL",
+    "TEAM KILL",
+    "CONNECTED",
+    "DISCONNECTED",
+    "CHAT[Allies][Team]",
+    "CHAT[Allies][Unit]",
+    "CHAT[Axis][Team]",
+    "CHAT[Axis][Unit]",
+    "TEAMSWITCH",
+    "CAMERA",
+    "MESSAGE",
+    "MATCH START",
+    "MATCH ENDED",
+    "VOTE",
+    "VOTE STARTED",
+    "VOTE COMPLETED",
+    "VOTE EXPIRED",
+    "VOTE PASSED",
+    "ADMIN",
+    "ADMIN KICKED",
+    "ADMIN BANNED",
+    "ADMIN PERMA BANNED",
+    "ADMIN IDLE",
+    "ADMIN ANTI-CHEAT",
+    "ADMIN MISC",
+    "TK AUTO",
+    "TK AUTO KICKED",
+    "TK AUTO BANNED",
+)
+_LOG_HISTORY_ACTION_IDS = {action: i for i, action in enumerate(LOG_HISTORY_ACTIONS)}
+
+
+def _compact_player_id(player_id: Any) -> Any:
+    # Steam IDs fit in a JSON integer, other IDs are stored as they are
+    if (
+        isinstance(player_id, str)
+        and player_id.isascii()
+        and player_id.isdigit()
+        and player_id[0] != "0"
+        and len(player_id) < 19
+    ):
+        return int(player_id)
+    return player_id
+
+
+def encode_log_history_entry(log: StructuredLogLineWithMetaData) -> bytes:
+    """Serialize a log as a JSON array, leaving out what can be derived
+
+    The event time is left out when it matches timestamp_ms, the raw line
+    is stored as its time prefix and the message as its offset in the line
+    without time when they end with it, actions are stored by their index in
+    LOG_HISTORY_ACTIONS and Steam IDs as integers.
+    """
+    values = [log.get(field) for field in LOG_HISTORY_FIELDS]
+    line = values[_LINE_WITHOUT_TIME]
+
+    event_time = values[_EVENT_TIME]
+    if isinstance(event_time, datetime) and event_time.tzinfo is not None:
+        timestamp = event_time.timestamp()
+        values[_EVENT_TIME] = (
+            None if timestamp * 1000 == values[_TIMESTAMP_MS] else timestamp
+        )
+
+    raw = values[_RAW]
+    if isinstance(raw, str) and isinstance(line, str) and raw.endswith(" " + line):
+        values[_RAW] = raw[: -len(line) - 1]
+    else:
+        values[_RAW] = [raw]
+
+    message = values[_MESSAGE]
+    if isinstance(message, str) and isinstance(line, str) and line.endswith(message):
+        values[_MESSAGE] = len(line) - len(message)
+
+    action_id = _LOG_HISTORY_ACTION_IDS.get(values[_ACTION])
+    if action_id is not None:
+        values[_ACTION] = action_id
+    values[_PLAYER_ID_1] = _compact_player_id(values[_PLAYER_ID_1])
+    values[_PLAYER_ID_2] = _compact_player_id(values[_PLAYER_ID_2])
+
+    while values and values[-1] is None:
+        values.pop()
+    return orjson.dumps(values)
+
+
+def _decode_event_time(values: list[Any], value: Any) -> datetime:
+    if value is None:
+        return datetime.fromtimestamp(values[_TIMESTAMP_MS] / 1000, tz=UTC)
+    return _parse_event_time({"event_time": value})["event_time"]
+
+
+def _decode_raw(values: list[Any], value: Any) -> str:
+    if isinstance(value, list):
+        return value[0]
+    return f"{value} {values[_LINE_WITHOUT_TIME]}"
+
+
+def _decode_action(values: list[Any], value: Any) -> str:
+    return LOG_HISTORY_ACTIONS[value] if isinstance(value, int) else value
+
+
+def _decode_player_id(values: list[Any], value: Any) -> str | None:
+    return str(value) if isinstance(value, int) else value
+
+
+def _decode_message(values: list[Any], value: Any) -> str:
+    return values[_LINE_WITHOUT_TIME][value:] if isinstance(value, int) else value
+
+
+# The fields not listed are stored as they are
+_LOG_HISTORY_DECODERS: tuple[Callable[[list[Any], Any], Any] | None, ...] = tuple(
+    {
+        _EVENT_TIME: _decode_event_time,
+        _RAW: _decode_raw,
+        _ACTION: _decode_action,
+        _PLAYER_ID_1: _decode_player_id,
+        _PLAYER_ID_2: _decode_player_id,
+        _MESSAGE: _decode_message,
+    }.get(i)
+    for i in range(len(LOG_HISTORY_FIELDS))
+)
+
+
+class LogHistoryEntry(Mapping):
+    """A read-only log of LogsHistory, each field is decoded when it is read
+
+    Filtering the history only pays for the fields the filter looks at, use
+    `to_dict` to get every field of the log.
+    """
+
+    __slots__ = ("values",)
+
+    def __init__(self, values: list[Any]):
+        if len(values) < len(LOG_HISTORY_FIELDS):
+            values.extend([None] * (len(LOG_HISTORY_FIELDS) - len(values)))
+        self.values = values
+
+    def __getitem__(self, key: str) -> Any:
+        index = _LOG_HISTORY_FIELD_INDEX[key]
+        value = self.values[index]
+        decode = _LOG_HISTORY_DECODERS[index]
+        return value if decode is None else decode(self.values, value)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(LOG_HISTORY_FIELDS)
+
+    def __len__(self) -> int:
+        return len(LOG_HISTORY_FIELDS)
+
+    def to_dict(self) -> StructuredLogLineWithMetaData:
+        # Same as going through __getitem__ for every field, inlined as it is hot
+        values = self.values
+        (
+            version,
+            timestamp_ms,
+            event_time,
+            relative_time_ms,
+            raw,
+            line_without_time,
+            action,
+            player_name_1,
+            player_id_1,
+            player_name_2,
+            player_id_2,
+            weapon,
+            message,
+            sub_content,
+        ) = values
+        return {
+            "version": version,
+            "timestamp_ms": timestamp_ms,
+            "event_time": (
+                datetime.fromtimestamp(timestamp_ms / 1000, tz=UTC)
+                if event_time is None
+                else _decode_event_time(values, event_time)
+            ),
+            "relative_time_ms": relative_time_ms,
+            "raw": raw[0] if raw.__class__ is list else f"{raw} {line_without_time}",
+            "line_without_time": line_without_time,
+            "action": (
+                LOG_HISTORY_ACTIONS[action] if action.__class__ is int else action
+            ),
+            "player_name_1": player_name_1,
+            "player_id_1": (
+                str(player_id_1) if player_id_1.__class__ is int else player_id_1
+            ),
+            "player_name_2": player_name_2,
+            "player_id_2": (
+                str(player_id_2) if player_id_2.__class__ is int else player_id_2
+            ),
+            "weapon": weapon,
+            "message": (
+                line_without_time[message:] if message.__class__ is int else message
+            ),
+            "sub_content": sub_content,
+        }
+
+
+def decode_log_history_entry(
+    data: bytes | str,
+) -> LogHistoryEntry | StructuredLogLineWithMetaData:
+    """Load an entry of LogsHistory without decoding its fields yet"""
+    obj = orjson.loads(data)
+    if isinstance(obj, list):
+        return LogHistoryEntry(obj)
+    return _parse_event_time(obj)
+
+
 class LogsHistory(FixedLenList[StructuredLogLineWithMetaData]):
     def __init__(self, key: str = "logs_history", max_len: int = 100_000):
-        super().__init__(key, max_len, deserializer=logs_deserializer)
+        super().__init__(
+            key,
+            max_len,
+            serializer=encode_log_history_entry,
+            deserializer=logs_deserializer,
+        )
+
+    def entries(
+        self, start: int = 0, end: int | None = None
+    ) -> list[LogHistoryEntry | StructuredLogLineWithMetaData]:
+        """The logs from start up to end (excluded), fields decoded on access"""
+        stop = -1 if end is None else end - 1
+        if stop < start and end is not None:
+            return []
+        return [
+            decode_log_history_entry(o) for o in self.red.lrange(self.key, start, stop)
+        ]
+
+
+class LogsRecorderStream(Stream[StructuredLogLineWithMetaData]):
+    """Every log line cached by the log loop, in order, for the LogRecorder
+
+    The recorder reads it through a consumer group so each line is delivered
+    at least once even if the recorder is stopped for a while, as long as it
+    catches up before the line is trimmed.
+    """
+
+    def __init__(self, key: str = "logs_recorder_stream", maxlen: int = 100_000):
+        super().__init__(key, maxlen=maxlen)
+
+    def _from_compatible_object(self, raw_obj: dict[bytes, bytes]):
+        return _parse_event_time(super()._from_compatible_object(raw_obj))
 
 
 class MapsHistory(FixedLenList[MapInfo]):
@@ -643,33 +970,7 @@ TEMP_FIELDS: dict[str, str | None] = {
 
 def get_temp_default_stats(existing: PlayerStatsType | None) -> PlayerStat:
     """Return temp stat defaults (p_* [shortly for prev] fields reset to 0)."""
-    if existing is not None:
-        return {
-            "combat": existing.combat,
-            "p_combat": 0,
-            "offense": existing.offense,
-            "p_offense": 0,
-            "defense": existing.defense,
-            "p_defense": 0,
-            "support": existing.support,
-            "p_support": 0,
-            "vehicle_kills": existing.vehicle_kills,
-            "p_vehicle_kills": 0,
-            "vehicles_destroyed": existing.vehicles_destroyed,
-            "p_vehicles_destroyed": 0,
-            "kills_and_assists": existing.kills,
-            "p_kills_and_assists": 0,
-            "deaths_and_redeploys": existing.deaths,
-            "p_deaths_and_redeploys": 0,
-            "units": existing.units,
-            "p_unit": existing.p_unit,
-            "level": existing.level,
-            "p_coord": existing.p_coord,
-            "has_spawned": existing.has_spawned,
-            "names": existing.names,
-            "status": existing.status,
-        }
-    return {
+    defaults: PlayerStat = {
         "combat": 0,
         "p_combat": 0,
         "offense": 0,
@@ -694,6 +995,24 @@ def get_temp_default_stats(existing: PlayerStatsType | None) -> PlayerStat:
         "names": [],
         "status": "offline",
     }
+    if existing is not None:
+        # Only the persisted columns are available on a recorded PlayerStats row,
+        # the live-only fields (p_unit, p_coord, status...) keep their defaults
+        defaults.update(
+            {
+                "combat": existing.combat,
+                "offense": existing.offense,
+                "defense": existing.defense,
+                "support": existing.support,
+                "vehicle_kills": existing.vehicle_kills,
+                "vehicles_destroyed": existing.vehicles_destroyed,
+                "kills_and_assists": existing.kills,
+                "deaths_and_redeploys": existing.deaths,
+                "units": existing.units,
+                "level": existing.level,
+            }
+        )
+    return defaults
 
 
 def get_default_player_stats() -> PlayerStatsType:
@@ -0,0 +1,271 @@
+"""Bring the VIPs of the game server and their PlayerVIP records to a desired state.
+
+The difference between the desired and the current state is computed first,
+then only the VIPs that differ are sent to the game server (pipelined) and
+written to the database (in bulk).
+"""
+
+import itertools
+import logging
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+
+from sqlalchemy import delete
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.orm import Session
+
+from rcon.cache_utils import invalidates
+from rcon.commands import ServerCtl
+from rcon.expiry import ExpiryKind, cancel_expirations, schedule_vip_expirations
+from rcon.models import PlayerID, PlayerVIP, enter_session
+from rcon.player_identity import get_player_identity
+from rcon.policy_index import refresh_player_policies
+from rcon.rcon import Rcon
+from rcon.types import DesiredVipType, VipReconciliationResultType
+from rcon.utils import get_server_number
+
+logger = logging.getLogger(__name__)
+
+# Commands in flight at once on the game server connection
+RCON_BATCH_SIZE = 100
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Naive expirations are UTC, as in Rcon.add_vip
+    return value if value.tzinfo else value.replace(tzinfo=UTC)
+
+
+@dataclass
+class VipChanges:
+    # player_id -> description to set on the game server
+    server_additions: dict[str, str] = field(default_factory=dict)
+    server_removals: list[str] = field(default_factory=list)
+    record_upserts: dict[str, DesiredVipType] = field(default_factory=dict)
+    record_deletions: list[str] = field(default_factory=list)
+
+    added: list[str] = field(default_factory=list)
+    updated: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    def result(self, errors: list[str] | None = None) -> VipReconciliationResultType:
+        return {
+            "added": self.added,
+            "updated": self.updated,
+            "removed": self.removed,
+            "unchanged": self.unchanged,
+            "errors": errors or [],
+        }
+
+
+def compute_vip_changes(
+    server_vips: Mapping[str, str],
+    vip_records: Mapping[str, datetime],
+    desired: Iterable[DesiredVipType],
+    remove: Iterable[str] = (),
+    remove_missing: bool = False,
+) -> VipChanges:
+    """Compute what must change to reach the desired state
+
+    server_vips maps the VIPs of the game server to their description and
+    vip_records maps the PlayerVIP records of the server to their expiration.
+    VIPs in `remove` lose their VIP, as do every VIP that is not desired if
+    remove_missing is set. A desired VIP is never removed.
+    """
+    changes = VipChanges()
+    wanted = {vip["player_id"]: vip for vip in desired}
+
+    to_remove = set(remove)
+    if remove_missing:
+        to_remove |= server_vips.keys() | vip_records.keys()
+    to_remove -= wanted.keys()
+
+    for player_id in sorted(to_remove):
+        if player_id in server_vips:
+            changes.server_removals.append(player_id)
+        if player_id in vip_records:
+            changes.record_deletions.append(player_id)
+        if player_id in server_vips or player_id in vip_records:
+            changes.removed.append(player_id)
+
+    for player_id, vip in wanted.items():
+        expiration = _as_utc(vip["expiration"])
+        record = vip_records.get(player_id)
+        record_changed = record is None or _as_utc(record) != expiration
+
+        if server_vips.get(player_id) != vip["description"]:
+            changes.server_additions[player_id] = vip["description"]
+        if record_changed:
+            changes.record_upserts[player_id] = {**vip, "expiration": expiration}
+
+        if player_id not in server_vips:
+            changes.added.append(player_id)
+        elif player_id in changes.server_additions or record_changed:
+            changes.updated.append(player_id)
+        else:
+            changes.unchanged += 1
+
+    return changes
+
+
+def _fetch_vip_records(sess: Session, server_number: int) -> dict[str, datetime]:
+    return dict(
+        sess.query(PlayerID.player_id, PlayerVIP.expiration)
+        .join(PlayerVIP, PlayerVIP.player_id_id == PlayerID.id)
+        .filter(PlayerVIP.server_number == server_number)
+        .tuples()
+    )
+
+
+def _run_batched(
+    command: Callable[[list], dict[str, bool]], items: Sequence
+) -> list[str]:
+    """Run a bulk RCON command over the items, return the player IDs that failed"""
+    failed: list[str] = []
+    for batch in itertools.batched(items, RCON_BATCH_SIZE):
+        failed.extend(
+            player_id for player_id, ok in command(list(batch)).items() if not ok
+        )
+    return failed
+
+
+def _upsert_vip_records(
+    sess: Session, server_number: int, expirations: Mapping[int, datetime]
+):
+    if sess.get_bind().dialect.name != "postgresql":
+        existing = {
+            record.player_id_id: record
+            for record in sess.query(PlayerVIP).filter(
+                PlayerVIP.server_number == server_number,
+                PlayerVIP.player_id_id.in_(expirations.keys()),
+            )
+        }
+        for pk, expiration in expirations.items():
+            if pk in existing:
+                existing[pk].expiration = expiration
+            else:
+                sess.add(
+                    PlayerVIP(
+                        player_id_id=pk,
+                        server_number=server_number,
+                        expiration=expiration,
+                    )
+                )
+        return
+
+    statement = postgresql_insert(PlayerVIP).values(
+        [
+            {"player_id_id": pk, "server_number": server_number, "expiration": exp}
+            for pk, exp in expirations.items()
+        ]
+    )
+    sess.execute(
+        statement.on_conflict_do_update(
+            constraint="unique_player_server_vip",
+            set_={"expiration": statement.excluded.expiration},
+        )
+    )
+
+
+def _apply_record_changes(sess: Session, server_number: int, changes: VipChanges):
+    identity = get_player_identity()
+    if changes.record_deletions:
+        pks = identity.get_pks(sess, changes.record_deletions).values()
+        sess.execute(
+            delete(PlayerVIP).where(
+                PlayerVIP.server_number == server_number,
+                PlayerVIP.player_id_id.in_(pks),
+            )
+        )
+
+    if changes.record_upserts:
+        # VIPs can be given to players never seen on the server, their description
+        # is saved as their name like for any other new player
+        pks = identity.get_or_create_pks(
+            sess,
+            {
+                player_id: vip["description"]
+                for player_id, vip in changes.record_upserts.items()
+            },
+        )
+        _upsert_vip_records(
+            sess,
+            server_number,
+            {
+                pks[player_id]: vip["expiration"]
+                for player_id, vip in changes.record_upserts.items()
+            },
+        )
+
+
+def reconcile_vips(
+    rcon: Rcon,
+    desired: Iterable[DesiredVipType],
+    remove: Iterable[str] = (),
+    remove_missing: bool = False,
+    dry_run: bool = False,
+) -> VipReconciliationResultType:
+    """Apply the changes needed to reach the desired VIPs, see compute_vip_changes
+
+    The VIPs the game server failed to add or remove keep their PlayerVIP record
+    unchanged and are reported in the errors.
+    """
+    server_number = get_server_number()
+    # Not the cached Rcon.get_vip_ids, the diff must be made against the live list
+    server_vips = {vip["player_id"]: vip["name"] for vip in ServerCtl.get_vip_ids(rcon)}
+
+    with enter_session() as sess:
+        changes = compute_vip_changes(
+            server_vips,
+            _fetch_vip_records(sess, server_number),
+            desired,
+            remove=remove,
+            remove_missing=remove_missing,
+        )
+        logger.info(
+            "VIP changes %s: %d to add, %d to update, %d to remove, %d unchanged",
+            "(dry run)" if dry_run else "",
+            len(changes.added),
+            len(changes.updated),
+            len(changes.removed),
+            changes.unchanged,
+        )
+        if dry_run:
+            return changes.result()
+
+        errors: list[str] = []
+        with invalidates(Rcon.get_vip_ids):
+            failed_removals = _run_batched(
+                rcon.bulk_remove_vips, changes.server_removals
+            )
+            failed_additions = _run_batched(
+                rcon.bulk_add_vips, list(changes.server_additions.items())
+            )
+            errors.extend(f"Failed to remove VIP from {p}" for p in failed_removals)
+            errors.extend(f"Failed to add VIP to {p}" for p in failed_additions)
+
+            failed = set(failed_removals) | set(failed_additions)
+            changes.record_deletions = [
+                p for p in changes.record_deletions if p not in failed
+            ]
+            changes.record_upserts = {
+                p: vip for p, vip in changes.record_upserts.items() if p not in failed
+            }
+            for attribute in ("added", "updated", "removed"):
+                setattr(
+                    changes,
+                    attribute,
+                    [p for p in getattr(changes, attribute) if p not in failed],
+                )
+
+            _apply_record_changes(sess, server_number, changes)
+            sess.commit()
+
+    cancel_expirations(ExpiryKind.VIP, changes.record_deletions)
+    refresh_player_policies([*changes.record_deletions, *changes.record_upserts])
+    schedule_vip_expirations(
+        {p: vip["expiration"] for p, vip in changes.record_upserts.items()}
+    )
+
+    return changes.result(errors)
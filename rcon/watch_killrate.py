@@ -12,6 +12,7 @@ from discord_webhook import DiscordEmbed, DiscordWebhook
 
 from rcon.api_commands import RconAPI, get_rcon_api
 from rcon.cache_utils import invalidates, ttl_cache
+from rcon.expiry import ExpiryKind, get_expiry_scheduler, schedule_expirations
 from rcon.player_history import get_player_profile, player_has_flag
 from rcon.player_stats import current_game_stats
 from rcon.user_config.rcon_server_settings import RconServerSettingsUserConfig
@@ -149,6 +150,7 @@ def reset_cache() -> None:
     global _LAST_REPORTED_CACHE
     with invalidates(get_cache_value):
         _LAST_REPORTED_CACHE = defaultdict(lambda: None)
+    get_expiry_scheduler().cancel_kind(ExpiryKind.KILLRATE_COOLDOWN)
 
 
 @ttl_cache(ttl=10, cache_falsy=False)
@@ -389,13 +391,19 @@ def watch_killrate(
                 )
                 continue
 
-            # Player has not been reported or cooldown has passed
-            if (
-                not last_reported
-                or (timestamp - last_reported).total_seconds()
-                > config.report_cooldown_mins * 60
+            # Player has not been reported or cooldown has passed, the cooldown
+            # is kept in the expiry schedule so it outlives a service restart
+            if not get_expiry_scheduler().is_pending(
+                ExpiryKind.KILLRATE_COOLDOWN, player_id, timestamp
             ):
                 set_cache_value(player_id, timestamp)
+                schedule_expirations(
+                    ExpiryKind.KILLRATE_COOLDOWN,
+                    {
+                        player_id: timestamp
+                        + timedelta(minutes=config.report_cooldown_mins)
+                    },
+                )
 
                 logger.info(
                     "Creating embed %s/%s, kpm=%s, filtered_kpm=%s, armor_kpm=%s, arty_kpm=%s, mg_kpm=%s, %s",
@@ -7,6 +7,7 @@ from rcon.hooks import inject_player_ids
 from rcon.logs.loop import on_connected
 from rcon.models import WatchList, enter_session
 from rcon.player_history import _get_set_player, get_player
+from rcon.policy_index import get_policy_index, refresh_player_policies
 from rcon.rcon import HLLCommandFailedError, Rcon
 from rcon.types import PlayerProfileType, StructuredLogLineWithMetaData
 from rcon.user_config.rcon_server_settings import RconServerSettingsUserConfig
@@ -16,6 +17,10 @@ from rcon.user_config.webhooks import WatchlistWebhooksUserConfig
 @on_connected()
 @inject_player_ids
 def watchdog(rcon: Rcon, log: StructuredLogLineWithMetaData, name: str, player_id: str):
+    policy = get_policy_index().get(player_id)
+    if policy is not None and not policy.watched:
+        return
+
     watcher = PlayerWatch(player_id)
     if watcher.is_watched():
         watcher.increment_watch()
@@ -85,6 +90,7 @@ class PlayerWatch:
                 player.watchlist.is_watched = False
                 player.watchlist.count = 0
 
+        refresh_player_policies([self.player_id])
         return True
 
     def watch(self, reason: str, by: str, player_name: str = ""):
@@ -108,4 +114,5 @@ class PlayerWatch:
                 )
                 sess.add(watch)
 
+        refresh_player_policies([self.player_id])
         return True
@@ -2,7 +2,6 @@ import datetime
 import hashlib
 import logging
 import os
-from concurrent.futures import as_completed
 from datetime import UTC, timedelta
 from typing import Any
 
@@ -10,6 +9,8 @@ from rq import Queue
 from rq.job import Dependency, Job, Retry
 from rq_scheduler import Scheduler
 from sqlalchemy import and_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 from rcon.cache_utils import get_redis_client
@@ -17,10 +18,10 @@ from rcon.game.registry import GAME_ID
 from rcon.game_logs import get_historical_logs_records
 from rcon.logs.recorder import LogRecorder
 from rcon.models import Maps, PlayerStats, enter_session
-from rcon.player_history import get_player
+from rcon.player_identity import get_player_identity
 from rcon.player_stats import TimeWindowStats
 from rcon.rcon import get_rcon
-from rcon.types import GameLayout, MapInfo, MapScore, PlayerStat
+from rcon.types import DesiredVipType, GameLayout, MapInfo, MapScore, PlayerStat
 from rcon.utils import (
     GAME_LOG_STAT_FIELDS,
     INDEFINITE_VIP_DATE,
@@ -30,35 +31,46 @@ from rcon.utils import (
     get_server_number,
     get_temp_default_stats,
 )
+from rcon.vip_reconciliation import reconcile_vips
 
 logger = logging.getLogger("rcon")
 
 
-def update_player_steaminfo_on_connect_worker(player_name: str, player_id: str) -> None:
-    """Refresh Steam data outside the synchronous log-loop process."""
+def update_players_steaminfo_on_connect_worker(players: dict[str, str]) -> None:
+    """Refresh Steam data of up to 100 connected players (player_id -> name)
+
+    The Steam API takes up to 100 steam IDs per request, so a whole batch of
+    connections costs a single request per kind of data.
+    """
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+
     from rcon import steam_utils
-    from rcon.models import enter_session
-    from rcon.player_history import _get_set_player
+    from rcon.models import PlayerID
 
     started = datetime.datetime.now(datetime.UTC)
     try:
         with enter_session() as sess:
-            player = _get_set_player(sess, player_name=player_name, player_id=player_id)
-            steam_utils.update_missing_old_steam_info_single_player(
-                sess=sess, player=player
+            pks = get_player_identity().get_or_create_pks(sess, players)
+            found = sess.scalars(
+                select(PlayerID)
+                .options(selectinload(PlayerID.steaminfo))
+                .where(PlayerID.id.in_(pks.values()))
+            ).all()
+            steam_utils.update_missing_old_steam_info_mult_players(
+                sess=sess, players=found
             )
 
         # The synchronous CONNECTED hook may have checked VAC data before the
         # Steam refresh completed, so repeat that check with fresh data here.
-        from rcon.hooks import ban_if_has_vac_bans
-        from rcon.rcon import get_rcon
+        from rcon.hooks import ban_players_with_vac_bans
 
-        ban_if_has_vac_bans(get_rcon(), player_id, player_name)
+        ban_players_with_vac_bans(get_rcon(), players)
     finally:
         logger.info(
-            "Steam connect enrichment completed in %.3fs for %s",
+            "Steam connect enrichment completed in %.3fs for %s players",
             (datetime.datetime.now(datetime.UTC) - started).total_seconds(),
-            player_id,
+            len(players),
         )
 
 
@@ -443,6 +455,27 @@ def _get_game_logs_stats(
     )
 
 
+def _build_player_stats_upsert(rows: list[dict[str, Any]], force: bool = False):
+    """Build a single multi-row INSERT for the given PlayerStats rows.
+
+    Rows that collide on (playersteamid_id, map_id) are left untouched unless
+    force is set, in which case every stat column is overwritten.
+    """
+    statement = postgresql_insert(PlayerStats).values(rows)
+    if not force:
+        return statement.on_conflict_do_nothing(constraint="unique_map_player")
+
+    immutable_columns = {"id", "playersteamid_id", "map_id"}
+    return statement.on_conflict_do_update(
+        constraint="unique_map_player",
+        set_={
+            column.name: statement.excluded[column.name]
+            for column in PlayerStats.__table__.columns
+            if column.name not in immutable_columns
+        },
+    )
+
+
 def record_stats_from_map(
     sess: Session, map_: Maps, map_info: MapInfo | None, force: bool = False
 ) -> None:
@@ -454,7 +487,7 @@ def record_stats_from_map(
 
     _save_match_result(sess, map_)
 
-    seen_players: set[str] = set()
+    game_log_stats_by_player: dict[str, dict[str, Any]] = {}
     for player_game_log_stats in _get_game_logs_stats(sess, map_, temp_stats).values():
         player_id = player_game_log_stats.get("player_id")
         if not player_id:
@@ -463,47 +496,78 @@ def record_stats_from_map(
             )
             continue
 
-        if player_id in seen_players:
+        if player_id in game_log_stats_by_player:
             logger.info(f"Failed to record duplicate stats for {player_id}")
             continue
 
-        seen_players.add(player_id)
+        game_log_stats_by_player[player_id] = player_game_log_stats
 
-        player_record = get_player(sess, player_id=player_id)
-        if not player_record:
-            logger.error("Can't find DB record for %s", player_id)
-            continue
+    if not game_log_stats_by_player:
+        return
 
-        # Check for any already recorded stats
-        existing: PlayerStats | None = (
-            sess.query(PlayerStats)
-            .filter(
-                PlayerStats.map_id == map_.id,
-                PlayerStats.player_id_id == player_record.id,
-            )
-            .one_or_none()
+    # Resolve every player and every already recorded stat for this map up front
+    # instead of issuing two queries per player
+    pks_by_player_id = get_player_identity().get_pks(
+        sess, game_log_stats_by_player.keys()
+    )
+    existing_by_pk: dict[int, PlayerStats] = {
+        stat.player_id_id: stat
+        for stat in sess.query(PlayerStats).filter(
+            PlayerStats.map_id == map_.id,
+            PlayerStats.player_id_id.in_(list(pks_by_player_id.values())),
         )
+    }
 
+    rows: list[dict[str, Any]] = []
+    for player_id, player_game_log_stats in game_log_stats_by_player.items():
+        player_pk = pks_by_player_id.get(player_id)
+        if player_pk is None:
+            logger.error("Can't find DB record for %s", player_id)
+            continue
+
+        existing = existing_by_pk.get(player_pk)
         # The stats were already recorded once
         if existing is not None and not force:
             continue
 
         player_temp_stats = temp_stats.get(player_id, get_temp_default_stats(existing))
-
-        combined_player_stats = _build_player_stat_dict(
-            player_record.id, map_.id, player_game_log_stats, player_temp_stats
+        rows.append(
+            _build_player_stat_dict(
+                player_pk, map_.id, player_game_log_stats, player_temp_stats
+            )
         )
 
-        if existing is not None and force:
-            logger.debug("Updating stats for player %s on map %s", player_id, map_.id)
-            for key, value in combined_player_stats.items():
-                if key not in ("player_id_id", "map_id"):
-                    setattr(existing, key, value)
-            continue
+    if not rows:
+        return
+
+    logger.debug(
+        "Saving stats for %d players on map %s (force=%s)", len(rows), map_.id, force
+    )
+    sess.execute(_build_player_stats_upsert(rows, force=force))
+    # Loaded rows may have been overwritten by the upsert, reload them on access
+    for existing in existing_by_pk.values():
+        sess.expire(existing)
+
 
-        logger.debug("Saving stats for player %s on map %s", player_id, map_.id)
-        player_stat_record = PlayerStats(**combined_player_stats)
-        sess.add(player_stat_record)
+def reprocess_map_stats(map_id: int, force: bool = False) -> str | None:
+    """Recompute and save the stats of one recorded match in its own session.
+
+    Returns an error message if the match could not be processed, None otherwise.
+    Used by the reprocess-games CLI to run several matches in parallel processes.
+    """
+    with enter_session() as sess:
+        map_ = sess.get(Maps, map_id)
+        if map_ is None:
+            return f"Map {map_id} does not exist"
+        try:
+            # The live stats of a past match are no longer cached, the combat
+            # scores are taken from the already recorded stats, if any
+            record_stats_from_map(sess, map_, None, force=force)
+            sess.commit()
+        except (IntegrityError, ValueError) as e:
+            sess.rollback()
+            return repr(e)
+    return None
 
 
 def get_job_results(job_key):
@@ -540,53 +604,30 @@ def worker_bulk_vip(name_ids, job_key, mode="override"):
 
 
 def bulk_vip(name_ids, mode="override"):
+    """Make (description, player_id, expiration) the VIPs of the server
+
+    Only the VIPs that differ from the current ones are changed.
+    """
     from rcon.api_commands import get_rcon_api
 
     ctl = get_rcon_api()
-    errors = []
     logger.info(f"bulk_vip name_ids {name_ids[0]} type {type(name_ids)}")
-    vips = ctl.get_vip_ids()
 
-    removal_futures = {
-        ctl.run_in_pool("remove_vip", vip["player_id"]): vip
-        for idx, vip in enumerate(vips)
-    }
-    for future in as_completed(removal_futures):
-        try:
-            result = future.result()
-            if not result:
-                errors.append(f"Failed to add {removal_futures[future]}")
-        except Exception:
-            logger.exception(f"Failed to remove vip from {removal_futures[future]}")
-
-    processed_additions = []
-    for description, player_id, expiration_timestamp in name_ids:
-        if not expiration_timestamp:
-            expiration_timestamp = INDEFINITE_VIP_DATE.isoformat()
-        else:
-            expiration_timestamp = expiration_timestamp.isoformat()
-
-        processed_additions.append((description, player_id, expiration_timestamp))
-
-    add_futures = {
-        ctl.run_in_pool(
-            "add_vip",
-            player_id=player_id,
-            description=description,
-            expiration=expiration_timestamp,
-        ): player_id
-        for idx, (description, player_id, expiration_timestamp) in enumerate(
-            processed_additions
-        )
-    }
-    for future in as_completed(add_futures):
-        try:
-            result = future.result()
-            if not result:
-                errors.append(f"Failed to add {add_futures[future]}")
-        except Exception:
-            logger.exception(f"Failed to add vip to {add_futures[future]}")
+    desired: list[DesiredVipType] = [
+        {
+            "player_id": player_id,
+            "description": description,
+            "expiration": expiration_timestamp or INDEFINITE_VIP_DATE,
+        }
+        for description, player_id, expiration_timestamp in name_ids
+    ]
+    result = reconcile_vips(ctl, desired, remove_missing=mode == "override")
 
+    errors = result["errors"]
     if not errors:
         errors.append("ALL OK")
+    errors.append(
+        f"{len(result['added'])} added, {len(result['updated'])} updated, "
+        f"{len(result['removed'])} removed, {result['unchanged']} unchanged"
+    )
     return errors
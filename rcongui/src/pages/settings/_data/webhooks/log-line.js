@@ -6,9 +6,9 @@ const logLineWebhooksNotes = `
 
         For example, you could mention roles or users in Discord when a match starts or ends.
 
-        You can set as many URLs as you want, but these are updated sequentially not concurrently,
-        so setting more than one will delay the updates of each one and you should probably not
-        set more than a few
+        Messages are queued and sent by the webhook service within Discord's rate limits,
+        busy log types (kills for instance) can be coalesced to send the lines received
+        within a second in a single message
     */
     "webhooks": [
         /*
@@ -30,7 +30,9 @@ const logLineWebhooksNotes = `
                 ],
                 /* A list of role ID(s), must be in the <@...> format  to mention*/
                 "role_mentions": []
-            }
+            },
+            /* Send the lines received within a second in a single message */
+            "coalesce": false
         }
     ]
 }
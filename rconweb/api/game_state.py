@@ -0,0 +1,82 @@
+import asyncio
+
+import orjson
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.urls import path
+
+from api.auth import APITokenAuthMiddleware, RconJsonResponse
+from api.scoreboards import build_live_scoreboard
+from api.views import build_public_info, rcon_api
+from rcon.game_state_hub import GameStateHub, GameStateSubscription
+
+_HUB: GameStateHub | None = None
+
+
+def get_game_state_hub() -> GameStateHub:
+    """The game state shared by every websocket of this process
+
+    The sections are the same as the get_gamestate, get_team_view,
+    get_public_info and get_live_scoreboard endpoints.
+    """
+    global _HUB
+    if _HUB is None:
+        _HUB = GameStateHub(
+            sections={
+                "gamestate": rcon_api.get_gamestate,
+                "team_view": rcon_api.get_team_view,
+                "public_info": build_public_info,
+                "live_scoreboard": build_live_scoreboard,
+            },
+            default=RconJsonResponse._orjson_dump_pydantic,
+        )
+    return _HUB
+
+
+class GameStateConsumer(AsyncWebsocketConsumer):
+    """Send the game state snapshot on connect, then a JSON patch per change
+
+    Every message has a version, a patch applies to the state of the
+    previous version. A client that misses one should reconnect.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.subscription: GameStateSubscription | None = None
+        self.sender: asyncio.Task | None = None
+
+    async def connect(self):
+        await self.accept()
+        self.subscription = await get_game_state_hub().subscribe()
+        self.sender = asyncio.create_task(self.send_updates(self.subscription))
+
+    async def disconnect(self, code):
+        if self.subscription is not None:
+            get_game_state_hub().unsubscribe(self.subscription)
+            self.subscription = None
+        if self.sender is not None:
+            self.sender.cancel()
+            self.sender = None
+
+    async def send_updates(self, subscription: GameStateSubscription):
+        # Already serialized by the hub, once for every client
+        while (message := await subscription.get()) is not None:
+            await self.send(text_data=message)
+
+        if subscription.error is not None:
+            await self.send(
+                text_data=orjson.dumps(
+                    {"type": "error", "error": subscription.error}
+                ).decode()
+            )
+            await self.close()
+
+
+urlpatterns = [
+    path(
+        "ws/game_state",
+        APITokenAuthMiddleware(
+            app=GameStateConsumer.as_asgi(),
+            perms=("api.can_view_gamestate", "api.can_view_team_view"),
+        ),
+    )
+]
@@ -1,5 +1,4 @@
 import asyncio
-from collections.abc import Generator
 from logging import getLogger
 from typing import TypedDict
 
@@ -7,11 +6,9 @@ from channels.generic.websocket import AsyncJsonWebsocketConsumer
 from django.urls import path
 
 from api.auth import APITokenAuthMiddleware
-from rcon.game_logs import is_action
-from rcon.logs.stream import LogStream
+from rcon.logs.stream_hub import LogStreamSubscription, get_log_stream_hub
 from rcon.types import AllLogTypes, StructuredLogLineWithMetaData
-from rcon.user_config.log_stream import LogStreamUserConfig
-from rcon.utils import StreamID, StreamInvalidID
+from rcon.utils import StreamID
 
 logger = getLogger(__name__)
 
@@ -28,31 +25,35 @@ class LogStreamResponse(TypedDict):
 
 
 class LogStreamConsumer(AsyncJsonWebsocketConsumer):
+    """Send the live logs to a client, read once per process by the hub"""
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.connected = False
-
-    async def websocket_connect(self, *args, **kwargs):
-        self.connected = True
-        await super().websocket_connect(*args, **kwargs)
+        self.subscription: LogStreamSubscription | None = None
+        self.sender: asyncio.Task | None = None
 
     async def websocket_disconnect(self, *args, **kwargs):
-        self.connected = False
+        self.stop()
         await super().websocket_disconnect(*args, **kwargs)
 
-    async def receive_json(self, content, **kwargs):
-        config = LogStreamUserConfig.load_from_db()
-
-        if not config.enabled:
-            response: LogStreamResponse = {
-                "error": "Log stream is not enabled in your config",
-                # TODO: should this be None?
-                "last_seen_id": None,
-                "logs": [],
-            }
-            await self.send_json(response)
-            return await self.websocket_disconnect()
+    def stop(self):
+        if self.subscription is not None:
+            get_log_stream_hub().unsubscribe(self.subscription)
+            self.subscription = None
+        if self.sender is not None:
+            self.sender.cancel()
+            self.sender = None
+
+    async def send_error(self, error: str):
+        response: LogStreamResponse = {
+            "error": error,
+            # TODO: should this be None?
+            "last_seen_id": None,
+            "logs": [],
+        }
+        await self.send_json(response)
 
+    async def receive_json(self, content, **kwargs):
         last_seen: StreamID = content.get("last_seen_id")
         raw_actions: list[str] | None = content.get("actions")
 
@@ -64,69 +65,28 @@ class LogStreamConsumer(AsyncJsonWebsocketConsumer):
                 actions_filter = []
         except ValueError as e:
             logger.error(e)
+            await self.send_error(str(e))
+            return await self.close()
+
+        # A new request replaces the current one
+        self.stop()
+        self.subscription = await get_log_stream_hub().subscribe(
+            last_seen_id=last_seen, actions=actions_filter
+        )
+        self.sender = asyncio.create_task(self.send_logs(self.subscription))
+
+    async def send_logs(self, subscription: LogStreamSubscription):
+        while batch := await subscription.get_batch(size=25):
             response: LogStreamResponse = {
-                "error": str(e),
-                # TODO: should this be None?
-                "last_seen_id": None,
-                "logs": [],
+                "last_seen_id": batch[-1][0],
+                "logs": [{"id": id_, "log": log} for id_, log in batch],
+                "error": None,
             }
             await self.send_json(response)
-            return await self.websocket_disconnect()
-
-        send_all = False
-        if len(actions_filter) == 0:
-            send_all = True
-
-        def batch_logs(
-            logs: list[LogStreamObject], size=25
-        ) -> Generator[list[LogStreamObject], None, None]:
-            size = max(size, 1)
-            return (logs[i : i + size] for i in range(0, len(logs), size))
-
-        log_stream = LogStream()
-        while self.connected:
-            config = LogStreamUserConfig.load_from_db()
-
-            if not config.enabled:
-                response: LogStreamResponse = {
-                    "error": "Log stream is not enabled in your config",
-                    # TODO: should this be None?
-                    "last_seen_id": None,
-                    "logs": [],
-                }
-                await self.send_json(response)
-                return await self.websocket_disconnect()
-
-            try:
-                logs = log_stream.logs_since(last_seen=last_seen)
-                json_logs: list[LogStreamObject] = []
-                if logs:
-                    for id_, log in logs:
-                        last_seen = id_
-                        if send_all or is_action(
-                            actions_filter, log["action"], exact_match=False
-                        ):
-                            json_logs.append({"id": id_, "log": log})
-
-                    if json_logs:
-                        for batch in batch_logs(json_logs):
-                            response: LogStreamResponse = {
-                                "last_seen_id": batch[-1]["id"],
-                                "logs": batch,
-                                "error": None,
-                            }
-                            await self.send_json(response)
-
-            except StreamInvalidID as e:
-                response: LogStreamResponse = {
-                    "error": str(e),
-                    # TODO: should this be None?
-                    "last_seen_id": None,
-                    "logs": [],
-                }
-                await self.send_json(response)
-                raise
-            await asyncio.sleep(0.3)
+
+        if subscription.error is not None:
+            await self.send_error(subscription.error)
+            await self.close()
 
     async def send_json(self, content, close=False):
         return await super().send_json(content, close)
@@ -31,20 +31,24 @@ def parse_recorded_layer(record: Maps) -> Layer:
     return get_game_profile(GameEnum.from_int(record.game)).parse_layer(record.map_name)
 
 
+def build_live_scoreboard() -> dict:
+    stats = LiveStats()
+    config = RconServerSettingsUserConfig.load_from_db()
+    result = stats.get_cached_stats()
+    return {
+        "snapshot_timestamp": result["snapshot_timestamp"],
+        "refresh_interval_sec": config.live_stats_refresh_seconds,
+        "stats": result["stats"],
+    }
+
+
 @csrf_exempt
 @stats_login_required
 @require_http_methods(["GET"])
 def get_live_scoreboard(request):
     """Return stats for all currently connected players (stats are reset on disconnect, not match start)"""
-    stats = LiveStats()
-    config = RconServerSettingsUserConfig.load_from_db()
     try:
-        result = stats.get_cached_stats()
-        result = {
-            "snapshot_timestamp": result["snapshot_timestamp"],
-            "refresh_interval_sec": config.live_stats_refresh_seconds,
-            "stats": result["stats"],
-        }
+        result = build_live_scoreboard()
         error = (None,)
         failed = False
     except Exception:
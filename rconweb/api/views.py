@@ -85,9 +85,7 @@ def get_version(request):
     return api_response(res.stdout.decode(), failed=False, command="get_version")
 
 
-@csrf_exempt
-@require_http_methods(["GET"])
-def get_public_info(request):
+def build_public_info() -> PublicInfoType:
     cached_cur_map = MapsHistory().get_current_map()
     if not cached_cur_map:
         logger.error("Can't get current map time, map_recorder is probably offline")
@@ -151,9 +149,14 @@ def get_public_info(request):
         "name": name,
         "config": server_config,
     }
+    return res
+
 
+@csrf_exempt
+@require_http_methods(["GET"])
+def get_public_info(request):
     return api_response(
-        result=res,
+        result=build_public_info(),
         failed=False,
         command="get_public_info",
     )
@@ -17,11 +17,13 @@ from django.core.asgi import get_asgi_application
 django_asgi_app = get_asgi_application()
 
 # This has to be imported *after* setting DJANGO_SETTINGS_MODULE
-from api import barricade, log_stream
+from api import barricade, game_state, log_stream
 
 application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
-        "websocket": URLRouter(log_stream.urlpatterns + barricade.urlpatterns),
+        "websocket": URLRouter(
+            log_stream.urlpatterns + barricade.urlpatterns + game_state.urlpatterns
+        ),
     }
 )
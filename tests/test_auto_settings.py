@@ -0,0 +1,217 @@
+from datetime import UTC, datetime
+from unittest import mock
+
+from fakeredis import FakeStrictRedis
+
+from rcon.auto_settings import (
+    AutoSettings,
+    AutoSettingsApplier,
+    AutoSettingsTriggers,
+    TokenBucket,
+    compile_settings,
+    desired_commands,
+)
+from rcon.auto_settings_events import (
+    AutoSettingsEvent,
+    AutoSettingsEvents,
+    auto_settings_channel,
+    publish_auto_settings_event,
+)
+from rcon.user_config.auto_settings import AutoSettingsConfig
+
+CONFIG = {
+    "always_apply_defaults": True,
+    "can_invoke_multiple_rules": True,
+    "defaults": {
+        "set_idle_autokick_time": {"minutes": 10},
+        "set_autobalance_threshold": {"max_diff": 2},
+        "say": {"message": "hello"},
+    },
+    "rules": [
+        {
+            "conditions": {"player_count": {"min": 0, "max": 50}},
+            "commands": {"set_idle_autokick_time": {"minutes": 0}},
+        },
+        {
+            "conditions": {"player_count": {"min": 30, "max": 100}},
+            "commands": {"set_autobalance_threshold": {"max_diff": 5}},
+        },
+    ],
+}
+
+
+def _rcon(players: int):
+    rcon = mock.Mock()
+    rcon.get_slots.return_value = {"current_players": players}
+    return rcon
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+def test_desired_commands_keep_the_last_sent_values():
+    settings = compile_settings(CONFIG)
+
+    # Each matching rule re-applied the set defaults before its own commands
+    assert desired_commands(settings, _rcon(40)) == {
+        "say": {"message": "hello"},
+        "set_idle_autokick_time": {"minutes": 10},
+        "set_autobalance_threshold": {"max_diff": 5},
+    }
+    assert desired_commands(settings, _rcon(60)) == {
+        "say": {"message": "hello"},
+        "set_idle_autokick_time": {"minutes": 10},
+        "set_autobalance_threshold": {"max_diff": 5},
+    }
+    assert desired_commands(settings, _rcon(10)) == {
+        "say": {"message": "hello"},
+        "set_idle_autokick_time": {"minutes": 0},
+        "set_autobalance_threshold": {"max_diff": 2},
+    }
+
+
+def test_only_changed_commands_are_sent():
+    rcon = _rcon(10)
+    clock = FakeClock()
+    applier = AutoSettingsApplier(rcon, TokenBucket(clock=clock, sleep=clock.sleep))
+    desired = {
+        "set_idle_autokick_time": {"minutes": 0},
+        "say": {"message": "hello"},
+    }
+
+    with mock.patch("rcon.auto_settings.run_command", return_value=True) as run:
+        assert applier.apply(desired) == ["set_idle_autokick_time", "say"]
+        assert applier.apply(desired) == ["say"]
+        desired["set_idle_autokick_time"] = {"minutes": 5}
+        assert applier.apply(desired) == ["set_idle_autokick_time", "say"]
+
+    assert run.call_count == 5
+
+
+def test_user_configs_are_compared_with_their_stored_values():
+    rcon = mock.Mock()
+    rcon.get_vote_kick_config.return_value.model_dump.return_value = {
+        "enabled": True,
+        "thresholds": [[0, 60]],
+    }
+    applier = AutoSettingsApplier(rcon)
+
+    assert applier.is_current("set_vote_kick_config", {"enabled": True, "by": "me"})
+    assert not applier.is_current("set_vote_kick_config", {"enabled": False})
+
+
+def test_token_bucket_allows_bursts_then_paces():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1 / 5, capacity=2, clock=clock, sleep=clock.sleep)
+
+    for _ in range(4):
+        bucket.acquire()
+
+    assert clock.now == 10
+
+
+def test_rules_are_compiled_once_per_config():
+    auto_settings = AutoSettings(_rcon(10), applier=mock.Mock())
+    config = mock.Mock()
+    config.get_settings.return_value = CONFIG
+
+    with (
+        mock.patch("rcon.auto_settings.AutoSettingsConfig", return_value=config),
+        mock.patch(
+            "rcon.auto_settings.compile_settings", wraps=compile_settings
+        ) as compile,
+    ):
+        auto_settings.run_once()
+        auto_settings.run_once()
+        config.get_settings.return_value = {**CONFIG, "rules": []}
+        auto_settings.run_once()
+
+    assert compile.call_count == 2
+
+
+def test_conditions_share_the_metrics_of_an_evaluation():
+    rcon = _rcon(40)
+    settings = compile_settings(
+        {
+            "rules": [
+                {"conditions": {"player_count": {"min": 0, "max": 30}}},
+                {"conditions": {"player_count": {"min": 31, "max": 50}}},
+            ]
+        }
+    )
+
+    desired_commands(settings, rcon)
+
+    rcon.get_slots.assert_called_once()
+
+
+def test_player_count_triggers_on_threshold_crossings_only():
+    triggers = AutoSettingsTriggers(compile_settings(CONFIG))
+    triggers.observe_player_count(10)
+
+    assert not triggers.is_relevant(AutoSettingsEvent.PLAYER_COUNT, _rcon(29))
+    assert triggers.is_relevant(AutoSettingsEvent.PLAYER_COUNT, _rcon(30))
+    assert not triggers.is_relevant(AutoSettingsEvent.PLAYER_COUNT, _rcon(50))
+    assert triggers.is_relevant(AutoSettingsEvent.PLAYER_COUNT, _rcon(51))
+    assert not triggers.is_relevant(AutoSettingsEvent.MAP_CHANGE, _rcon(51))
+    assert triggers.is_relevant(AutoSettingsEvent.CONFIG, _rcon(51))
+
+
+def test_time_of_day_conditions_schedule_their_next_boundary():
+    settings = compile_settings(
+        {
+            "rules": [
+                {
+                    "conditions": {
+                        "time_of_day": {"min": "10:00", "max": "18:30"},
+                        "current_map": {"map_names": ["stmereeglise_warfare"]},
+                    }
+                }
+            ]
+        }
+    )
+    triggers = AutoSettingsTriggers(settings, resync_seconds=24 * 60 * 60)
+
+    assert triggers.on_map_change
+    assert triggers.seconds_until_next(datetime(2024, 1, 1, 9, 0, tzinfo=UTC)) == 3600
+    assert triggers.seconds_until_next(datetime(2024, 1, 1, 18, 30, tzinfo=UTC)) == 60
+    assert triggers.seconds_until_next(datetime(2024, 1, 1, 20, 0, tzinfo=UTC)) == (
+        14 * 60 * 60
+    )
+
+
+def test_events_wake_the_service_up():
+    red = FakeStrictRedis()
+    events = AutoSettingsEvents(red)
+    events.get(timeout=0.1)
+
+    publish_auto_settings_event(AutoSettingsEvent.MAP_CHANGE, red)
+
+    assert events.get(timeout=1) == AutoSettingsEvent.MAP_CHANGE
+
+
+def test_config_changes_wake_the_service_of_their_server_up():
+    red = FakeStrictRedis()
+    events = AutoSettingsEvents(red)
+    events.get(timeout=0.1)
+    other = red.pubsub(ignore_subscribe_messages=True)
+    other.subscribe(auto_settings_channel(2))
+    other.get_message(timeout=0.1)
+
+    with (
+        mock.patch("rcon.auto_settings_events.get_redis_client", return_value=red),
+        mock.patch("rcon.user_config.auto_settings.set_user_config"),
+        mock.patch.object(AutoSettingsConfig, "validate_settings"),
+    ):
+        AutoSettingsConfig(server_number=2).set_settings({})
+
+    assert other.get_message(timeout=1)["data"] == AutoSettingsEvent.CONFIG.encode()
+    assert events.get(timeout=0.1) is None
@@ -0,0 +1,125 @@
+from datetime import UTC, datetime
+from unittest import mock
+
+from fakeredis import FakeStrictRedis
+
+from rcon.automods.automod import get_punitions_to_apply
+from rcon.automods.models import PunitionsToApply, WatchStatus
+from rcon.automods.scheduler import AutomodScheduler, TimerWheel
+from rcon.automods.state_store import WatchStateStore
+
+
+def _player(player_id: str, role: str = "rifleman", level: int = 50):
+    return {"player_id": player_id, "name": player_id, "role": role, "level": level}
+
+
+def _team_view(**squads):
+    return {
+        "allies": {
+            "commander": None,
+            "squads": {
+                name: {"type": "infantry", "has_leader": False, "players": players}
+                for name, players in squads.items()
+            },
+        }
+    }
+
+
+class ChangeDrivenMod:
+    change_driven = True
+
+    def __init__(self):
+        self.config = mock.Mock(
+            notes_interval_seconds=0,
+            warning_interval_seconds=60,
+            punish_interval_seconds=0,
+            kick_grace_period_seconds=0,
+        )
+        self.config.model_dump_json.return_value = "{}"
+        self.state_store = WatchStateStore(FakeStrictRedis(), "watch", 120)
+        self.evaluated = []
+
+    def punitions_to_apply(self, team_view, squad_name, team, squad, game_state):
+        self.evaluated.append(squad_name)
+        return PunitionsToApply()
+
+
+def test_timer_wheel_pops_due_timers_once():
+    wheel = TimerWheel(tick_seconds=1, size=8)
+    wheel.pop_due(100)
+    wheel.schedule("a", 103.5)
+    wheel.schedule("b", 120)
+    wheel.schedule("c", 104)
+    wheel.cancel("c")
+
+    assert wheel.pop_due(103) == set()
+    assert wheel.pop_due(104) == {"a"}
+    assert wheel.pop_due(119) == set()
+    assert wheel.pop_due(125) == {"b"}
+    assert len(wheel) == 0
+
+
+def test_only_changed_squads_are_planned():
+    scheduler = AutomodScheduler()
+    mod = ChangeDrivenMod()
+    team_view = _team_view(able=[_player("1"), _player("2")], baker=[_player("3")])
+
+    assert scheduler.plan(team_view, [mod], now=0) == {
+        "ChangeDrivenMod": {("allies", "able"), ("allies", "baker")}
+    }
+    assert scheduler.plan(team_view, [mod], now=5) == {"ChangeDrivenMod": set()}
+
+    team_view["allies"]["squads"]["able"]["players"][0]["role"] = "officer"
+    assert scheduler.plan(team_view, [mod], now=10) == {
+        "ChangeDrivenMod": {("allies", "able")}
+    }
+
+    # A change of team size re-evaluates every remaining squad
+    del team_view["allies"]["squads"]["baker"]
+    assert scheduler.plan(team_view, [mod], now=15) == {
+        "ChangeDrivenMod": {("allies", "able")}
+    }
+    assert scheduler.global_fingerprint[0] == 2
+
+
+def test_watched_squads_are_evaluated_when_their_next_step_is_due():
+    scheduler = AutomodScheduler()
+    mod = ChangeDrivenMod()
+    team_view = _team_view(able=[_player("1")])
+    warned_at = datetime.now(tz=UTC).timestamp()
+    scheduler.plan(team_view, [mod], now=warned_at)
+    with mod.state_store.watch("allies:able") as watch_status:
+        watch_status.warned["1"] = [datetime.fromtimestamp(warned_at, tz=UTC)]
+    scheduler.mark_evaluated(mod, "allies", "able")
+    scheduler.reschedule([mod], now=warned_at)
+
+    assert scheduler.plan(team_view, [mod], now=warned_at + 59) == {
+        "ChangeDrivenMod": set()
+    }
+    assert scheduler.plan(team_view, [mod], now=warned_at + 61) == {
+        "ChangeDrivenMod": {("allies", "able")}
+    }
+
+
+def test_unwatched_squads_are_not_rescheduled():
+    scheduler = AutomodScheduler()
+    mod = ChangeDrivenMod()
+    with mod.state_store.watch("allies:able") as watch_status:
+        assert watch_status == WatchStatus()
+    scheduler.mark_evaluated(mod, "allies", "able")
+    scheduler.reschedule([mod], now=0)
+
+    assert len(scheduler.wheel) == 0
+
+
+def test_idle_ticks_skip_the_game_state():
+    scheduler = AutomodScheduler()
+    mod = ChangeDrivenMod()
+    rcon = mock.Mock()
+    rcon.get_team_view.return_value = _team_view(able=[_player("1")])
+
+    get_punitions_to_apply(rcon, [mod], scheduler)
+    get_punitions_to_apply(rcon, [mod], scheduler)
+
+    assert mod.evaluated == ["able"]
+    assert rcon.get_gamestate.call_count == 1
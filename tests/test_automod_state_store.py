@@ -0,0 +1,94 @@
+import time
+from datetime import UTC, datetime
+from unittest import mock
+
+from fakeredis import FakeStrictRedis
+
+from rcon.automods.models import SquadHasLeader, WatchStatus
+from rcon.automods.no_leader import NoLeaderAutomod
+from rcon.automods.state_store import (
+    WatchStateStore,
+    dump_watch_status,
+    load_watch_status,
+)
+from rcon.user_config.auto_mod_no_leader import AutoModNoLeaderUserConfig
+
+
+def test_watch_status_round_trip():
+    now = datetime(2024, 5, 1, 12, 30, 15, 123000, tzinfo=UTC)
+    watch_status = WatchStatus(
+        offensive_points={"a": 3},
+        noted={"a": [now]},
+        warned={"a": [now, now]},
+        punished={},
+    )
+
+    raw = dump_watch_status(watch_status)
+
+    assert load_watch_status(raw) == watch_status
+    assert dump_watch_status(load_watch_status(raw)) == raw
+
+
+def test_tick_loads_once_and_writes_only_changes():
+    red = FakeStrictRedis()
+    store = WatchStateStore(red, "watch", 120)
+    with store.tick():
+        with store.watch("allies:able") as watch_status:
+            watch_status.warned["a"] = [datetime.now(tz=UTC)]
+        with store.watch("axis:baker"):
+            pass
+
+    with (
+        mock.patch.object(red, "pipeline", wraps=red.pipeline) as pipeline,
+        store.tick(),
+    ):
+        for field in ("allies:able", "axis:baker", "axis:charlie"):
+            with store.watch(field):
+                pass
+
+    # A single load, nothing changed or went stale so nothing is written
+    assert pipeline.call_count == 1
+    assert red.hkeys("watch") == [b"allies:able"]
+    assert "a" in load_watch_status(red.hget("watch", "allies:able")).warned
+
+
+def test_reset_and_expired_states_are_removed():
+    red = FakeStrictRedis()
+    store = WatchStateStore(red, "watch", 120)
+    with store.watch("allies:able") as watch_status:
+        watch_status.noted["a"] = [datetime.now(tz=UTC)]
+    with store.watch("axis:baker") as watch_status:
+        watch_status.noted["b"] = [datetime.now(tz=UTC)]
+    red.hset("watch:seen", "axis:baker", time.time() - 121)
+
+    with store.tick():
+        store.delete("allies:able")
+        assert store.get("axis:baker") == WatchStatus()
+
+    assert red.hgetall("watch") == {}
+    assert red.hgetall("watch:seen") == {}
+
+
+def test_failed_watch_drops_its_changes():
+    store = WatchStateStore(FakeStrictRedis(), "watch", 120)
+    with store.tick():
+        try:
+            with store.watch("allies:able") as watch_status:
+                watch_status.noted["a"] = [datetime.now(tz=UTC)]
+                raise ValueError
+        except ValueError:
+            pass
+        assert store.get("allies:able") == WatchStatus()
+
+
+def test_automod_clears_the_state_of_squads_with_a_leader():
+    red = FakeStrictRedis()
+    mod = NoLeaderAutomod(AutoModNoLeaderUserConfig(enabled=True), red)
+    with mod.watch_state("allies", "Able") as watch_status:
+        watch_status.noted["a"] = [datetime.now(tz=UTC)]
+    assert red.hkeys("no_leader_watch") == [b"allies:able"]
+
+    with mod.watch_state("allies", "Able"):
+        raise SquadHasLeader()
+
+    assert red.hkeys("no_leader_watch") == []
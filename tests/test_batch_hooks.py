@@ -0,0 +1,220 @@
+import threading
+import time
+from unittest import mock
+
+from rcon import hooks
+from rcon.logs.hook_executor import HookExecutor
+from rcon.logs.loop import BATCH_HOOKS, HOOKS, LogLoop
+from rcon.policy_index import NO_POLICY, PlayerPolicy
+from rcon.types import AllLogTypes
+
+
+def _log(action: AllLogTypes, player_id: str | None, ts: int = 1_000):
+    return {
+        "action": action.value,
+        "player_id_1": player_id,
+        "player_name_1": f"name {player_id}",
+        "timestamp_ms": ts,
+        "message": "",
+        "raw": "",
+    }
+
+
+def _loop(logs) -> LogLoop:
+    loop = object.__new__(LogLoop)
+    loop.GET_LOGS_SINCE_MIN = 5
+    loop.rcon = mock.Mock()
+    loop.rcon.get_structured_logs.return_value = {"logs": list(reversed(logs))}
+    loop.record_line = lambda log, name_to_id: log
+    loop.hook_executor = HookExecutor(max_workers=1)
+    return loop
+
+
+def test_batch_hooks_receive_the_whole_fetch_before_single_hooks():
+    calls = []
+
+    def on_sessions(_, logs):
+        calls.append(("batch", [log["player_id_1"] for log in logs]))
+
+    def on_connect(_, log):
+        calls.append(("single", log["player_id_1"]))
+
+    logs = [
+        _log(AllLogTypes.disconnected, "a"),
+        _log(AllLogTypes.connected, "b"),
+        _log(AllLogTypes.kill, "c"),
+        _log(AllLogTypes.connected, "a"),
+    ]
+
+    with (
+        mock.patch.dict(
+            BATCH_HOOKS,
+            {
+                AllLogTypes.connected.value: [on_sessions],
+                AllLogTypes.disconnected.value: [on_sessions],
+            },
+        ),
+        mock.patch.dict(
+            HOOKS,
+            {AllLogTypes.connected.value: [on_connect]},
+        ),
+        mock.patch("rcon.logs.loop.MapsHistory"),
+    ):
+        loop = _loop(logs)
+        loop.process_logs()
+        loop.hook_executor.join()
+
+    assert calls == [
+        ("batch", ["a", "b", "a"]),
+        ("single", "b"),
+        ("single", "a"),
+    ]
+
+
+def test_failing_batch_hook_does_not_stop_the_others():
+    failing = mock.Mock(side_effect=ValueError, __name__="failing")
+    working = mock.Mock(__name__="working")
+    logs = [_log(AllLogTypes.connected, "a")]
+
+    with mock.patch.dict(
+        BATCH_HOOKS, {AllLogTypes.connected.value: [failing, working]}
+    ):
+        loop = _loop(logs)
+        loop.process_batch_hooks(logs)
+        loop.hook_executor.join()
+
+    working.assert_called_once()
+
+
+def test_slow_batch_hook_does_not_block_the_log_loop():
+    release = threading.Event()
+    done = []
+
+    def slow(_, logs):
+        release.wait(5)
+
+    def on_connect(_, log):
+        done.append(log["player_id_1"])
+
+    executor = HookExecutor(max_workers=8)
+    # A player whose hooks don't share the lane of the batch hooks
+    player_id = next(
+        p
+        for p in map(str, range(100))
+        if executor.lane_of(p) is not executor.lane_of(HookExecutor.MATCH_KEY)
+    )
+    logs = [_log(AllLogTypes.connected, player_id)]
+    with (
+        mock.patch.dict(BATCH_HOOKS, {AllLogTypes.connected.value: [slow]}),
+        mock.patch.dict(HOOKS, {AllLogTypes.connected.value: [on_connect]}),
+        mock.patch("rcon.logs.loop.MapsHistory"),
+    ):
+        loop = _loop(logs)
+        loop.hook_executor = executor
+        started = time.monotonic()
+        loop.process_logs()
+        assert time.monotonic() - started < 1
+
+        # The hooks of the players are not held back either
+        deadline = time.monotonic() + 5
+        while not done and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert done == [player_id]
+
+        release.set()
+        loop.hook_executor.join()
+
+
+def test_steam_enrichment_is_queued_per_hundred_players():
+    logs = [_log(AllLogTypes.connected, str(i)) for i in range(150)]
+    logs.append(_log(AllLogTypes.connected, None))
+
+    with mock.patch("rcon.hooks.get_queue") as get_queue:
+        hooks.update_player_steaminfo_on_connect(None, logs)
+
+    jobs = [call.args[1] for call in get_queue.return_value.enqueue.call_args_list]
+    assert [len(players) for players in jobs] == [100, 50]
+    assert jobs[1]["149"] == "name 149"
+
+
+def test_only_blacklisted_players_are_looked_up():
+    index = mock.Mock()
+    index.get_many.return_value = {
+        "a": NO_POLICY,
+        "b": PlayerPolicy(blacklisted=True),
+    }
+
+    with (
+        mock.patch("rcon.hooks.get_policy_index", return_value=index),
+        mock.patch("rcon.hooks.enter_session"),
+        mock.patch("rcon.hooks.is_player_blacklisted") as is_player_blacklisted,
+        mock.patch(
+            "rcon.hooks.apply_blacklist_punishment", return_value=True
+        ) as apply_punishment,
+    ):
+        punished = hooks.ban_blacklisted_players(None, {"a": "A", "b": "B"})
+
+    assert punished == {"b"}
+    assert is_player_blacklisted.call_args.args[1] == "b"
+    apply_punishment.assert_called_once()
+
+
+def test_connections_skip_the_sessions_of_blacklisted_players():
+    rcon = mock.Mock()
+    rcon.get_all_player_info.return_value = []
+    logs = [
+        _log(AllLogTypes.connected, "a", 1_000),
+        _log(AllLogTypes.connected, "b", 2_000),
+        _log(AllLogTypes.disconnected, "a", 3_000),
+    ]
+
+    with (
+        mock.patch("rcon.hooks.save_players") as save_players,
+        mock.patch("rcon.hooks.PlayerSoldier"),
+        mock.patch("rcon.hooks.ban_blacklisted_players", return_value={"b"}),
+        mock.patch("rcon.hooks.save_player_sessions") as save_player_sessions,
+        mock.patch("rcon.hooks.ban_players_with_vac_bans") as ban_vac,
+    ):
+        hooks.handle_connections(rcon, logs)
+
+    save_players.assert_called_once_with(
+        {"a": "name a", "b": "name b"},
+        timestamp={"a": 1.0, "b": 2.0},
+        steam_ids={},
+    )
+    save_player_sessions.assert_called_once_with([("a", True, 1.0), ("a", False, 3.0)])
+    ban_vac.assert_called_once_with(rcon, {"a": "name a"})
+
+
+def test_a_failing_connection_only_loses_its_own_changes():
+    rcon = mock.Mock()
+    rcon.get_all_player_info.return_value = []
+    logs = [
+        _log(AllLogTypes.connected, "a", 1_000),
+        _log(AllLogTypes.connected, "bad", 2_000),
+        _log(AllLogTypes.disconnected, "a", 3_000),
+    ]
+
+    def save_players(players, **_):
+        if "bad" in players:
+            raise ValueError
+
+    def save_player_sessions(events):
+        if any(player_id == "bad" for player_id, _, _ in events):
+            raise ValueError
+        saved_sessions.extend(events)
+
+    saved_sessions = []
+    with (
+        mock.patch("rcon.hooks.save_players", side_effect=save_players),
+        mock.patch("rcon.hooks.PlayerSoldier") as soldier,
+        mock.patch("rcon.hooks.ban_blacklisted_players", return_value=set()),
+        mock.patch("rcon.hooks.save_player_sessions", side_effect=save_player_sessions),
+        mock.patch("rcon.hooks.ban_players_with_vac_bans") as ban_vac,
+    ):
+        hooks.handle_connections(rcon, logs)
+
+    # The batch, then each player on its own
+    assert soldier.update_many.call_count == 1
+    assert saved_sessions == [("a", True, 1.0), ("a", False, 3.0)]
+    ban_vac.assert_called_once_with(rcon, {"a": "name a", "bad": "name bad"})
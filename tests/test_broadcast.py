@@ -0,0 +1,76 @@
+from unittest import mock
+
+from rcon.broadcast import BroadcastRotation
+from rcon.message_variables import MessageVariableResolver
+from rcon.types import MessageVariable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _rcon():
+    rcon = mock.Mock()
+    rcon.get_name.return_value = "My Server"
+    rcon.get_vip_ids.return_value = [
+        {"player_id": "1", "name": "vip1", "vip_expiration": None}
+    ]
+    rcon.get_admin_ids.return_value = [{"name": "admin1", "role": "owner"}]
+    return rcon
+
+
+def test_sources_are_fetched_once_per_resolver():
+    rcon = _rcon()
+    resolver = MessageVariableResolver(rcon)
+
+    assert resolver.resolve(["server_name", "vip_names", "vip_status"], "1") == {
+        MessageVariable.server_name: "My Server",
+        MessageVariable.vip_names: ["vip1"],
+        MessageVariable.vip_status: True,
+    }
+    resolver.resolve(["server_name", "random_vip_name", "unknown"])
+
+    rcon.get_name.assert_called_once()
+    rcon.get_vip_ids.assert_called_once()
+
+
+def test_rotation_shares_the_sources_of_its_messages():
+    rcon = _rcon()
+    rotation = BroadcastRotation(
+        rcon,
+        ["Welcome on {servername}", "Our VIPs: {vips}", "{server_name} {owners}"],
+    )
+
+    rotation.prefetch()
+    assert rotation.render(1) == "Our VIPs: ['vip1']"
+    assert rotation.render(0) == "Welcome on My Server"
+    assert rotation.render(2) == "My Server ['admin1']"
+
+    rcon.get_name.assert_called_once()
+    rcon.get_vip_ids.assert_called_once()
+    rcon.get_admin_ids.assert_called_once()
+
+
+def test_messages_are_rendered_again_when_their_sources_change():
+    rcon = _rcon()
+    clock = FakeClock()
+    resolver = MessageVariableResolver(rcon, max_age_seconds=20, clock=clock)
+    rotation = BroadcastRotation(rcon, ["{servername}", "{vips}"], resolver)
+
+    with mock.patch("rcon.broadcast.format_message_string") as format_string:
+        format_string.side_effect = lambda msg, populated_variables, context: str(
+            list(populated_variables.values())
+        )
+        rotation.render(0)
+        rotation.render(1)
+        clock.now = 30
+        rcon.get_vip_ids.return_value = []
+        assert rotation.render(0) == "['My Server']"
+        assert rotation.render(1) == "[[]]"
+
+    assert format_string.call_count == 3
+    assert rcon.get_name.call_count == 2
@@ -1,11 +1,26 @@
+import datetime
 import os
+import pickle
+import uuid
 from logging import getLogger
 from unittest import mock
 
 import redis
 import redis.exceptions
+from fakeredis import FakeStrictRedis
 
-from rcon.cache_utils import RedisCached, ttl_cache
+from rcon.cache_utils import (
+    CACHE_COMPRESSION_NONE,
+    CACHE_COMPRESSION_ZLIB,
+    CACHE_ENCODING_JSON,
+    CACHE_ENCODING_PICKLE,
+    CacheCodec,
+    RedisCached,
+    clear_caches,
+    invalidates,
+    ttl_cache,
+)
+from rcon.types import GameEnum, GameIntEnum, PlayerTeamConfidence, Roles
 
 logger = getLogger(__name__)
 
@@ -17,6 +32,9 @@ class MockRedis:
     def get(self, key):
         raise redis.exceptions.RedisError
 
+    def mget(self, *keys):
+        raise redis.exceptions.RedisError
+
     def setex(self, _1, _2, _3):
         pass
 
@@ -72,3 +90,170 @@ def test_mem_cache_used(monkeypatch):
     # so we can't isinstance check it
     c = ttl_cache(ttl=1)
     assert not isinstance(c, RedisCached)
+
+
+def _counting_cache(red, function=_needs_qual_name):
+    calls = []
+
+    def func(*args):
+        calls.append(args)
+        return len(calls)
+
+    func.__qualname__ = function.__qualname__
+    cached = RedisCached(
+        pool=None,
+        red=red,
+        ttl_seconds=60,
+        function=func,
+        serializer=pickle.dumps,
+        deserializer=pickle.loads,
+    )
+    cached.cache_clear = cached.clear_all
+    cached.cache = cached
+    return cached, calls
+
+
+def test_clear_all_invalidates_every_cached_value():
+    red = FakeStrictRedis()
+    cached, calls = _counting_cache(red)
+
+    assert cached(1) == 1
+    assert cached(2) == 2
+    assert cached(1) == 1
+    assert len(calls) == 2
+
+    cached.clear_all()
+
+    assert cached(1) == 3
+    assert cached(2) == 4
+    # Nothing is scanned nor deleted, stale values are left to expire
+    assert red.get(cached.generation_key) == b"1"
+    assert red.ttl(cached.key(1)) > 0
+
+
+def test_values_cached_before_generations_are_ignored():
+    red = FakeStrictRedis()
+    cached, calls = _counting_cache(red)
+    red.set(cached.key(1), pickle.dumps("legacy"))
+
+    assert cached(1) == 1
+    assert cached(1) == 1
+
+
+def test_value_computed_during_invalidation_is_not_served():
+    red = FakeStrictRedis()
+    cached, calls = _counting_cache(red)
+
+    def invalidate_while_computing(*args):
+        cached.clear_all()
+        calls.append(args)
+        return len(calls)
+
+    cached.function = invalidate_while_computing
+    assert cached(1) == 1
+    # The value was stamped with the generation preceding the invalidation
+    assert cached.get_cached_value_for(1) is None
+
+
+def _other_function():
+    pass
+
+
+def test_clear_caches_is_batched():
+    red = FakeStrictRedis()
+    first, first_calls = _counting_cache(red)
+    second, second_calls = _counting_cache(red, _other_function)
+    first(1)
+    second(1)
+
+    with mock.patch.object(red, "pipeline", wraps=red.pipeline) as pipeline:
+        with invalidates(first, second):
+            pass
+    # Once before and once after
+    assert pipeline.call_count == 2
+
+    first(1)
+    second(1)
+    assert len(first_calls) == 2
+    assert len(second_calls) == 2
+
+
+def test_clear_caches_clears_memory_caches():
+    memory_cached = mock.Mock(spec=["cache_clear"])
+    clear_caches(memory_cached)
+    memory_cached.cache_clear.assert_called_once()
+
+
+def test_codec_stores_json_values_as_json():
+    codec = CacheCodec()
+    value = {"players": [{"name": "a", "kills": 1, "kpm": 0.5, "vip": None}]}
+
+    data = codec.dumps(value)
+
+    assert data[1:3] == bytes((CACHE_ENCODING_JSON, CACHE_COMPRESSION_NONE))
+    assert codec.loads(data) == value
+
+
+def test_codec_pickles_values_json_would_change():
+    codec = CacheCodec()
+
+    for value in [
+        {"at": datetime.datetime(2024, 1, 1)},
+        {1: "int key"},
+        [{"nested": {1, 2}}],
+        {"id": uuid.UUID(int=1)},
+    ]:
+        data = codec.dumps(value)
+        assert data[1] == CACHE_ENCODING_PICKLE
+        assert codec.loads(data) == value
+        assert type(codec.loads(data)) is type(value)
+
+
+def test_codec_pickles_enums():
+    codec = CacheCodec()
+
+    for value in [
+        GameEnum.HLL_WW2,
+        {"game": GameIntEnum.HLL_VIETNAM},
+        [Roles.commander],
+        PlayerTeamConfidence.STRONG,
+    ]:
+        data = codec.dumps(value)
+        assert data[1] == CACHE_ENCODING_PICKLE
+        assert codec.loads(data) == value
+        assert repr(codec.loads(data)) == repr(value)
+
+
+def test_codec_reads_tuples_back_as_lists():
+    codec = CacheCodec()
+
+    data = codec.dumps({"sizes": (50, 49)})
+
+    assert data[1] == CACHE_ENCODING_JSON
+    assert codec.loads(data) == {"sizes": [50, 49]}
+
+
+def test_codec_compresses_large_values():
+    codec = CacheCodec(compress_above=100, compression=CACHE_COMPRESSION_ZLIB)
+    value = [{"message": "hello " * 10}] * 100
+
+    data = codec.dumps(value)
+
+    assert data[2] == CACHE_COMPRESSION_ZLIB
+    assert len(data) < len(CacheCodec(compress_above=10**9).dumps(value))
+    assert codec.loads(data) == value
+
+
+def test_values_pickled_before_the_codec_are_still_read():
+    red = FakeStrictRedis()
+    cached, calls = _counting_cache(red)
+    codec = CacheCodec()
+    cached.serializer, cached.deserializer = codec.dumps, codec.loads
+    cached.key_serializer = pickle.dumps
+    red.set(cached.key(1), b"0|" + pickle.dumps("legacy"))
+
+    assert cached(1) == "legacy"
+    assert cached(2) == 1
+    assert red.get(cached.key(2))[3] == CACHE_ENCODING_JSON
+    assert cached(2) == 1
+    assert calls == [(2,)]
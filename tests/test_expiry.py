@@ -0,0 +1,115 @@
+from datetime import UTC, datetime, timedelta
+from unittest import mock
+
+import redis.exceptions
+from fakeredis import FakeStrictRedis
+
+from rcon import expiry_service
+from rcon.expiry import ExpiryKind, ExpiryScheduler, schedule_vip_expirations
+from rcon.utils import INDEFINITE_VIP_DATE
+
+NOW = datetime(2024, 11, 15, 12, tzinfo=UTC)
+
+
+def _scheduler() -> ExpiryScheduler:
+    return ExpiryScheduler(red=FakeStrictRedis(decode_responses=True), server_number=1)
+
+
+def test_claim_due_only_returns_due_entries_in_order():
+    scheduler = _scheduler()
+    scheduler.schedule(ExpiryKind.VIP, "later", NOW + timedelta(minutes=1))
+    scheduler.schedule(ExpiryKind.VIP, "second", NOW - timedelta(minutes=1))
+    scheduler.schedule(ExpiryKind.BLACKLIST_RECORD, 7, NOW - timedelta(minutes=2))
+
+    due = scheduler.claim_due(NOW)
+
+    assert [(e.kind, e.entity_id) for e in due] == [
+        (ExpiryKind.BLACKLIST_RECORD, "7"),
+        (ExpiryKind.VIP, "second"),
+    ]
+    assert due[0].expires_at == NOW - timedelta(minutes=2)
+    # Claimed entries are gone, the others are left for later
+    assert scheduler.claim_due(NOW) == []
+    assert scheduler.next_due() == NOW + timedelta(minutes=1)
+
+
+def test_claim_due_in_batches():
+    scheduler = _scheduler()
+    scheduler.schedule_many(
+        ExpiryKind.VIP, {str(i): NOW - timedelta(seconds=i) for i in range(5)}
+    )
+
+    assert len(scheduler.claim_due(NOW, batch_size=3)) == 3
+    assert len(scheduler.claim_due(NOW, batch_size=3)) == 2
+
+
+def test_rescheduling_and_cancelling():
+    scheduler = _scheduler()
+    scheduler.schedule(ExpiryKind.VIP, "a", NOW - timedelta(minutes=1))
+    scheduler.schedule(ExpiryKind.VIP, "a", NOW + timedelta(days=1))
+    scheduler.schedule(ExpiryKind.VIP, "b", NOW - timedelta(minutes=1))
+    scheduler.cancel(ExpiryKind.VIP, "b")
+
+    assert scheduler.claim_due(NOW) == []
+    assert scheduler.get_expiration(ExpiryKind.VIP, "a") == NOW + timedelta(days=1)
+    assert scheduler.is_pending(ExpiryKind.VIP, "a", NOW)
+    assert not scheduler.is_pending(ExpiryKind.VIP, "b", NOW)
+
+
+def test_is_pending_survives_redis_errors():
+    scheduler = _scheduler()
+    scheduler.schedule(ExpiryKind.KILLRATE_COOLDOWN, "a", NOW + timedelta(days=1))
+
+    with mock.patch.object(
+        scheduler.red, "zscore", side_effect=redis.exceptions.ConnectionError
+    ):
+        assert not scheduler.is_pending(ExpiryKind.KILLRATE_COOLDOWN, "a", NOW)
+
+
+def test_cancel_kind_keeps_other_kinds():
+    scheduler = _scheduler()
+    scheduler.schedule(ExpiryKind.KILLRATE_COOLDOWN, "a", NOW)
+    scheduler.schedule(ExpiryKind.VIP, "a", NOW)
+
+    scheduler.cancel_kind(ExpiryKind.KILLRATE_COOLDOWN)
+
+    assert scheduler.get_expiration(ExpiryKind.KILLRATE_COOLDOWN, "a") is None
+    assert scheduler.get_expiration(ExpiryKind.VIP, "a") == NOW
+
+
+def test_scheduling_wakes_the_service_up():
+    scheduler = _scheduler()
+    scheduler.schedule(ExpiryKind.VIP, "a", NOW)
+    scheduler.schedule(ExpiryKind.VIP, "b", NOW)
+
+    assert scheduler.red.llen(scheduler.wakeup_key) == 1
+    scheduler.wait(1)
+    assert scheduler.red.llen(scheduler.wakeup_key) == 0
+
+
+def test_indefinite_vips_are_not_scheduled():
+    scheduler = _scheduler()
+    with mock.patch("rcon.expiry.get_expiry_scheduler", return_value=scheduler):
+        schedule_vip_expirations({"a": INDEFINITE_VIP_DATE, "b": NOW})
+
+    assert scheduler.get_expiration(ExpiryKind.VIP, "a") is None
+    assert scheduler.get_expiration(ExpiryKind.VIP, "b") == NOW
+
+
+def test_process_due_groups_entries_by_kind():
+    scheduler = _scheduler()
+    scheduler.schedule_many(ExpiryKind.VIP, {"a": NOW, "b": NOW})
+    scheduler.schedule(ExpiryKind.BLACKLIST_RECORD, 3, NOW)
+    handlers = {kind: mock.MagicMock() for kind in ExpiryKind}
+
+    with mock.patch.dict(expiry_service.HANDLERS, handlers):
+        processed = expiry_service.process_due(
+            scheduler, rcon=None, config=None, now=NOW
+        )
+
+    assert processed == 3
+    handlers[ExpiryKind.VIP].assert_called_once_with(None, None, {"a": NOW, "b": NOW})
+    handlers[ExpiryKind.BLACKLIST_RECORD].assert_called_once_with(
+        None, None, {"3": NOW}
+    )
+    handlers[ExpiryKind.KILLRATE_COOLDOWN].assert_not_called()
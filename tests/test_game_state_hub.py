@@ -0,0 +1,146 @@
+import asyncio
+import copy
+from datetime import timedelta
+
+import orjson
+
+from rcon.game_state_hub import GAME_STATE_TOO_SLOW, GameStateHub, json_patch
+
+
+def _apply(document, ops):
+    """A minimal RFC 6902 client for the operations json_patch produces"""
+    document = copy.deepcopy(document)
+    for op in ops:
+        keys = [
+            k.replace("~1", "/").replace("~0", "~") for k in op["path"].split("/")[1:]
+        ]
+        if not keys:
+            document = op["value"]
+            continue
+        parent = document
+        for key in keys[:-1]:
+            parent = parent[int(key) if isinstance(parent, list) else key]
+        key = int(keys[-1]) if isinstance(parent, list) else keys[-1]
+        if op["op"] == "remove":
+            del parent[key]
+        else:
+            parent[key] = op["value"]
+    return document
+
+
+def test_json_patch_turns_the_old_value_into_the_new_one():
+    old = {
+        "allies": {"squads": {"able": {"players": [{"kills": 1}, {"kills": 2}]}}},
+        "a/b~c": 1,
+        "gone": None,
+        "score": 1,
+    }
+    new = {
+        "allies": {"squads": {"able": {"players": [{"kills": 1}, {"kills": 3}]}}},
+        "a/b~c": 2,
+        "score": 1.0,
+        "commander": None,
+    }
+
+    ops = json_patch(old, new)
+
+    assert _apply(old, ops) == new
+    assert {"op": "replace", "path": "/a~1b~0c", "value": 2} in ops
+    assert {
+        "op": "replace",
+        "path": "/allies/squads/able/players/1/kills",
+        "value": 3,
+    } in ops
+    assert json_patch(new, copy.deepcopy(new)) == []
+    assert _apply([1, 2], json_patch([1, 2], [1, 2, 3])) == [1, 2, 3]
+
+
+class Sections:
+    def __init__(self):
+        self.calls = 0
+        self.failing = False
+        self.gamestate = {"allied_score": 2, "time_remaining": timedelta(minutes=5)}
+
+    def get_gamestate(self):
+        self.calls += 1
+        if self.failing:
+            raise ConnectionError("game server unreachable")
+        return self.gamestate
+
+
+def test_clients_share_one_snapshot_then_get_patches():
+    async def main():
+        sections = Sections()
+        hub = GameStateHub(
+            {"gamestate": sections.get_gamestate},
+            interval_seconds=0.01,
+            default=lambda o: o.total_seconds(),
+        )
+        clients = [await hub.subscribe() for _ in range(10)]
+
+        snapshots = [orjson.loads(await client.get()) for client in clients]
+        assert snapshots[0] == {
+            "type": "snapshot",
+            "version": 1,
+            "state": {"gamestate": {"allied_score": 2, "time_remaining": 300.0}},
+        }
+        assert all(snapshot == snapshots[0] for snapshot in snapshots)
+        # Nothing is sent while the game state does not change
+        await asyncio.sleep(0.05)
+        assert all(client.queue.empty() for client in clients)
+        assert sections.calls < 20
+
+        sections.gamestate = {**sections.gamestate, "allied_score": 3}
+        patch = orjson.loads(await clients[0].get())
+        assert patch == {
+            "type": "patch",
+            "version": 2,
+            "ops": [{"op": "replace", "path": "/gamestate/allied_score", "value": 3}],
+        }
+        assert _apply(snapshots[0]["state"], patch["ops"]) == {
+            "gamestate": {"allied_score": 3, "time_remaining": 300.0}
+        }
+
+        for client in clients:
+            hub.unsubscribe(client)
+        await hub.task
+
+    asyncio.run(main())
+
+
+def test_slow_clients_are_dropped():
+    async def main():
+        sections = Sections()
+        hub = GameStateHub({"gamestate": sections.get_gamestate}, interval_seconds=0)
+        slow = await hub.subscribe(maxsize=2)
+
+        for score in range(3):
+            sections.gamestate = {"allied_score": score}
+            await hub.refresh()
+
+        assert slow.error == GAME_STATE_TOO_SLOW
+        assert slow not in hub.subscriptions
+        await hub.task
+
+    asyncio.run(main())
+
+
+def test_failing_sections_keep_their_last_value():
+    async def main():
+        sections = Sections()
+        hub = GameStateHub(
+            {"gamestate": sections.get_gamestate, "broken": lambda: 1 / 0},
+            default=str,
+        )
+        await hub.refresh()
+        sections.failing = True
+
+        await hub.refresh()
+
+        assert hub.snapshot["gamestate"] == {
+            "allied_score": 2,
+            "time_remaining": "0:05:00",
+        }
+        assert hub.snapshot["broken"] is None
+
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+import threading
+import time
+
+from rcon.logs.hook_executor import HookExecutor
+
+
+def _log(player_id: str | None = None):
+    return {"player_id_1": player_id, "raw": f"line of {player_id}"}
+
+
+def _hook(func, name: str):
+    func.__name__ = name
+    func.__module__ = "tests"
+    return func
+
+
+def test_hooks_of_a_player_run_in_order():
+    executor = HookExecutor(max_workers=4)
+    seen = []
+
+    def record(_, log):
+        time.sleep(0.001)
+        seen.append(log["n"])
+
+    hook = _hook(record, "record")
+    for n in range(20):
+        executor.submit(hook, None, {**_log("a"), "n": n})
+    executor.join()
+
+    assert seen == list(range(20))
+    assert executor.report(force=True)["tests.record"].calls == 20
+
+
+def test_slow_hook_is_reported_and_waited_for():
+    executor = HookExecutor(max_workers=1, timeout_seconds=0.05)
+    done = []
+
+    def slow(_, log):
+        time.sleep(0.2)
+        done.append("slow")
+
+    stuck = _hook(slow, "stuck")
+    fast = _hook(lambda _, log: done.append("fast"), "fast")
+
+    executor.submit(stuck, None, _log("a"))
+    executor.submit(fast, None, _log("a"))
+    executor.join()
+
+    # The next hook of the player still runs after it, on the same runner
+    assert done == ["slow", "fast"]
+    assert len(executor.lanes[0].runner._threads) == 1
+    stats = executor.report(force=True)
+    assert stats["tests.stuck"].timeouts == 1
+    assert stats["tests.fast"].timeouts == 0
+
+
+def test_lines_without_a_player_run_in_log_order():
+    executor = HookExecutor(max_workers=8)
+    seen = []
+
+    def hook(name: str, delay: float):
+        return _hook(lambda _, log: (time.sleep(delay), seen.append(name)), name)
+
+    # A slow match end must be done before the next match is recorded
+    executor.submit(hook("record_map_end", 0.05), None, _log())
+    executor.submit(hook("handle_new_match_start", 0), None, _log())
+    executor.join()
+
+    assert seen == ["record_map_end", "handle_new_match_start"]
+
+
+def test_errors_are_counted_and_isolated():
+    executor = HookExecutor(max_workers=2)
+    done = []
+
+    def failing(_, log):
+        raise ValueError(log)
+
+    executor.submit(_hook(failing, "failing"), None, _log())
+    executor.submit(_hook(lambda _, log: done.append(1), "working"), None, _log())
+    executor.join()
+
+    stats = executor.report(force=True)
+    assert stats["tests.failing"].errors == 1
+    assert stats["tests.working"].errors == 0
+    assert done == [1]
+
+
+def test_full_queue_blocks_the_submitter():
+    executor = HookExecutor(max_workers=1, queue_size=1)
+    release = threading.Event()
+    blocking = _hook(lambda _, log: release.wait(5), "blocking")
+
+    executor.submit(blocking, None, _log("a"))
+    # Wait for the first hook to be picked up so the next one fills the queue
+    while executor.pending():
+        time.sleep(0.001)
+    executor.submit(blocking, None, _log("a"))
+
+    submitted = threading.Event()
+    submitter = threading.Thread(
+        target=lambda: (executor.submit(blocking, None, _log("a")), submitted.set())
+    )
+    submitter.start()
+    assert not submitted.wait(0.1)
+
+    release.set()
+    assert submitted.wait(5)
+    executor.join()
+    executor.shutdown()
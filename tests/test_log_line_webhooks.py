@@ -0,0 +1,75 @@
+import threading
+from unittest import mock
+
+from rcon.logs.loop import (
+    DISCORD_EMBED_DESCRIPTION_LENGTH,
+    LogLineWebhookCoalescer,
+    make_log_line_webhook_messages,
+)
+from rcon.user_config.webhooks import DiscordMentionWebhook
+from rcon.webhook_service import WebhookMessageType
+
+WEBHOOK = DiscordMentionWebhook(
+    url="https://discord.com/api/webhooks/123/token",
+    user_mentions=["<@42>"],
+    role_mentions=[],
+)
+
+
+def _line(n: int, text: str = "KILL: a -> b") -> dict:
+    return {"timestamp_ms": 1_700_000_000_000 + n * 1000, "line_without_time": text}
+
+
+def test_single_line_is_one_embed():
+    messages = make_log_line_webhook_messages(WEBHOOK, [_line(0, "*bold*")], "s1")
+
+    assert len(messages) == 1
+    assert messages[0].message_type == WebhookMessageType.LOG_LINE
+    embed = messages[0].payload["embeds"][0]
+    assert embed["description"] == "\\*bold\\*"
+    assert embed["footer"]["text"] == "s1"
+    assert messages[0].payload["content"] == "<@42>"
+
+
+def test_coalesced_lines_share_an_embed():
+    messages = make_log_line_webhook_messages(
+        WEBHOOK, [_line(0), _line(1), _line(2)], "s1"
+    )
+
+    assert len(messages) == 1
+    description = messages[0].payload["embeds"][0]["description"]
+    assert description.splitlines() == [
+        f"<t:{1_700_000_000 + n}:T> KILL: a -> b" for n in range(3)
+    ]
+
+
+def test_coalesced_lines_are_split_at_the_embed_limit():
+    text = "x" * 1000
+    messages = make_log_line_webhook_messages(
+        WEBHOOK, [_line(n, text) for n in range(9)], "s1"
+    )
+
+    descriptions = [m.payload["embeds"][0]["description"] for m in messages]
+    assert len(descriptions) == 3
+    assert all(len(d) <= DISCORD_EMBED_DESCRIPTION_LENGTH for d in descriptions)
+    assert sum(len(d.splitlines()) for d in descriptions) == 9
+
+
+def test_coalescer_sends_a_window_at_once():
+    coalescer = LogLineWebhookCoalescer(window_seconds=0.05)
+    sent = threading.Event()
+    batches = []
+
+    def enqueue(webhook, log_lines):
+        batches.append((webhook, log_lines))
+        sent.set()
+
+    with mock.patch(
+        "rcon.logs.loop.enqueue_log_line_webhook_messages", side_effect=enqueue
+    ):
+        for n in range(3):
+            coalescer.add(WEBHOOK, _line(n))
+        assert sent.wait(2)
+
+    assert batches == [(WEBHOOK, [_line(0), _line(1), _line(2)])]
+    assert coalescer.pending == {}
@@ -0,0 +1,102 @@
+import datetime
+from unittest import mock
+
+import pytest
+
+from rcon.logs import partitions
+
+
+@pytest.mark.parametrize(
+    "month, months, expected",
+    [
+        (datetime.date(2024, 1, 1), 0, datetime.date(2024, 1, 1)),
+        (datetime.date(2024, 1, 1), 1, datetime.date(2024, 2, 1)),
+        (datetime.date(2024, 11, 1), 2, datetime.date(2025, 1, 1)),
+        (datetime.date(2024, 1, 1), -1, datetime.date(2023, 12, 1)),
+        (datetime.date(2024, 3, 1), -27, datetime.date(2021, 12, 1)),
+    ],
+)
+def test_add_months(month, months, expected):
+    assert partitions.add_months(month, months) == expected
+
+
+def test_partition_name():
+    month = datetime.date(2024, 3, 1)
+    assert partitions.partition_name(month) == "log_lines_y2024m03"
+    assert (
+        partitions.partition_name(month, partitions.ARCHIVE_PREFIX)
+        == "log_lines_archive_y2024m03"
+    )
+    assert partitions.PARTITION_NAME.match(partitions.partition_name(month))
+
+
+def _session(partition_names: list[str], in_default: bool = False):
+    """A session answering the catalog queries, recording every statement"""
+    sess = mock.MagicMock()
+    statements = []
+
+    def execute(statement, params=None):
+        sql = str(statement)
+        statements.append(sql)
+        result = mock.MagicMock()
+        result.scalars.return_value = iter(partition_names)
+        result.scalar.return_value = in_default
+        return result
+
+    sess.execute.side_effect = execute
+    return sess, statements
+
+
+NOW = datetime.datetime(2024, 11, 15, tzinfo=datetime.UTC)
+
+
+def test_ensure_partitions_creates_missing_months():
+    sess, statements = _session(
+        ["log_lines_default", "log_lines_y2024m10", "log_lines_y2024m11"]
+    )
+
+    created = partitions.ensure_partitions(sess, NOW)
+
+    assert created == ["log_lines_y2024m12", "log_lines_y2025m01"]
+    assert any(
+        "CREATE TABLE log_lines_y2025m01 PARTITION OF log_lines "
+        "FOR VALUES FROM ('2025-01-01') TO ('2025-02-01')" in sql
+        for sql in statements
+    )
+
+
+def test_ensure_partitions_moves_lines_out_of_default_partition():
+    sess, statements = _session(["log_lines_y2024m12", "log_lines_y2025m01"], True)
+
+    assert partitions.ensure_partitions(sess, NOW) == ["log_lines_y2024m11"]
+    assert any("DELETE FROM log_lines_default" in sql for sql in statements)
+    assert any(
+        "ALTER TABLE log_lines ATTACH PARTITION log_lines_y2024m11" in sql
+        for sql in statements
+    )
+
+
+@pytest.mark.parametrize("drop", [True, False])
+def test_detach_expired_partitions(drop):
+    sess, statements = _session(
+        [
+            "log_lines_default",
+            "log_lines_y2024m09",
+            "log_lines_y2024m07",
+            "log_lines_y2024m08",
+            "log_lines_y2024m11",
+        ]
+    )
+
+    detached = partitions.detach_expired_partitions(sess, 3, NOW, drop=drop)
+
+    # November and the 3 months before it are kept
+    assert detached == ["log_lines_y2024m07"]
+    assert "ALTER TABLE log_lines DETACH PARTITION log_lines_y2024m07" in statements
+    if drop:
+        assert "DROP TABLE log_lines_y2024m07" in statements
+    else:
+        assert (
+            "ALTER TABLE log_lines_y2024m07 RENAME TO log_lines_archive_y2024m07"
+            in statements
+        )
@@ -1,11 +1,15 @@
 import datetime
+import uuid
 from datetime import UTC
+from unittest import mock
 
 import pytest
 from sqlalchemy.orm import Session
 
 from rcon.logs.recorder import LogRecorder
 from rcon.models import LogLine, PlayerID, enter_session
+from rcon.player_identity import get_player_identity
+from rcon.utils import LogsRecorderStream
 
 first_player_id = "76561198091327692"
 second_player_id = "76561198133214514"
@@ -26,29 +30,33 @@ def log_recorder():
         sess.query(LogLine).delete()
         ensure_player_id(sess, first_player_id)
         ensure_player_id(sess, second_player_id)
-    yield
+    stream = LogsRecorderStream(key=f"test_logs_recorder_{uuid.uuid4()}")
+    # The consumer group starts at the beginning of the stream, nothing to backfill
+    with mock.patch.object(LogRecorder, "_backfill_from_history"):
+        yield stream
+    stream.red.delete(stream.key)
 
 
 class TestLogRecorder:
     def test_records_recent_logs(self, log_recorder):
-        r = LogRecorder(
-            log_history_fn=lambda: [
-                {
-                    "version": 1,
-                    "timestamp_ms": 1612695641000,
-                    "event_time": datetime.datetime.fromtimestamp(1612695641, tz=UTC),
-                    "action": "TEAM KILL",
-                    "player_name_1": "[ARC] DYDSO ★ツ",
-                    "player_id_1": first_player_id,
-                    "player_name_2": "Francky Mc Fly",
-                    "player_id_2": second_player_id,
-                    "weapon": "G43",
-                    "message": "",
-                    "raw": f"[646 ms (1612695641)] TEAM KILL: [ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
-                    "content": f"[ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
-                }
-            ]
-        )
+        r = LogRecorder(stream=log_recorder)
+        for log in [
+            {
+                "version": 1,
+                "timestamp_ms": 1612695641000,
+                "event_time": datetime.datetime.fromtimestamp(1612695641, tz=UTC),
+                "action": "TEAM KILL",
+                "player_name_1": "[ARC] DYDSO ★ツ",
+                "player_id_1": first_player_id,
+                "player_name_2": "Francky Mc Fly",
+                "player_id_2": second_player_id,
+                "weapon": "G43",
+                "message": "",
+                "raw": f"[646 ms (1612695641)] TEAM KILL: [ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
+                "content": f"[ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
+            }
+        ]:
+            log_recorder.add(log)
         with enter_session() as sess:
             r.run(run_immediately=True, one_off=True)
 
@@ -77,17 +85,17 @@ class TestLogRecorder:
                 "line_without_time": f"TEAM KILL: [ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
             }
         ]
-        r = LogRecorder(log_history_fn=lambda: new_logs)
+        r = LogRecorder(stream=log_recorder)
         with enter_session() as sess:
+            log_recorder.add(new_logs[0])
             r.run(run_immediately=True, one_off=True)
-            new_logs.insert(
-                0,
+            log_recorder.add(
                 {
                     **new_logs[0],
                     "action": "KILL",
                     "raw": f"[6.14 sec (1612695641)] KILL: Francky Mc Fly(Axis/{second_player_id}) -> [ARC] DYDSO ★ツ(Axis/{first_player_id}) with None",
                     "line_without_time": f"KILL: Francky Mc Fly(Axis/{second_player_id}) -> [ARC] DYDSO ★ツ(Axis/{first_player_id}) with None",
-                },
+                }
             )
             r.run(run_immediately=True, one_off=True)
 
@@ -119,11 +127,13 @@ class TestLogRecorder:
                 "line_without_time": f"TEAM KILL: [ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
             }
         ]
-        r = LogRecorder(log_history_fn=lambda: logs)
+        r = LogRecorder(stream=log_recorder)
         with enter_session() as sess:
+            log_recorder.add(logs[0])
             r.run(run_immediately=True, one_off=True)
-            logs.insert(
-                0,
+            # The same line delivered again is not recorded twice
+            log_recorder.add(logs[0])
+            log_recorder.add(
                 {
                     **logs[0],
                     "timestamp_ms": logs[0].get("timestamp_ms") + 2000,
@@ -132,7 +142,7 @@ class TestLogRecorder:
                     "action": "KILL",
                     "raw": f"[6.14 sec ({logs[0].get('timestamp_ms') + 2000})] KILL: [ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
                     "line_without_time": f"KILL: [ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
-                },
+                }
             )
             r.run(run_immediately=True, one_off=True)
 
@@ -142,3 +152,86 @@ class TestLogRecorder:
             assert res[1].player_1.player_id == first_player_id
             assert res[1].type == "KILL"
             assert res[1].player_2.player_id == second_player_id
+
+    def test_unrecorded_logs_are_retried(self, log_recorder):
+        log_recorder.add(
+            {
+                "version": 1,
+                "timestamp_ms": 1612695641000,
+                "event_time": datetime.datetime.fromtimestamp(1612695641, tz=UTC),
+                "action": "TEAM KILL",
+                "player_name_1": "[ARC] DYDSO ★ツ",
+                "player_id_1": first_player_id,
+                "player_name_2": "Francky Mc Fly",
+                "player_id_2": second_player_id,
+                "weapon": "G43",
+                "message": "",
+                "raw": f"[646 ms (1612695641)] TEAM KILL: [ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
+                "line_without_time": f"TEAM KILL: [ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
+            }
+        )
+        r = LogRecorder(stream=log_recorder)
+        with mock.patch.object(r, "_save_logs", return_value=False):
+            r.run(run_immediately=True, one_off=True)
+
+        r.run(run_immediately=True, one_off=True)
+
+        with enter_session() as sess:
+            assert sess.query(LogLine).count() == 1
+
+    def test_a_rejected_line_does_not_block_its_batch(self, log_recorder):
+        log = {
+            "version": 1,
+            "timestamp_ms": 1612695641000,
+            "event_time": datetime.datetime.fromtimestamp(1612695641, tz=UTC),
+            "action": "TEAM KILL",
+            "player_name_1": "[ARC] DYDSO ★ツ",
+            "player_id_1": first_player_id,
+            "player_name_2": "Francky Mc Fly",
+            "player_id_2": second_player_id,
+            "weapon": "G43",
+            "message": "",
+            "raw": f"[646 ms (1612695641)] TEAM KILL: [ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
+            "line_without_time": f"TEAM KILL: [ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
+        }
+        log_recorder.add(log)
+        log_recorder.add({**log, "version": "not a number", "raw": "rejected"})
+        r = LogRecorder(stream=log_recorder)
+
+        r.run(run_immediately=True, one_off=True)
+
+        with enter_session() as sess:
+            assert [line.raw for line in sess.query(LogLine).all()] == [log["raw"]]
+        # Acknowledged, the rejected line is not retried on the next run
+        assert not log_recorder.read_group(
+            r.GROUP, r.CONSUMER, pending=True, count=10, block_ms=None
+        )
+
+    def test_a_stale_player_pk_is_forgotten_and_retried(self, log_recorder):
+        log_recorder.add(
+            {
+                "version": 1,
+                "timestamp_ms": 1612695641000,
+                "event_time": datetime.datetime.fromtimestamp(1612695641, tz=UTC),
+                "action": "TEAM KILL",
+                "player_name_1": "[ARC] DYDSO ★ツ",
+                "player_id_1": first_player_id,
+                "player_name_2": "Francky Mc Fly",
+                "player_id_2": second_player_id,
+                "weapon": "G43",
+                "message": "",
+                "raw": f"[646 ms (1612695641)] TEAM KILL: [ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
+                "line_without_time": f"TEAM KILL: [ARC] DYDSO ★ツ(Axis/{first_player_id}) -> Francky Mc Fly(Axis/{second_player_id}) with None",
+            }
+        )
+        # e.g. the row was merged into another one by convert_win_player_ids
+        get_player_identity()._remember({first_player_id: 2**31 - 1})
+        r = LogRecorder(stream=log_recorder)
+
+        r.run(run_immediately=True, one_off=True)
+        with enter_session() as sess:
+            assert sess.query(LogLine).count() == 0
+
+        r.run(run_immediately=True, one_off=True)
+        with enter_session() as sess:
+            assert sess.query(LogLine).one().player_1.player_id == first_player_id
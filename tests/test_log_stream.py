@@ -0,0 +1,98 @@
+import orjson
+from fakeredis import FakeStrictRedis
+
+from rcon.logs.stream import (
+    CompactLogStream,
+    LogStream,
+    decode_log_stream_entry,
+    encode_log_stream_entry,
+)
+
+
+def _log(timestamp_ms: int, message: str):
+    return {
+        "version": 1,
+        "timestamp_ms": timestamp_ms,
+        "event_time": None,
+        "relative_time_ms": None,
+        "raw": message,
+        "line_without_time": message,
+        "action": "KILL",
+        "player_name_1": "player",
+        "player_id_1": "1",
+        "player_name_2": None,
+        "player_id_2": None,
+        "weapon": "M1 GARAND",
+        "message": message,
+        "sub_content": None,
+    }
+
+
+def _stream(maxlen: int = 10_000) -> CompactLogStream:
+    stream = CompactLogStream(key="log_stream", maxlen=maxlen)
+    stream.red = FakeStrictRedis()
+    return stream
+
+
+def test_entries_round_trip_in_a_single_field():
+    log = _log(1_000, "a kill")
+
+    entry = encode_log_stream_entry(log)
+
+    assert list(entry) == [b"l"]
+    assert decode_log_stream_entry(entry) == log
+    assert decode_log_stream_entry({"l": entry[b"l"].decode()}) == log
+
+
+def test_entries_written_per_field_are_still_decoded():
+    log = _log(1_000, "a kill")
+    per_field = {orjson.dumps(k): orjson.dumps(v) for k, v in log.items()}
+
+    assert decode_log_stream_entry(per_field) == log
+
+
+def test_only_logs_newer_than_the_stream_tail_are_added():
+    logs = [_log(3_000, "c"), _log(2_000, "b2"), _log(2_000, "b1"), _log(1_000, "a")]
+    ordered = LogStream.__new__(LogStream).bucket_by_timestamp(logs)
+
+    entries = LogStream.new_entries(ordered, last_seen_id="2-0")
+
+    assert [(id_, log["message"]) for id_, log in entries] == [
+        ("2-1", "b2"),
+        ("3-0", "c"),
+    ]
+    assert [id_ for id_, _ in LogStream.new_entries(ordered)] == [
+        "1-0",
+        "2-0",
+        "2-1",
+        "3-0",
+    ]
+
+
+def test_entries_are_added_and_trimmed_in_one_pipeline():
+    stream = _stream(maxlen=5)
+    logs = [(f"{i}-0", _log(i * 1_000, str(i))) for i in range(1, 21)]
+
+    assert stream.add_many(logs) == 20
+    assert stream.add_many([]) == 0
+
+    assert stream.red.xlen("log_stream") <= 20
+    id_, fields = stream.red.xrevrange("log_stream", count=1)[0]
+    assert id_ == b"20-0"
+    assert decode_log_stream_entry(fields) == logs[-1][1]
+
+
+def test_rejected_entries_are_skipped():
+    stream = _stream()
+    stream.add_many([("5-0", _log(5_000, "5"))])
+
+    added = stream.add_many(
+        [
+            ("4-0", _log(4_000, "4")),
+            ("3-0", _log(3_000, "3")),
+            ("6-0", _log(6_000, "6")),
+        ]
+    )
+
+    assert added == 1
+    assert [id_ for id_, _ in stream.red.xrange("log_stream")] == [b"5-0", b"6-0"]
@@ -0,0 +1,95 @@
+import asyncio
+from types import SimpleNamespace
+
+from fakeredis import FakeAsyncRedis
+
+from rcon.logs.stream import encode_log_stream_entry
+from rcon.logs.stream_hub import (
+    LOG_STREAM_DISABLED,
+    LOG_STREAM_TOO_SLOW,
+    LogStreamHub,
+)
+from rcon.types import AllLogTypes
+
+
+async def _add(red, stream_id: str, action: str):
+    log = {"action": action, "message": stream_id}
+    await red.xadd("log_stream", encode_log_stream_entry(log), id=stream_id)
+
+
+def _hub(red, enabled=True) -> LogStreamHub:
+    async def load_config():
+        return SimpleNamespace(enabled=enabled)
+
+    return LogStreamHub(red, block_ms=50, load_config=load_config)
+
+
+def test_entries_are_read_once_and_fanned_out():
+    async def main():
+        red = FakeAsyncRedis()
+        await _add(red, "1-0", "KILL")
+        hub = _hub(red)
+        everything = await hub.subscribe()
+        kills = await hub.subscribe(last_seen_id="1-0", actions=[AllLogTypes.kill])
+
+        await _add(red, "2-0", "CHAT[Allies]")
+        await _add(red, "3-0", "KILL")
+        first = await everything.get_batch()
+        while len(first) < 3:
+            first += await everything.get_batch()
+        assert [id_ for id_, _ in first] == ["1-0", "2-0", "3-0"]
+        assert [id_ for id_, _ in await kills.get_batch()] == ["3-0"]
+
+        hub.unsubscribe(everything)
+        hub.unsubscribe(kills)
+        await hub.task
+
+    asyncio.run(main())
+
+
+def test_clients_resume_from_their_last_seen_id():
+    async def main():
+        red = FakeAsyncRedis()
+        for i in range(1, 6):
+            await _add(red, f"{i}-0", "KILL")
+        hub = _hub(red)
+
+        subscription = await hub.subscribe(last_seen_id="3-0")
+
+        assert [id_ for id_, _ in await subscription.get_batch()] == ["4-0", "5-0"]
+        hub.close_all()
+        await hub.task
+
+    asyncio.run(main())
+
+
+def test_slow_clients_are_dropped():
+    async def main():
+        red = FakeAsyncRedis()
+        hub = _hub(red)
+        slow = await hub.subscribe(last_seen_id="0-0", maxsize=2)
+        fast = await hub.subscribe(last_seen_id="0-0")
+
+        for i in range(1, 4):
+            await _add(red, f"{i}-0", "KILL")
+        batch = []
+        while len(batch) < 3:
+            batch += await fast.get_batch()
+
+        assert slow.error == LOG_STREAM_TOO_SLOW
+        assert slow not in hub.subscriptions
+        assert fast in hub.subscriptions
+        hub.close_all()
+        await hub.task
+
+    asyncio.run(main())
+
+
+def test_disabled_log_stream_closes_the_subscription():
+    async def main():
+        subscription = await _hub(FakeAsyncRedis(), enabled=False).subscribe()
+
+        assert await subscription.get_batch() == []
+        assert subscription.error == LOG_STREAM_DISABLED
+
+    asyncio.run(main())
@@ -1,10 +1,19 @@
 from datetime import UTC, datetime, timedelta, timezone
+from unittest import mock
 
 import orjson
 import pytest
+from fakeredis import FakeStrictRedis
 
+from rcon.game_logs import get_recent_logs
 from rcon.rcon import Rcon
-from rcon.utils import logs_deserializer
+from rcon.utils import (
+    LogHistoryEntry,
+    LogsHistory,
+    decode_log_history_entry,
+    encode_log_history_entry,
+    logs_deserializer,
+)
 
 
 def test_logs_deserializer_preserves_iso_timestamp_timezone():
@@ -21,6 +30,56 @@ def test_logs_deserializer_assumes_utc_for_naive_iso_timestamp():
     assert result["event_time"] == datetime(2026, 8, 19, 9, 6, 3, tzinfo=UTC)
 
 
+HISTORY_RAW_LOGS = [
+    "[29:55 min (1606340690)] KILL: Karadoc(Axis/76561198080212634) -> Bullitt-FR(Allies/76561198000776367) with G43",
+    "[29:55 min (1606340690)] KILL: Karadoc(Axis/a21af8b5-59df-5vbr-88gf-ab4239r4g6f4) -> Bullitt-FR(Allies/76561198000776367) with G43",
+    "[29:37 min (1606340690)] CONNECTED Waxxeer (12345678901234567)",
+    "[1.89 sec (1606340677)] CHAT[Team][bananacocoo(Allies/76561198003251789)]: pas jouable la map",
+    "[1:03 min (1645012776)] KICK: [T17 Scott] has been kicked. [BANNED FOR 2 HOURS FOR TEAM KILLING!]",
+    "[6.06 sec (16250121723)] MATCH ENDED `UTAH BEACH OFFENSIVE` ALLIED (1 - 4) AXIS",
+    "[9.85 sec (1675360334)] VOTESYS: Player [Dingbat252] voted [PV_Favour] for VoteID[2]",
+    "[57:13 min (1675362812)] Player [Fachi (76561198312191879)] Entered Admin Camera",
+]
+
+
+def test_log_history_entries_round_trip():
+    logs = Rcon.parse_logs(HISTORY_RAW_LOGS)["logs"]
+
+    for log in logs:
+        data = encode_log_history_entry(log)
+        assert data.startswith(b"[")
+        assert logs_deserializer(data) == log
+        assert len(data) < len(orjson.dumps(log)) / 2
+
+
+def test_log_history_entries_keep_what_cannot_be_derived():
+    log = Rcon.parse_logs(HISTORY_RAW_LOGS[:1])["logs"][0]
+    log |= {
+        "event_time": datetime(2020, 1, 1, tzinfo=UTC),
+        "raw": "edited",
+        "action": "NOT AN ACTION",
+        "player_id_1": "00123",
+        "message": "not in the line",
+    }
+
+    assert logs_deserializer(encode_log_history_entry(log)) == log
+
+
+def test_log_history_entries_decode_fields_on_access():
+    log = Rcon.parse_logs(HISTORY_RAW_LOGS[:1])["logs"][0]
+
+    entry = decode_log_history_entry(encode_log_history_entry(log))
+
+    assert isinstance(entry, LogHistoryEntry)
+    assert entry["action"] == "KILL"
+    assert entry["player_id_2"] == "76561198000776367"
+    assert entry.get("sub_content") is None
+    assert entry.to_dict() == dict(entry) == log
+    assert decode_log_history_entry(orjson.dumps(log)) == logs_deserializer(
+        orjson.dumps(log)
+    )
+
+
 # Test that we successfully split raw log lines from the game server
 # into the time stamp and actual log line
 @pytest.mark.parametrize(
@@ -1107,3 +1166,20 @@ to test something]""",
 )
 def test_player_messages(raw_log_line, expected):
     assert Rcon.parse_log_line(raw_log_line) == expected
+
+
+def test_recent_logs_are_filtered_on_the_compact_entries():
+    history = LogsHistory()
+    history.red = FakeStrictRedis()
+    logs = Rcon.parse_logs(HISTORY_RAW_LOGS)["logs"]
+    history.red.rpush(history.key, *(encode_log_history_entry(log) for log in logs))
+
+    with mock.patch(
+        "rcon.game_logs.LogLoop.get_log_history_list", return_value=history
+    ):
+        kills = get_recent_logs(action_filter=["KILL"], exact_action=True)
+        page = get_recent_logs(start=1, end=3)
+
+    assert kills["logs"] == [log for log in logs if log["action"] == "KILL"]
+    assert "Waxxeer" in kills["players"]
+    assert page["logs"] == logs[1:3]
@@ -0,0 +1,37 @@
+from contextlib import nullcontext
+
+import fakeredis
+import orjson
+
+from rcon.cache_migrations.logs_history import migrate_logs_history
+from rcon.rcon import Rcon
+from rcon.utils import LogsHistory
+
+RAW_LOGS = [
+    "[29:55 min (1606340690)] KILL: Karadoc(Axis/76561198080212634) -> Bullitt-FR(Allies/76561198000776367) with G43",
+    "[29:37 min (1606340690)] CONNECTED Waxxeer (12345678901234567)",
+    "[1.89 sec (1606340677)] CHAT[Team][bananacocoo(Allies/76561198003251789)]: pas jouable la map",
+]
+
+
+def _history(red) -> LogsHistory:
+    history = LogsHistory()
+    history.red = red
+    return history
+
+
+def test_legacy_entries_are_rewritten_in_place():
+    red = fakeredis.FakeStrictRedis()
+    red.lock = lambda *args, **kwargs: nullcontext()
+    history = _history(red)
+    logs = Rcon.parse_logs(RAW_LOGS)["logs"]
+    # The newest log was cached after the upgrade, the others before
+    red.rpush("logs_history", *(orjson.dumps(log) for log in logs[1:]))
+    history.lpush(logs[0])
+
+    assert history[:] == logs
+    assert migrate_logs_history(red) == 2
+
+    assert all(raw.startswith(b"[") for raw in red.lrange("logs_history", 0, -1))
+    assert history[:] == logs
+    assert migrate_logs_history(red) == 0
@@ -291,7 +291,7 @@ def test_chat_commands_hook_command_words(
     monkeypatch.setattr(
         rcon.hooks,
         "get_recent_actions",
-        lambda: {player_id: recent_event},
+        lambda requested_id: {player_id: recent_event}[requested_id],
     )
 
     struct_log: StructuredLogLineWithMetaData = {
@@ -415,7 +415,7 @@ def test_chat_commands_hook_help_words(
     monkeypatch.setattr(
         rcon.hooks,
         "get_recent_actions",
-        lambda: {player_id: recent_event},
+        lambda requested_id: {player_id: recent_event}[requested_id],
     )
 
     struct_log: StructuredLogLineWithMetaData = {
@@ -484,7 +484,7 @@ def test_chat_commands_hook_description_words(
     monkeypatch.setattr(
         rcon.hooks,
         "get_recent_actions",
-        lambda: {player_id: recent_event},
+        lambda requested_id: {player_id: recent_event}[requested_id],
     )
 
     struct_log: StructuredLogLineWithMetaData = {
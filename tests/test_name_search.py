@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from rcon.game_logs import player_name_filter
+from rcon.models import LogLine, PlayerID, enter_session
+from rcon.player_history import _players_matching_name
+
+
+def explain(sess: Session, statement) -> str:
+    compiled = statement.compile(
+        dialect=sess.get_bind().dialect, compile_kwargs={"literal_binds": True}
+    )
+    # The test tables are tiny, make sure the planner picks an index whenever it can
+    sess.execute(text("SET LOCAL enable_seqscan = off"))
+    return "\n".join(sess.execute(text(f"EXPLAIN {compiled}")).scalars())
+
+
+@pytest.mark.parametrize(
+    "ignore_accent, fuzzy_name_match, expected_indexes",
+    [
+        (True, False, ["ix_player_names_name_unaccent_trgm"]),
+        (False, False, ["ix_player_names_name_trgm"]),
+        (True, True, ["ix_player_names_name_unaccent_trgm"]),
+    ],
+)
+def test_player_name_search_uses_trigram_indexes(
+    ignore_accent, fuzzy_name_match, expected_indexes
+):
+    statement = select(PlayerID.id).where(
+        PlayerID.id.in_(
+            _players_matching_name(
+                "dydso",
+                ignore_accent=ignore_accent,
+                fuzzy_name_match=fuzzy_name_match,
+            )
+        )
+    )
+    with enter_session() as sess:
+        plan = explain(sess, statement)
+
+    for index in expected_indexes + ["ix_player_account_name_trgm"]:
+        assert index in plan
+    assert "Seq Scan on player_names" not in plan
+
+
+def test_log_name_search_uses_trigram_indexes():
+    statement = select(LogLine.id).where(player_name_filter("dydso"))
+    with enter_session() as sess:
+        plan = explain(sess, statement)
+
+    # Every partition is searched through its own copy of the indexes
+    assert "player1_name_idx" in plan
+    assert "player2_name_idx" in plan
+    assert "Seq Scan" not in plan
@@ -0,0 +1,157 @@
+from unittest import mock
+
+import redis.exceptions
+from fakeredis import FakeStrictRedis
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from rcon.player_identity import PlayerIdentityCache
+
+
+def _session(db_rows: dict[str, int]):
+    sess = mock.MagicMock()
+
+    def filter_(criterion):
+        requested = criterion.right.value
+        return [(k, v) for k, v in db_rows.items() if k in requested]
+
+    sess.query.return_value.filter.side_effect = filter_
+    return sess
+
+
+def test_get_pks_queries_the_database_once_for_all_missing_players():
+    sess = _session({"a": 1, "b": 2})
+    identity = PlayerIdentityCache(red=FakeStrictRedis())
+
+    assert identity.get_pks(sess, ["a", "b", "c"]) == {"a": 1, "b": 2}
+    assert sess.query.return_value.filter.call_count == 1
+
+
+def test_get_pks_is_served_from_the_local_cache():
+    sess = _session({"a": 1})
+    identity = PlayerIdentityCache(red=FakeStrictRedis())
+
+    identity.get_pks(sess, ["a"])
+    assert identity.get_pks(sess, ["a"]) == {"a": 1}
+    assert sess.query.return_value.filter.call_count == 1
+
+
+def test_get_pks_is_shared_through_redis():
+    red = FakeStrictRedis()
+    PlayerIdentityCache(red=red).get_pks(_session({"a": 1}), ["a"])
+
+    sess = _session({})
+    assert PlayerIdentityCache(red=red).get_pks(sess, ["a"]) == {"a": 1}
+    sess.query.assert_not_called()
+
+
+def test_get_pks_falls_back_to_the_database_without_redis():
+    red = mock.MagicMock()
+    red.hmget.side_effect = redis.exceptions.RedisError
+    red.pipeline.side_effect = redis.exceptions.RedisError
+    identity = PlayerIdentityCache(red=red)
+
+    assert identity.get_pks(_session({"a": 1}), ["a"]) == {"a": 1}
+
+
+def test_forget_drops_both_cache_levels():
+    red = FakeStrictRedis()
+    identity = PlayerIdentityCache(red=red)
+    identity.get_pks(_session({"a": 1}), ["a"])
+
+    identity.forget("a")
+
+    assert red.hget(PlayerIdentityCache.REDIS_KEY, "a") is None
+    assert identity.get_pks(_session({}), ["a"]) == {}
+
+
+def test_get_or_create_pks_only_creates_missing_players():
+    identity = PlayerIdentityCache(red=FakeStrictRedis())
+    sess = _session({"a": 1})
+
+    with (
+        mock.patch(
+            "rcon.player_identity._bulk_create_players", return_value={"b": 2}
+        ) as create,
+        mock.patch("rcon.player_identity._bulk_upsert_player_names") as names,
+    ):
+        pks = identity.get_or_create_pks(sess, {"a": "Able", "b": "Baker"})
+
+    assert pks == {"a": 1, "b": 2}
+    create.assert_called_once_with(sess, ["b"])
+    names.assert_called_once_with(sess, {2: "Baker"}, None)
+    sess.flush.assert_called_once()
+    sess.commit.assert_not_called()
+
+
+def test_get_or_create_pks_saves_every_name():
+    identity = PlayerIdentityCache(red=FakeStrictRedis())
+    sess = _session({"a": 1, "b": 2})
+
+    with (
+        mock.patch("rcon.player_identity._bulk_create_players") as create,
+        mock.patch("rcon.player_identity._bulk_upsert_player_names") as names,
+    ):
+        identity.get_or_create_pks(
+            sess, {"a": "Able", "b": None}, 1000.0, save_names=True
+        )
+
+    create.assert_not_called()
+    names.assert_called_once_with(sess, {1: "Able"}, 1000.0)
+    sess.commit.assert_not_called()
+
+
+def _created_players_session(identity: PlayerIdentityCache, pks: dict[str, int]):
+    sess = Session(create_engine("sqlite://"))
+    sess.connection()
+    identity._remember_after_commit(sess, pks)
+    return sess
+
+
+def test_created_players_are_cached_once_committed():
+    red = FakeStrictRedis()
+    identity = PlayerIdentityCache(red=red)
+    sess = _created_players_session(identity, {"b": 2})
+
+    assert red.hget(PlayerIdentityCache.REDIS_KEY, "b") is None
+    sess.commit()
+
+    assert red.hget(PlayerIdentityCache.REDIS_KEY, "b") == b"2"
+
+
+def test_created_players_are_not_cached_when_rolled_back():
+    red = FakeStrictRedis()
+    identity = PlayerIdentityCache(red=red)
+    sess = _created_players_session(identity, {"b": 2})
+
+    sess.rollback()
+    sess.commit()
+
+    assert red.hget(PlayerIdentityCache.REDIS_KEY, "b") is None
+    assert identity.get_pks(_session({}), ["b"]) == {}
+
+
+def test_caching_does_not_extend_the_ttl():
+    red = FakeStrictRedis()
+    identity = PlayerIdentityCache(red=red)
+    identity.get_pks(_session({"a": 1}), ["a"])
+    red.expire(PlayerIdentityCache.REDIS_KEY, 10)
+
+    identity.get_pks(_session({"b": 2}), ["b"])
+
+    assert red.ttl(PlayerIdentityCache.REDIS_KEY) <= 10
+
+
+def test_forget_all_is_seen_by_every_process():
+    red = FakeStrictRedis()
+    identity = PlayerIdentityCache(red=red)
+    other = PlayerIdentityCache(red=red)
+    identity.get_pks(_session({"a": 1}), ["a"])
+    other.get_pks(_session({"a": 1}), ["a"])
+
+    identity.forget_all()
+    other._generation_checked_at = None
+
+    assert red.exists(PlayerIdentityCache.REDIS_KEY) == 0
+    assert identity.get_pks(_session({"a": 2}), ["a"]) == {"a": 2}
+    assert other.get_pks(_session({"a": 2}), ["a"]) == {"a": 2}
@@ -0,0 +1,115 @@
+from datetime import UTC, datetime, timedelta
+from unittest import mock
+
+from fakeredis import FakeStrictRedis
+
+from rcon.policy_index import NO_POLICY, PolicyIndex, _Entry, decode_policy
+
+NOW = datetime(2024, 11, 15, 12, tzinfo=UTC)
+LATER = (NOW + timedelta(days=1)).timestamp()
+EARLIER = (NOW - timedelta(days=1)).timestamp()
+
+
+def test_missing_entry_has_no_policy():
+    assert decode_policy(None, 1, NOW) == NO_POLICY
+    assert not NO_POLICY.needs_action
+
+
+def test_blacklists_apply_to_their_servers_until_they_expire():
+    entry = _Entry(blacklists=[(0b10, None), (0b01, EARLIER)]).encode()
+
+    assert not decode_policy(entry, 1, NOW).blacklisted
+    assert decode_policy(entry, 2, NOW).blacklisted
+    assert not decode_policy(entry, 3, NOW).blacklisted
+
+    every_server = _Entry(blacklists=[(None, LATER)]).encode()
+    assert decode_policy(every_server, 3, NOW).blacklisted
+    assert not decode_policy(every_server, 3, NOW + timedelta(days=2)).blacklisted
+
+
+def test_vips_flags_and_watch():
+    entry = _Entry(watched=True, flags=["🚨"], vips={1: LATER, 2: EARLIER}).encode()
+
+    policy = decode_policy(entry, 1, NOW)
+    assert policy.watched
+    assert policy.needs_action
+    assert policy.flags == ("🚨",)
+    assert policy.is_vip
+    assert policy.vip_expiration == datetime.fromtimestamp(LATER, tz=UTC)
+    assert not decode_policy(entry, 2, NOW).is_vip
+
+
+def _index(entries: dict[str, _Entry]) -> PolicyIndex:
+    index = PolicyIndex(red=FakeStrictRedis(), server_number=1)
+    with mock.patch("rcon.policy_index.load_entries", return_value=entries):
+        with mock.patch("rcon.policy_index.enter_session"):
+            index.rebuild()
+    return index
+
+
+def test_get_many_answers_every_player_in_one_lookup():
+    index = _index({"a": _Entry(watched=True), "b": _Entry(flags=["x"])})
+
+    policies = index.get_many(["a", "b", "c"], NOW)
+
+    assert policies["a"].watched
+    assert policies["b"].flags == ("x",)
+    assert policies["c"] == NO_POLICY
+
+
+def test_refresh_replaces_and_removes_entries():
+    index = _index({"a": _Entry(watched=True), "b": _Entry(watched=True)})
+
+    with mock.patch(
+        "rcon.policy_index.load_entries", return_value={"a": _Entry(flags=["x"])}
+    ):
+        index.refresh(["a", "b"], sess=mock.MagicMock())
+
+    policies = index.get_many(["a", "b"], NOW)
+    assert policies["a"] == decode_policy(_Entry(flags=["x"]).encode(), 1, NOW)
+    assert policies["b"] == NO_POLICY
+
+
+def test_unbuilt_index_is_built_once_then_used():
+    index = PolicyIndex(red=FakeStrictRedis(), server_number=1)
+
+    with (
+        mock.patch("rcon.policy_index.enter_session"),
+        mock.patch(
+            "rcon.policy_index.load_entries", return_value={"a": _Entry(watched=True)}
+        ) as load_entries,
+    ):
+        assert index.get("a", NOW).watched
+        assert index.get("a", NOW).watched
+    load_entries.assert_called_once()
+
+
+def test_index_being_built_elsewhere_falls_back_to_the_database():
+    index = PolicyIndex(red=FakeStrictRedis(), server_number=1)
+    index.red.set(index.BUILD_LOCK_KEY, 1)
+
+    assert index.get("a", NOW) is None
+
+
+def test_refresh_during_a_rebuild_is_not_lost():
+    index = PolicyIndex(red=FakeStrictRedis(), server_number=1)
+    database = {"a": _Entry(watched=True)}
+
+    def load_entries(sess, player_ids=None):
+        if player_ids is not None:
+            return {p: database[p] for p in player_ids if p in database}
+        snapshot = dict(database)
+        # A player gets watched while the rebuild reads the database
+        database["b"] = _Entry(watched=True)
+        index.refresh(["b"], sess=mock.MagicMock())
+        return snapshot
+
+    with (
+        mock.patch("rcon.policy_index.enter_session"),
+        mock.patch("rcon.policy_index.load_entries", side_effect=load_entries),
+    ):
+        index.rebuild()
+
+    policies = index.get_many(["a", "b"], NOW)
+    assert policies["a"].watched
+    assert policies["b"].watched
@@ -0,0 +1,80 @@
+from fakeredis import FakeStrictRedis
+
+from rcon.recent_actions import RecentActionsStore, collect_recent_actions
+from rcon.types import AllLogTypes, MostRecentEvents
+
+
+def _kill(killer: str, victim: str, weapon: str | None, action=AllLogTypes.kill):
+    return {
+        "action": action.value,
+        "player_name_1": f"name {killer}",
+        "player_id_1": killer,
+        "player_name_2": f"name {victim}",
+        "player_id_2": victim,
+        "weapon": weapon,
+    }
+
+
+def _store() -> RecentActionsStore:
+    return RecentActionsStore(
+        red=FakeStrictRedis(decode_responses=True), server_number=1
+    )
+
+
+def test_later_kills_of_a_fetch_win():
+    updates = collect_recent_actions(
+        [
+            _kill("a", "b", "M1"),
+            _kill("c", "a", "MP40"),
+            _kill("a", "d", "KAR98", action=AllLogTypes.team_kill),
+            _kill("a", "c", "M1"),
+            _kill(None, "c", "M1"),
+        ]
+    )
+
+    assert updates["a"] == {
+        "player_name": "name a",
+        "last_victim_player_id": "c",
+        "last_victim_name": "name c",
+        "last_victim_weapon": "M1",
+        "last_nemesis_player_id": "c",
+        "last_nemesis_name": "name c",
+        "last_nemesis_weapon": "MP40",
+        "last_tk_victim_player_id": "d",
+        "last_tk_victim_name": "name d",
+        "last_tk_victim_weapon": "KAR98",
+    }
+    assert updates["d"]["last_tk_nemesis_player_id"] == "a"
+
+
+def test_store_reads_a_single_player():
+    store = _store()
+    store.update(collect_recent_actions([_kill("a", "b", "M1")]))
+
+    assert store.get("a") == MostRecentEvents(
+        player_name="name a",
+        last_victim_player_id="b",
+        last_victim_name="name b",
+        last_victim_weapon="M1",
+    )
+    assert store.get("b").last_nemesis_player_id == "a"
+    assert store.get("unknown") == MostRecentEvents()
+
+
+def test_missing_values_are_removed():
+    store = _store()
+    store.update(collect_recent_actions([_kill("a", "b", "M1")]))
+    store.update(collect_recent_actions([_kill("a", "b", None)]))
+
+    assert store.get("a").last_victim_weapon is None
+    assert store.get("a").last_victim_player_id == "b"
+
+
+def test_clear_removes_every_player():
+    store = _store()
+    store.update(collect_recent_actions([_kill("a", "b", "M1")]))
+
+    store.clear()
+
+    assert store.get("a") == MostRecentEvents()
+    assert store.red.keys("*") == []
@@ -0,0 +1,83 @@
+from unittest import mock
+
+from sqlalchemy.dialects import postgresql
+
+from rcon import workers
+from rcon.models import PlayerStats
+
+
+def _compile(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+def _row(player_pk: int) -> dict:
+    return workers._build_player_stat_dict(
+        player_pk, 1, {"player": f"player {player_pk}", "kills": 3}, {}
+    )
+
+
+def test_stats_upsert_does_nothing_on_conflict_without_force():
+    sql = _compile(workers._build_player_stats_upsert([_row(1), _row(2)]))
+
+    assert "ON CONFLICT ON CONSTRAINT unique_map_player DO NOTHING" in sql
+
+
+def test_stats_upsert_overwrites_stats_with_force():
+    sql = _compile(workers._build_player_stats_upsert([_row(1)], force=True))
+
+    assert "ON CONFLICT ON CONSTRAINT unique_map_player DO UPDATE SET" in sql
+    assert "kills = excluded.kills" in sql
+    assert "map_id = excluded.map_id" not in sql
+    assert "playersteamid_id = excluded.playersteamid_id" not in sql
+
+
+def _record(game_log_stats, pks, existing, force=False):
+    sess = mock.MagicMock()
+    sess.query.return_value.filter.return_value = existing
+    map_ = mock.MagicMock(id=1)
+
+    with (
+        mock.patch.object(workers, "_are_match_logs_available", return_value=True),
+        mock.patch.object(workers, "_save_match_result"),
+        mock.patch.object(workers, "_get_game_logs_stats", return_value=game_log_stats),
+        mock.patch.object(workers, "get_player_identity") as get_identity,
+    ):
+        get_pks = get_identity.return_value.get_pks
+        get_pks.return_value = pks
+        workers.record_stats_from_map(sess, map_, None, force=force)
+
+    return sess, get_pks
+
+
+def test_record_stats_writes_all_players_in_one_statement():
+    game_log_stats = {
+        "a": {"player_id": "a", "player": "A", "kills": 1},
+        "b": {"player_id": "b", "player": "B", "kills": 2},
+        "c": {"player_id": "c", "player": "C", "kills": 3},
+    }
+    sess, get_pks = _record(game_log_stats, {"a": 10, "b": 20}, existing=[])
+
+    get_pks.assert_called_once()
+    assert set(get_pks.call_args.args[1]) == {"a", "b", "c"}
+    assert sess.execute.call_count == 1
+    statement = sess.execute.call_args.args[0]
+    assert "DO NOTHING" in _compile(statement)
+    sess.add.assert_not_called()
+
+
+def test_record_stats_skips_existing_without_force():
+    game_log_stats = {"a": {"player_id": "a", "player": "A", "kills": 1}}
+    existing = [PlayerStats(player_id_id=10, map_id=1)]
+    sess, _ = _record(game_log_stats, {"a": 10}, existing=existing)
+
+    sess.execute.assert_not_called()
+
+
+def test_record_stats_overwrites_existing_with_force():
+    game_log_stats = {"a": {"player_id": "a", "player": "A", "kills": 1}}
+    existing = [PlayerStats(player_id_id=10, map_id=1)]
+    sess, _ = _record(game_log_stats, {"a": 10}, existing=existing, force=True)
+
+    assert sess.execute.call_count == 1
+    assert "DO UPDATE" in _compile(sess.execute.call_args.args[0])
+    sess.expire.assert_called_once_with(existing[0])
@@ -0,0 +1,228 @@
+import time
+from unittest import mock
+
+import orjson
+
+from rcon.game.registry import get_game_profile
+from rcon.rcon import Rcon
+from rcon.team_view import (
+    STAT_FIELDS,
+    UNASSIGNED,
+    build_team_view,
+    guess_squad_type,
+    has_leader,
+)
+from rcon.types import GameEnum
+from rcon.utils import ALL_ROLES, ALL_ROLES_KEY_INDEX_MAP
+
+ROLES = {"rifleman": 0, "officer": 9, "tankcommander": 12, "armycommander": 13}
+
+
+def _raw_player(player_id: str, team: int, platoon: str, role: str, kills: int = 1):
+    return {
+        "name": f"player {player_id}",
+        "iD": player_id,
+        "team": team,
+        "role": ROLES[role],
+        "platoon": platoon,
+        "loadout": "standard issue",
+        "level": 50,
+        "stats": {
+            "infantryKills": kills,
+            "deaths": 1,
+            "teamKills": 0,
+            "vehicleKills": 0,
+            "vehiclesDestroyed": 0,
+        },
+        "scoreData": {"cOMBAT": 10, "offense": 20, "defense": 30, "support": 40},
+        "platform": "steam",
+        "clanTag": "",
+        "worldPosition": {"x": 0.0, "y": 0.0, "z": 0.0},
+    }
+
+
+class FakeGameServer:
+    """Answers the player and VIP lists after `latency` seconds per round trip"""
+
+    def __init__(self, players: list[dict], latency: float = 0.0):
+        self.players = players
+        self.latency = latency
+        self.sent: list[str] = []
+        self.round_trips = 0
+        self.in_flight = 0
+
+    def send(self, command, version, content="", **kwargs):
+        self.sent.append(content["Name"])
+        self.in_flight += 1
+        return content["Name"]
+
+    def receive(self, handle):
+        # Requests sent before the first response is read share its round trip
+        if self.in_flight:
+            self.round_trips += 1
+            self.in_flight = 0
+            time.sleep(self.latency)
+        response = mock.Mock()
+        if handle == "players":
+            response.content_dict = {"players": self.players}
+        else:
+            response.content_dict = {
+                "vipPlayers": [{"iD": self.players[0]["iD"], "comment": "vip"}]
+            }
+        return response
+
+
+def _rcon(server: FakeGameServer) -> Rcon:
+    rcon = Rcon.__new__(Rcon)
+    rcon.game_profile = get_game_profile(GameEnum.HLL_WW2)
+    rcon.send = server.send
+    rcon.receive = server.receive
+    return rcon
+
+
+def _players(count: int) -> list[dict]:
+    players = []
+    for i in range(count):
+        team = 1 if i % 2 else 0
+        squad = "ABCDEFGHIJKL"[(i // 2) % 12]
+        role = "officer" if i < 24 else "rifleman"
+        players.append(_raw_player(f"7656119{i:010d}", team, squad, role))
+    players[-1]["role"] = ROLES["armycommander"]
+    players[-1]["platoon"] = ""
+    return players
+
+
+def test_detailed_players_use_one_round_trip_and_one_profile_query():
+    server = FakeGameServer(_players(100))
+    rcon = _rcon(server)
+
+    with (
+        mock.patch("rcon.rcon.MapsHistory", return_value=[{"start": None}]),
+        mock.patch("rcon.rcon.get_profiles", return_value=[]) as get_profiles,
+    ):
+        detailed = rcon.get_detailed_players()
+
+    assert len(detailed["players"]) == 100
+    assert detailed["fail_count"] == 0
+    assert server.sent == ["players", "vipplayers"]
+    assert server.round_trips == 1
+    get_profiles.assert_called_once()
+    assert detailed["players"]["76561190000000000"]["is_vip"]
+
+
+def test_team_view_keeps_its_shape():
+    detailed = {
+        "fail_count": 0,
+        "players": {
+            p["player_id"]: p
+            for p in [
+                {
+                    "player_id": "1",
+                    "team": "allies",
+                    "unit_name": "able",
+                    "role": "rifleman",
+                    "combat": 1,
+                    "offense": 2,
+                    "defense": 3,
+                    "support": 4,
+                    "kills": 5,
+                    "deaths": 6,
+                },
+                {
+                    "player_id": "2",
+                    "team": "allies",
+                    "unit_name": "able",
+                    "role": "officer",
+                    "combat": 1,
+                    "offense": 1,
+                    "defense": 1,
+                    "support": 1,
+                    "kills": 1,
+                    "deaths": 1,
+                },
+                {
+                    "player_id": "3",
+                    "team": "allies",
+                    "unit_name": "command",
+                    "role": "armycommander",
+                    "combat": 10,
+                    "offense": 0,
+                    "defense": 0,
+                    "support": 0,
+                    "kills": 0,
+                    "deaths": 0,
+                },
+                {
+                    "player_id": "4",
+                    "team": None,
+                    "unit_name": None,
+                    "role": None,
+                    "combat": 0,
+                    "offense": 0,
+                    "defense": 0,
+                    "support": 0,
+                    "kills": 0,
+                    "deaths": 0,
+                },
+            ]
+        },
+    }
+
+    team_view = build_team_view(detailed)
+
+    assert list(team_view) == ["fail_count", "allies", "unassigned"]
+    allies = team_view["allies"]
+    assert allies["commander"]["player_id"] == "3"
+    assert list(allies["squads"]) == ["able"]
+    able = allies["squads"]["able"]
+    assert [p["player_id"] for p in able["players"]] == ["2", "1"]
+    assert able["type"] == "infantry"
+    assert able["has_leader"]
+    assert (able["combat"], able["kills"], able["deaths"]) == (2, 6, 7)
+    assert (allies["combat"], allies["count"]) == (12, 3)
+    assert team_view["unassigned"]["squads"][None]["players"][0]["player_id"] == "4"
+
+
+def _nested_team_view(detailed):
+    """The team view as it was built before, with nested dicts and sums"""
+    teams = {}
+    for player in detailed["players"].values():
+        team_name = player.get("team") if player.get("team") is not None else UNASSIGNED
+        squad = teams.setdefault(team_name, {}).setdefault(player.get("unit_name"), {})
+        squad.setdefault("players", []).append(player)
+
+    game = {}
+    for team, squads in teams.items():
+        for squad in squads.values():
+            squad["players"] = sorted(
+                squad["players"],
+                key=lambda p: (
+                    ALL_ROLES_KEY_INDEX_MAP.get(p.get("role"), len(ALL_ROLES)),
+                    p.get("player_id"),
+                ),
+            )
+            squad["type"] = guess_squad_type(squad["players"])
+            squad["has_leader"] = has_leader(squad["players"])
+            for name in STAT_FIELDS:
+                squad[name] = sum(p[name] for p in squad["players"])
+        commander = [s for s in squads.values() if s["type"] == "commander"]
+        game[team] = {
+            "squads": {n: s for n, s in squads.items() if s["type"] != "commander"},
+            "commander": commander[0]["players"][0] if commander else None,
+            **{name: sum(s[name] for s in squads.values()) for name in STAT_FIELDS},
+            "count": sum(len(s["players"]) for s in squads.values()),
+        }
+    return dict(fail_count=detailed["fail_count"], **game)
+
+
+def test_columnar_team_view_matches_the_nested_one():
+    server = FakeGameServer(_players(100))
+    with (
+        mock.patch("rcon.rcon.MapsHistory", return_value=[{"start": None}]),
+        mock.patch("rcon.rcon.get_profiles", return_value=[]),
+    ):
+        detailed = _rcon(server).get_detailed_players()
+
+    assert orjson.dumps(build_team_view(detailed)) == orjson.dumps(
+        _nested_team_view(detailed)
+    )
@@ -1,4 +1,9 @@
-from rcon.utils import exception_in_chain
+import datetime
+import uuid
+
+import pytest
+
+from rcon.utils import LogsRecorderStream, exception_in_chain
 
 
 class FakeException(Exception):
@@ -51,3 +56,30 @@ def test_deeply_chained_implicit():
     e.__context__.__cause__.__context__ = DeepChainedException()
 
     assert exception_in_chain(e, DeepChainedException)
+
+
+@pytest.fixture
+def recorder_stream():
+    stream = LogsRecorderStream(key=f"test_stream_{uuid.uuid4()}")
+    yield stream
+    stream.red.delete(stream.key)
+
+
+def test_stream_group_delivers_in_order_until_acknowledged(recorder_stream):
+    event_time = datetime.datetime(2024, 1, 1, tzinfo=datetime.UTC)
+    ids = [recorder_stream.add({"n": n, "event_time": event_time}) for n in range(3)]
+
+    assert recorder_stream.create_group("group") is True
+    assert recorder_stream.create_group("group") is False
+
+    entries = recorder_stream.read_group("group", "consumer", count=2)
+    assert [(id_, log["n"]) for id_, log in entries] == [(ids[0], 0), (ids[1], 1)]
+    assert entries[0][1]["event_time"] == event_time
+
+    recorder_stream.ack("group", ids[0])
+    pending = recorder_stream.read_group("group", "consumer", pending=True)
+    assert [id_ for id_, _ in pending] == [ids[1]]
+
+    entries = recorder_stream.read_group("group", "consumer")
+    assert [id_ for id_, _ in entries] == [ids[2]]
+    assert recorder_stream.read_group("group", "consumer") == []
@@ -0,0 +1,87 @@
+from datetime import UTC, datetime
+
+from rcon.vip_reconciliation import compute_vip_changes
+
+EXPIRATION = datetime(2025, 1, 1, tzinfo=UTC)
+LATER = datetime(2025, 6, 1, tzinfo=UTC)
+
+
+def vip(player_id: str, description: str, expiration: datetime = EXPIRATION):
+    return {
+        "player_id": player_id,
+        "description": description,
+        "expiration": expiration,
+    }
+
+
+def test_unchanged_vips_are_left_alone():
+    changes = compute_vip_changes(
+        {"1": "one", "2": "two"},
+        {"1": EXPIRATION, "2": EXPIRATION},
+        [vip("1", "one"), vip("2", "two")],
+        remove_missing=True,
+    )
+
+    assert changes.unchanged == 2
+    assert not changes.server_additions
+    assert not changes.server_removals
+    assert not changes.record_upserts
+    assert not changes.record_deletions
+
+
+def test_only_the_difference_is_applied():
+    changes = compute_vip_changes(
+        {"1": "one", "2": "two", "3": "three"},
+        {"1": EXPIRATION, "2": EXPIRATION, "4": EXPIRATION},
+        [vip("1", "one"), vip("2", "renamed"), vip("5", "five", LATER)],
+        remove_missing=True,
+    )
+
+    assert changes.server_additions == {"2": "renamed", "5": "five"}
+    assert changes.server_removals == ["3"]
+    assert set(changes.record_upserts) == {"5"}
+    assert changes.record_deletions == ["4"]
+    assert changes.added == ["5"]
+    assert changes.updated == ["2"]
+    assert changes.removed == ["3", "4"]
+    assert changes.unchanged == 1
+
+
+def test_expiration_change_only_touches_the_record():
+    changes = compute_vip_changes(
+        {"1": "one"}, {"1": EXPIRATION}, [vip("1", "one", LATER)]
+    )
+
+    assert not changes.server_additions
+    assert changes.record_upserts["1"]["expiration"] == LATER
+    assert changes.updated == ["1"]
+
+
+def test_naive_expirations_are_utc():
+    naive = EXPIRATION.replace(tzinfo=None)
+    changes = compute_vip_changes({"1": "one"}, {"1": naive}, [vip("1", "one")])
+
+    assert changes.unchanged == 1
+    assert not changes.record_upserts
+
+
+def test_explicit_removals_keep_other_vips():
+    changes = compute_vip_changes(
+        {"1": "one", "2": "two"},
+        {"1": EXPIRATION, "2": EXPIRATION},
+        [],
+        remove=["1", "unknown"],
+    )
+
+    assert changes.server_removals == ["1"]
+    assert changes.record_deletions == ["1"]
+    assert changes.removed == ["1"]
+
+
+def test_desired_vips_are_never_removed():
+    changes = compute_vip_changes(
+        {"1": "one"}, {"1": EXPIRATION}, [vip("1", "one")], remove=["1"]
+    )
+
+    assert not changes.removed
+    assert changes.unchanged == 1